@@ -13,12 +13,19 @@ project_dir=${project_dir-"${base_dir}/norduni/src/niweb"}
 log_dir=${log_dir-'/var/log/norduni'}
 state_dir=${state_dir-"${base_dir}/run"}
 media_dir=${media_dir-"${base_dir}/media"}
+# prometheus_client keeps the web metrics of the worker processes here, /metrics serves the sum over all workers
+metrics_dir=${metrics_dir-"${state_dir}/metrics"}
 workers=${workers-1}
 worker_class=${worker_class-sync}
 worker_threads=${worker_threads-1}
 worker_timeout=${worker_timeout-30}
 gunicorn_args="--bind 0.0.0.0:8080 -w ${workers} -k ${worker_class} --threads ${worker_threads} -t ${worker_timeout} niweb.wsgi"
 
+# Metrics of the workers of an earlier server must not be added up with the new ones
+rm -rf "${metrics_dir}"
+mkdir -p "${metrics_dir}"
+export PROMETHEUS_MULTIPROC_DIR="${metrics_dir}"
+
 chown -R ni: "${log_dir}" "${state_dir}" "${media_dir}"
 
 # set PYTHONPATH if it is not already set using Docker environment
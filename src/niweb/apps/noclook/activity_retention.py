@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Retention and compaction of the activity log.
+
+The consumers write an action for every property update and relationship they touch, so the actstream_action table
+grows without bound. Two kinds of actions are removed:
+
+Expired actions, older than the days of the first retention policy matching their action type and actor, see
+ACTIVITY_RETENTION_POLICIES. A policy without days keeps the actions it matches, later policies do not see them.
+
+Redundant relationship actions, a create after a create or a delete after a delete of the same relationship type
+between the same nodes. They are found with a LAG window over the relationship actions in the database instead of
+per node in Python.
+
+Removed actions are written to a gzip compressed NDJSON file in ACTIVITY_ARCHIVE_PATH before they are deleted, in
+batches of ACTIVITY_RETENTION_BATCH_SIZE actions.
+"""
+
+import gzip
+import json
+import logging
+import os
+from collections import namedtuple
+from datetime import timedelta
+
+from actstream.models import Action
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import F, Q, Window
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Lag
+from django.utils import timezone
+
+from apps.noclook.models import NodeHandle
+
+logger = logging.getLogger('noclook.activity_retention')
+
+RetentionPolicy = namedtuple('RetentionPolicy', ['action_type', 'actor', 'days'])
+
+ARCHIVE_FIELDS = (
+    'id', 'actor_content_type__app_label', 'actor_content_type__model', 'actor_object_id', 'verb', 'description',
+    'target_content_type__app_label', 'target_content_type__model', 'target_object_id',
+    'action_object_content_type__app_label', 'action_object_content_type__model', 'action_object_object_id',
+    'timestamp', 'public', 'data',
+)
+
+
+def policies(config=None):
+    """
+    :param config: List of dicts with action_type, actor (username) and days, all optional,
+    ACTIVITY_RETENTION_POLICIES by default
+    :return: List of RetentionPolicy
+    :raises ImproperlyConfigured: if a policy has unknown keys or days is not a positive number
+    """
+    result = []
+    for item in settings.ACTIVITY_RETENTION_POLICIES if config is None else config:
+        unknown = set(item) - set(RetentionPolicy._fields)
+        if unknown:
+            raise ImproperlyConfigured('Unknown activity retention policy keys: {}'.format(', '.join(sorted(unknown))))
+        policy = RetentionPolicy(item.get('action_type'), item.get('actor'), item.get('days'))
+        if policy.days is not None and (not isinstance(policy.days, int) or policy.days < 1):
+            raise ImproperlyConfigured('Activity retention days must be a positive integer: {}'.format(item))
+        result.append(policy)
+    return result
+
+
+def _policy_filter(policy):
+    q = Q()
+    if policy.action_type:
+        q &= Q(data__noclook__action_type=policy.action_type)
+    if policy.actor:
+        user = User.objects.filter(username=policy.actor).first()
+        # Matches nothing for unknown users
+        q &= Q(actor_content_type=ContentType.objects.get_for_model(User),
+               actor_object_id=str(user.pk) if user else '')
+    return q
+
+
+def expired_actions(retention_policies=None, now=None):
+    """
+    :param retention_policies: List of RetentionPolicy, see policies
+    :return: List of (RetentionPolicy, QuerySet of the actions it expires)
+    """
+    now = now or timezone.now()
+    result = []
+    earlier = []
+    for policy in policies() if retention_policies is None else retention_policies:
+        q = _policy_filter(policy)
+        if policy.days is not None:
+            actions = Action.objects.filter(q, timestamp__lt=now - timedelta(days=policy.days))
+            for earlier_q in earlier:
+                actions = actions.exclude(earlier_q)
+            result.append((policy, actions))
+        if not q:
+            # Matches all actions, nothing is left for later policies
+            break
+        earlier.append(q)
+    return result
+
+
+def redundant_actions(handle_ids=None):
+    """
+    :param handle_ids: Only relationship actions with these nodes as action object, all by default
+    :return: List of ids of relationship actions with the same verb as the previous action of the same relationship
+    type between the same nodes
+    """
+    actions = Action.objects.filter(data__noclook__action_type='relationship')
+    if handle_ids is not None:
+        actions = actions.filter(action_object_content_type=ContentType.objects.get_for_model(NodeHandle),
+                                 action_object_object_id__in=[str(handle_id) for handle_id in handle_ids])
+    previous_verb = Window(
+        expression=Lag('verb'),
+        partition_by=[F('action_object_content_type'), F('action_object_object_id'), F('target_content_type'),
+                      F('target_object_id'), KeyTextTransform('relationship_type', 'data__noclook')],
+        order_by=[F('timestamp').asc(), F('id').asc()],
+    )
+    # Window expressions can not be filtered on, so the windowed query is a subquery
+    sql, params = actions.annotate(previous_verb=previous_verb).values('id', 'verb', 'previous_verb').query\
+        .sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id FROM ({}) windowed WHERE verb = previous_verb ORDER BY id'.format(sql), params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+class Archive(object):
+    """
+    Gzip compressed NDJSON file with one line per archived action, created on the first write.
+    """
+
+    def __init__(self, directory, now=None):
+        self.path = None
+        if directory:
+            name = 'activity-{}.ndjson.gz'.format((now or timezone.now()).strftime('%Y%m%dT%H%M%S'))
+            self.path = os.path.join(directory, name)
+        self._file = None
+
+    def write(self, ids):
+        """
+        Writes the actions with ids to the archive.
+        """
+        if self.path is None:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        for row in Action.objects.filter(id__in=ids).order_by('id').values(*ARCHIVE_FIELDS):
+            self._file.write(json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':')))
+            self._file.write('\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _batches(ids, batch_size):
+    for start in range(0, len(ids), batch_size):
+        yield ids[start:start + batch_size]
+
+
+def delete_actions(actions, archive, batch_size=None, dry_run=False):
+    """
+    :param actions: QuerySet of actions or list of action ids
+    :param archive: Archive the actions are written to before they are deleted
+    :return: Number of actions deleted, or that would be deleted with dry_run
+    """
+    batch_size = batch_size or settings.ACTIVITY_RETENTION_BATCH_SIZE
+    if isinstance(actions, list):
+        batches = _batches(actions, batch_size)
+    elif dry_run:
+        return actions.count()
+    else:
+        # Deleted actions no longer match, so the first batch is always the next one
+        batches = iter(lambda: list(actions.order_by('id').values_list('id', flat=True)[:batch_size]), [])
+    deleted = 0
+    for ids in batches:
+        if not dry_run:
+            with transaction.atomic():
+                archive.write(ids)
+                Action.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+    return deleted
+
+
+def run(dry_run=False, compact=True, batch_size=None, archive_path=None, now=None):
+    """
+    Deletes the expired actions of ACTIVITY_RETENTION_POLICIES and, with compact, the redundant relationship
+    actions.
+
+    :param archive_path: Directory of the archive, ACTIVITY_ARCHIVE_PATH by default, empty to not archive
+    :return: Dict of what was removed, a description of the policy or compacted, and number of actions
+    """
+    now = now or timezone.now()
+    archive_path = settings.ACTIVITY_ARCHIVE_PATH if archive_path is None else archive_path
+    result = {}
+    with Archive(archive_path, now) as archive:
+        for policy, actions in expired_actions(now=now):
+            description = 'action_type={} actor={} days={}'.format(policy.action_type or '*', policy.actor or '*',
+                                                                   policy.days)
+            result[description] = delete_actions(actions, archive, batch_size, dry_run)
+            logger.info('%s actions expired by %s', result[description], description)
+        if compact:
+            result['compacted'] = delete_actions(redundant_actions(), archive, batch_size, dry_run)
+            logger.info('%s redundant relationship actions', result['compacted'])
+    return result
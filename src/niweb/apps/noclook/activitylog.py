@@ -6,7 +6,33 @@ Created on 2012-11-23 10:18 AM
 """
 
 from actstream import action
-from .models import NodeHandle
+from django.utils import timezone
+from .models import NodeHandle, NodeType
+import norduniclient as nc
+
+NEIGHBOURS_QUERY = """
+    MATCH (n:Node {handle_id: {handle_id}})--(m:Node)
+    RETURN DISTINCT m.handle_id as handle_id
+    """
+
+
+def touch_node_types(*handle_ids):
+    """
+    Moves the modification watermarks of the node types of handle_ids to now, see apps.noclook.conditional.
+    """
+    NodeType.objects.filter(nodehandle__handle_id__in=handle_ids).update(modified=timezone.now())
+
+
+def touch_neighbours(handle_id):
+    """
+    Moves the watermarks of the nodes related to handle_id and of their node types to now, for a deleted node. The
+    pages showing the node also show one of its neighbours, see apps.noclook.conditional.
+    """
+    handle_ids = [item['handle_id'] for item in nc.query_to_list(nc.graphdb.manager, NEIGHBOURS_QUERY,
+                                                                 handle_id=handle_id)]
+    if handle_ids:
+        NodeHandle.objects.filter(handle_id__in=handle_ids).update(watermark=timezone.now())
+        touch_node_types(*handle_ids)
 
 
 def update_node_property(user, action_object, property_key, value_before, value_after):
@@ -21,6 +47,7 @@ def update_node_property(user, action_object, property_key, value_before, value_
     """
     action_object.modifier = user
     action_object.save()
+    touch_node_types(action_object.handle_id)
     action.send(
         user,
         verb='update',
@@ -40,6 +67,7 @@ def create_node(user, action_object):
     :param action_object: NodeHandle instance
     :return: None
     """
+    touch_node_types(action_object.handle_id)
     action.send(
         user,
         verb='create',
@@ -56,12 +84,16 @@ def delete_node(user, action_object):
     :param action_object: NodeHandle instance
     :return: None
     """
+    # Called before the node is deleted
+    touch_node_types(action_object.handle_id)
+    touch_neighbours(action_object.handle_id)
     action.send(
         user,
         verb='delete',
         noclook={
             'action_type': 'node',
-            'object_name': u'{}'.format(action_object)
+            'object_name': u'{}'.format(action_object),
+            'handle_id': action_object.handle_id,
         }
     )
 
@@ -82,6 +114,7 @@ def update_relationship_property(user, relationship, property_key, value_before,
     end_nh = NodeHandle.objects.get(pk=relationship.end['handle_id'])
     end_nh.modifier = user
     end_nh.save()
+    touch_node_types(start_nh.handle_id, end_nh.handle_id)
     action.send(
         user,
         verb='update',
@@ -109,6 +142,7 @@ def create_relationship(user, relationship):
     end_nh = NodeHandle.objects.get(pk=relationship.end['handle_id'])
     end_nh.modifier = user
     end_nh.save()
+    touch_node_types(start_nh.handle_id, end_nh.handle_id)
     action.send(
         user,
         verb='create',
@@ -133,6 +167,7 @@ def delete_relationship(user, relationship):
     end_nh = NodeHandle.objects.get(pk=relationship.end['handle_id'])
     end_nh.modifier = user
     end_nh.save()
+    touch_node_types(start_nh.handle_id, end_nh.handle_id)
     action.send(
         user,
         verb='delete',
@@ -22,11 +22,13 @@ from django.urls import re_path
 from django.urls import reverse, resolve, NoReverseMatch
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.http import HttpResponseNotAllowed, HttpResponse
+from django.db.models import Max
 from django.template.defaultfilters import slugify
 from apps.noclook.models import NodeHandle, NodeType, NordunetUniqueId, Dropdown
 from apps.noclook import forms
 from apps.noclook.forms import common as common_forms
 from apps.noclook import helpers
+from apps.noclook import conditional, impact
 from apps.noclook import unique_ids
 import norduniclient as nc
 from norduniclient.exceptions import NodeNotFound
@@ -41,14 +43,30 @@ formatter = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
 ch.setFormatter(formatter)
 logger.addHandler(ch)
 
+# The nodes and relationship ids of a page of NodeHandleResource objects
+NODES_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {handle_ids}
+    RETURN n
+    """
+RELATIONSHIP_IDS_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {handle_ids}
+    MATCH (n)-[r]-(:Node)
+    RETURN n.handle_id as handle_id, id(r) as relationship_id
+    ORDER BY type(r), id(r)
+    """
+
 
-def handle_id2resource_uri(handle_id):
+def handle_id2resource_uri(handle_id, node_handles=None):
     """
     Returns a NodeHandleResource URI from a Neo4j node.
+
+    :param node_handles: Optional dict of handle_id and NodeHandle, with node_type selected, to look the node up in
     """
     if not isinstance(handle_id, int):
         handle_id = handle_id['handle_id']
-    nh = NodeHandle.objects.get(pk=handle_id)
+    nh = (node_handles or {}).get(handle_id)
+    if nh is None:
+        nh = NodeHandle.objects.get(pk=handle_id)
     view = 'api_dispatch_detail'
     nhr = NodeHandleResource()
     kwargs = nhr.resource_uri_kwargs()
@@ -210,8 +228,37 @@ class NodeHandleResource(ModelResource):
             re_path(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/relationships%s$" % (
                 self._meta.resource_name, utils.trailing_slash()),
                 self.wrap_view('get_relationships'), name="api_get_relationships"),
+            re_path(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/impact%s$" % (
+                self._meta.resource_name, utils.trailing_slash()),
+                self.wrap_view('get_impact'), name="api_get_impact"),
         ]
 
+    def get_impact(self, request, **kwargs):
+        """
+        Services, customers, end users and other nodes transitively depending on the node, see apps.noclook.impact.
+        The depth parameter limits the number of relationships followed.
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        try:
+            depth = int(request.GET['depth'])
+        except (KeyError, ValueError):
+            depth = None
+        try:
+            data = {'pk': kwargs['pk']}
+            if getattr(self._meta, 'pk_field', 'pk') != 'pk':
+                kwargs[self._meta.pk_field] = kwargs['pk']
+                data = {self._meta.pk_field: kwargs['pk']}
+                kwargs.pop('pk', None)
+            bundle = self.build_bundle(data, request=request)
+            obj = self.cached_obj_get(bundle=bundle, **self.remove_api_resource_names(kwargs))
+        except ObjectDoesNotExist:
+            return HttpGone()
+        except MultipleObjectsReturned:
+            return HttpMultipleChoices("More than one resource is found at this URI.")
+        return self.create_response(request, impact.impact_analysis(obj.pk, depth))
+
     def get_relationships(self, request, **kwargs):
         rel_type = kwargs.get('rel_type', None)
         if rel_type:
@@ -236,8 +283,73 @@ class NodeHandleResource(ModelResource):
         child_resource = RelationshipResource()
         return child_resource.get_list(request, **kwargs)
 
+    def get_object_list(self, request):
+        return super(NodeHandleResource, self).get_object_list(request).select_related(
+            'node_type', 'creator', 'modifier')
+
+    def get_detail(self, request, **kwargs):
+        """
+        Conditional GET on the modification watermark of the node, see apps.noclook.conditional.
+        """
+        handle_ids = list(self._meta.queryset.filter(**self.remove_api_resource_names(kwargs))
+                          .values_list('handle_id', flat=True)[:2])
+        watermark = conditional.node_watermark(handle_ids[0]) if len(handle_ids) == 1 else None
+        return conditional.conditional_response(
+            request, watermark, lambda: super(NodeHandleResource, self).get_detail(request, **kwargs))
+
+    def get_list(self, request, **kwargs):
+        """
+        Conditional GET on the modification watermark of the listed node types, see apps.noclook.conditional.
+        """
+        watermark = self._meta.queryset.aggregate(Max('node_type__modified'))['node_type__modified__max']
+        return conditional.conditional_response(request, watermark, lambda: self._get_list(request, **kwargs))
+
+    def _get_list(self, request, **kwargs):
+        """
+        Resource.get_list with the nodes and relationships of the page fetched in two queries instead of two per
+        object.
+        """
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        sorted_objects = self.apply_sorting(objects, options=request.GET)
+        paginator = self._meta.paginator_class(
+            request.GET, sorted_objects, resource_uri=self.get_resource_uri(), limit=self._meta.limit,
+            max_limit=self._meta.max_limit, collection_name=self._meta.collection_name)
+        to_be_serialized = paginator.page()
+        bundles = [self.build_bundle(obj=obj, request=request)
+                   for obj in to_be_serialized[self._meta.collection_name]]
+        self._prefetch_nodes(bundles)
+        to_be_serialized[self._meta.collection_name] = [self.full_dehydrate(bundle, for_list=True)
+                                                        for bundle in bundles]
+        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+        return self.create_response(request, to_be_serialized)
+
+    def _prefetch_nodes(self, bundles):
+        handle_ids = [bundle.obj.handle_id for bundle in bundles]
+        if not handle_ids:
+            return
+        nodes = dict((item['n']['handle_id'], dict(item['n'].items())) for item in nc.query_to_list(
+            nc.graphdb.manager, NODES_QUERY, handle_ids=handle_ids))
+        relationship_ids = dict((handle_id, []) for handle_id in handle_ids)
+        for item in nc.query_to_list(nc.graphdb.manager, RELATIONSHIP_IDS_QUERY, handle_ids=handle_ids):
+            relationship_ids[item['handle_id']].append(item['relationship_id'])
+        for bundle in bundles:
+            if bundle.obj.handle_id in nodes:
+                bundle.node_data = nodes[bundle.obj.handle_id]
+                bundle.relationship_ids = relationship_ids[bundle.obj.handle_id]
+
+    def _bundle_node(self, bundle):
+        """
+        The node data and relationship ids of the bundle object, fetched once per bundle unless prefetched.
+        """
+        if getattr(bundle, 'node_data', None) is None:
+            node = bundle.obj.get_node()
+            bundle.node_data = node.data
+            bundle.relationship_ids = [rel['relationship_id'] for rels in node.relationships.values() for rel in rels]
+        return bundle.node_data, bundle.relationship_ids
+
     def dehydrate_node(self, bundle):
-        return bundle.obj.get_node().data
+        return self._bundle_node(bundle)[0]
 
     def hydrate_node(self, bundle):
         try:
@@ -258,11 +370,9 @@ class NodeHandleResource(ModelResource):
         bundle.data['relationships'] = []
         rr = RelationshipResource()
         tmp_obj = RelationshipObject()
-        relationships = bundle.obj.get_node().relationships
-        for key in relationships.keys():
-            for rel in relationships.get(key, []):
-                tmp_obj.id = rel['relationship_id']
-                bundle.data['relationships'].append(rr.get_resource_uri(tmp_obj))
+        for relationship_id in self._bundle_node(bundle)[1]:
+            tmp_obj.id = relationship_id
+            bundle.data['relationships'].append(rr.get_resource_uri(tmp_obj))
         return bundle
 
     def resource_uri_kwargs(self, bundle_or_obj=None):
@@ -333,13 +443,22 @@ class RelationshipResource(Resource):
         authorization = Authorization()
         allowed_methods = ['get', 'put', 'post']
 
-    def _new_obj(self, rel):
+    # All relationships of a node with the handle ids of their nodes, fetched in one query
+    RELATIONSHIPS_QUERY = """
+        MATCH (n:Node {handle_id: {handle_id}})-[r]-(:Node)
+        WHERE {rel_type} IS NULL OR type(r) = {rel_type}
+        RETURN id(r) as id, type(r) as type, properties(r) as data, startNode(r).handle_id as start,
+            endNode(r).handle_id as end
+        ORDER BY type(r), id(r)
+        """
+
+    def _new_obj(self, rel, node_handles=None):
         new_obj = RelationshipObject()
         new_obj.id = rel.id
         new_obj.type = rel.type
         new_obj.properties.update(rel.data)
-        new_obj.start = handle_id2resource_uri(rel.start)
-        new_obj.end = handle_id2resource_uri(rel.end)
+        new_obj.start = handle_id2resource_uri(rel.start, node_handles)
+        new_obj.end = handle_id2resource_uri(rel.end, node_handles)
         return new_obj
 
     def get_resource_uri(self, bundle_or_obj=None, url_name='api_dispatch_detail'):
@@ -364,15 +483,12 @@ class RelationshipResource(Resource):
         if kwargs.get('parent_obj', None):
             rel_type = kwargs.get('rel_type', None)
             nh = NodeHandle.objects.get(pk=kwargs['parent_obj'])
-            relationships = nh.get_node().relationships
-            if rel_type:
-                keys = [rel_type]
-            else:
-                keys = relationships.keys()
-            for key in keys:
-                for item in relationships.get(key, []):
-                    relationship = nc.get_relationship_model(nc.graphdb.manager, item['relationship_id'])
-                    results.append(self._new_obj(relationship))
+            relationships = [RelationshipObject(item) for item in nc.query_to_list(
+                nc.graphdb.manager, self.RELATIONSHIPS_QUERY, handle_id=nh.handle_id, rel_type=rel_type)]
+            handle_ids = set(rel.start for rel in relationships) | set(rel.end for rel in relationships)
+            node_handles = NodeHandle.objects.select_related('node_type').in_bulk(handle_ids)
+            for relationship in relationships:
+                results.append(self._new_obj(relationship, node_handles))
             return results
         else:
             raise ImmediateHttpResponse(HttpResponseNotAllowed(['POST']))
@@ -15,4 +15,15 @@ class NOCLookConfig(AppConfig):
         registry.register(Group)
         registry.register(Comment)
         registry.register(self.get_model('Nodehandle'))
+        # Connects the reference data cache invalidation signals
+        from apps.noclook import reference_data  # noqa
+        # Connects the topology version, visualization and map cache invalidation signals
+        from apps.noclook import topology, arborgraph, maps  # noqa
+        from apps.noclook import neo4j_instrumentation
+        neo4j_instrumentation.install()
+        from django.conf import settings
+        if settings.NEO4J_BACKEND == 'memory':
+            import norduniclient as nc
+            from apps.noclook.memory_graph import MemoryGraphManager
+            nc.graphdb.manager = MemoryGraphManager()
 
@@ -3,13 +3,35 @@
 Created on Thu Nov 10 14:52:53 2011
 
 @author: lundberg
+
+Graphs for the Arbor.js visualization, the root node and the nodes at most depth relationships away.
+
+The graph is expanded breadth first with one neo4j query per depth, decommissioned nodes are left out by the query.
+Expansion stops at max_nodes nodes and the graph is then marked as truncated.
+
+The JSON of a graph is cached per root, depth and max_nodes together with a token per node in the graph. The
+activity log changes the tokens of the nodes of created or deleted relationships and changed properties, a cached
+graph is used as long as the tokens of all its nodes are unchanged. Deleted nodes drop all cached graphs. The nodes
+of a graph are only known once it is computed, so a graph is only cached if no tokens changed while it was computed,
+see CHANGES_KEY.
 """
 
+import hashlib
 import json
-from .helpers import labels_to_node_type, get_node_urls
-import norduniclient as nc
+import uuid
 from collections import defaultdict
 import logging
+
+from actstream.models import Action
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from .helpers import labels_to_node_type
+from .models import NodeHandle
+from . import metrics
+import norduniclient as nc
 logger = logging.getLogger(__name__)
 
 # Color and shape settings for know node types
@@ -50,16 +72,28 @@ def to_arbor_node(raw_node, fixed=False):
     return structure
 
 
-def create_generic_graph(root_node, graph_dict=None):
+NEIGHBOURS_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {handle_ids}
+    MATCH (n)-[r]-(other:Node)
+    WHERE NOT other.operational_state IN ['Decommissioned'] OR NOT exists(other.operational_state)
+    RETURN n.handle_id as handle_id, startNode(r) = n as outgoing, type(r) as relation, other
     """
-    Creates a data structure from the root node and adjacent nodes.
-    This will be done in a special way for known node types else a
-    generic way will be used.
+
+GENERATION_KEY = 'noclook:arborgraph:generation'
+NODE_TOKEN_KEY = 'noclook:arborgraph:node:{}'
+# Changed before the tokens of any node are changed
+CHANGES_KEY = 'noclook:arborgraph:changes'
+
+
+def create_generic_graph(root_node, graph_dict=None, depth=1, max_nodes=None):
+    """
+    Creates a data structure from the root node and the nodes at most depth relationships away, breadth first.
 
     {"nodes": {
         id: {
             "color": "",
-            "label": ""
+            "label": "",
+            "url": ""
         },
     "edges": {
         id: {
@@ -68,7 +102,12 @@ def create_generic_graph(root_node, graph_dict=None):
                 "label": ""
             }
         }
+    },
+    "truncated": false
     }
+
+    :param depth: Number of relationships to follow from the root node
+    :param max_nodes: Number of nodes in the graph at most, None for no limit
     """
     if not graph_dict:
         graph_dict = {'nodes': defaultdict(dict), 'edges': defaultdict(dict)}
@@ -80,38 +119,121 @@ def create_generic_graph(root_node, graph_dict=None):
             'fixed': True,
         }
     })
-
-    q = """
-        MATCH (n:Node {handle_id: {handle_id}})-[r]->(end)
-        WHERE NOT end.operational_state IN ['Decommissioned'] OR NOT exists(end.operational_state)
-        RETURN type(r) as relation, collect(distinct end) as nodes
-        """
-    relations = nc.query_to_list(nc.graphdb.manager, q, handle_id=root_node.handle_id)
-    q = """
-        MATCH (n:Node {handle_id: {handle_id}})<-[r]-(start)
-        WHERE NOT start.operational_state IN ['Decommissioned'] OR NOT exists(start.operational_state)
-        RETURN type(r) as relation, collect(distinct start) as nodes
-        """
-    dependencies = nc.query_to_list(nc.graphdb.manager, q, handle_id=root_node.handle_id)
-    for rel in relations:
-        rel_type = rel['relation'].replace('_', ' ')
-        for node in rel['nodes']:
-            graph_dict['nodes'].update(to_arbor_node(node))
-        graph_dict['edges'][root_node.handle_id].update({n['handle_id']: {"directed": True, "label": rel_type} for n in rel['nodes']})
-
-    for dep in dependencies:
-        rel_type = dep['relation'].replace('_', ' ')
-        for node in dep['nodes']:
-            graph_dict['nodes'].update(to_arbor_node(node))
-            graph_dict['edges'][node['handle_id']].update({root_node.handle_id: {"directed": True, "label": rel_type}})
-    urls = get_node_urls(root_node, relations, dependencies)
+    truncated = False
+    frontier = [root_node.handle_id]
+    for i in range(depth):
+        if not frontier:
+            break
+        found = []
+        for item in nc.query_to_list(nc.graphdb.manager, NEIGHBOURS_QUERY, handle_ids=frontier):
+            node = item['other']
+            handle_id = node['handle_id']
+            if handle_id not in graph_dict['nodes']:
+                if max_nodes is not None and len(graph_dict['nodes']) >= max_nodes:
+                    truncated = True
+                    continue
+                graph_dict['nodes'].update(to_arbor_node(node))
+                found.append(handle_id)
+            start, end = (item['handle_id'], handle_id) if item['outgoing'] else (handle_id, item['handle_id'])
+            graph_dict['edges'][start].update({end: {'directed': True, 'label': item['relation'].replace('_', ' ')}})
+        frontier = found
+    handles = NodeHandle.objects.filter(handle_id__in=list(graph_dict['nodes'])).select_related('node_type')
+    urls = dict((nh.handle_id, nh.get_absolute_url()) for nh in handles)
     for node in graph_dict['nodes']:
         graph_dict['nodes'][node]['url'] = urls.get(node)
+    graph_dict['truncated'] = truncated
     return graph_dict
 
 
 def get_json(graph_dict):
     """
-    Converts a graph_list to JSON and returns the JSON string.
+    Converts a graph_list to compact JSON and returns the JSON string.
+    """
+    return json.dumps(graph_dict, separators=(',', ':'))
+
+
+def _token(key):
+    token = cache.get(key)
+    if token is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        token = cache.get(key)
+    return token
+
+
+def _generation():
+    return _token(GENERATION_KEY)
+
+
+def _node_tokens(handle_ids, create=False):
+    """
+    :param create: Add tokens for the nodes that have none, so a cached graph of them can not be mistaken as current
+    :return: Dict of handle_id and token
+    """
+    keys = dict((NODE_TOKEN_KEY.format(handle_id), handle_id) for handle_id in handle_ids)
+    tokens = cache.get_many(list(keys))
+    if create and len(tokens) < len(keys):
+        cache.set_many(dict((key, uuid.uuid4().hex) for key in keys if key not in tokens), None)
+        tokens = cache.get_many(list(keys))
+    return dict((keys[key], token) for key, token in tokens.items())
+
+
+def get_graph(handle_id, depth=1, max_nodes=None):
+    """
+    :return: (JSON string of the graph of handle_id, its ETag), see create_generic_graph. The JSON is {} when the
+    node does not exist in neo4j.
+    """
+    key = 'noclook:arborgraph:{}:{}:{}:{}'.format(_generation(), handle_id, depth, max_nodes)
+    cached = cache.get(key)
+    if cached is not None and _node_tokens(cached['tokens']) != cached['tokens']:
+        cached = None
+    metrics.cache_lookup('arborgraph', hit=cached is not None)
+    if cached is None:
+        # The node tokens are read after the graph is computed, they are as old as the graph only if no tokens
+        # changed in the meantime
+        changes = _token(CHANGES_KEY)
+        try:
+            root_node = nc.get_node_model(nc.graphdb.manager, handle_id)
+        except nc.exceptions.NodeNotFound:
+            root_node = None
+        graph_dict = create_generic_graph(root_node, depth=depth, max_nodes=max_nodes) if root_node else {}
+        jsonstr = get_json(graph_dict)
+        cached = {
+            'json': jsonstr,
+            'etag': '"{}"'.format(hashlib.md5(jsonstr.encode('utf-8')).hexdigest()),
+            'tokens': _node_tokens(graph_dict.get('nodes', [handle_id]), create=True),
+        }
+        if _token(CHANGES_KEY) == changes:
+            cache.set(key, cached, settings.VISUALIZE_CACHE_TIMEOUT)
+    return cached['json'], cached['etag']
+
+
+def invalidate(*handle_ids):
     """
-    return json.dumps(graph_dict, indent=4)
+    Changes the tokens of handle_ids, the cached graphs containing any of them are no longer used.
+    """
+    # Before the node tokens, a graph computed meanwhile is not cached with any of the new tokens
+    cache.set(CHANGES_KEY, uuid.uuid4().hex, None)
+    cache.set_many(dict((NODE_TOKEN_KEY.format(handle_id), uuid.uuid4().hex) for handle_id in handle_ids), None)
+
+
+def clear():
+    """
+    Drops all cached graphs.
+    """
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def _action_handler(sender, instance, created, **kwargs):
+    if not created:
+        return
+    noclook = (instance.data or {}).get('noclook', {})
+    if noclook.get('action_type') == 'node' and instance.verb == 'delete':
+        transaction.on_commit(clear)
+        return
+    handle_ids = [int(object_id) for object_id in (instance.action_object_object_id, instance.target_object_id)
+                  if object_id]
+    if handle_ids:
+        transaction.on_commit(lambda: invalidate(*handle_ids))
+
+
+post_save.connect(_action_handler, sender=Action, dispatch_uid='noclook.arborgraph.action')
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Conditional GET for the detail, list and API views from the modification watermarks of nodes and node types.
+
+The page of a node shows nodes several relationships away, the location path of a router, the equipment at the far
+end of its connections or the services depending on its ports. The watermark of a node is the latest
+NodeHandle.modified or NodeHandle.watermark of its neighbourhood, the nodes reached by the NEIGHBOURHOOD patterns.
+NodeHandle.modified moves when the node or its relationships change, NodeHandle.watermark when something else shown
+with the node changes, like comments, attachments or a deleted neighbour. The neighbourhood of each node is cached
+together with the watermark it had when it was walked. A relationship created or deleted elsewhere can only change the
+neighbourhood when one of its ends is in it, and then NodeHandle.modified of that end moves, so the neighbourhood is
+walked again only when its watermark moved past the cached one. A client that already has the current version of a
+page gets 304 Not Modified after a cache lookup and one SQL query, without any neo4j query. Pages of nodes with more
+than CONDITIONAL_GET_MAX_NODES nodes in their neighbourhood are always rendered.
+
+The watermark of a node type is NodeType.modified, activitylog moves it for every change of a node of the type.
+
+The validators also change every CONDITIONAL_GET_INTERVAL seconds, for what depends on the time, like expired
+nodes. The ETag also depends on the user and the CSRF cookie, as pages differ per user and embed the CSRF token.
+"""
+
+import calendar
+import hashlib
+from functools import wraps
+from time import time
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from apps.noclook import metrics, topology
+from apps.noclook.models import NodeHandle, NodeType
+from apps.noclook.topology import OUT, IN, BOTH
+
+HAS_PARENT = ('Has', IN)
+HAS_CHILD = ('Has', OUT)
+LOCATED_IN = ('Located_in', OUT)
+USER_TYPES = ('Uses', 'Owns', 'Provides', 'Responsible_for')
+DEPENDENCY_TYPES = ('Depends_on', 'Part_of')
+
+# Patterns of what the detail pages show, lists of (steps, max depth) stages. A stage follows its steps from all
+# nodes reached by the stages before it, None for no depth limit. CONNECTION_PATH_MAX_DEPTH is read when walking.
+CONNECTION_PATH = 'connection_path'
+NEIGHBOURHOOD = (
+    # Related nodes, parent and children
+    [(tuple((rel_type, BOTH) for rel_type in USER_TYPES + DEPENDENCY_TYPES + ('Has', 'Located_in', 'Connected_to')),
+      1)],
+    # Location path
+    [((HAS_PARENT,), None), ((LOCATED_IN,), 1), ((HAS_PARENT,), None)],
+    # Connections and connection paths of the ports, with the equipment and location at the far ends
+    [((HAS_CHILD,), 2), ((('Connected_to', BOTH),), CONNECTION_PATH), ((HAS_PARENT,), None), ((LOCATED_IN,), 1),
+     ((HAS_PARENT,), None)],
+    # Dependents
+    [((HAS_CHILD,), 2), (tuple((rel_type, IN) for rel_type in DEPENDENCY_TYPES), None), ((('Uses', IN),), 1)],
+    # Dependencies, also of what the node uses, with their parents
+    [((('Uses', OUT),), 1), (tuple((rel_type, OUT) for rel_type in DEPENDENCY_TYPES), None), ((HAS_PARENT,), None)],
+)
+
+
+def _walk(handle_id, pattern, max_nodes):
+    # One neo4j query per stage, a node that does not exist reaches nothing and has no watermark
+    reached = {handle_id}
+    for steps, max_depth in pattern:
+        if max_depth == CONNECTION_PATH:
+            max_depth = settings.CONNECTION_PATH_MAX_DEPTH
+        reached |= topology.reachable(reached, steps, max_depth, current=True)
+        if len(reached) > max_nodes:
+            return None
+    return reached
+
+
+def _watermark(handle_ids):
+    return NodeHandle.objects.filter(handle_id__in=handle_ids)\
+        .aggregate(watermark=Max(Greatest('modified', 'watermark')))['watermark']
+
+
+def _walk_neighbourhood(handle_id):
+    max_nodes = settings.CONDITIONAL_GET_MAX_NODES
+    handle_ids = {handle_id}
+    for pattern in NEIGHBOURHOOD:
+        reached = _walk(handle_id, pattern, max_nodes)
+        if reached is None:
+            return None
+        handle_ids |= reached
+        if len(handle_ids) > max_nodes:
+            return None
+    return handle_ids
+
+
+def _neighbourhood(handle_id):
+    """
+    :return: (handle_ids, watermark) of the neighbourhood of the node, (None, None) if it is too large
+    """
+    key = 'noclook:neighbourhood:{}'.format(handle_id)
+    cached = cache.get(key)
+    if cached is not None:
+        handle_ids, walked = cached
+        # An empty set is cached for too large neighbourhoods, until the cache entry expires
+        watermark = _watermark(handle_ids) if handle_ids else None
+        hit = not handle_ids or (watermark is not None and watermark <= walked)
+        metrics.cache_lookup('neighbourhood', hit=hit)
+        if hit:
+            return handle_ids or None, watermark
+    else:
+        metrics.cache_lookup('neighbourhood', hit=False)
+    # Changes made while walking move the watermark past started, the next call walks again
+    started = timezone.now()
+    handle_ids = _walk_neighbourhood(handle_id)
+    watermark = _watermark(handle_ids) if handle_ids else None
+    if handle_ids is None or watermark is not None:
+        cache.set(key, (handle_ids or set(), watermark and min(watermark, started)),
+                  settings.CONDITIONAL_GET_NEIGHBOURHOOD_TIMEOUT)
+    return handle_ids, watermark
+
+
+def neighbourhood(handle_id):
+    """
+    :return: Set of the handle_ids of the nodes the page of the node shows, see NEIGHBOURHOOD, None if there are
+    more than CONDITIONAL_GET_MAX_NODES
+    """
+    return _neighbourhood(handle_id)[0]
+
+
+def node_watermark(handle_id):
+    """
+    :return: Modification watermark of the node and its neighbourhood, None if there is no such node or the
+    neighbourhood is too large
+    """
+    return _neighbourhood(handle_id)[1]
+
+
+def type_watermark(*slugs):
+    """
+    :return: Latest modification watermark of the node types, None if there are no such node types
+    """
+    return NodeType.objects.filter(slug__in=slugs).aggregate(Max('modified'))['modified__max']
+
+
+def interval_start():
+    """
+    :return: Timestamp of the start of the current CONDITIONAL_GET_INTERVAL
+    """
+    interval = settings.CONDITIONAL_GET_INTERVAL
+    return int(time()) // interval * interval
+
+
+def validators(request, watermark):
+    """
+    :return: (ETag, Last-Modified timestamp) of the response to request for the watermark
+    """
+    start = interval_start()
+    timestamp = max(calendar.timegm(watermark.utctimetuple()), start)
+    # Last-Modified has whole seconds, the ETag also changes for changes within the same second
+    parts = [watermark.isoformat(), start, request.user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')]
+    etag = '"{}"'.format(hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+    return etag, timestamp
+
+
+def conditional_response(request, watermark, get_response):
+    """
+    :param watermark: Modification watermark of what the response shows, None to always call get_response
+    :param get_response: Function returning the response
+    :return: 304 Not Modified when the client has the current version, else the response of get_response with
+    ETag and Last-Modified
+    """
+    # Pending messages are shown once, in the next page rendered
+    if request.method not in ('GET', 'HEAD') or watermark is None or len(messages.get_messages(request)):
+        return get_response()
+    etag, last_modified = validators(request, watermark)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = get_response()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Browsers keep the page but ask if it is still current
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def node_condition(view_func):
+    """
+    Conditional GET for views of the node with the handle_id keyword argument.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        return conditional_response(request, node_watermark(kwargs['handle_id']),
+                                    lambda: view_func(request, *args, **kwargs))
+    return _wrapped_view
+
+
+def type_condition(*slugs):
+    """
+    Conditional GET for views listing the nodes of the node types slugs, by default the type of the slug keyword
+    argument.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            return conditional_response(request, type_watermark(*(slugs or [kwargs['slug']])),
+                                        lambda: view_func(request, *args, **kwargs))
+        return _wrapped_view
+    return decorator
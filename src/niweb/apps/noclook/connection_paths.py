@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end physical connection paths of cables and ports.
+
+A connection path is the chain of ports and cables joined by Connected_to relationships, eg. router port, cable,
+patch panel port, cable, patch panel port, cable and switch port, each part with the top equipment that has it.
+Instead of the variable length path Cypher of the node models the chain is found from the Connected_to component of
+the node, the nodes at most CONNECTION_PATH_MAX_DEPTH relationships away from topology.reachable and their
+relationships from one topology.expand, ordered from one end of its longest path to the other.
+
+The handle_ids of the path are cached, keyed on the topology version of Connected_to and Has, for every part of the
+path at once, so the other cables and ports of a chain are cache hits. The node data shown is always fetched fresh.
+paths and endpoints take many handle_ids for list views.
+"""
+
+import logging
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.noclook import metrics, topology
+from apps.noclook.models import NodeHandle
+from apps.noclook.topology import IN, BOTH
+import norduniclient as nc
+
+logger = logging.getLogger('noclook.connection_paths')
+
+CONNECTED = (('Connected_to', BOTH),)
+HAS_PARENT = (('Has', IN),)
+
+NODES_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {handle_ids}
+    RETURN n
+    """
+
+
+def _cache_key(version, handle_id):
+    return 'noclook:connection_path:{}:{}'.format(version, handle_id)
+
+
+def _components(roots, max_depth):
+    """
+    :return: Dict of handle_id and neighbours of all nodes at most max_depth Connected_to relationships from roots
+    """
+    roots = list(OrderedDict.fromkeys(roots))
+    if not roots:
+        return {}
+    reached = topology.reachable(roots, CONNECTED, max_depth, current=True)
+    adjacency = topology.expand(roots + sorted(reached - set(roots)), CONNECTED, current=True)
+    # Neighbours beyond max_depth are not part of the components
+    return dict((handle_id, [n for n in ns if n in adjacency]) for handle_id, ns in adjacency.items())
+
+
+def _farthest(adjacency, start):
+    """
+    :return: (farthest handle_id from start, dict of handle_id and parent on the way from start)
+    """
+    parents = {start: None}
+    queue = deque([start])
+    last = start
+    while queue:
+        last = queue.popleft()
+        for n in adjacency.get(last, []):
+            if n not in parents:
+                parents[n] = last
+                queue.append(n)
+    return last, parents
+
+
+def _longest_path(adjacency, start):
+    """
+    :return: List of handle_ids from one end of the component of start to the other, exact for chains
+    """
+    end, parents = _farthest(adjacency, start)
+    other_end, parents = _farthest(adjacency, end)
+    path = [other_end]
+    while parents[path[-1]] is not None:
+        path.append(parents[path[-1]])
+    return path
+
+
+def _top_parents(handle_ids, max_depth):
+    """
+    :return: Dict of handle_id and the handle_id of the top node of the Has chain above it, None for top nodes
+    """
+    parent_of = {}
+    frontier = list(handle_ids)
+    expanded = set(frontier)
+    for depth in range(max_depth):
+        if not frontier:
+            break
+        found = topology.expand(frontier, HAS_PARENT, current=True)
+        frontier = []
+        for child, parents in found.items():
+            if parents:
+                parent_of[child] = parents[0]
+                if parents[0] not in expanded:
+                    expanded.add(parents[0])
+                    frontier.append(parents[0])
+    result = {}
+    for handle_id in handle_ids:
+        top = parent_of.get(handle_id)
+        for i in range(max_depth):
+            if top not in parent_of:
+                break
+            top = parent_of[top]
+        result[handle_id] = top
+    return result
+
+
+def compute(handle_ids):
+    """
+    :return: Dict of handle_id and path, a list of (part handle_id, top parent handle_id or None)
+    """
+    max_depth = settings.CONNECTION_PATH_MAX_DEPTH
+    adjacency = _components(handle_ids, max_depth)
+    paths = {}
+    for handle_id in handle_ids:
+        if handle_id in paths:
+            continue
+        if not adjacency.get(handle_id):
+            paths[handle_id] = []
+            continue
+        path = _longest_path(adjacency, handle_id)
+        # All nodes of the component share the path, also those off the longest path of a branching component
+        for part in _farthest(adjacency, handle_id)[1]:
+            paths[part] = path
+    parts = set(part for path in paths.values() for part in path)
+    parents = _top_parents(sorted(parts), max_depth)
+    return dict((handle_id, [(part, parents[part]) for part in path]) for handle_id, path in paths.items())
+
+
+def paths(handle_ids):
+    """
+    :param handle_ids: Cables and ports
+    :return: Dict of handle_id and path, a list of (part handle_id, top parent handle_id or None), empty when the
+    node is not connected
+    """
+    handle_ids = list(OrderedDict.fromkeys(handle_ids))
+    version = topology.version('Connected_to', 'Has')
+    keys = dict((_cache_key(version, handle_id), handle_id) for handle_id in handle_ids)
+    cached = cache.get_many(list(keys))
+    result = dict((keys[key], path) for key, path in cached.items())
+    missing = [handle_id for handle_id in handle_ids if handle_id not in result]
+    for handle_id in handle_ids:
+        metrics.cache_lookup('connection_path', hit=handle_id in result)
+    if missing:
+        computed = compute(missing)
+        cache.set_many(dict((_cache_key(version, handle_id), path) for handle_id, path in computed.items()),
+                       settings.CONNECTION_PATH_CACHE_TIMEOUT)
+        result.update((handle_id, computed[handle_id]) for handle_id in missing)
+    return result
+
+
+def get_connection_path(handle_id):
+    """
+    :return: List of dicts with part and parent, the node data of the parts of the path, like the
+    get_connection_path of the node models
+    """
+    path = paths([handle_id])[handle_id]
+    handle_ids = set(part for part, parent in path) | set(parent for part, parent in path if parent is not None)
+    nodes = {}
+    if handle_ids:
+        for item in nc.query_to_list(nc.graphdb.manager, NODES_QUERY, handle_ids=list(handle_ids)):
+            nodes[item['n']['handle_id']] = item['n']
+    return [{'part': nodes.get(part, {'handle_id': part}), 'parent': nodes.get(parent) if parent else None}
+            for part, parent in path]
+
+
+def endpoints(handle_ids):
+    """
+    :param handle_ids: Cables and ports
+    :return: Dict of handle_id and list of the two ends of its path, dicts with the handle_id of the end part and
+    name, the name of the top parent and the part. Empty list when the node is not connected.
+    """
+    all_paths = paths(handle_ids)
+    ends = {}
+    for handle_id, path in all_paths.items():
+        ends[handle_id] = [path[0], path[-1]] if len(path) > 1 else list(path)
+    names = dict(NodeHandle.objects.filter(handle_id__in=set(h for end in ends.values() for part in end
+                                                            for h in part if h is not None))
+                 .values_list('handle_id', 'node_name'))
+    result = {}
+    for handle_id, end in ends.items():
+        result[handle_id] = [{
+            'handle_id': part,
+            'name': ' '.join(names[h] for h in (parent, part) if h in names),
+        } for part, parent in end]
+    return result
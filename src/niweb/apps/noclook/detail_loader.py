@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent loading of the data shown on the detail pages.
+
+The detail views ask neo4j for the location path, connections, dependents, dependencies and so on of a node. The
+queries are independent of each other, run one after the other the page takes the sum of their times. load runs them
+on a shared thread pool instead, each query in its own driver session, so the page takes about as long as the slowest
+query. The pool is bounded by NEO4J_QUERY_THREADS.
+
+    location_path, connections = detail_loader.load(router, 'get_location_path', 'get_connections')
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from apps.noclook import neo4j_instrumentation
+
+logger = logging.getLogger('noclook.detail_loader')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def max_threads():
+    return max(1, int(getattr(settings, 'NEO4J_QUERY_THREADS', 8)))
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_threads(), thread_name_prefix='noclook-neo4j')
+        return _executor
+
+
+def _in_collector(collector, call):
+    def run():
+        with neo4j_instrumentation.use_collector(collector):
+            return call()
+    return run
+
+
+def run_concurrently(*calls):
+    """
+    Runs the calls, functions without arguments, on the thread pool. The calls must not use the Django database, the
+    pool threads do not close their database connections.
+
+    :return: List of the results in the order of the calls
+    :raises: The exception of the first failing call
+    """
+    if len(calls) < 2 or max_threads() == 1:
+        return [call() for call in calls]
+    # Queries made in the pool threads count towards the query budget and metrics of the request
+    collector = neo4j_instrumentation.current_collector()
+    futures = [get_executor().submit(_in_collector(collector, call)) for call in calls]
+    return [future.result() for future in futures]
+
+
+def load(node, *methods):
+    """
+    Calls the methods of the node model concurrently.
+
+    :param node: norduniclient node model
+    :param methods: Method names, eg. 'get_location_path'
+    :return: List of the method results in the order of methods
+    """
+    return run_concurrently(*[getattr(node, method) for method in methods])
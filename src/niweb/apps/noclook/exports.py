@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export of tabular data (iterables of dicts) to CSV, XLSX and NDJSON.
+
+Rows are consumed from an iterable and written one by one to a StreamingHttpResponse so that large exports never need
+to be held in memory. The header is either supplied or sampled from the first rows.
+"""
+
+import csv
+import math
+import re
+import zipfile
+from itertools import chain, islice
+from xml.sax.saxutils import escape
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = ('csv', 'xlsx', 'ndjson')
+
+# Number of rows used to find the header if no header is supplied
+HEADER_SAMPLE_SIZE = 1000
+# Number of rows to write between handing data back to the response
+XLSX_CHUNK_ROWS = 500
+# Rows per sheet in the xlsx format, including the header row
+XLSX_MAX_ROWS = 1048576
+# Characters that are not allowed in XML 1.0 documents
+_illegal_xml_chars = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_illegal_sheet_name_chars = re.compile(r'[\[\]:*?/\\]')
+
+
+def normalize_whitespace(s):
+    """
+    Removes leading and ending whitespace from a string.
+    """
+    try:
+        return u' '.join(s.split())
+    except AttributeError:
+        return s
+
+
+def header_keys(rows):
+    """
+    Returns a sorted list of the union of the keys of all rows.
+
+    :param rows: Iterable of dicts
+    :return: List of keys
+    """
+    key_set = set()
+    for item in rows:
+        key_set.update(item.keys())
+    return sorted(key_set)
+
+
+def sample_header(rows, sample_size=HEADER_SAMPLE_SIZE):
+    """
+    Reads the first sample_size rows and returns a sorted list of all their keys together with an iterator that
+    still yields all rows.
+
+    :param rows: Iterable of dicts
+    :param sample_size: Integer
+    :return: Tuple of header list and row iterator
+    """
+    rows = iter(rows)
+    sample = list(islice(rows, sample_size))
+    return header_keys(sample), chain(sample, rows)
+
+
+def _header_and_rows(rows, header=None):
+    if header:
+        return header, iter(rows)
+    return sample_header(rows)
+
+
+def row_values(item, header):
+    """
+    Returns the values of item in header order with normalized whitespace, missing keys are returned as ''.
+    """
+    values = []
+    for key in header:
+        try:
+            values.append(normalize_whitespace(item[key]))
+        except KeyError:
+            values.append(u'')  # Node did not have that key, add a blank item.
+    return values
+
+
+class Echo(object):
+    """
+    File-like object that returns what is written to it instead of buffering it, see the Django documentation on
+    streaming large CSV files.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, header):
+    """
+    Yields the header followed by each row as CSV formatted lines.
+    """
+    writer = csv.writer(Echo(), dialect=csv.excel, delimiter=',', quoting=csv.QUOTE_NONNUMERIC)
+    yield writer.writerow(header)
+    for item in rows:
+        yield writer.writerow([u'%s' % value for value in row_values(item, header)])
+
+
+def ndjson_lines(rows, header=None):
+    """
+    Yields each row as a JSON document on its own line. If header is supplied only those keys are included.
+    """
+    encoder = DjangoJSONEncoder()
+    for item in rows:
+        if header:
+            item = dict(zip(header, row_values(item, header)))
+        yield encoder.encode(dict(item)) + '\n'
+
+
+class _StreamBuffer(object):
+    """
+    Unseekable file-like object that collects written bytes until they are drained.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _column_name(index):
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def _xlsx_cell(ref, value):
+    # NaN and infinity are not valid numeric cell values, they are written as strings
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+        return u'<c r="{}"><v>{}</v></c>'.format(ref, value)
+    if value is None:
+        value = u''
+    value = _illegal_xml_chars.sub(u'', u'%s' % value)
+    return u'<c r="{}" t="inlineStr"><is><t xml:space="preserve">{}</t></is></c>'.format(ref, escape(value))
+
+
+def _xlsx_row(row_number, values):
+    cells = u''.join(_xlsx_cell(u'{}{}'.format(_column_name(i), row_number), value) for i, value in enumerate(values))
+    return u'<row r="{}">{}</row>'.format(row_number, cells)
+
+
+def _sheet_names(sheet_name, num_sheets):
+    base = _illegal_sheet_name_chars.sub(u' ', sheet_name or u'Sheet')[:31]
+    names = [base]
+    for i in range(2, num_sheets + 1):
+        suffix = u' ({})'.format(i)
+        names.append(base[:31 - len(suffix)] + suffix)
+    return names
+
+
+_XLSX_CONTENT_TYPES = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    u'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    u'<Default Extension="xml" ContentType="application/xml"/>'
+    u'<Override PartName="/xl/workbook.xml" '
+    u'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    u'{sheets}</Types>'
+)
+_XLSX_SHEET_CONTENT_TYPE = (
+    u'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+    u'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_XLSX_ROOT_RELS = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    u'<Relationship Id="rId1" '
+    u'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    u'Target="xl/workbook.xml"/></Relationships>'
+)
+_XLSX_WORKBOOK = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    u'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    u'<sheets>{sheets}</sheets></workbook>'
+)
+_XLSX_WORKBOOK_SHEET = u'<sheet name="{name}" sheetId="{n}" r:id="rId{n}"/>'
+_XLSX_WORKBOOK_RELS = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{sheets}</Relationships>'
+)
+_XLSX_WORKBOOK_SHEET_REL = (
+    u'<Relationship Id="rId{n}" '
+    u'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    u'Target="worksheets/sheet{n}.xml"/>'
+)
+_XLSX_SHEET_START = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_XLSX_SHEET_END = u'</sheetData></worksheet>'
+
+
+def xlsx_chunks(rows, header, sheet_name, max_rows=XLSX_MAX_ROWS):
+    """
+    Yields an Office Open XML workbook as chunks of bytes. Rows that do not fit in one sheet are continued in
+    a new sheet with the header repeated.
+
+    :param rows: Iterable of dicts
+    :param header: List of unique strings
+    :param sheet_name: String
+    :param max_rows: Maximum number of rows per sheet, including the header row
+    :return: Generator of bytes
+    """
+    rows = iter(rows)
+    buf = _StreamBuffer()
+    num_sheets = 0
+    with zipfile.ZipFile(buf, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        item = next(rows, None)
+        while num_sheets == 0 or item is not None:
+            num_sheets += 1
+            # The size of a sheet is not known up front, it may need the ZIP64 extensions
+            with zf.open('xl/worksheets/sheet{}.xml'.format(num_sheets), mode='w', force_zip64=True) as sheet:
+                sheet.write(_XLSX_SHEET_START.encode('utf-8'))
+                sheet.write(_xlsx_row(1, header).encode('utf-8'))
+                row_number = 1
+                while item is not None and row_number < max_rows:
+                    row_number += 1
+                    sheet.write(_xlsx_row(row_number, row_values(item, header)).encode('utf-8'))
+                    if row_number % XLSX_CHUNK_ROWS == 0:
+                        yield buf.drain()
+                    item = next(rows, None)
+                sheet.write(_XLSX_SHEET_END.encode('utf-8'))
+            yield buf.drain()
+        sheet_numbers = range(1, num_sheets + 1)
+        names = _sheet_names(sheet_name, num_sheets)
+        zf.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(sheets=u''.join(
+            _XLSX_WORKBOOK_SHEET.format(name=escape(names[n - 1], {'"': '&quot;'}), n=n) for n in sheet_numbers)))
+        zf.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS.format(
+            sheets=u''.join(_XLSX_WORKBOOK_SHEET_REL.format(n=n) for n in sheet_numbers)))
+        zf.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        zf.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES.format(
+            sheets=u''.join(_XLSX_SHEET_CONTENT_TYPE.format(n=n) for n in sheet_numbers)))
+    yield buf.drain()
+
+
+def csv_response(rows, header=None, file_name='result.csv'):
+    """
+    Takes an iterable of dicts and returns a streaming response with a comma separated file of the header keys and
+    their values. If header is not supplied it is sampled from the first rows.
+    """
+    header, rows = _header_and_rows(rows, header)
+    response = StreamingHttpResponse(csv_lines(rows, header), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename={}; charset=utf-8;'.format(file_name)
+    return response
+
+
+def xlsx_response(rows, header=None, file_name='result.xlsx', sheet_name='NOCLook result'):
+    """
+    Takes an iterable of dicts and returns a streaming response with an Excel (xlsx) file of the header keys and
+    their values. If header is not supplied it is sampled from the first rows.
+    """
+    header, rows = _header_and_rows(rows, header)
+    response = StreamingHttpResponse(
+        xlsx_chunks(rows, header, sheet_name),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response['Content-Disposition'] = 'attachment; filename={};'.format(file_name)
+    return response
+
+
+def ndjson_response(rows, header=None, file_name='result.ndjson'):
+    """
+    Takes an iterable of dicts and returns a streaming response with one JSON document per row.
+    """
+    response = StreamingHttpResponse(ndjson_lines(rows, header), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename={};'.format(file_name)
+    return response
+
+
+def export_response(rows, file_format, header=None, file_name='result', sheet_name='NOCLook result'):
+    """
+    Returns a streaming response of rows in file_format, one of EXPORT_FORMATS.
+
+    :param rows: Iterable of dicts
+    :param file_format: String
+    :param header: List of unique strings
+    :param file_name: File name without extension
+    :param sheet_name: String, only used for xlsx
+    :return: StreamingHttpResponse
+    """
+    file_name = u'{}.{}'.format(file_name, file_format)
+    if file_format == 'csv':
+        return csv_response(rows, header, file_name)
+    elif file_format == 'xlsx':
+        return xlsx_response(rows, header, file_name, sheet_name)
+    elif file_format == 'ndjson':
+        return ndjson_response(rows, header, file_name)
+    raise ValueError('Unsupported export format: {}'.format(file_format))
+
+
+def requested_format(request):
+    """
+    Returns the export format asked for with the format query parameter or None.
+    """
+    file_format = request.GET.get('format')
+    if file_format in EXPORT_FORMATS:
+        return file_format
+    return None
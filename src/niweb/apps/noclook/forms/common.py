@@ -6,7 +6,7 @@ from django.db import IntegrityError
 import json
 import csv
 from apps.noclook.models import NodeHandle, UniqueIdGenerator, ServiceType, NordunetUniqueId, Dropdown, SwitchType
-from .. import unique_ids
+from .. import unique_ids, reference_data
 import norduniclient as nc
 from dynamic_preferences.registries import global_preferences_registry
 from io import StringIO
@@ -648,8 +648,7 @@ class NewServiceForm(forms.Form):
         self.fields['operational_state'].choices = Dropdown.get('operational_states').as_choices()
         self.fields['responsible_group'].choices = Dropdown.get('responsible_groups').as_choices()
         self.fields['support_group'].choices = Dropdown.get('responsible_groups').as_choices()
-        service_types = ServiceType.objects.all().prefetch_related('service_class').order_by('service_class__name', 'name')
-        self.fields['service_type'].choices = [t.as_choice() for t in service_types]
+        self.fields['service_type'].choices = [t.as_choice() for t in reference_data.service_types()]
 
     class Meta:
         id_generator_property = 'id_generators__services'
@@ -693,8 +692,7 @@ class EditServiceForm(forms.Form):
         self.fields['operational_state'].choices = Dropdown.get('operational_states').as_choices()
         self.fields['responsible_group'].choices = Dropdown.get('responsible_groups').as_choices()
         self.fields['support_group'].choices = Dropdown.get('responsible_groups').as_choices()
-        service_types = ServiceType.objects.all().prefetch_related('service_class').order_by('service_class__name', 'name')
-        self.fields['service_type'].choices = [t.as_choice() for t in service_types]
+        self.fields['service_type'].choices = [t.as_choice() for t in reference_data.service_types()]
         self.fields['relationship_provider'].choices = get_node_type_tuples('Provider')
 
     name = forms.CharField(required=False)
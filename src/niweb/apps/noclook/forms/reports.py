@@ -1,4 +1,5 @@
 from django import forms
+from django.db.models import Q
 from datetime import date, timedelta
 
 OPERATIONAL_STATE = [
@@ -37,6 +38,25 @@ class HostReportForm(forms.Form):
             q = " WHERE (" + ") and (".join(conditions)+")"
         return q
 
+    def to_filter(self):
+        """
+        The same conditions as to_where but as a Q object for models with noclook_last_seen and operational_state
+        fields, eg. HostSnapshot.
+        """
+        q = Q()
+        if self.is_valid():
+            data = self.cleaned_data
+            if data['cut_off'] and data['cut_off'] != "All":
+                cut_off = (date.today() - timedelta(int(data['cut_off']))).strftime("%Y-%m-%d")
+                q &= Q(noclook_last_seen__gte=cut_off)
+            if data['operational_state']:
+                states = [state for state in data['operational_state'] if state != "Not set"]
+                q_state = Q(operational_state__in=states)
+                if "Not set" in data['operational_state']:
+                    q_state |= Q(operational_state__isnull=True)
+                q &= q_state
+        return q
+
 
 def _append_not_empty(arr, item):
     if item:
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Hardware module trees of routers and switches.
+
+The juniper consumer stores the hardware of a router or switch once per run with store, as a parsed tree in a
+HardwareInventory row keyed on the node together with a hash of its content. The detail pages load it with
+get_inventory, one primary key lookup, and show the text of render, cached per content hash so it is only built
+again when the hardware changes.
+
+Nodes that only have the {name}-hardware.json attachment of older consumer runs are moved to the store the first
+time their page is shown.
+"""
+
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.noclook import helpers, metrics
+from apps.noclook.models import HardwareInventory
+from apps.noclook.templatetags.noclook_tags import hardware_module
+
+logger = logging.getLogger('noclook.hardware')
+
+
+def attachment_name(node_name):
+    """
+    :return: Name of the hardware attachment of the node node_name
+    """
+    return '{}-hardware.json'.format(node_name)
+
+
+def content_hash(modules):
+    """
+    :return: SHA-256 hex digest of the modules as canonical JSON
+    """
+    return hashlib.sha256(json.dumps(modules, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def store(handle_id, modules):
+    """
+    :param modules: Hardware module tree, a dict with modules, sub_modules or sub-modules lists
+    :return: (HardwareInventory, True if the content changed)
+    """
+    new_hash = content_hash(modules)
+    inventory = HardwareInventory.objects.filter(node_handle_id=handle_id).first()
+    if inventory and inventory.content_hash == new_hash:
+        return inventory, False
+    inventory = inventory or HardwareInventory(node_handle_id=handle_id)
+    inventory.modules = modules
+    inventory.content_hash = new_hash
+    inventory.save()
+    return inventory, True
+
+
+def _from_attachment(nh, node_name):
+    attachment = helpers.find_attachments(nh.handle_id, attachment_name(node_name)).first()
+    if not attachment:
+        return None
+    try:
+        modules = json.loads(helpers.attachment_content(attachment))
+    except IOError as e:
+        logger.warning('Missing hardware modules json for %s(%s). Error was: %s', nh.node_name, nh.handle_id, e)
+        return None
+    return store(nh.handle_id, modules)[0]
+
+
+def get_inventory(nh, node_name=None):
+    """
+    :param nh: NodeHandle of the router or switch
+    :param node_name: Name of the node in neo4j if it differs from nh.node_name, for the legacy attachment
+    :return: HardwareInventory of the node, None if there is no hardware information
+    """
+    inventory = HardwareInventory.objects.filter(node_handle_id=nh.handle_id).first()
+    if inventory is None:
+        inventory = _from_attachment(nh, node_name or nh.node_name)
+    return inventory
+
+
+def render(inventory):
+    """
+    :return: The hardware module tree of inventory as indented text, as shown on the detail pages
+    """
+    key = 'noclook:hardware:{}'.format(inventory.content_hash)
+    text = cache.get(key)
+    metrics.cache_lookup('hardware', hit=text is not None)
+    if text is None:
+        text = hardware_module(inventory.modules)
+        cache.set(key, text, settings.HARDWARE_CACHE_TIMEOUT)
+    return text
@@ -8,37 +8,32 @@ Created on Mon Apr  2 11:17:57 2012
 import socket
 from django.conf import settings as django_settings
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.mail import EmailMessage
 from datetime import datetime, timedelta
-from actstream.models import action_object_stream, target_stream
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-import csv
 import xlwt
 import re
 import os
+import logging
 from neo4j.v1.types import Node
 
 from .models import NodeHandle, NodeType
 from . import activitylog
+from . import reference_data
+from . import exports
+from .exports import normalize_whitespace
 import norduniclient as nc
 from norduniclient.exceptions import UniqueNodeError, NodeNotFound
 
 # File upload
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
 from attachments.models import Attachment
 from django.contrib.contenttypes.models import ContentType
 
-
-def normalize_whitespace(s):
-    """
-    Removes leading and ending whitespace from a string.
-    """
-    try:
-        return u' '.join(s.split())
-    except AttributeError:
-        return s
+logger = logging.getLogger('noclook.helpers')
 
 
 def get_node_url(handle_id):
@@ -342,30 +337,18 @@ def neo4j_report_age(item, old, very_old):
 
 def dicts_to_csv_response(dict_list, header=None, file_name='result.csv'):
     """
-    Takes a list of dicts and returns a comma separated file with all dict keys
-    and their values.
+    Takes an iterable of dicts and returns a streaming comma separated file with the header keys and their values.
+    If header is omitted the keys of the first rows are used.
     """
-    # Create the HttpResponse object with the appropriate CSV header.
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename={}; charset=utf-8;'.format(file_name)
-    writer = csv.writer(response, dialect=csv.excel, delimiter=',', quoting=csv.QUOTE_NONNUMERIC)
-    if not header:
-        key_set = set()
-        for item in dict_list:
-            key_set.update(item.keys())
-        key_set = sorted(key_set)
-    else:
-        key_set = header
-    writer.writerow(key_set) # Line collection with header
-    for item in dict_list:
-        line = []
-        for key in key_set:
-            try:
-                line.append('%s' % normalize_whitespace(item[key]))
-            except KeyError:
-                line.append('') # Node did not have that key, add a blank item.
-        writer.writerow(line)
-    return response
+    return exports.csv_response(dict_list, header, file_name)
+
+
+def dicts_to_xlsx_response(dict_list, header=None, file_name='result.xlsx', sheet_name='NOCLook result'):
+    """
+    Takes an iterable of dicts and returns a streaming response with an Excel (xlsx) file.
+    If header is omitted the keys of the first rows are used.
+    """
+    return exports.xlsx_response(dict_list, header, file_name, sheet_name)
 
 
 def dicts_to_xls(dict_list, header, sheet_name):
@@ -393,6 +376,7 @@ def dicts_to_xls(dict_list, header, sheet_name):
             ws.flush_row_data()
         if i == 65534:
             # Reached the limit of old xls format
+            logger.warning(u'Sheet "{}" truncated to 65535 rows, use xlsx for larger exports.'.format(sheet_name))
             break
     return wb
 
@@ -405,14 +389,10 @@ def dicts_to_xls_response(dict_list, header=None, file_name='result.xls', sheet_
     response = HttpResponse(content_type='application/excel')
     response['Content-Disposition'] = 'attachment; filename={};'.format(file_name)
 
+    dict_list = list(dict_list)
     if not header:
-        key_set = set()
-        for item in dict_list:
-            key_set.update(item.keys())
-        key_set = sorted(key_set)
-    else:
-        key_set = header
-    wb = dicts_to_xls(dict_list, key_set, sheet_name)
+        header = exports.header_keys(dict_list)
+    wb = dicts_to_xls(dict_list, header, sheet_name)
     wb.save(response)
     return response
 
@@ -443,10 +423,9 @@ def create_email(subject, body, to, cc=None, bcc=None, attachement=None, filenam
 def get_node_type(handle_id):
     model = nc.get_node_model(nc.graphdb.manager, handle_id)
     for t in model.labels:
-        try:
-            return NodeType.objects.get(type=t.replace('_', ' ')).type
-        except NodeType.DoesNotExist:
-            pass
+        node_type = reference_data.node_type_by_type(t.replace('_', ' '))
+        if node_type:
+            return node_type.type
 
 
 def labels_to_node_type(labels):
@@ -471,19 +450,12 @@ def slug_to_node_type(slug, create=False):
             node_type.type = type_name
             node_type.save()
     else:
-        node_type = get_object_or_404(NodeType, slug=slug)
+        node_type = reference_data.node_type_by_slug(slug)
+        if node_type is None:
+            raise Http404('No NodeType matches the given query.')
     return node_type
 
 
-def get_history(nh):
-    """
-    :param nh: NodeHandle
-    :return: List of ActStream actions
-    """
-    history = list(action_object_stream(nh)) + list(target_stream(nh))
-    return sorted(history, key=lambda action: action.timestamp, reverse=True)
-
-
 def create_unit(parent_node, unit_name, creator):
     """
     Creates a port with the supplied parent.
@@ -837,6 +809,65 @@ def get_node_urls(*args):
     return urls
 
 
+# Bulk versions of the node model queries depend_include.html made per row
+DEPENDENT_USERS_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {handle_ids}
+    MATCH (n)<-[:Uses]-(user)
+    RETURN n.handle_id as handle_id, user
+    """
+DEPENDENCY_PORTS_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {handle_ids}
+    MATCH (n)-[:Connected_to|Depends_on]-(port:Port)
+    OPTIONAL MATCH p=(port)<-[:Has*1..]-(parent)
+    RETURN n.handle_id as handle_id, port, LAST(nodes(p)) as parent
+    ORDER BY parent.name
+    """
+PLACEMENT_PATHS_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {handle_ids}
+    MATCH p=(n)<-[:Has*1..20]-(parent)
+    RETURN n.handle_id as handle_id, parent
+    ORDER BY length(p) DESC
+    """
+
+
+def get_related_rows(query, handle_ids, key=None):
+    """
+    :param query: Query with a handle_ids parameter returning rows with the handle_id they belong to
+    :param key: Column to collect, the whole row if None
+    :return: Dict of each of handle_ids and the list of its rows, in the order of the query
+    """
+    result = dict((handle_id, []) for handle_id in handle_ids)
+    if result:
+        for row in nc.query_to_list(nc.graphdb.manager, query, handle_ids=list(result)):
+            result[row['handle_id']].append(row[key] if key else row)
+    return result
+
+
+def get_dependency_details(dependent, dependencies):
+    """
+    What noclook/detail/includes/depend_include.html shows for each dependent and dependency, one query each instead
+    of one per row.
+
+    :param dependent: Result of get_dependent_as_types or None
+    :param dependencies: Result of get_dependencies_as_types or None
+    :return: Dict with the users of the dependent services, the ports of the optical links and cables and the
+    placement paths of the direct dependencies, dicts of handle_id and list
+    """
+    dependent = dependent or {}
+    dependencies = dependencies or {}
+
+    def handle_ids(*lists):
+        return [item['handle_id'] for items in lists for item in items or []]
+    ports = get_related_rows(DEPENDENCY_PORTS_QUERY, handle_ids(dependent.get('links'), dependencies.get('links'),
+                                                                dependencies.get('cables')))
+    return {
+        'users': get_related_rows(DEPENDENT_USERS_QUERY, handle_ids(dependent.get('services')), 'user'),
+        'ports': dict((handle_id, [{'port': row['port'], 'parent': row['parent']} for row in rows])
+                      for handle_id, rows in ports.items()),
+        'placement_paths': get_related_rows(PLACEMENT_PATHS_QUERY, handle_ids(dependencies.get('direct')), 'parent'),
+    }
+
+
 def paginate(full_list, page=None, per_page=250):
     paginator = Paginator(full_list, per_page, allow_empty_first_page=True)
     try:
@@ -853,6 +884,24 @@ def app_enabled(appname):
     return appname in django_settings.INSTALLED_APPS
 
 
+def client_address(request):
+    """
+    Address of the client of request. Behind the proxies in TRUSTED_PROXIES it is the last address in
+    X-Forwarded-For that is not a trusted proxy.
+
+    :param request: HttpRequest
+    :return: String, None if the request was forwarded by a proxy that is not trusted
+    """
+    address = request.META.get('REMOTE_ADDR')
+    forwarded_for = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if address not in django_settings.TRUSTED_PROXIES:
+        return None if forwarded_for else address
+    for address in reversed(forwarded_for):
+        if address not in django_settings.TRUSTED_PROXIES:
+            break
+    return address
+
+
 # Simple sorting that handles numbers such as 1-1 1-2 1-11
 convert = lambda text: int(text) if text.isdigit() else text
 alphanum_key = lambda key: [ convert(c) for c in re.split('([0-9]+)', key) ]
@@ -885,12 +934,15 @@ def attach_as_file(handle_id, name, content, user, overwrite=False):
     attachment.object_id = handle_id
     attachment.creator = user
     attachment.attachment_file = _file
-    return attachment.save()
+    attachment.save()
+    # Moves the watermark of the node, the hardware section of the router page shows the attachment
+    nh.watermark = timezone.now()
+    NodeHandle.objects.filter(pk=handle_id).update(watermark=nh.watermark)
 
 def find_attachments(handle_id, name=None):
     attachments = Attachment.objects.filter(object_id=handle_id)
     if name:
-        attachments.filter(attachment_file__endswith=name)
+        attachments = attachments.filter(attachment_file__endswith=name)
     return attachments
 
 def attachment_content(attachment):
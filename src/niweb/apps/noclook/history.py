@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Paged history of a node.
+
+The history of a node is the actions with the node as action object or as target. Both streams are merged with a SQL
+UNION, ordered by timestamp and id, and paged with a keyset cursor, the timestamp and id of the last action of the
+previous page. Every page is then one indexed range scan per stream however long the history is, see the
+0014_action_history_indexes migration.
+"""
+
+import base64
+import binascii
+from collections import namedtuple
+
+from actstream.models import Action
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from apps.noclook.models import NodeHandle
+
+# Values of data.noclook.action_type that the history can be filtered on, with their labels
+ACTION_TYPES = (
+    ('node', 'Node'),
+    ('node_property', 'Properties'),
+    ('relationship', 'Relationships'),
+    ('relationship_property', 'Relationship properties'),
+    ('comment', 'Comments'),
+)
+
+HistoryPage = namedtuple('HistoryPage', ['actions', 'next_cursor'])
+
+
+def encode_cursor(action):
+    """
+    :return: Cursor of the page after action
+    """
+    value = '{}|{}'.format(action.timestamp.isoformat(), action.pk)
+    return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    :return: (timestamp, id) of the last action of the previous page
+    :raises ValueError: if cursor is not a cursor of encode_cursor
+    """
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        timestamp = parse_datetime(timestamp)
+    except (TypeError, UnicodeError, binascii.Error) as e:
+        raise ValueError('Invalid history cursor: {}'.format(e))
+    if timestamp is None:
+        raise ValueError('Invalid history cursor timestamp')
+    return timestamp, int(pk)
+
+
+def _stream(field, nh, action_type, after, limit):
+    actions = Action.objects.filter(**{
+        '{}_content_type'.format(field): ContentType.objects.get_for_model(NodeHandle),
+        '{}_object_id'.format(field): str(nh.handle_id),
+    })
+    if action_type:
+        actions = actions.filter(data__noclook__action_type=action_type)
+    if after:
+        timestamp, pk = after
+        actions = actions.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+    actions = actions.order_by().values_list('id', 'timestamp')
+    if connection.features.supports_slicing_ordering_in_compound:
+        # Each stream only needs to read a page
+        actions = actions.order_by('-timestamp', '-id')[:limit]
+    return actions
+
+
+def get_page(nh, cursor=None, action_type=None, per_page=None):
+    """
+    :param nh: NodeHandle
+    :param cursor: next_cursor of the previous page, None for the latest actions
+    :param action_type: Only actions with this data.noclook.action_type, see ACTION_TYPES
+    :param per_page: Number of actions, HISTORY_PAGE_SIZE by default
+    :return: HistoryPage with the actions, newest first, and the cursor of the next page, None on the last page
+    :raises ValueError: if cursor is invalid
+    """
+    per_page = per_page or settings.HISTORY_PAGE_SIZE
+    after = decode_cursor(cursor) if cursor else None
+    limit = per_page + 1
+    merged = _stream('action_object', nh, action_type, after, limit)\
+        .union(_stream('target', nh, action_type, after, limit))\
+        .order_by('-timestamp', '-id')[:limit]
+    ids = [pk for pk, timestamp in merged]
+    actions = list(Action.objects.filter(id__in=ids[:per_page]).order_by('-timestamp', '-id')
+                   .prefetch_related('actor', 'action_object', 'target'))
+    next_cursor = encode_cursor(actions[-1]) if len(ids) > per_page else None
+    return HistoryPage(actions, next_cursor)
+
+
+def action_type_param(request):
+    """
+    :return: The action_type query parameter of request if it is one of ACTION_TYPES, else None
+    """
+    action_type = request.GET.get('action_type')
+    return action_type if action_type in dict(ACTION_TYPES) else None
+
+
+def page_context(nh, page, action_type=None):
+    """
+    :return: Context of the noclook/detail/history.html and noclook/detail/includes/history_page.html templates
+    """
+    return {
+        'node_handle': nh,
+        'history': page.actions,
+        'next_cursor': page.next_cursor,
+        'action_type': action_type,
+        'action_types': ACTION_TYPES,
+        'history_url': '{}history'.format(nh.get_absolute_url()),
+    }
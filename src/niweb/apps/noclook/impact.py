@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Transitive service impact analysis.
+
+The impact of a node is everything that stops working when it goes down: what depends on it, what it has (a router
+its ports), the units that are part of its ports and what is connected to it, and so on transitively. The services,
+customers and end users among them are what the NOC needs for a ticket, the users of affected nodes are added with
+the depth of the node they use.
+
+Results are cached per root handle_id for IMPACT_CACHE_TIMEOUT seconds, keyed on the topology version of the impact
+relationship types. A relationship of those types created or deleted in the activity log, or a deleted node, changes
+the version, so writes cost a cache update and the results are computed again when they are asked for.
+"""
+
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.noclook import metrics, topology
+from apps.noclook.models import NodeHandle
+from apps.noclook.topology import OUT, IN, BOTH
+
+IMPACT_STEPS = (('Depends_on', IN), ('Has', OUT), ('Part_of', IN), ('Connected_to', BOTH))
+USER_STEPS = (('Uses', IN),)
+RELATIONSHIP_TYPES = sorted(set(rel_type for rel_type, direction in IMPACT_STEPS + USER_STEPS))
+
+# Node types listed first, in this order
+SERVICE_GROUPS = ['Service', 'Customer', 'End User']
+
+GENERATION_KEY = 'noclook:impact:generation'
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _cache_key(handle_id):
+    return 'noclook:impact:{}:{}:{}'.format(_generation(), topology.version(*RELATIONSHIP_TYPES), handle_id)
+
+
+def compute(handle_id):
+    """
+    :return: Dict with the impacted nodes of handle_id up to IMPACT_MAX_DEPTH, see impact_analysis
+    """
+    max_nodes = settings.IMPACT_MAX_NODES
+    depths = OrderedDict()
+    vias = {}
+    truncated = False
+    for node_id, depth, parent in topology.traverse([handle_id], IMPACT_STEPS, settings.IMPACT_MAX_DEPTH,
+                                                     current=True):
+        if depth == 0:
+            continue
+        if len(depths) >= max_nodes:
+            truncated = True
+            break
+        depths[node_id] = depth
+        vias[node_id] = parent
+    affected = [handle_id] + list(depths)
+    for node_id, depth, parent in topology.traverse(affected, USER_STEPS, max_depth=1, current=True):
+        if depth == 1 and node_id not in depths and node_id != handle_id:
+            depths[node_id] = depths.get(parent, 1)
+            vias[node_id] = parent
+    handles = NodeHandle.objects.filter(handle_id__in=affected + list(depths)).select_related('node_type')
+    handles = dict((nh.handle_id, nh) for nh in handles)
+    groups = {}
+    for nh in handles.values():
+        if nh.handle_id not in depths:
+            continue
+        via = handles.get(vias[nh.handle_id])
+        groups.setdefault(nh.node_type.type, []).append({
+            'handle_id': nh.handle_id,
+            'name': nh.node_name,
+            'url': nh.get_absolute_url(),
+            'depth': depths[nh.handle_id],
+            'via': vias[nh.handle_id],
+            'via_name': via.node_name if via else '',
+        })
+    order = SERVICE_GROUPS + sorted(set(groups) - set(SERVICE_GROUPS))
+    return {
+        'handle_id': handle_id,
+        'max_depth': settings.IMPACT_MAX_DEPTH,
+        'truncated': truncated,
+        # The nodes of the last depth are incomplete when truncated
+        'last_depth': max(depths.values()) if depths else 0,
+        'groups': OrderedDict((node_type, sorted(groups[node_type], key=lambda item: (item['depth'], item['name'])))
+                              for node_type in order if node_type in groups),
+    }
+
+
+def impact_analysis(handle_id, depth=None):
+    """
+    :param handle_id: Root node
+    :param depth: Number of relationships to follow, at most and by default IMPACT_MAX_DEPTH
+    :return: Dict with handle_id, depth, truncated, count and groups, an OrderedDict of node type and list of
+    impacted nodes (handle_id, name, url, depth, via and via_name, the node it was reached from)
+    """
+    key = _cache_key(handle_id)
+    result = cache.get(key)
+    metrics.cache_lookup('impact', hit=result is not None)
+    if result is None:
+        result = compute(handle_id)
+        cache.set(key, result, settings.IMPACT_CACHE_TIMEOUT)
+    if depth is None or depth >= result['max_depth']:
+        depth = result['max_depth']
+    groups = OrderedDict()
+    for node_type, items in result['groups'].items():
+        items = [item for item in items if item['depth'] <= depth]
+        if items:
+            groups[node_type] = items
+    return {
+        'handle_id': handle_id,
+        'depth': depth,
+        'truncated': result['truncated'] and depth >= result['last_depth'],
+        'count': sum(len(items) for items in groups.values()),
+        'groups': groups,
+    }
+
+
+def clear():
+    """
+    Drops all cached results.
+    """
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.noclook import activity_retention
+
+
+class Command(BaseCommand):
+    help = 'Archives and deletes the actions expired by ACTIVITY_RETENTION_POLICIES and redundant relationship actions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', '-N', action='store_true', default=False,
+                            help='Only count the actions that would be deleted.')
+        parser.add_argument('--no-compact', action='store_false', dest='compact', default=True,
+                            help='Keep redundant relationship actions.')
+        parser.add_argument('--batch-size', type=int, default=settings.ACTIVITY_RETENTION_BATCH_SIZE,
+                            help='Number of actions to delete per transaction.')
+        parser.add_argument('--archive-path', default=settings.ACTIVITY_ARCHIVE_PATH,
+                            help='Directory for the archive, defaults to ACTIVITY_ARCHIVE_PATH. Empty to not archive.')
+
+    def handle(self, *args, **options):
+        result = activity_retention.run(dry_run=options['dry_run'], compact=options['compact'],
+                                        batch_size=options['batch_size'], archive_path=options['archive_path'])
+        for description, count in result.items():
+            self.stdout.write('{:<60} {:>8}'.format(description, count))
+        self.stdout.write('{} actions {}.'.format(sum(result.values()),
+                                                  'would be deleted' if options['dry_run'] else 'deleted'))
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+from apps.noclook import report_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Collects the data for the host reports from neo4j and replaces the current host report snapshot.'
+
+    def handle(self, *args, **options):
+        snapshot = report_snapshots.generate_host_report_snapshot()
+        self.stdout.write('Host report snapshot with {} hosts generated in {:.2f}s.'.format(
+            snapshot.num_hosts, snapshot.duration))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from time import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from apps.noclook import synthetic
+from apps.noclook.models import NodeHandle
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic inventory in neo4j and the SQL database, for benchmarks. Do not use in production.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Multiplies the number of nodes, 1 gives 10 sites, 10 routers and 50 hosts.')
+        parser.add_argument('--ports-per-router', type=int, default=48)
+        parser.add_argument('--units-per-port', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--user', default='noclook', help='Username of the creator of the nodes.')
+        parser.add_argument('--force', action='store_true', default=False,
+                            help='Generate the inventory even if the database already contains nodes.')
+
+    def handle(self, *args, **options):
+        if NodeHandle.objects.exists() and not options['force']:
+            raise CommandError('The database already contains nodes, use --force to add the synthetic inventory '
+                               'anyway.')
+        user, created = User.objects.get_or_create(username=options['user'])
+        start = time()
+        graph = synthetic.inventory(user, scale=options['scale'], ports_per_router=options['ports_per_router'],
+                                    units_per_port=options['units_per_port'], seed=options['seed'])
+        for node_type, count in sorted(graph.counts().items()):
+            self.stdout.write('{:<20} {:>8}'.format(node_type, count))
+        self.stdout.write('{} nodes generated in {:.1f}s.'.format(sum(graph.counts().values()), time() - start))
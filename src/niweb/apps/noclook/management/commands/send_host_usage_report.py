@@ -1,105 +1,170 @@
 # -*- coding: utf-8 -*-
 __author__ = 'lundberg'
 
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import BaseCommand
 from django.template.defaultfilters import yesno, date
 from django.conf import settings as django_settings
-import tempfile
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from collections import OrderedDict
+from io import BytesIO
+from time import time
+from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from apps.noclook.templatetags.noclook_tags import timestamp_to_td
 from apps.noclook import helpers
 import norduniclient as nc
 
+PRICE_PER_HOST = 95
+# Hosts not seen for this many days are left out of the report, see helpers.neo4j_report_age
+VERY_OLD_DAYS = 30
+
+HEADER = [
+    'Host user',
+    'Host',
+    'Host type',
+    'IP address(es)',
+    'Contract number',
+    'Description',
+    'Responsible',
+    'Backup',
+    'Syslog',
+    'Nagios',
+    'Operational State',
+    'Security Class',
+    'Location',
+    'Last seen',
+    'Uptime (days)'
+]
+
+# All hosts for all requested contract numbers in one go. noclook_last_seen is stored as an ISO 8601 string so
+# comparing it to an ISO 8601 string gives the same result as comparing the datetimes.
+HOST_USAGE_QUERY = '''
+    MATCH (host_user:Host_User)-[:Uses|Owns]->(host:Host:Logical)
+    WHERE host.contract_number IN {contract_numbers}
+        AND (host.noclook_last_seen IS NULL OR host.noclook_last_seen > {very_old})
+        AND coalesce(host.operational_state, '') <> 'Decommissioned'
+    RETURN host.contract_number AS contract_number, host_user.name AS host_user_name, host
+    ORDER BY contract_number, host_user_name, host.name
+    '''
+
+
+def get_hosts(contract_numbers, very_old_days=VERY_OLD_DAYS):
+    """
+    :param contract_numbers: List of contract numbers
+    :param very_old_days: Integer, hosts last seen this many days ago or earlier are excluded
+    :return: OrderedDict of contract number and a list of (host user name, host) tuples
+    """
+    very_old = (datetime.today() - timedelta(days=very_old_days)).isoformat()
+    hosts = OrderedDict((contract_number, []) for contract_number in contract_numbers)
+    q = HOST_USAGE_QUERY
+    for item in nc.query_to_iterator(nc.graphdb.manager, q, contract_numbers=list(hosts), very_old=very_old):
+        # Plain dicts, the hosts are sent to the workbook worker processes
+        hosts[item['contract_number']].append((item['host_user_name'], dict(item['host'])))
+    return hosts
+
+
+def host_values(host_user, host):
+    uptime = host.get('uptime', '')
+    if uptime:
+        uptime = timestamp_to_td(uptime).days
+    return [
+        u'{}'.format(host_user),
+        u'{}'.format(host['name']),
+        u'Logical',
+        u', '.join([address for address in host.get('ip_addresses', [])]),
+        u'{}'.format(host['contract_number']),
+        u'{}'.format(host.get('description', '')),
+        u'{}'.format(host.get('responsible_group', '')),
+        u'{}'.format(host.get('backup', 'Not set')),
+        u'{}'.format(yesno(host.get('syslog', None), 'Yes,No,Not set')),
+        u'{}'.format(yesno(host.get('nagios_checks', False), 'Yes,No,Not set')),
+        u'{}'.format(host.get('operational_state', 'Not set')),
+        u'{}'.format(host.get('security_class', '')),
+        u'{}'.format(''),
+        u'{}'.format(date(helpers.isots_to_dt(host), "Y-m-d")),
+        u'{}'.format(uptime),
+    ]
+
+
+def _create_workbook(item):
+    return create_workbook(*item)
+
+
+def create_workbooks(hosts, workers):
+    """
+    Creates the workbooks in worker processes, xlwt is pure Python so threads would not run in parallel. The workers
+    are forked so that they inherit the configured Django settings.
+
+    :param hosts: OrderedDict of contract number and a list of (host user name, host dict) tuples, see get_hosts
+    :param workers: Number of worker processes, 1 to create the workbooks in this process
+    :return: Iterator of create_workbook results in the order of hosts
+    """
+    if workers <= 1 or len(hosts) <= 1:
+        for item in hosts.items():
+            yield create_workbook(*item)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        for result in executor.map(_create_workbook, hosts.items()):
+            yield result
+
+
+def create_workbook(contract_number, hosts):
+    """
+    :param contract_number: String
+    :param hosts: List of (host user name, host) tuples
+    :return: Tuple of number of hosts, the xls file as bytes and the seconds it took to create it
+    """
+    start = time()
+    result = [dict(zip(HEADER, host_values(host_user, host))) for host_user, host in hosts]
+    num_hosts = len(result)
+    wb = helpers.dicts_to_xls(result, HEADER, contract_number)
+    # Calculate and write pricing info
+    ws = wb.get_sheet(0)
+    ws.write(num_hosts + 2, 1, 'Number of Virtual Servers')
+    ws.write(num_hosts + 2, 4, '%d' % num_hosts)
+    ws.write(num_hosts + 3, 1, 'Price')
+    ws.write(num_hosts + 3, 4, '%d' % PRICE_PER_HOST)
+    ws.write(num_hosts + 4, 1, 'Total Invoice amount ex. VAT')
+    ws.write(num_hosts + 4, 4, '%d' % (num_hosts * PRICE_PER_HOST))
+    f = BytesIO()
+    wb.save(f)
+    return num_hosts, f.getvalue(), time() - start
+
 
 class Command(BaseCommand):
     help = 'Sends host usage report for specified contract numbers.'
 
     def add_arguments(self, parser):
         parser.add_argument('contract_number', nargs='+', type=str)
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of processes creating workbooks in parallel.')
 
     def handle(self, *args, **options):
-        for contract_number in options['contract_number']:
-            utcnow = datetime.utcnow()
-            last_month = utcnow - relativedelta(months=1)
+        start = time()
+        utcnow = datetime.utcnow()
+        last_month = utcnow - relativedelta(months=1)
+        to = getattr(django_settings, 'REPORTS_TO', [])
+        cc = getattr(django_settings, 'REPORTS_CC', None)
+        bcc = getattr(django_settings, 'REPORTS_BCC', None)
+        extra_report = getattr(django_settings, 'EXTRA_REPORT_TO', {})
+
+        hosts = get_hosts(options['contract_number'])
+        query_time = time() - start
+
+        workbooks = create_workbooks(hosts, options['workers'])
+        for contract_number, (num_hosts, xls, build_time) in zip(hosts, workbooks):
             subject = 'NOCLook host report for %s' % contract_number
-            to = getattr(django_settings, 'REPORTS_TO', [])
-            cc = getattr(django_settings, 'REPORTS_CC', None)
-            bcc = getattr(django_settings, 'REPORTS_BCC', None)
-            extra_report = getattr(django_settings, 'EXTRA_REPORT_TO', {})
             extended_to = to + extra_report.get(contract_number, [])  # Avoid changing REPORTS_TO :)
             body = '''
                 This is an auto generated report from NOCLook for contract number %s.
 
                 This report was generated on %s UTC.
                     ''' % (contract_number, utcnow.strftime('%Y-%m-%d %H:%M'))
-            price_per_host = 95
-            header = [
-                'Host user',
-                'Host',
-                'Host type',
-                'IP address(es)',
-                'Contract number',
-                'Description',
-                'Responsible',
-                'Backup',
-                'Syslog',
-                'Nagios',
-                'Operational State',
-                'Security Class',
-                'Location',
-                'Last seen',
-                'Uptime (days)'
-            ]
-            result = []
-            q = '''
-                    MATCH (host_user:Host_User)-[r:Uses|Owns]->(host:Host)
-                    WHERE host.contract_number = {contract_number}
-                    RETURN host_user.name as host_user_name, host.name, host.handle_id as host_handle_id
-                    ORDER BY host_user.name, host.name
-                    '''
-            for item in nc.query_to_list(nc.graphdb.manager, q, contract_number=contract_number):
-                host = nc.get_node_model(nc.graphdb.manager, item['host_handle_id'])
-                age = helpers.neo4j_report_age(host.data, 15, 30)
-                operational_state = host.data.get('operational_state', 'Not set')
-                host_type = host.meta_type
-                host_user = item['host_user_name']
-                uptime = host.data.get('uptime', '')
-                if uptime:
-                    uptime = timestamp_to_td(uptime).days
-                if host_type == 'Logical' and age != 'very_old' and operational_state != 'Decommissioned':
-                    values = [
-                        u'{}'.format(host_user),
-                        u'{}'.format(host.data['name']),
-                        u'{}'.format(host_type).capitalize(),
-                        u', '.join([address for address in host.data['ip_addresses']]),
-                        u'{}'.format(host.data['contract_number']),
-                        u'{}'.format(host.data.get('description', '')),
-                        u'{}'.format(host.data.get('responsible_group', '')),
-                        u'{}'.format(host.data.get('backup', 'Not set')),
-                        u'{}'.format(yesno(host.data.get('syslog', None), 'Yes,No,Not set')),
-                        u'{}'.format(yesno(host.data.get('nagios_checks', False), 'Yes,No,Not set')),
-                        u'{}'.format(operational_state),
-                        u'{}'.format(host.data.get('security_class', '')),
-                        u'{}'.format(''),
-                        u'{}'.format(date(helpers.isots_to_dt(host.data), "Y-m-d")),
-                        u'{}'.format(uptime),
-                    ]
-                    result.append(dict(zip(header, values)))
-            num_hosts = len(result)
             filename = '%s hosts %s.xls' % (contract_number, last_month.strftime('%B %Y'))
-            wb = helpers.dicts_to_xls(result, header, contract_number)
-            # Calculate and write pricing info
-            ws = wb.get_sheet(0)
-            ws.write(num_hosts + 2, 1, 'Number of Virtual Servers')
-            ws.write(num_hosts + 2, 4, '%d' % num_hosts)
-            ws.write(num_hosts + 3, 1, 'Price')
-            ws.write(num_hosts + 3, 4, '%d' % price_per_host)
-            ws.write(num_hosts + 4, 1, 'Total Invoice amount ex. VAT')
-            ws.write(num_hosts + 4, 4, '%d' % (num_hosts * price_per_host))
-            with tempfile.TemporaryFile() as temp:
-                wb.save(temp)
-                temp.seek(0)
-                msg = helpers.create_email(subject, body, extended_to, cc, bcc, temp.read(), filename, 'application/excel')
-                msg.send()
-            self.stdout.write('Sent report for contract number {}'.format(contract_number))
+            msg = helpers.create_email(subject, body, extended_to, cc, bcc, xls, filename, 'application/excel')
+            msg.send()
+            self.stdout.write('Sent report for contract number {} ({} hosts, workbook created in {:.2f}s)'.format(
+                contract_number, num_hosts, build_time))
+        self.stdout.write('Sent {} reports with {} hosts, query {:.2f}s, total {:.2f}s'.format(
+            len(hosts), sum(len(h) for h in hosts.values()), query_time, time() - start))
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+from time import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.noclook import topology
+
+
+class Command(BaseCommand):
+    help = 'Builds the in-memory topology snapshot from neo4j and writes it to TOPOLOGY_SNAPSHOT_PATH.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.TOPOLOGY_SNAPSHOT_PATH,
+                            help='File to write, defaults to TOPOLOGY_SNAPSHOT_PATH.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of nodes to export the relationships of per neo4j query.')
+        parser.add_argument('--refresh', action='store_true', default=False,
+                            help='Apply the activity log to the existing snapshot instead of exporting the graph, run it '
+                                 'periodically to keep the changes applied by each process small.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError('Set TOPOLOGY_SNAPSHOT_PATH or use --path.')
+        start = time()
+        if options['refresh']:
+            snapshot = topology.load(path)
+            if snapshot is None:
+                raise CommandError('No snapshot to refresh in {}, build one without --refresh.'.format(path))
+            # Builds the arrays with the changes, processes refreshing the new file start with an empty overlay
+            snapshot = topology.refresh(snapshot).compacted()
+        else:
+            snapshot = topology.build(batch_size=options['batch_size'])
+        topology.save(snapshot, path)
+        for rel_type in snapshot.relationship_types:
+            self.stdout.write('{:<20} {:>8}'.format(rel_type, len(snapshot.outgoing[rel_type].targets)))
+        self.stdout.write('{} nodes written to {} in {:.1f}s.'.format(len(snapshot), path, time() - start))
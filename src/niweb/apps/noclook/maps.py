@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Map data for the Google Maps pages, the sites and the optical nodes with the dark fibers between them.
+
+The documents are built with one neo4j query and one NodeHandle query each and cached as rendered JSON, in the
+format of the map page or as GeoJSON, together with their ETag. The activity log drops the cached documents of a
+map when a node of one of its node types or a relationship of one of its relationship types is changed, see
+MAP_NODE_TYPES and MAP_RELATIONSHIP_TYPES. Deleted nodes drop all cached documents.
+"""
+
+import hashlib
+import json
+import logging
+
+from actstream.models import Action
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from apps.noclook import helpers, metrics
+from apps.noclook.models import NodeHandle
+import norduniclient as nc
+
+logger = logging.getLogger('noclook.maps')
+
+SITES = 'sites'
+OPTICAL_NODES = 'optical-nodes'
+FORMATS = ('json', 'geojson')
+
+MAP_NODE_TYPES = {
+    SITES: {'Site'},
+    OPTICAL_NODES: {'Site', 'Cable', 'Optical Node', 'Port'},
+}
+MAP_RELATIONSHIP_TYPES = {
+    SITES: set(),
+    OPTICAL_NODES: {'Connected_to', 'Has', 'Located_in'},
+}
+
+# Cypher query to get all cables with cable type fiber that are connected
+# to two optical node.
+OPTICAL_NODES_QUERY = """
+    MATCH (cable:Cable)
+    WHERE cable.cable_type = "Dark Fiber"
+    MATCH (cable)-[Connected_to]->(port)
+    WITH cable, port
+    MATCH (port)<-[:Has*0..]-(equipment)
+    WHERE (equipment:Optical_Node) AND NOT equipment.type =~ "(?i).*tss.*"
+    WITH cable, port, equipment
+    MATCH p2=(equipment)-[:Located_in]->()<-[:Has*0..]-(loc)
+    WHERE (loc:Site)
+    RETURN cable, equipment, loc
+    """
+
+
+def _cache_key(name, fmt):
+    return 'noclook:maps:{}:{}'.format(name, fmt)
+
+
+def _coords(node):
+    return {
+        'lng': float(str(node.get('longitude', 0))),
+        'lat': float(str(node.get('latitude', 0)))
+    }
+
+
+def sites():
+    """
+    :return: Dict with nodes, a list of dicts with name, url, lng and lat of all sites, and edges, an empty list
+    """
+    site_nodes = list(nc.get_nodes_by_type(nc.graphdb.manager, 'Site'))
+    urls = helpers.get_node_urls(site_nodes)
+    site_list = []
+    for site in site_nodes:
+        try:
+            site = dict(name=site['name'], url=urls.get(site['handle_id'], ''), **_coords(site))
+        except KeyError:
+            continue
+        site_list.append(site)
+    return {'nodes': site_list, 'edges': []}
+
+
+def optical_nodes():
+    """
+    :return: Dict with nodes, a list of dicts with name, url, lng and lat of the optical nodes, and edges, a list of
+    dicts with name, url and end_points, the coordinates of the connected optical nodes, of the dark fibers
+    """
+    result = nc.query_to_list(nc.graphdb.manager, OPTICAL_NODES_QUERY)
+    urls = helpers.get_node_urls([[item['equipment'], item['cable']] for item in result])
+    nodes = {}
+    edges = {}
+    for item in result:
+        coords = _coords(item['loc'])
+        nodes[item['equipment']['name']] = dict(name=item['equipment']['name'],
+                                                url=urls.get(item['equipment']['handle_id'], ''), **coords)
+        edge = edges.setdefault(item['cable']['name'], {
+            'name': item['cable']['name'],
+            'url': urls.get(item['cable']['handle_id'], ''),
+            'end_points': []
+        })
+        edge['end_points'].append(coords)
+    return {'nodes': list(nodes.values()), 'edges': list(edges.values())}
+
+
+MAPS = {
+    SITES: sites,
+    OPTICAL_NODES: optical_nodes,
+}
+
+
+def to_geojson(data):
+    """
+    :param data: Map data, see sites and optical_nodes
+    :return: GeoJSON FeatureCollection with a Point per node and a LineString per edge
+    """
+    features = []
+    for node in data['nodes']:
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [node['lng'], node['lat']]},
+            'properties': {'name': node['name'], 'url': node['url']},
+        })
+    for edge in data['edges']:
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': [[p['lng'], p['lat']] for p in edge['end_points']]},
+            'properties': {'name': edge['name'], 'url': edge['url']},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def get_map(name, fmt='json'):
+    """
+    :param name: SITES or OPTICAL_NODES
+    :param fmt: json for the format of the map page or geojson
+    :return: (JSON string, ETag)
+    """
+    key = _cache_key(name, fmt)
+    cached = cache.get(key)
+    metrics.cache_lookup('maps', hit=cached is not None)
+    if cached is None:
+        data = MAPS[name]()
+        if fmt == 'geojson':
+            data = to_geojson(data)
+        jsonstr = json.dumps(data, separators=(',', ':'))
+        cached = {'json': jsonstr, 'etag': '"{}"'.format(hashlib.md5(jsonstr.encode('utf-8')).hexdigest())}
+        cache.set(key, cached, settings.MAPS_CACHE_TIMEOUT)
+    return cached['json'], cached['etag']
+
+
+def invalidate(*names):
+    """
+    Drops the cached documents of the maps names, all maps without names.
+    """
+    cache.delete_many([_cache_key(name, fmt) for name in (names or MAPS) for fmt in FORMATS])
+
+
+def _changed_maps(handle_ids):
+    node_types = set(NodeHandle.objects.filter(handle_id__in=handle_ids).values_list('node_type__type', flat=True))
+    return [name for name, types in MAP_NODE_TYPES.items() if types & node_types]
+
+
+def _action_handler(sender, instance, created, **kwargs):
+    if not created:
+        return
+    noclook = (instance.data or {}).get('noclook', {})
+    action_type = noclook.get('action_type')
+    if action_type == 'node' and instance.verb == 'delete':
+        transaction.on_commit(invalidate)
+    elif action_type == 'relationship':
+        names = [name for name, rel_types in MAP_RELATIONSHIP_TYPES.items()
+                 if noclook.get('relationship_type') in rel_types]
+        if names:
+            transaction.on_commit(lambda: invalidate(*names))
+    elif action_type in ('node', 'node_property') and instance.action_object_object_id:
+        handle_id = int(instance.action_object_object_id)
+
+        def on_commit():
+            names = _changed_maps([handle_id])
+            if names:
+                invalidate(*names)
+        transaction.on_commit(on_commit)
+
+
+post_save.connect(_action_handler, sender=Action, dispatch_uid='noclook.maps.action')
@@ -0,0 +1,1539 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory stand-in for the neo4j database behind norduniclient.
+
+MemoryGraphManager has the session and transaction context managers of norduniclient's Neo4jDBSessionManager, so it
+can be set as nc.graphdb.manager. Instead of sending Cypher to a server the session looks the statement up among the
+registered queries and runs the Python handler registered for it. The queries norduniclient itself sends (nodes,
+relationships, set_* helpers and the node model queries) and the Cypher of the noclook views, forms, reports and API
+are registered here, other modules can register their own with register_query. A statement that is not registered
+raises UnsupportedQuery, tests that need arbitrary Cypher have to run against neo4j.
+
+Results are made of neo4j Records, Nodes and Relationships, the same types the driver returns.
+
+Use it by setting NEO4J_BACKEND to memory, eg. for unit tests and benchmark dry runs:
+
+    NEO4J_BACKEND=memory python manage.py test apps.noclook.tests.test_graph_backends
+"""
+
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from itertools import count
+from time import perf_counter
+
+from neo4j import Record
+from neo4j.exceptions import CypherError
+from neo4j.types.graph import Graph
+
+logger = logging.getLogger('noclook.memory_graph')
+
+_queries = []
+
+
+class UnsupportedQuery(NotImplementedError):
+
+    def __init__(self, statement):
+        super(UnsupportedQuery, self).__init__(
+            u'The in-memory graph backend has no handler for the query: {}'.format(statement))
+        self.statement = statement
+
+
+def normalize(statement):
+    """
+    :return: The statement with all whitespace collapsed to single spaces
+    """
+    return u' '.join(u'{}'.format(statement).split())
+
+
+def register_query(pattern):
+    """
+    Registers the decorated function as handler of the statements matching pattern. The pattern is a regular
+    expression matched against the whole normalized statement.
+
+    The handler is called with the MemoryGraph, the re match and the query parameters and returns a list of
+    (keys, values) tuples, one per row. Values may be MemoryNode, MemoryRelationship or plain values.
+    """
+    def decorator(handler):
+        _queries.append((re.compile(pattern), handler))
+        return handler
+    return decorator
+
+
+def find_handler(statement):
+    for regex, handler in _queries:
+        match = regex.fullmatch(statement)
+        if match:
+            return handler, match
+    return None, None
+
+
+def _clean_properties(properties):
+    # neo4j does not store null properties
+    return dict((key, value) for key, value in (properties or {}).items() if value is not None)
+
+
+class MemoryNode(object):
+
+    def __init__(self, node_id, labels, properties):
+        self.id = node_id
+        self.labels = set(labels)
+        self.properties = _clean_properties(properties)
+
+
+class MemoryRelationship(object):
+
+    def __init__(self, relationship_id, rel_type, start, end, properties):
+        self.id = relationship_id
+        self.type = rel_type
+        self.start = start
+        self.end = end
+        self.properties = _clean_properties(properties)
+
+    def other(self, node):
+        return self.end if node is self.start else self.start
+
+
+class MemoryGraph(object):
+    """
+    Nodes indexed on handle_id and relationships indexed on their start and end nodes.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.nodes = {}
+            self.relationships = {}
+            self.by_handle_id = {}
+            self.outgoing = {}
+            self.incoming = {}
+            self._node_ids = count()
+            self._relationship_ids = count()
+
+    def create_node(self, labels, properties):
+        handle_id = properties.get('handle_id')
+        if handle_id is not None and handle_id in self.by_handle_id:
+            raise CypherError.hydrate(
+                message='Node({}) already exists with label `Node` and property `handle_id` = {!r}'.format(
+                    self.by_handle_id[handle_id].id, handle_id),
+                code='Neo.ClientError.Schema.ConstraintValidationFailed')
+        node = MemoryNode(next(self._node_ids), labels, properties)
+        self.nodes[node.id] = node
+        self.outgoing[node.id] = {}
+        self.incoming[node.id] = {}
+        if handle_id is not None:
+            self.by_handle_id[handle_id] = node
+        return node
+
+    def set_node_properties(self, node, properties):
+        handle_id = node.properties.get('handle_id')
+        if self.by_handle_id.get(handle_id) is node:
+            del self.by_handle_id[handle_id]
+        node.properties = _clean_properties(properties)
+        if node.properties.get('handle_id') is not None:
+            self.by_handle_id[node.properties['handle_id']] = node
+
+    def get_node(self, handle_id, *labels):
+        node = self.by_handle_id.get(handle_id)
+        if node is not None and node.labels.issuperset(labels):
+            return node
+        return None
+
+    def nodes_with_label(self, label):
+        return [node for node in self.nodes.values() if label in node.labels]
+
+    def delete_node(self, node):
+        for relationship in self.relationships_of(node):
+            self.delete_relationship(relationship)
+        del self.nodes[node.id]
+        del self.outgoing[node.id]
+        del self.incoming[node.id]
+        if self.by_handle_id.get(node.properties.get('handle_id')) is node:
+            del self.by_handle_id[node.properties['handle_id']]
+
+    def create_relationship(self, start, rel_type, end, properties=None):
+        relationship = MemoryRelationship(next(self._relationship_ids), rel_type, start, end, properties)
+        self.relationships[relationship.id] = relationship
+        self.outgoing[start.id][relationship.id] = relationship
+        self.incoming[end.id][relationship.id] = relationship
+        return relationship
+
+    def delete_relationship(self, relationship):
+        del self.relationships[relationship.id]
+        del self.outgoing[relationship.start.id][relationship.id]
+        del self.incoming[relationship.end.id][relationship.id]
+
+    def relationships_of(self, node, direction=None, types=None):
+        """
+        :param direction: 'out', 'in' or None for both
+        :param types: Relationship types to include, None for all
+        :return: List of relationships ordered by id
+        """
+        relationships = []
+        if direction in (None, 'out'):
+            relationships.extend(self.outgoing[node.id].values())
+        if direction in (None, 'in'):
+            relationships.extend(r for r in self.incoming[node.id].values() if direction or r.start is not r.end)
+        if types:
+            relationships = [r for r in relationships if r.type in types]
+        return sorted(relationships, key=lambda r: r.id)
+
+
+class MemoryResult(object):
+    """
+    The parts of neo4j.BoltStatementResult used by norduniclient and noclook.
+    """
+
+    def __init__(self, keys, records):
+        self._keys = tuple(keys)
+        self._records = list(records)
+
+    def __iter__(self):
+        while self._records:
+            yield self._records.pop(0)
+
+    def keys(self):
+        return self._keys
+
+    def records(self):
+        return iter(self)
+
+    def single(self):
+        records = list(self)
+        if not records:
+            return None
+        if len(records) != 1:
+            logger.warning('Expected a result with a single record, but this result contains %d', len(records))
+        return records[0]
+
+    def peek(self):
+        return self._records[0] if self._records else None
+
+    def data(self):
+        return [record.data() for record in self]
+
+    def value(self, item=0, default=None):
+        return [record.value(item, default) for record in self]
+
+    def detach(self):
+        return len(self._records)
+
+    def consume(self):
+        self._records = []
+
+
+def _hydrate(rows):
+    """
+    Turns the handler rows into neo4j Records with Nodes and Relationships belonging to one Graph, like the driver does.
+    """
+    graph = Graph()
+
+    def node(n):
+        return graph.put_node(n.id, n.labels, dict(n.properties))
+
+    def value(v):
+        if isinstance(v, MemoryNode):
+            return node(v)
+        if isinstance(v, MemoryRelationship):
+            return graph.put_relationship(v.id, node(v.start), node(v.end), v.type, dict(v.properties))
+        if isinstance(v, list):
+            return [value(x) for x in v]
+        if isinstance(v, dict):
+            return dict((key, value(x)) for key, x in v.items())
+        return v
+
+    keys = rows[0][0] if rows else ()
+    return keys, [Record(zip(row_keys, [value(v) for v in values])) for row_keys, values in rows]
+
+
+class MemorySession(object):
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.success = None
+
+    def run(self, statement, parameters=None, **kwparameters):
+        from apps.noclook import neo4j_instrumentation
+        params = dict(parameters or {}, **kwparameters)
+        start = perf_counter()
+        normalized = normalize(statement)
+        handler, match = find_handler(normalized)
+        if handler is None:
+            raise UnsupportedQuery(normalized)
+        with self.graph.lock:
+            rows = handler(self.graph, match, params)
+            keys, records = _hydrate(rows or [])
+        if neo4j_instrumentation.installed():
+            neo4j_instrumentation.record(statement, params, len(records), perf_counter() - start)
+        return MemoryResult(keys, records)
+
+    def begin_transaction(self):
+        return self
+
+    def close(self):
+        pass
+
+
+class MemoryGraphManager(object):
+    """
+    Drop-in replacement for norduniclient.contextmanager.Neo4jDBSessionManager. Changes are visible immediately and
+    are not rolled back.
+    """
+
+    uri = 'memory://'
+
+    def __init__(self, graph=None):
+        self.graph = graph or MemoryGraph()
+
+    @contextmanager
+    def _session(self):
+        yield MemorySession(self.graph)
+    session = property(_session)
+
+    @contextmanager
+    def _transaction(self):
+        transaction = MemorySession(self.graph)
+        try:
+            yield transaction
+        except Exception:
+            transaction.success = False
+            raise
+        else:
+            transaction.success = True
+    transaction = property(_transaction)
+
+
+# Helpers for the handlers
+
+NODE = r'\((?P<{0}>\w+)(?::(?P<{0}_labels>[\w:]+))?(?: \{{ ?handle_id: ?\{{ ?(?P<{0}_param>\w+) ?\}} ?\}})?\)'
+RELATIONSHIP = r'(?P<left><)?-\[r(?::(?P<types>[\w|]+))?\]-(?P<right>>)?'
+# norduniclient.core.META_TYPES
+META_TYPES = ('Physical', 'Logical', 'Relation', 'Location')
+
+
+def _labels(labels):
+    return [label for label in (labels or '').split(':') if label]
+
+
+def _direction(match):
+    if match.group('right'):
+        return 'out'
+    if match.group('left'):
+        return 'in'
+    return None
+
+
+def _types(match):
+    types = match.group('types')
+    return types.split('|') if types else None
+
+
+def _nodes(graph, labels, handle_id=None):
+    labels = _labels(labels)
+    if handle_id is not None:
+        node = graph.get_node(handle_id, *labels)
+        return [node] if node else []
+    if not labels:
+        return list(graph.nodes.values())
+    return [node for node in graph.nodes_with_label(labels[0]) if node.labels.issuperset(labels)]
+
+
+def _relationship(graph, params):
+    return graph.relationships.get(int(params['relationship_id']))
+
+
+def _conditions(where):
+    """
+    Parses "a.x = {p} AND b.y={q}" to [('a', 'x', 'p'), ('b', 'y', 'q')].
+    """
+    if not where:
+        return []
+    conditions = []
+    for condition in where.split(' AND '):
+        m = re.fullmatch(r'(\w+)\.(\w+) ?= ?\{(\w+)\}', condition.strip())
+        if m is None:
+            raise UnsupportedQuery(where)
+        conditions.append(m.groups())
+    return conditions
+
+
+def _cypher_regex_match(pattern, value):
+    if isinstance(value, list):
+        return any(_cypher_regex_match(pattern, x) for x in value)
+    return isinstance(value, str) and pattern.fullmatch(value) is not None
+
+
+def _sort_key(*values):
+    """
+    Sort key like Cypher ORDER BY, nulls last.
+    """
+    return tuple((value is None, value if value is not None else '') for value in values)
+
+
+def _lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def _get(node, prop):
+    """
+    node.prop in Cypher, null for a null node.
+    """
+    return node.properties.get(prop) if node is not None else None
+
+
+def _label_list(node):
+    """
+    labels(n) with Node first and the node type last, in the order the nodes were created with.
+    """
+    return sorted(node.labels, key=lambda label: (label != 'Node', label not in META_TYPES, label))
+
+
+def _distinct(items):
+    result = []
+    for item in items:
+        if item not in result:
+            result.append(item)
+    return result
+
+
+def _reachable(graph, start, types, direction, max_depth):
+    """
+    The nodes matched by (start)-[:types*1..max_depth]-(node), each once, nearest first.
+    """
+    seen = {start.id}
+    nodes = []
+    frontier = [start]
+    for _ in range(max_depth):
+        following = []
+        for node in frontier:
+            for r in graph.relationships_of(node, direction, types):
+                other = r.other(node)
+                if other.id not in seen:
+                    seen.add(other.id)
+                    following.append(other)
+        if not following:
+            break
+        nodes.extend(following)
+        frontier = following
+    return nodes
+
+
+def _paths_to(graph, node, max_depth=20):
+    """
+    The nodes of each path matched by p=()-[:Has*0..max_depth]->(node), shortest first.
+    """
+    paths = [[node]]
+    for path in paths:
+        if len(path) > max_depth:
+            continue
+        for r in graph.relationships_of(path[0], 'in', ['Has']):
+            if r.start not in path:
+                paths.append([r.start] + path)
+    return paths
+
+
+def _longest(paths):
+    """
+    FILTER(path IN paths WHERE length(path)=maxLength)
+    """
+    longest = max((len(path) for path in paths), default=0)
+    return [path for path in paths if len(path) == longest]
+
+
+def _top_parent(graph, node):
+    """
+    last(collect(end)) of OPTIONAL MATCH (node)<-[:Has*1..10]-(end), the top most parent of node or None.
+    """
+    parents = _reachable(graph, node, ['Has'], 'in', 10) if node is not None else []
+    return parents[-1] if parents else None
+
+
+# Queries sent by norduniclient.core
+
+@register_query(r'CREATE (CONSTRAINT|INDEX) ON .*')
+def _schema(graph, match, params):
+    return []
+
+
+@register_query(r'CREATE \(n:(?P<labels>[\w:]+) \{ name: \{ name \}, handle_id: \{ handle_id \}\}\) RETURN n')
+def _create_node(graph, match, params):
+    node = graph.create_node(_labels(match.group('labels')),
+                             {'name': params['name'], 'handle_id': params['handle_id']})
+    return [(('n',), (node,))]
+
+
+@register_query(r'MATCH \(n:Node \{ ?handle_id: ?\{ ?handle_id ?\} ?\}\) RETURN n')
+def _get_node(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    return [(('n',), (node,))] if node else []
+
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\) OPTIONAL MATCH \(n\)-\[r\]-\(\) DELETE n,r')
+def _delete_node(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node:
+        graph.delete_node(node)
+    return []
+
+
+@register_query(r'MATCH \(a:Node\) OPTIONAL MATCH \(a\)-\[r\]-\(b\) DELETE a, b, r')
+def _delete_all(graph, match, params):
+    graph.clear()
+    return []
+
+
+@register_query(r'MATCH \(n:Node\) WHERE n\.handle_id >= \{start\} AND n\.handle_id < \{end\} DETACH DELETE n')
+def _delete_handle_id_range(graph, match, params):
+    for handle_id, node in list(graph.by_handle_id.items()):
+        if isinstance(handle_id, int) and params['start'] <= handle_id < params['end']:
+            graph.delete_node(node)
+    return []
+
+
+@register_query(r'MATCH \(\)-\[r\]->\(\) WHERE ID\(r\) = \{relationship_id\} RETURN r')
+def _get_relationship(graph, match, params):
+    relationship = _relationship(graph, params)
+    return [(('r',), (relationship,))] if relationship else []
+
+
+@register_query(r'MATCH \(start\)-\[r\]->\(end\) WHERE ID\(r\) = \{relationship_id\} RETURN start, r, end')
+def _get_relationship_bundle(graph, match, params):
+    r = _relationship(graph, params)
+    return [(('start', 'r', 'end'), (r.start, r, r.end))] if r else []
+
+
+@register_query(r'MATCH \(\)-\[r\]->\(\) WHERE ID\(r\) = \{relationship_id\} DELETE r')
+def _delete_relationship(graph, match, params):
+    relationship = _relationship(graph, params)
+    if relationship:
+        graph.delete_relationship(relationship)
+    return []
+
+
+@register_query(r'MATCH \(\)-\[r\]->\(\) WHERE ID\(r\) = \{relationship_id\} SET r = \{props\} RETURN r')
+def _set_relationship_properties(graph, match, params):
+    relationship = _relationship(graph, params)
+    if relationship is None:
+        return []
+    relationship.properties = _clean_properties(params['props'])
+    return [(('r',), (relationship,))]
+
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{props\}\.handle_id\}\) SET n = \{props\} RETURN n')
+def _set_node_properties(graph, match, params):
+    node = graph.get_node(params['props']['handle_id'])
+    if node is None:
+        return []
+    graph.set_node_properties(node, params['props'])
+    return [(('n',), (node,))]
+
+
+@register_query(r'MATCH \(n:(?P<label>\w+)\) WHERE n\.(?P<prop>\w+) = \{value\} RETURN distinct n')
+def _get_nodes_by_value(graph, match, params):
+    prop, value = match.group('prop'), params['value']
+    return [(('n',), (node,)) for node in graph.nodes_with_label(match.group('label'))
+            if node.properties.get(prop) == value or
+            (isinstance(node.properties.get(prop), list) and value in node.properties[prop])]
+
+
+@register_query(r'MATCH \(n:(?P<label>\w+)\) RETURN (distinct )?n')
+def _get_nodes_by_type(graph, match, params):
+    return [(('n',), (node,)) for node in graph.nodes_with_label(match.group('label'))]
+
+
+@register_query(r'MATCH \(n:(?P<label>\w+)\) WHERE n\.(?P<prop>\w+) =~ "\(\?i\)\.\*(?P<value>.*?)\.\*" OR '
+                r'any\(x IN n\.(?P=prop) WHERE x =~ "\(\?i\)\.\*(?P=value)\.\*"\) RETURN distinct n')
+def _search_nodes_by_prop(graph, match, params):
+    pattern = re.compile('(?i).*{}.*'.format(match.group('value')))
+    return [(('n',), (node,)) for node in graph.nodes_with_label(match.group('label'))
+            if _cypher_regex_match(pattern, node.properties.get(match.group('prop')))]
+
+
+@register_query(r'MATCH \(n:(?P<label>\w+)\) WITH n, keys\(n\) as props WHERE any\(prop in props WHERE '
+                r'n\[prop\] =~ "\(\?i\)\.\*(?P<value>.*?)\.\*"\) OR any\(prop in props WHERE any\(x IN n\[prop\] '
+                r'WHERE x =~ "\(\?i\)\.\*(?P=value)\.\*"\)\) RETURN distinct n')
+def _search_nodes(graph, match, params):
+    pattern = re.compile('(?i).*{}.*'.format(match.group('value')))
+    return [(('n',), (node,)) for node in graph.nodes_with_label(match.group('label'))
+            if any(_cypher_regex_match(pattern, value) for value in node.properties.values())]
+
+
+@register_query(r'MATCH \(n:Node \{name: \{name\}\}\) RETURN n')
+def _get_nodes_by_name(graph, match, params):
+    return [(('n',), (node,)) for node in graph.nodes_with_label('Node')
+            if node.properties.get('name') == params['name']]
+
+
+@register_query(r'MATCH \(n:(?P<label>\w+)\) WHERE LOWER\(n\.(?P<prop>\w+)\) (?P<func>CONTAINS|STARTS WITH|ENDS WITH) '
+                r'LOWER\(\{value\}\) RETURN n')
+def _get_indexed_node(graph, match, params):
+    value = params['value'].lower()
+    test = {
+        'CONTAINS': lambda s: value in s,
+        'STARTS WITH': lambda s: s.startswith(value),
+        'ENDS WITH': lambda s: s.endswith(value),
+    }[match.group('func')]
+    return [(('n',), (node,)) for node in graph.nodes_with_label(match.group('label'))
+            if isinstance(node.properties.get(match.group('prop')), str) and
+            test(node.properties[match.group('prop')].lower())]
+
+
+@register_query(r'MATCH \(n:Node \{ name: \{name\} \}\) WHERE \{label\} IN labels\(n\) '
+                r'RETURN n\.handle_id as handle_id')
+def _get_unique_node_by_name(graph, match, params):
+    return [(('handle_id',), (node.properties['handle_id'],)) for node in graph.nodes_with_label(params['label'])
+            if node.properties.get('name') == params['name']]
+
+
+@register_query(r'MATCH \(a:Node \{handle_id: \{start\}\}\),\(b:Node \{handle_id: \{end\}\}\) '
+                r'CREATE \(a\)-\[r:(?P<type>\w+)\]->\(b\) RETURN r')
+def _create_relationship(graph, match, params):
+    start, end = graph.get_node(params['start']), graph.get_node(params['end'])
+    if start is None or end is None:
+        return []
+    return [(('r',), (graph.create_relationship(start, match.group('type'), end),))]
+
+
+@register_query(r'MATCH \(a:Node \{handle_id: \{handle_id1\}\}\)' + RELATIONSHIP +
+                r'\(b:Node \{handle_id: \{handle_id2\}\}\) RETURN collect\(r\) as relationships')
+def _get_relationships(graph, match, params):
+    a, b = graph.get_node(params['handle_id1']), graph.get_node(params['handle_id2'])
+    relationships = []
+    if a and b:
+        relationships = [r for r in graph.relationships_of(a, types=_types(match)) if r.other(a) is b]
+    return [(('relationships',), (relationships,))]
+
+
+# Queries sent by norduniclient.models
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\) (?P<op>SET|REMOVE) n:(?P<label>\w+) RETURN n')
+def _set_label(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    if match.group('op') == 'SET':
+        node.labels.add(match.group('label'))
+    else:
+        node.labels.discard(match.group('label'))
+    return [(('n',), (node,))]
+
+
+@register_query(r'MATCH ' + NODE.format('a') + RELATIONSHIP + NODE.format('b') + r'(?: WHERE (?P<where>.+?))? '
+                r'RETURN (?:"(?P<key>\w+)" as key, )?r, (?P<ret>\w+)(?: as node)?')
+def _neighbours(graph, match, params):
+    """
+    MATCH (n:Node {handle_id: {handle_id}})<-[r:Has]-(parent) RETURN r, parent as node, and the like.
+    """
+    if match.group('ret') != match.group('b') or match.group('a_param') != 'handle_id':
+        raise UnsupportedQuery(match.string)
+    start = graph.get_node(params['handle_id'], *_labels(match.group('a_labels')))
+    if start is None:
+        return []
+    b_labels = _labels(match.group('b_labels'))
+    b_handle_id = params.get(match.group('b_param')) if match.group('b_param') else None
+    conditions = _conditions(match.group('where'))
+    keys = ('r', 'node') if match.group('key') is None else ('key', 'r', 'node')
+    rows = []
+    for r in graph.relationships_of(start, _direction(match), _types(match)):
+        node = r.other(start)
+        if not node.labels.issuperset(b_labels):
+            continue
+        if b_handle_id is not None and node.properties.get('handle_id') != b_handle_id:
+            continue
+        entities = {'r': r, match.group('b'): node, match.group('a'): start}
+        if any(entities[alias].properties.get(prop) != params.get(param) for alias, prop, param in conditions):
+            continue
+        rows.append((keys, (r, node) if match.group('key') is None else (match.group('key'), r, node)))
+    return rows
+
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\), ' + NODE.format('b') +
+                r' WITH n, (?P=b), NOT EXISTS\(.*\) as created MERGE \(n\)' + RELATIONSHIP +
+                r'\((?P=b)\) RETURN created, r, (?P=b) as node')
+def _merge_relationship(graph, match, params):
+    """
+    The set_* methods of the node models, MERGE (n)<-[r:Uses]-(user) RETURN created, r, user as node.
+    """
+    n = graph.get_node(params['handle_id'])
+    other = graph.get_node(params.get(match.group('b_param')), *_labels(match.group('b_labels')))
+    if n is None or other is None:
+        return []
+    existing = [r for r in graph.relationships_of(n, _direction(match), _types(match)) if r.other(n) is other]
+    keys = ('created', 'r', 'node')
+    if existing:
+        return [(keys, (False, r, other)) for r in existing]
+    if _direction(match) == 'in':
+        r = graph.create_relationship(other, match.group('types'), n)
+    else:
+        r = graph.create_relationship(n, match.group('types'), other)
+    return [(keys, (True, r, other))]
+
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\), ' + NODE.format('b') +
+                r' CREATE \(n\)(?P<left><)?-\[r:(?P<type>\w+) \{(?P<props>[^\]]*)\}\]-(?P<right>>)?\((?P=b)\) '
+                r'RETURN true as created, r, (?P=b) as node')
+def _create_relationship_with_properties(graph, match, params):
+    """
+    set_host_service, set_peering_group and set_group_dependency.
+    """
+    n = graph.get_node(params['handle_id'])
+    other = graph.get_node(params.get(match.group('b_param')), *_labels(match.group('b_labels')))
+    if n is None or other is None:
+        return []
+    properties = dict((key, params.get(param)) for key, param in re.findall(r'(\w+): ?\{(\w+)\}', match.group('props')))
+    if match.group('left'):
+        r = graph.create_relationship(other, match.group('type'), n, properties)
+    else:
+        r = graph.create_relationship(n, match.group('type'), other, properties)
+    return [(('created', 'r', 'node'), (True, r, other))]
+
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\), \(other:Node:Relation \{name: \{name\}\}\) '
+                r'WHERE other\.handle_id <> n\.handle_id RETURN COLLECT\(other\.handle_id\) as ids')
+def _with_same_name(graph, match, params):
+    if graph.get_node(params['handle_id']) is None:
+        return []
+    return [(('ids',), ([node.properties['handle_id'] for node in graph.nodes_with_label('Relation')
+                         if node.properties.get('name') == params['name'] and
+                         node.properties['handle_id'] != params['handle_id']],))]
+
+
+# Queries sent by apps.noclook.synthetic
+
+@register_query(r'UNWIND \{rows\} AS row CREATE \(n:(?P<labels>[\w:]+)\) SET n = row')
+def _create_nodes(graph, match, params):
+    labels = _labels(match.group('labels'))
+    for row in params['rows']:
+        graph.create_node(labels, row)
+    return []
+
+
+@register_query(r'UNWIND \{rows\} AS row '
+                r'MATCH \(a:Node \{handle_id: row\.start\}\), \(b:Node \{handle_id: row\.end\}\) '
+                r'CREATE \(a\)-\[r:(?P<type>\w+)\]->\(b\) SET r = row\.properties')
+def _create_relationships(graph, match, params):
+    for row in params['rows']:
+        start, end = graph.get_node(row['start']), graph.get_node(row['end'])
+        if start is not None and end is not None:
+            graph.create_relationship(start, match.group('type'), end, row.get('properties'))
+    return []
+
+
+# Queries sent by apps.noclook.topology
+
+@register_query(r'MATCH \(a:Node\)-\[r\]->\(b:Node\) WHERE a\.handle_id >= \{start\} AND a\.handle_id <= \{end\} '
+                r'RETURN a\.handle_id as start, type\(r\) as type, b\.handle_id as end')
+def _export_relationships(graph, match, params):
+    rows = []
+    for relationship in sorted(graph.relationships.values(), key=lambda r: r.id):
+        start = relationship.start.properties.get('handle_id')
+        end = relationship.end.properties.get('handle_id')
+        if isinstance(start, int) and params['start'] <= start <= params['end'] and end is not None:
+            rows.append((('start', 'type', 'end'), (start, relationship.type, end)))
+    return rows
+
+
+_EXPAND = re.compile(r'MATCH \(n:Node\) WHERE n\.handle_id IN \{handle_ids\} '
+                     r'MATCH \(n\)(?P<left><)?-\[:(?P<types>[\w|]+)\]-(?P<right>>)?\(m:Node\) '
+                     r'RETURN n\.handle_id as parent, m\.handle_id as handle_id')
+
+
+@register_query(r'(?P<parts>MATCH \(n:Node\) WHERE n\.handle_id IN \{handle_ids\} MATCH .* '
+                r'RETURN n\.handle_id as parent, m\.handle_id as handle_id)')
+def _expand(graph, match, params):
+    rows = []
+    for part in match.group('parts').split(' UNION '):
+        expand = _EXPAND.fullmatch(part)
+        if expand is None:
+            raise UnsupportedQuery(match.group(0))
+        direction = 'in' if expand.group('left') else 'out'
+        types = expand.group('types').split('|')
+        for handle_id in params['handle_ids']:
+            node = graph.get_node(handle_id)
+            if node is None:
+                continue
+            for relationship in graph.relationships_of(node, direction, types):
+                other = relationship.other(node).properties.get('handle_id')
+                row = (('parent', 'handle_id'), (handle_id, other))
+                if other is not None and row not in rows:
+                    rows.append(row)
+    return rows
+
+
+@register_query(r'MATCH \(n:Node\) WHERE n\.handle_id IN \{handle_ids\} '
+                r'MATCH \(n\)(?P<left><)?-\[:(?P<types>[\w|]+)\*1\.\.(?P<max_depth>\d*)\]-(?P<right>>)?\(m:Node\) '
+                r'RETURN DISTINCT m\.handle_id as handle_id')
+def _reachable_from(graph, match, params):
+    direction = 'in' if match.group('left') else 'out' if match.group('right') else None
+    types = match.group('types').split('|')
+    max_depth = int(match.group('max_depth') or len(graph.nodes))
+    starts = (graph.get_node(handle_id) for handle_id in params['handle_ids'])
+    nodes = _distinct(node for start in starts if start is not None
+                      for node in _reachable(graph, start, types, direction, max_depth))
+    return [(('handle_id',), (node.properties.get('handle_id'),)) for node in nodes]
+
+
+# Queries sent by apps.noclook.connection_paths
+
+@register_query(r'MATCH \(n:Node\) WHERE n\.handle_id IN \{handle_ids\} RETURN n')
+def _get_nodes(graph, match, params):
+    nodes = (graph.get_node(handle_id) for handle_id in params['handle_ids'])
+    return [(('n',), (node,)) for node in nodes if node is not None]
+
+
+# Queries sent by apps.noclook.api.resources
+
+@register_query(r'MATCH \(n:Node\) WHERE n\.handle_id IN \{handle_ids\} MATCH \(n\)-\[r\]-\(:Node\) '
+                r'RETURN n\.handle_id as handle_id, id\(r\) as relationship_id ORDER BY type\(r\), id\(r\)')
+def _relationship_ids(graph, match, params):
+    rows = []
+    for handle_id in params['handle_ids']:
+        node = graph.get_node(handle_id)
+        if node is None:
+            continue
+        rows.extend((r.type, r.id, handle_id) for r in graph.relationships_of(node))
+    return [(('handle_id', 'relationship_id'), (handle_id, relationship_id))
+            for rel_type, relationship_id, handle_id in sorted(rows)]
+
+
+# Queries sent by apps.noclook.arborgraph
+
+@register_query(r'MATCH \(n:Node\) WHERE n\.handle_id IN \{handle_ids\} MATCH \(n\)-\[r\]-\(other:Node\) '
+                r'WHERE NOT other\.operational_state IN \[\'Decommissioned\'\] '
+                r'OR NOT exists\(other\.operational_state\) '
+                r'RETURN n\.handle_id as handle_id, startNode\(r\) = n as outgoing, type\(r\) as relation, other')
+def _arborgraph_neighbours(graph, match, params):
+    rows = []
+    for handle_id in params['handle_ids']:
+        node = graph.get_node(handle_id)
+        if node is None:
+            continue
+        for relationship in graph.relationships_of(node):
+            other = relationship.other(node)
+            if other.properties.get('operational_state') != 'Decommissioned':
+                rows.append((('handle_id', 'outgoing', 'relation', 'other'),
+                             (handle_id, relationship.start is node, relationship.type, other)))
+    return rows
+
+
+# Queries sent by apps.noclook.activitylog
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\)--\(m:Node\) RETURN DISTINCT m\.handle_id as handle_id')
+def _neighbour_handle_ids(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    handle_ids = []
+    for relationship in graph.relationships_of(node):
+        handle_id = relationship.other(node).properties.get('handle_id')
+        if handle_id not in handle_ids:
+            handle_ids.append(handle_id)
+    return [(('handle_id',), (handle_id,)) for handle_id in handle_ids]
+
+
+# Queries sent by the norduniclient node models
+
+LONGEST_PATHS = (r'WITH COLLECT\(nodes\(p\)\) as paths, MAX\(length\(nodes\(p\)\)\) AS maxLength '
+                 r'WITH FILTER\(path IN paths WHERE length\(path\)=maxLength\) AS longestPaths '
+                 r'UNWIND\(longestPaths\) as (?P<key>\w+) RETURN (?P=key)')
+
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\)(?P<left><)?-\[:(?P<types>\w+)\]-(?P<right>>)?'
+                r'\((?P<parent>\w+)\) (?:OPTIONAL )?MATCH p=\(\)-\[:Has\*0\.\.20\]->'
+                r'(?P<located>\(r\)<-\[:Located_in\]-\(\)-\[:Has\*0\.\.20\]->)?\((?P=parent)\) ' + LONGEST_PATHS)
+def _location_path(graph, match, params):
+    """
+    get_location_path and get_placement_path of the node models, the longest paths of Has relationships down to the
+    location or parent of the node, for sub equipment through the location of the equipment.
+    """
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    paths = []
+    for relationship in graph.relationships_of(node, _direction(match), _types(match)):
+        for below in _paths_to(graph, relationship.other(node)):
+            if not match.group('located'):
+                paths.append(below)
+                continue
+            for located_in in graph.relationships_of(below[0], 'out', ['Located_in']):
+                paths.extend(above + below for above in _paths_to(graph, located_in.end))
+    return [((match.group('key'),), (path,)) for path in _longest(paths)]
+
+
+AS_TYPES = (r'WITH (?:node, )?direct, deps, filter\(n in deps WHERE n:Service\) as services '
+            r'WITH (?:node, )?direct, deps, services, filter\(n in deps WHERE n:Optical_Path\) as paths '
+            r'WITH (?:node, )?direct, deps, services, paths, '
+            r'filter\(n in deps WHERE n:Optical_Multiplex_Section\) as oms '
+            r'WITH (?:node, )?direct, deps, services, paths, oms, filter\(n in deps WHERE n:Optical_Link\) as links ')
+AS_TYPES_KEYS = ('direct', 'services', 'paths', 'oms', 'links')
+
+
+def _as_types(direct, deps):
+    return (direct,) + tuple([node for node in deps if label in node.labels]
+                             for label in ('Service', 'Optical_Path', 'Optical_Multiplex_Section', 'Optical_Link'))
+
+
+def _depending(graph, nodes, types):
+    """
+    collect(DISTINCT dep) of OPTIONAL MATCH (node)<-[:types*1..20]-(dep) for each of nodes.
+    """
+    return _distinct(dep for node in nodes for dep in _reachable(graph, node, types, 'in', 20))
+
+
+@register_query(r'MATCH \(node:Node \{handle_id: \{handle_id\}\}\) OPTIONAL MATCH \(node\)<-\[:Depends_on\]-\(d\) '
+                r'WITH node, collect\(DISTINCT d\) as direct '
+                r'OPTIONAL MATCH \(node\)<-\[:Part_of\|Depends_on\*1\.\.20\]-\(dep\) '
+                r'OPTIONAL MATCH \(node\)-\[:Depends_on\]->\(p:Port\)<-\[:Part_of\|Depends_on\*1\.\.20\]-\(port_deps\) '
+                r'WITH direct, collect\(DISTINCT dep\) \+ collect\(DISTINCT port_deps\) as deps ' + AS_TYPES +
+                r'RETURN direct, services, paths, oms, links')
+def _dependents(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    direct = _distinct(r.start for r in graph.relationships_of(node, 'in', ['Depends_on']))
+    ports = [r.end for r in graph.relationships_of(node, 'out', ['Depends_on']) if 'Port' in r.end.labels]
+    deps = _depending(graph, [node], ['Part_of', 'Depends_on']) + _depending(graph, ports, ['Part_of', 'Depends_on'])
+    return [(AS_TYPES_KEYS, _as_types(direct, deps))]
+
+
+@register_query(r'MATCH \(node:Node \{handle_id: \{handle_id\}\}\) OPTIONAL MATCH \(node\)<-\[:Depends_on\]-\(d\) '
+                r'WITH node, collect\(DISTINCT d\) as direct '
+                r'OPTIONAL MATCH \(node\)-\[:Has\*1\.\.20\]->\(\)<-\[:Part_of\|Depends_on\*1\.\.20\]-\(dep\) '
+                r'OPTIONAL MATCH \(node\)-\[:Has\*1\.\.20\]->\(\)<-\[:Connected_to\]-\(\)-\[:Connected_to\]->\(\)'
+                r'<-\[:Depends_on\*1\.\.20\]-\(cable_dep\) '
+                r'WITH direct, collect\(DISTINCT dep\) \+ collect\(DISTINCT cable_dep\) \+ direct as coll '
+                r'UNWIND coll AS x WITH direct, collect\(DISTINCT x\) as deps ' + AS_TYPES +
+                r'RETURN direct, services, paths, oms, links')
+def _equipment_dependents(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    direct = _distinct(r.start for r in graph.relationships_of(node, 'in', ['Depends_on']))
+    parts = _reachable(graph, node, ['Has'], 'out', 20)
+    cable_ends = [
+        r1.end for part in parts for r0 in graph.relationships_of(part, 'in', ['Connected_to'])
+        for r1 in graph.relationships_of(r0.start, 'out', ['Connected_to']) if r1 is not r0
+    ]
+    deps = _distinct(_depending(graph, parts, ['Part_of', 'Depends_on']) +
+                     _depending(graph, cable_ends, ['Depends_on']) + direct)
+    if not deps:
+        return []
+    return [(AS_TYPES_KEYS, _as_types(direct, deps))]
+
+
+@register_query(r'MATCH \(node:Node \{handle_id: \{handle_id\}\}\) OPTIONAL MATCH \(node\)<-\[:Depends_on\]-\(d\) '
+                r'WITH node, filter\(n in collect\(DISTINCT d\) WHERE NOT\(n:Host_Service\)\) as direct '
+                r'MATCH \(node\)<-\[:Depends_on\*1\.\.20\]-\(dep\) WITH direct, collect\(DISTINCT dep\) as deps ' +
+                AS_TYPES + r'RETURN direct, services, paths, oms, links')
+def _host_dependents(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    deps = _depending(graph, [node], ['Depends_on'])
+    if not deps:
+        return []
+    direct = _distinct(r.start for r in graph.relationships_of(node, 'in', ['Depends_on'])
+                       if 'Host_Service' not in r.start.labels)
+    return [(AS_TYPES_KEYS, _as_types(direct, deps))]
+
+
+@register_query(r'MATCH \(node:Node \{handle_id: \{handle_id\}\}\) OPTIONAL MATCH \(node\)-\[:Depends_on\]->\(d\) '
+                r'WITH node, collect\(DISTINCT d\) as direct MATCH \(node\)-\[:Depends_on\*1\.\.20\]->\(dep\) '
+                r'WITH node, direct, collect\(DISTINCT dep\) as deps ' + AS_TYPES +
+                r'WITH node, direct, services, paths, oms, links '
+                r'OPTIONAL MATCH \(node\)-\[:Depends_on\*1\.\.20\]->\(\)-\[:Connected_to\*1\.\.50\]-\(cable\) '
+                r'RETURN direct, services, paths, oms, links, '
+                r'filter\(n in collect\(DISTINCT cable\) WHERE n:Cable\) as cables')
+def _dependencies(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    deps = _reachable(graph, node, ['Depends_on'], 'out', 20)
+    if not deps:
+        return []
+    direct = _distinct(r.end for r in graph.relationships_of(node, 'out', ['Depends_on']))
+    cables = _distinct(cable for dep in deps for cable in _reachable(graph, dep, ['Connected_to'], None, 50)
+                       if 'Cable' in cable.labels)
+    return [(AS_TYPES_KEYS + ('cables',), _as_types(direct, deps) + (cables,))]
+
+
+LOCATION_AND_SITE = (r'OPTIONAL MATCH \(end\)-\[:Located_in\]->\(location\) '
+                     r'OPTIONAL MATCH \(location\)<-\[:Has(?P<site_depth>\*1\.\.10)?\]-\(site(?P<site_label>:Site)?\)')
+
+
+def _locations_and_sites(graph, match, end):
+    """
+    The (location, site) rows of LOCATION_AND_SITE.
+    """
+    rows = []
+    locations = [r.end for r in graph.relationships_of(end, 'out', ['Located_in'])] if end is not None else []
+    for location in locations or [None]:
+        sites = []
+        if location is not None and match.group('site_depth'):
+            sites = [site for site in _reachable(graph, location, ['Has'], 'in', 10) if 'Site' in site.labels]
+        elif location is not None:
+            sites = [r.start for r in graph.relationships_of(location, 'in', ['Has'])
+                     if not match.group('site_label') or 'Site' in r.start.labels]
+        rows.extend((location, site) for site in sites or [None])
+    return rows
+
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\)-\[:Has\*1\.\.10\]->\(porta:Port\) '
+                r'OPTIONAL MATCH \(porta\)<-\[r0:Connected_to\]-\(cable\) '
+                r'OPTIONAL MATCH \(cable\)-\[r1:Connected_to\]->\(portb:Port\) WHERE ID\(r1\) <> ID\(r0\) '
+                r'OPTIONAL MATCH \(portb\)<-\[:Has\*1\.\.10\]-\(end\) '
+                r'WITH porta, r0, cable, portb, r1, last\(collect\(end\)\) as end ' + LOCATION_AND_SITE +
+                r' RETURN porta, r0, cable, r1, portb, end, location, site')
+def _connections(graph, match, params):
+    """
+    get_connections of the equipment models, the cables connected to the ports of the equipment and where they go.
+    """
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    keys = ('porta', 'r0', 'cable', 'r1', 'portb', 'end', 'location', 'site')
+    rows = []
+    for porta in _reachable(graph, node, ['Has'], 'out', 10):
+        if 'Port' not in porta.labels:
+            continue
+        for r0 in graph.relationships_of(porta, 'in', ['Connected_to']) or [None]:
+            cable = r0.start if r0 is not None else None
+            r1s = [r for r in graph.relationships_of(cable, 'out', ['Connected_to'])
+                   if r is not r0 and 'Port' in r.end.labels] if cable is not None else []
+            for r1 in r1s or [None]:
+                portb = r1.end if r1 is not None else None
+                end = _top_parent(graph, portb)
+                rows.extend((keys, (porta, r0, cable, r1, portb, end, location, site))
+                            for location, site in _locations_and_sites(graph, match, end))
+    return rows
+
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\)-\[rel:Connected_to\]->\(port\) '
+                r'OPTIONAL MATCH \(port\)<-\[:Has\*1\.\.10\]-\(end\) WITH rel, port, last\(collect\(end\)\) as end ' +
+                LOCATION_AND_SITE + r' RETURN id\(rel\) as rel_id, rel, port, end, location, site '
+                r'ORDER BY end\.name, port\.name')
+def _connected_equipment(graph, match, params):
+    """
+    get_connected_equipment of the cable model, the ports the cable is connected to and their equipment.
+    """
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    rows = []
+    for rel in graph.relationships_of(node, 'out', ['Connected_to']):
+        end = _top_parent(graph, rel.end)
+        rows.extend((rel.id, rel, rel.end, end, location, site)
+                    for location, site in _locations_and_sites(graph, match, end))
+    rows.sort(key=lambda row: _sort_key(_get(row[3], 'name'), _get(row[2], 'name')))
+    return [(('rel_id', 'rel', 'port', 'end', 'location', 'site'), row) for row in rows]
+
+
+
+@register_query(r'MATCH \(porta:Node \{handle_id: \{handle_id\}\}\)<-\[r0:Connected_to\]-\(cable\) '
+                r'OPTIONAL MATCH \(porta\)<-\[r0:Connected_to\]-\(cable\)-\[r1:Connected_to\]->\(portb\) '
+                r'OPTIONAL MATCH \(portb\)<-\[:Has\*1\.\.10\]-\(end\) '
+                r'WITH porta, r0, cable, portb, r1, last\(collect\(end\)\) as end ' + LOCATION_AND_SITE +
+                r' RETURN porta, r0, cable, r1, portb, end, location, site')
+def _port_connections(graph, match, params):
+    """
+    get_connections of the sub equipment models.
+    """
+    porta = graph.get_node(params['handle_id'])
+    if porta is None:
+        return []
+    keys = ('porta', 'r0', 'cable', 'r1', 'portb', 'end', 'location', 'site')
+    rows = []
+    for r0 in graph.relationships_of(porta, 'in', ['Connected_to']):
+        cable = r0.start
+        for r1 in [r for r in graph.relationships_of(cable, 'out', ['Connected_to']) if r is not r0] or [None]:
+            portb = r1.end if r1 is not None else None
+            end = _top_parent(graph, portb)
+            rows.extend((keys, (porta, r0, cable, r1, portb, end, location, site))
+                        for location, site in _locations_and_sites(graph, match, end))
+    return rows
+
+
+@register_query(r'MATCH \(node:Node \{handle_id: \{handle_id\}\}\)-\[r:Connected_to\|Depends_on\]-\(port:Port\) '
+                r'WITH port, r OPTIONAL MATCH p=\(port\)<-\[:Has\*1\.\.\]-\(parent\) '
+                r'RETURN port, r as relationship, LAST\(nodes\(p\)\) as parent ORDER BY parent\.name')
+def _logical_ports(graph, match, params):
+    """
+    get_ports of the logical models, a row for each port and each of its parents.
+    """
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    rows = []
+    for r in graph.relationships_of(node, types=['Connected_to', 'Depends_on']):
+        port = r.other(node)
+        if 'Port' in port.labels:
+            parents = _reachable(graph, port, ['Has'], 'in', len(graph.nodes))
+            rows.extend((port, r, parent) for parent in parents or [None])
+    rows.sort(key=lambda row: _sort_key(_get(row[2], 'name')))
+    return [(('port', 'relationship', 'parent'), row) for row in rows]
+
+# Queries sent by apps.noclook.api.resources
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\)-\[r\]-\(:Node\) '
+                r'WHERE \{rel_type\} IS NULL OR type\(r\) = \{rel_type\} '
+                r'RETURN id\(r\) as id, type\(r\) as type, properties\(r\) as data, '
+                r'startNode\(r\)\.handle_id as start, endNode\(r\)\.handle_id as end ORDER BY type\(r\), id\(r\)')
+def _relationships(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    types = [params['rel_type']] if params.get('rel_type') is not None else None
+    relationships = sorted(graph.relationships_of(node, types=types), key=lambda r: (r.type, r.id))
+    return [(('id', 'type', 'data', 'start', 'end'),
+             (r.id, r.type, dict(r.properties), r.start.properties.get('handle_id'), r.end.properties.get('handle_id')))
+            for r in relationships]
+
+
+
+@register_query(r'MATCH \(node:(?P<label>\w+)\) WHERE node\.(?P<prop>\w+) = "(?P<value>[^"]*)" '
+                r'OR node\.(?P=prop) = "(?P<other>[^"]*)" RETURN collect\(node\.handle_id\) as handle_ids')
+def _handle_ids_by_value(graph, match, params):
+    values = (match.group('value'), match.group('other'))
+    nodes = [node for node in graph.nodes_with_label(match.group('label'))
+             if node.properties.get(match.group('prop')) in values]
+    return [(('handle_ids',), ([node.properties.get('handle_id') for node in nodes],))]
+
+# Queries sent by apps.noclook.forms
+
+@register_query(r'MATCH \(n:(?P<label>\w+)\) RETURN n\.handle_id as handle_id, n\.name as name ORDER BY n\.name')
+def _choices(graph, match, params):
+    nodes = sorted(graph.nodes_with_label(match.group('label')), key=lambda n: _sort_key(_get(n, 'name')))
+    return [(('handle_id', 'name'), (_get(n, 'handle_id'), _get(n, 'name'))) for n in nodes]
+
+
+# Queries sent by apps.noclook.views.list
+
+@register_query(r'MATCH \((?P<var>\w+):(?P<label>\w+)\) RETURN (?P=var) ORDER BY (?P=var)\.name')
+def _list_nodes(graph, match, params):
+    nodes = sorted(graph.nodes_with_label(match.group('label')), key=lambda n: _sort_key(_get(n, 'name')))
+    return [((match.group('var'),), (node,)) for node in nodes]
+
+
+@register_query(r'MATCH \((?P<var>\w+):(?P<label>\w+)\) OPTIONAL MATCH \((?P=var)\)<-\[:Owns\|Uses\]-\(user\) '
+                r'RETURN (?P=var), collect\(user\) as users ORDER BY (?P=var)\.name')
+def _list_with_users(graph, match, params):
+    nodes = sorted(graph.nodes_with_label(match.group('label')), key=lambda n: _sort_key(_get(n, 'name')))
+    return [((match.group('var'), 'users'),
+             (node, [r.start for r in graph.relationships_of(node, 'in', ['Owns', 'Uses'])])) for node in nodes]
+
+
+@register_query(r'MATCH \(site:Site\) OPTIONAL MATCH \(site\)<-\[:Responsible_for\]-\(owner:Site_Owner\) '
+                r'RETURN site, owner ORDER BY site\.country_code, site\.name')
+def _list_sites(graph, match, params):
+    rows = []
+    for site in graph.nodes_with_label('Site'):
+        owners = [r.start for r in graph.relationships_of(site, 'in', ['Responsible_for'])
+                  if 'Site_Owner' in r.start.labels]
+        rows.extend((site, owner) for owner in owners or [None])
+    rows.sort(key=lambda row: _sort_key(_get(row[0], 'country_code'), _get(row[0], 'name')))
+    return [(('site', 'owner'), row) for row in rows]
+
+
+@register_query(r'MATCH \(rack:Rack\) OPTIONAL MATCH \(rack\)<-\[:Has\]-\(loc\) '
+                r'OPTIONAL MATCH p=\(loc\)<-\[:Has\*0\.\.20\]-\(\) '
+                r'WITH COLLECT\(nodes\(p\)\) as paths, MAX\(length\(nodes\(p\)\)\) AS maxLength, rack AS rack '
+                r'WITH FILTER\(path IN paths WHERE length\(path\)=maxLength\) AS longestPaths, rack AS rack '
+                r'UNWIND CASE WHEN longestPaths = \[\] THEN \[null\] ELSE longestPaths END as location_path '
+                r'RETURN rack, reverse\(location_path\) as location_path ORDER BY rack\.name')
+def _list_racks(graph, match, params):
+    rows = []
+    for rack in graph.nodes_with_label('Rack'):
+        paths = [path for r in graph.relationships_of(rack, 'in', ['Has']) for path in _paths_to(graph, r.start)]
+        rows.extend((rack, path) for path in _longest(paths) or [None])
+    rows.sort(key=lambda row: _sort_key(_get(row[0], 'name')))
+    return [(('rack', 'location_path'), row) for row in rows]
+
+
+@register_query(r'MATCH \(cable:Cable\) OPTIONAL MATCH \(cable\)-\[r:Connected_to\]->\(port:Port\) '
+                r'OPTIONAL MATCH \(port\)<-\[:Has\*1\.\.10\]-\(end\) WHERE NOT\(\(end\)<-\[:Has\]-\(\)\) '
+                r'RETURN cable, collect\(\{equipment: \{name: end\.name, handle_id: end\.handle_id\}, '
+                r'port: \{name: port\.name, handle_id: port\.handle_id\}\}\) as end order by cable\.name')
+def _list_cables(graph, match, params):
+    rows = []
+    for cable in sorted(graph.nodes_with_label('Cable'), key=lambda n: _sort_key(_get(n, 'name'))):
+        ends = []
+        ports = [r.end for r in graph.relationships_of(cable, 'out', ['Connected_to']) if 'Port' in r.end.labels]
+        for port in ports or [None]:
+            equipment = [node for node in _reachable(graph, port, ['Has'], 'in', 10)
+                         if not graph.relationships_of(node, 'in', ['Has'])] if port is not None else []
+            ends.extend({'equipment': {'name': _get(node, 'name'), 'handle_id': _get(node, 'handle_id')},
+                         'port': {'name': _get(port, 'name'), 'handle_id': _get(port, 'handle_id')}}
+                        for node in equipment or [None])
+        rows.append((('cable', 'end'), (cable, ends)))
+    return rows
+
+
+@register_query(r'MATCH \(port:Port\) OPTIONAL MATCH \(port\)<-\[:Has\]-\(parent:Node\) '
+                r'RETURN port, collect\(parent\) as parent order by toLower\(port\.name\)')
+def _list_ports(graph, match, params):
+    ports = sorted(graph.nodes_with_label('Port'), key=lambda n: _sort_key(_lower(_get(n, 'name'))))
+    return [(('port', 'parent'), (port, [r.start for r in graph.relationships_of(port, 'in', ['Has'])]))
+            for port in ports]
+
+
+@register_query(r'MATCH \(service:Service\)(?: WHERE service\.service_class = "(?P<service_class>[^"]*)")? '
+                r'OPTIONAL MATCH \(service\)<-\[:Uses\]-\(customer:Customer\) '
+                r'WITH service, COLLECT\(customer\) as customers '
+                r'OPTIONAL MATCH \(service\)<-\[:Uses\]-\(end_user:End_User\) '
+                r'RETURN service, customers, COLLECT\(end_user\) as end_users ORDER BY service\.name')
+def _list_services(graph, match, params):
+    rows = []
+    services = graph.nodes_with_label('Service')
+    if match.group('service_class') is not None:
+        services = [s for s in services if s.properties.get('service_class') == match.group('service_class')]
+    for service in sorted(services, key=lambda n: _sort_key(_get(n, 'name'))):
+        users = [r.start for r in graph.relationships_of(service, 'in', ['Uses'])]
+        rows.append((('service', 'customers', 'end_users'),
+                     (service, [u for u in users if 'Customer' in u.labels],
+                      [u for u in users if 'End_User' in u.labels])))
+    return rows
+
+
+# Queries sent by apps.noclook.views.detail and apps.noclook.views.edit
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\)-\[r:Uses\|:Owns\]->\(u\) '
+                r'RETURN labels\(u\) as labels, u\.handle_id as handle_id, u\.name as name, '
+                r'u\.noclook_last_seen as noclook_last_seen, u\.noclook_auto_manage as noclook_auto_manage')
+def _used(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    keys = ('labels', 'handle_id', 'name', 'noclook_last_seen', 'noclook_auto_manage')
+    return [(keys, (_label_list(r.end),) + tuple(_get(r.end, key) for key in keys[1:]))
+            for r in graph.relationships_of(node, 'out', ['Uses', 'Owns'])]
+
+
+@register_query(r'MATCH \((?P<location>\w+):(?P<label>\w+) \{handle_id: \{handle_id\}\}\)-\[:Has\]->'
+                r'\(rack:(?P<rack_label>\w+)\) OPTIONAL MATCH \(rack\)<-\[:Located_in\]-\(item:Node\) '
+                r'WHERE NOT item\.operational_state IN \[\'Decommissioned\'\] OR NOT exists\(item\.operational_state\) '
+                r'RETURN rack, item order by toLower\(rack\.name\), toLower\(item\.name\)')
+def _racked_equipment(graph, match, params):
+    location = graph.get_node(params['handle_id'], match.group('label'))
+    if location is None:
+        return []
+    rows = []
+    for r in graph.relationships_of(location, 'out', ['Has']):
+        rack = r.end
+        if match.group('rack_label') not in rack.labels:
+            continue
+        items = [i.start for i in graph.relationships_of(rack, 'in', ['Located_in'])
+                 if 'Node' in i.start.labels and i.start.properties.get('operational_state') != 'Decommissioned']
+        rows.extend((rack, item) for item in items or [None])
+    rows.sort(key=lambda row: _sort_key(_lower(_get(row[0], 'name')), _lower(_get(row[1], 'name'))))
+    return [(('rack', 'item'), row) for row in rows]
+
+
+@register_query(r'MATCH \(site:Site \{handle_id: \{handle_id\}\}\)-\[:Has\]->\(room:Room\) '
+                r'RETURN room order by toLower\(room\.name\)')
+def _rooms(graph, match, params):
+    site = graph.get_node(params['handle_id'], 'Site')
+    if site is None:
+        return []
+    rooms = [r.end for r in graph.relationships_of(site, 'out', ['Has']) if 'Room' in r.end.labels]
+    return [(('room',), (room,)) for room in sorted(rooms, key=lambda n: _sort_key(_lower(_get(n, 'name'))))]
+
+
+
+@register_query(r'MATCH \(n:Node \{handle_id: \{handle_id\}\}\)<-\[:Part_of\]-\(unit:Unit\) RETURN unit')
+def _units(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    return [(('unit',), (r.start,)) for r in graph.relationships_of(node, 'in', ['Part_of'])
+            if 'Unit' in r.start.labels]
+
+
+# Queries sent by apps.noclook.views.fragments and apps.noclook.helpers
+
+@register_query(r'MATCH \(n:Node\) WHERE n\.handle_id IN \{handle_ids\} '
+                r'MATCH \(n\)<-\[:(?P<types>[\w|]+)\]-\((?P<key>\w+)(?::(?P<label>\w+))?\) '
+                r'RETURN n\.handle_id as handle_id, (?P=key)')
+def _related_nodes(graph, match, params):
+    rows = []
+    for handle_id in params['handle_ids']:
+        node = graph.get_node(handle_id)
+        if node is None:
+            continue
+        rows.extend((('handle_id', match.group('key')), (handle_id, r.start))
+                    for r in graph.relationships_of(node, 'in', _types(match))
+                    if not match.group('label') or match.group('label') in r.start.labels)
+    return rows
+
+
+@register_query(r'MATCH \(n:Node\) WHERE n\.handle_id IN \{handle_ids\} '
+                r'MATCH \(n\)-\[:Connected_to\|Depends_on\]-\(port:Port\) '
+                r'OPTIONAL MATCH p=\(port\)<-\[:Has\*1\.\.\]-\(parent\) '
+                r'RETURN n\.handle_id as handle_id, port, LAST\(nodes\(p\)\) as parent ORDER BY parent\.name')
+def _dependency_ports(graph, match, params):
+    """
+    get_ports of the logical models for each of the nodes.
+    """
+    rows = []
+    for handle_id in params['handle_ids']:
+        node = graph.get_node(handle_id)
+        if node is None:
+            continue
+        for r in graph.relationships_of(node, types=['Connected_to', 'Depends_on']):
+            port = r.other(node)
+            if 'Port' in port.labels:
+                parents = _reachable(graph, port, ['Has'], 'in', len(graph.nodes))
+                rows.extend((handle_id, port, parent) for parent in parents or [None])
+    rows.sort(key=lambda row: _sort_key(_get(row[2], 'name')))
+    return [(('handle_id', 'port', 'parent'), row) for row in rows]
+
+
+@register_query(r'MATCH \(n:Node\) WHERE n\.handle_id IN \{handle_ids\} '
+                r'MATCH p=\(n\)<-\[:Has\*1\.\.20\]-\(parent\) '
+                r'RETURN n\.handle_id as handle_id, parent ORDER BY length\(p\) DESC')
+def _placement_paths(graph, match, params):
+    rows = []
+    for handle_id in params['handle_ids']:
+        node = graph.get_node(handle_id)
+        if node is None:
+            continue
+        # A node has one parent, the nodes reached are the path up to the top, nearest first
+        parents = _reachable(graph, node, ['Has'], 'in', 20)
+        rows.extend((depth + 1, handle_id, parent) for depth, parent in enumerate(parents))
+    rows.sort(key=lambda row: -row[0])
+    return [(('handle_id', 'parent'), (handle_id, parent)) for length, handle_id, parent in rows]
+
+
+# Queries sent by apps.noclook.views.other
+
+@register_query(r'match \(n:Node\) where any\(prop in keys\(n\) where n\[prop\] =~ \{search\}\) return n')
+def _search(graph, match, params):
+    pattern = re.compile(params['search'])
+    return [(('n',), (node,)) for node in graph.nodes_with_label('Node')
+            if any(isinstance(value, str) and pattern.fullmatch(value) for value in node.properties.values())]
+
+
+def _path_name(path):
+    """
+    REDUCE(s = "", n IN path | s + n.name + " "), null if a name is missing.
+    """
+    names = [n.properties.get('name') for n in path]
+    if any(name is None for name in names):
+        return None
+    return ''.join(name + ' ' for name in names)
+
+
+@register_query(r'MATCH p = \(:Location\) - \[:Has \* 0\.\.20\]-> \(l:Location\) '
+                r'WITH COLLECT\(nodes\(p\)\) as paths, MAX\(size\(nodes\(p\)\)\) AS maxLength, '
+                r'l\.handle_id as handle_id '
+                r'WITH \[path IN paths WHERE size\(path\) = maxLength \| path \] AS longestPaths, '
+                r'handle_id as handle_id UNWIND\(longestPaths\) AS location_path '
+                r'WITH REDUCE\(s = "", n IN location_path \| s \+ n\.name \+ " "\) AS name, handle_id '
+                r'WHERE name =~ \$name_re RETURN name, handle_id')
+def _typeahead_locations(graph, match, params):
+    pattern = re.compile(params['name_re'])
+    rows = []
+    for location in graph.nodes_with_label('Location'):
+        paths = [path for path in _paths_to(graph, location) if 'Location' in path[0].labels]
+        for path in _longest(paths):
+            name = _path_name(path)
+            if name is not None and pattern.fullmatch(name):
+                rows.append((('name', 'handle_id'), (name, _get(location, 'handle_id'))))
+    return rows
+
+
+@register_query(r'MATCH \(port:Port\)<-\[:Has\]-\(n:Node\) OPTIONAL MATCH \(n\)-\[:Located_in\]->\(n2:Node\) '
+                r'OPTIONAL MATCH p = \(\) - \[:Has \* 0\.\.20\]->\(n2\) '
+                r'WITH COLLECT\(nodes\(p\)\) as paths, MAX\(length\(nodes\(p\)\)\) AS maxLength, '
+                r'port\.handle_id AS handle_id, n\.handle_id AS parent_id, port\.name AS port_name, '
+                r'n\.name AS node_name '
+                r'WITH FILTER\(path IN paths WHERE length\(path\) = maxLength\) AS longestPaths, '
+                r'handle_id AS handle_id, parent_id AS parent_id, port_name AS port_name, node_name AS node_name '
+                r'UNWIND\(longestPaths\) AS location_path '
+                r'WITH REDUCE\(s = "", n IN location_path \| s \+ n\.name \+ " "\) \+ node_name \+ " " \+ port_name '
+                r'AS name, handle_id, parent_id WHERE name =~ \$name_re RETURN name, handle_id, parent_id')
+def _typeahead_ports(graph, match, params):
+    pattern = re.compile(params['name_re'])
+    rows = []
+    for port in graph.nodes_with_label('Port'):
+        for has in graph.relationships_of(port, 'in', ['Has']):
+            parent = has.start
+            if 'Node' not in parent.labels:
+                continue
+            paths = [path for r in graph.relationships_of(parent, 'out', ['Located_in']) if 'Node' in r.end.labels
+                     for path in _paths_to(graph, r.end)]
+            for path in _longest(paths):
+                name = _path_name(path)
+                if name is None or _get(parent, 'name') is None or _get(port, 'name') is None:
+                    continue
+                name = '{}{} {}'.format(name, parent.properties['name'], port.properties['name'])
+                if pattern.fullmatch(name):
+                    rows.append((('name', 'handle_id', 'parent_id'),
+                                 (name, _get(port, 'handle_id'), _get(parent, 'handle_id'))))
+    return rows
+
+
+@register_query(r'MATCH \(n:Node\) WHERE not n:Location OPTIONAL MATCH \(n\)<-\[:Has\]-\(e:Node\) '
+                r'WITH n\.handle_id as handle_id, coalesce\(e\.name, ""\) \+ " "\+ n\.name as name, '
+                r'labels\(n\) as labels WHERE name =~ \$name_re RETURN handle_id, trim\(name\) as name, labels '
+                r'ORDER BY name')
+def _typeahead_nodes(graph, match, params):
+    pattern = re.compile(params['name_re'])
+    rows = []
+    for node in graph.nodes_with_label('Node'):
+        if 'Location' in node.labels or _get(node, 'name') is None:
+            continue
+        parents = [r.start for r in graph.relationships_of(node, 'in', ['Has']) if 'Node' in r.start.labels]
+        for parent in parents or [None]:
+            name = '{} {}'.format(_get(parent, 'name') or '', node.properties['name'])
+            if pattern.fullmatch(name):
+                rows.append((_get(node, 'handle_id'), name.strip(), _label_list(node)))
+    rows.sort(key=lambda row: _sort_key(row[1]))
+    return [(('handle_id', 'name', 'labels'), row) for row in rows]
+
+
+
+# Queries sent by apps.noclook.templatetags.noclook_tags
+
+@register_query(r'MATCH \(host:Node \{handle_id: \{handle_id\}\}\)<-\[r:Depends_on\]-\(\) '
+                r'RETURN count\(r\.rogue_port\) as count')
+def _count_rogue_ports(graph, match, params):
+    host = graph.get_node(params['handle_id'])
+    relationships = graph.relationships_of(host, 'in', ['Depends_on']) if host is not None else []
+    return [(('count',), (len([r for r in relationships if 'rogue_port' in r.properties]),))]
+
+
+@register_query(r'MATCH \(n:Node\)<-\[:Uses\]-\(u:Node\) where n\.handle_id in \$handle_ids '
+                r'return DISTINCT\(u\.name\) as Uses')
+def _user_names(graph, match, params):
+    nodes = (graph.get_node(handle_id) for handle_id in params['handle_ids'])
+    names = _distinct(_get(r.start, 'name') for node in nodes if node is not None
+                      for r in graph.relationships_of(node, 'in', ['Uses']) if 'Node' in r.start.labels)
+    return [(('Uses',), (name,)) for name in names]
+
+# Queries sent by apps.noclook.views.import_nodes
+
+@register_query(r'MATCH \(n:Node \{name: \{node_name\}\}\)<-\[:Has\]-\(s:Site \{handle_id: \{handle_id\}\}\) RETURN n')
+def _site_child_by_name(graph, match, params):
+    site = graph.get_node(params['handle_id'], 'Site')
+    if site is None:
+        return []
+    return [(('n',), (r.end,)) for r in graph.relationships_of(site, 'out', ['Has'])
+            if r.end.properties.get('name') == params['node_name']]
+
+
+@register_query(r'MATCH p=\(n:Node \{handle_id: \{handle_id\}\}\)-\[r:Has\|:Located_in\*1\.\.3\]-\(x\) '
+                r'WHERE \(not exists\(x\.operational_state\) or x\.operational_state <> \'Decommissioned\'\) '
+                r'RETURN tail\(nodes\(p\)\) as nodes, labels\(x\) as labels')
+def _export_paths(graph, match, params):
+    node = graph.get_node(params['handle_id'])
+    if node is None:
+        return []
+    rows = []
+    # Breadth first, a path comes after the paths to its parents
+    paths = [([node], [])]
+    for nodes, relationships in paths:
+        if len(relationships) == 3:
+            continue
+        for r in graph.relationships_of(nodes[-1], types=['Has', 'Located_in']):
+            if r in relationships:
+                continue
+            x = r.other(nodes[-1])
+            paths.append((nodes + [x], relationships + [r]))
+            if x.properties.get('operational_state') != 'Decommissioned':
+                rows.append((('nodes', 'labels'), (nodes[1:] + [x], _label_list(x))))
+    return rows
+
+
+# Queries sent by apps.noclook.maps
+
+@register_query(r'MATCH \(cable:Cable\) WHERE cable\.cable_type = "Dark Fiber" '
+                r'MATCH \(cable\)-\[Connected_to\]->\(port\) WITH cable, port '
+                r'MATCH \(port\)<-\[:Has\*0\.\.\]-\(equipment\) '
+                r'WHERE \(equipment:Optical_Node\) AND NOT equipment\.type =~ "\(\?i\)\.\*tss\.\*" '
+                r'WITH cable, port, equipment '
+                r'MATCH p2=\(equipment\)-\[:Located_in\]->\(\)<-\[:Has\*0\.\.\]-\(loc\) WHERE \(loc:Site\) '
+                r'RETURN cable, equipment, loc')
+def _optical_nodes(graph, match, params):
+    tss = re.compile('(?i).*tss.*')
+    rows = []
+    for cable in graph.nodes_with_label('Cable'):
+        if cable.properties.get('cable_type') != 'Dark Fiber':
+            continue
+        # Connected_to is the name of the relationship in the pattern, not its type
+        for r in graph.relationships_of(cable, 'out'):
+            port = r.end
+            for equipment in [port] + _reachable(graph, port, ['Has'], 'in', len(graph.nodes)):
+                if 'Optical_Node' not in equipment.labels or not isinstance(equipment.properties.get('type'), str) \
+                        or tss.fullmatch(equipment.properties['type']):
+                    continue
+                for located_in in graph.relationships_of(equipment, 'out', ['Located_in']):
+                    location = located_in.end
+                    for loc in [location] + _reachable(graph, location, ['Has'], 'in', len(graph.nodes)):
+                        if 'Site' in loc.labels:
+                            rows.append((('cable', 'equipment', 'loc'), (cable, equipment, loc)))
+    return rows
+
+
+# Queries sent by apps.noclook.report_snapshots
+
+@register_query(r'MATCH \(host:Host\) OPTIONAL MATCH \(host\)<-\[:Uses\|Owns\]-\(host_user:Host_User\) '
+                r'RETURN host, filter\(x in labels\(host\) where not x in \[\'Node\', \'Host\'\]\) as type, '
+                r'collect\(DISTINCT \{name: host_user\.name, handle_id: host_user\.handle_id\}\) as host_users')
+def _report_hosts(graph, match, params):
+    rows = []
+    for host in graph.nodes_with_label('Host'):
+        users = [r.start for r in graph.relationships_of(host, 'in', ['Uses', 'Owns']) if 'Host_User' in r.start.labels]
+        host_users = _distinct({'name': _get(user, 'name'), 'handle_id': _get(user, 'handle_id')}
+                               for user in users or [None])
+        rows.append((('host', 'type', 'host_users'),
+                     (host, [label for label in _label_list(host) if label not in ('Node', 'Host')], host_users)))
+    return rows
+
+
+@register_query(r'MATCH \(host:Host\)<-\[r:Depends_on\]-\(service\) WHERE (?P<where>exists\(r\.rogue_port\)|r\.public) '
+                r'RETURN host\.handle_id as handle_id, '
+                r'collect\(\{data: r, (?P<id>id: id\(r\), )?start: service\.handle_id\}\) as ports')
+def _report_ports(graph, match, params):
+    rows = []
+    for host in graph.nodes_with_label('Host'):
+        relationships = graph.relationships_of(host, 'in', ['Depends_on'])
+        if match.group('where') == 'r.public':
+            relationships = [r for r in relationships if r.properties.get('public') is True]
+        else:
+            relationships = [r for r in relationships if 'rogue_port' in r.properties]
+        ports = []
+        for r in relationships:
+            port = {'data': r, 'start': _get(r.start, 'handle_id')}
+            if match.group('id'):
+                port['id'] = r.id
+            ports.append(port)
+        if ports:
+            rows.append((('handle_id', 'ports'), (_get(host, 'handle_id'), ports)))
+    return rows
+
+
+# Queries sent by apps.noclook.management.commands.send_host_usage_report
+
+@register_query(r'MATCH \(host_user:Host_User\)-\[:Uses\|Owns\]->\(host:Host:Logical\) '
+                r'WHERE host\.contract_number IN \{contract_numbers\} AND \(host\.noclook_last_seen IS NULL OR '
+                r'host\.noclook_last_seen > \{very_old\}\) AND coalesce\(host\.operational_state, \'\'\) <> '
+                r'\'Decommissioned\' RETURN host\.contract_number AS contract_number, '
+                r'host_user\.name AS host_user_name, host ORDER BY contract_number, host_user_name, host\.name')
+def _host_usage(graph, match, params):
+    rows = []
+    for host_user in graph.nodes_with_label('Host_User'):
+        for r in graph.relationships_of(host_user, 'out', ['Uses', 'Owns']):
+            host = r.end
+            last_seen = host.properties.get('noclook_last_seen')
+            if not host.labels.issuperset(['Host', 'Logical']) or \
+                    host.properties.get('contract_number') not in params['contract_numbers'] or \
+                    host.properties.get('operational_state') == 'Decommissioned' or \
+                    (last_seen is not None and not last_seen > params['very_old']):
+                continue
+            rows.append((host.properties['contract_number'], _get(host_user, 'name'), host))
+    rows.sort(key=lambda row: _sort_key(row[0], row[1], _get(row[2], 'name')))
+    return [(('contract_number', 'host_user_name', 'host'), row) for row in rows]
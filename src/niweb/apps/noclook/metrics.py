@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics in the Prometheus text exposition format, using prometheus_client.
+
+The web metrics are prometheus_client metrics in the default registry and are served by the metrics view. With several
+worker processes PROMETHEUS_MULTIPROC_DIR must be set in the environment before the workers start, each worker then
+keeps its metrics in that directory and the metrics view serves the sum over all workers, see
+prometheus_client.multiprocess. The directory should be emptied when the server is started.
+
+Besides the web metrics the metrics view serves the depth and age of the scan queue, read at scrape time by
+ScanQueueCollector. Consumer scripts use ConsumerRun to write their metrics to a node_exporter textfile collector file
+after each run.
+"""
+
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from time import time, perf_counter
+
+from django.conf import settings
+from django.utils import timezone
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess, \
+    write_to_textfile
+from prometheus_client.core import GaugeMetricFamily
+
+# Upper bounds in seconds for the per view histogram of neo4j time per request
+NEO4J_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# -- Web metrics
+REQUEST_SECONDS = Histogram('noclook_request_duration_seconds', 'Request latency per URL name.',
+                            ['url_name', 'method'])
+DB_QUERIES = Counter('noclook_db_queries_total', 'Number of SQL queries.', ['url_name'])
+DB_QUERY_SECONDS = Counter('noclook_db_query_seconds_total', 'Time spent on SQL queries.', ['url_name'])
+NEO4J_QUERIES = Counter('noclook_neo4j_queries_total', 'Number of neo4j queries.', ['url_name'])
+NEO4J_QUERY_SECONDS = Counter('noclook_neo4j_query_seconds_total', 'Time spent on neo4j queries.', ['url_name'])
+NEO4J_REQUEST_SECONDS = Histogram('noclook_neo4j_request_seconds', 'Neo4j time per request and view.', ['view'],
+                                  buckets=NEO4J_BUCKETS)
+CACHE_REQUESTS = Counter('noclook_cache_requests_total', 'Cache lookups by cache and result (hit or miss).',
+                         ['cache', 'result'])
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+
+class ScanQueueCollector(object):
+    """
+    Depth and age of the oldest item per type and status of the scan queue.
+    """
+
+    def collect(self):
+        from django.db.models import Count, Min
+        from apps.scan.models import QueueItem
+        now = timezone.now()
+        depth = GaugeMetricFamily('noclook_scan_queue_items', 'Number of items in the scan queue.',
+                                  labels=['type', 'status'])
+        age = GaugeMetricFamily('noclook_scan_queue_oldest_age_seconds', 'Age of the oldest item in the scan queue.',
+                                labels=['type', 'status'])
+        items = QueueItem.objects.values('type', 'status').annotate(depth=Count('id'), oldest=Min('created_at'))
+        for item in items.order_by('type', 'status'):
+            labels = [item['type'], item['status']]
+            depth.add_metric(labels, item['depth'])
+            oldest = item['oldest']
+            if timezone.is_naive(oldest):
+                oldest = timezone.make_aware(oldest, timezone.utc)
+            age.add_metric(labels, (now - oldest).total_seconds())
+        return [depth, age]
+
+
+def web_registry():
+    """
+    :return: Registry with the web metrics of all worker processes with PROMETHEUS_MULTIPROC_DIR, else of this process
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def web_metrics():
+    """
+    :return: The web metrics and, with apps.scan installed, the scan queue metrics in the text exposition format
+    """
+    output = generate_latest(web_registry())
+    if 'apps.scan' in settings.INSTALLED_APPS:
+        output += generate_latest(ScanQueueCollector())
+    return output
+
+
+# -- Consumer metrics
+class ConsumerRun(object):
+    """
+    Metrics for one consumer run. Use phase() around each part of the run and write_textfile() at the end.
+
+        run = ConsumerRun('noclook_consumer')
+        with run.phase('nmap_services'):
+            insert_nmap(run.counted('nmap_services', data))
+        run.write_textfile('/var/lib/node_exporter/textfile_collector/noclook_consumer.prom')
+
+    The values are kept on the run and collected into a registry of their own, they never end up in the web metrics.
+    """
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.started = datetime.now()
+        self.start = perf_counter()
+        self.phase_seconds = {}
+        self.items = {}
+        self.nodes = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] = perf_counter() - start
+
+    def counted(self, phase, iterable):
+        """
+        Yields the items of iterable and counts them as processed by phase.
+        """
+        self.items[phase] = 0
+        for item in iterable:
+            self.items[phase] += 1
+            yield item
+
+    def count_nodes(self):
+        """
+        Counts the node handles created and modified since the run started. Changes made to the neo4j nodes only are
+        not counted.
+        """
+        from apps.noclook.models import NodeHandle
+        started = self.started
+        if timezone.is_aware(timezone.now()):
+            started = timezone.make_aware(started)
+        self.nodes['created'] = NodeHandle.objects.filter(created__gte=started).count()
+        self.nodes['updated'] = NodeHandle.objects.filter(modified__gte=started, created__lt=started).count()
+
+    def _family(self, name, documentation, label, values):
+        family = GaugeMetricFamily(name, documentation, labels=['consumer', label])
+        for value, metric in sorted(values.items()):
+            family.add_metric([self.consumer, value], metric)
+        return family
+
+    def collect(self):
+        duration = GaugeMetricFamily('noclook_consumer_duration_seconds', 'Duration of the consumer run.',
+                                     labels=['consumer'])
+        duration.add_metric([self.consumer], perf_counter() - self.start)
+        last_run = GaugeMetricFamily('noclook_consumer_last_run_timestamp_seconds',
+                                     'End time of the last consumer run.', labels=['consumer'])
+        last_run.add_metric([self.consumer], time())
+        return [
+            self._family('noclook_consumer_phase_duration_seconds', 'Duration of each consumer phase.', 'phase',
+                         self.phase_seconds),
+            self._family('noclook_consumer_items_processed', 'Items processed by each consumer phase.', 'phase',
+                         self.items),
+            self._family('noclook_consumer_nodes', 'Node handles created or updated during the run.', 'change',
+                         self.nodes),
+            duration,
+            last_run,
+        ]
+
+    def write_textfile(self, path):
+        """
+        Writes the metrics to path, the file is replaced atomically so node_exporter never reads a partial file.
+        """
+        registry = CollectorRegistry()
+        registry.register(self)
+        write_to_textfile(path, registry)
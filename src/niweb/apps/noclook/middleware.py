@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from time import perf_counter
+
+from django.db import connection
+
+from apps.noclook import metrics, neo4j_instrumentation
+from apps.noclook.neo4j_instrumentation import logger
+
+
+def view_name(request, view_func=None):
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        return match.view_name or match._func_path
+    if view_func is not None:
+        return '{}.{}'.format(view_func.__module__, getattr(view_func, '__name__', view_func.__class__.__name__))
+    return None
+
+
+class Neo4jQueryMiddleware:
+    """
+    Sums up the neo4j queries made during a request. The totals are added to the response headers
+    X-Neo4j-Queries, X-Neo4j-Time (milliseconds) and X-Neo4j-Rows, logged and added to the histogram of the view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with neo4j_instrumentation.collect() as collector:
+            response = self.get_response(request)
+        request.neo4j_collector = collector
+        view = collector.view or view_name(request) or 'unresolved'
+        response['X-Neo4j-Queries'] = str(collector.count)
+        response['X-Neo4j-Time'] = '{:.1f}'.format(collector.duration * 1000)
+        response['X-Neo4j-Rows'] = str(collector.rows)
+        if collector.count:
+            logger.info('%s %s (%s): %d neo4j queries, %.1fms, %d rows', request.method, request.path, view,
+                        collector.count, collector.duration * 1000, collector.rows)
+            neo4j_instrumentation.observe_view(view, collector)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        collector = neo4j_instrumentation.current_collector()
+        if collector is not None:
+            collector.view = view_name(request, view_func)
+        return None
+
+
+class SQLTimer(object):
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Records request latency, SQL and neo4j queries per URL name for the metrics view, see apps.noclook.metrics.
+    Should be placed before Neo4jQueryMiddleware so that the neo4j totals of the request are available.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sql = SQLTimer()
+        start = perf_counter()
+        with connection.execute_wrapper(sql):
+            response = self.get_response(request)
+        duration = perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match is not None and match.url_name else 'unresolved'
+        metrics.REQUEST_SECONDS.labels(url_name=url_name, method=request.method).observe(duration)
+        metrics.DB_QUERIES.labels(url_name=url_name).inc(sql.count)
+        metrics.DB_QUERY_SECONDS.labels(url_name=url_name).inc(sql.duration)
+        collector = getattr(request, 'neo4j_collector', None)
+        if collector is not None:
+            metrics.NEO4J_QUERIES.labels(url_name=url_name).inc(collector.count)
+            metrics.NEO4J_QUERY_SECONDS.labels(url_name=url_name).inc(collector.duration)
+        return response
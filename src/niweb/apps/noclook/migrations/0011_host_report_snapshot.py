@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:19
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noclook', '0010_add_actstream_actor_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostReportSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generated', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('duration', models.FloatField(default=0, help_text='Seconds it took to collect the data from neo4j.')),
+                ('num_hosts', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-generated'],
+                'get_latest_by': 'generated',
+            },
+        ),
+        migrations.CreateModel(
+            name='HostSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('handle_id', models.IntegerField()),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('host_type', models.CharField(blank=True, max_length=255)),
+                ('operational_state', models.CharField(max_length=255, null=True)),
+                ('noclook_last_seen', models.CharField(max_length=255, null=True)),
+                ('classified', models.BooleanField(default=False)),
+                ('services_locked', models.BooleanField(default=False)),
+                ('num_unauthorized_ports', models.IntegerField(default=0)),
+                ('num_public_ports', models.IntegerField(default=0)),
+                ('data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('host_users', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('unauthorized_ports', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('public_ports', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hosts', to='noclook.hostreportsnapshot')),
+            ],
+            options={
+                'unique_together': {('snapshot', 'handle_id')},
+            },
+        ),
+    ]
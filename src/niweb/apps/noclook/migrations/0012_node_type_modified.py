@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noclook', '0011_host_report_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nodetype',
+            name='modified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noclook', '0012_node_type_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HardwareInventory',
+            fields=[
+                ('node_handle', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='hardware_inventory', serialize=False, to='noclook.nodehandle')),
+                ('modules', models.JSONField(default=dict)),
+                ('content_hash', models.CharField(help_text='SHA-256 of the modules as canonical JSON.', max_length=64)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Indexes for the paged node history, see apps.noclook.history.
+    """
+
+    dependencies = [
+        ('noclook', '0013_hardware_inventory'),
+        ('actstream', '0003_add_follow_flag'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+            CREATE INDEX "actstream_action_action_object_timestamp_index"
+            ON "actstream_action" ("action_object_content_type_id", "action_object_object_id", "timestamp", "id");
+            """,
+            reverse_sql='DROP INDEX "actstream_action_action_object_timestamp_index";',
+        ),
+        migrations.RunSQL(
+            sql="""
+            CREATE INDEX "actstream_action_target_timestamp_index"
+            ON "actstream_action" ("target_content_type_id", "target_object_id", "timestamp", "id");
+            """,
+            reverse_sql='DROP INDEX "actstream_action_target_timestamp_index";',
+        ),
+    ]
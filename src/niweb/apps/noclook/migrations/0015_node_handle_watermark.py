@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('noclook', '0014_action_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nodehandle',
+            name='watermark',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django_comments.signals import comment_was_posted, comment_was_flagged
 from django.dispatch import receiver
 from django_comments.models import Comment
 from django.urls import reverse
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 from actstream import action
 try:
     from neo4j.exceptions import CypherError
@@ -31,6 +33,8 @@ class NodeType(models.Model):
     type = models.CharField(unique=True, max_length=255)
     slug = models.SlugField(unique=True, help_text='Automatically generated from type. Must be unique.')
     hidden = models.BooleanField(default=False, help_text="Hide from menus")
+    # Modification watermark of the nodes of the type, see activitylog and apps.noclook.conditional
+    modified = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return self.type
@@ -70,6 +74,8 @@ class NodeHandle(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modifier = models.ForeignKey(User, related_name='modifier', null=True, on_delete=models.SET_NULL)
     modified = models.DateTimeField(auto_now=True)
+    # Changes shown on the pages of the node that are not changes of the node, see apps.noclook.conditional
+    watermark = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return '%s %s' % (self.node_type, self.node_name)
@@ -142,23 +148,52 @@ class UniqueIdGenerator(models.Model):
     def __str__(self):
         return self.name
 
-    def get_id(self):
+    def format_id(self, base_id):
         """
-        Returns the next id and increments the base_id field.
+        Returns base_id formatted with the prefix, suffix and zero fill of the generator.
         """
-        base_id = self.base_id
         if self.zfill:
-            base_id = str(self.base_id).zfill(self.base_id_length)
+            base_id = str(base_id).zfill(self.base_id_length)
         prefix = suffix = ''
         if self.prefix:
             prefix = self.prefix
         if self.suffix:
             suffix = self.suffix
-        unique_id = '%s%s%s' % (prefix, base_id, suffix)
-        self.last_id = unique_id
-        self.base_id += 1
-        self.save()
-        return unique_id
+        return '%s%s%s' % (prefix, base_id, suffix)
+
+    def get_id(self):
+        """
+        Returns the next id and increments the base_id field.
+        """
+        return self.lease_ids(1)[0]
+
+    def lease_ids(self, num_of_ids):
+        """
+        Returns a block of num_of_ids consecutive ids and increments the base_id field past them. The generator row is
+        locked while the block is leased so concurrent callers never get overlapping blocks.
+        """
+        with transaction.atomic():
+            generator = self.lock()
+            start = generator.base_id
+            generator.advance_to(start + num_of_ids)
+        self.refresh_from_db()
+        return [self.format_id(base_id) for base_id in range(start, start + num_of_ids)]
+
+    def lock(self):
+        """
+        Returns a fresh copy of the generator with its row locked until the end of the current transaction.
+        """
+        return UniqueIdGenerator.objects.select_for_update().get(pk=self.pk)
+
+    def advance_to(self, base_id):
+        """
+        Sets base_id, the id before base_id is considered the last used id. Call on a locked generator.
+        """
+        self.base_id = base_id
+        self.last_id = self.format_id(base_id - 1)
+        self.save(update_fields=['base_id', 'last_id', 'next_id', 'modified'])
+
+    advance_to.alters_data = True
 
     def get_regex(self):
         prefix = suffix = ''
@@ -173,15 +208,7 @@ class UniqueIdGenerator(models.Model):
         """
         Increments the base_id.
         """
-        base_id = self.base_id
-        if self.zfill:
-            base_id = str(self.base_id).zfill(self.base_id_length)
-        prefix = suffix = ''
-        if self.prefix:
-            prefix = self.prefix
-        if self.suffix:
-            suffix = self.suffix
-        self.next_id = '%s%s%s' % (prefix, base_id, suffix)
+        self.next_id = self.format_id(self.base_id)
         super(UniqueIdGenerator, self).save(*args, **kwargs)
 
     save.alters_data = True
@@ -260,14 +287,23 @@ class DummyDropdown(object):
 class Dropdown(models.Model):
     name = models.CharField(max_length=255, unique=True)
 
+    def choices(self):
+        """
+        Choices ordered by name, dropdowns from apps.noclook.reference_data already have them loaded.
+        """
+        cached_choices = getattr(self, 'cached_choices', None)
+        if cached_choices is not None:
+            return cached_choices
+        return self.choice_set.order_by('name')
+
     def as_choices(self, empty=True):
-        choices = [choice.as_choice() for choice in self.choice_set.order_by('name')]
+        choices = [choice.as_choice() for choice in self.choices()]
         if empty:
             choices = [('', '')] + choices
         return choices
 
     def as_values(self, empty=True):
-        values = [choice.value for choice in self.choice_set.order_by('name')]
+        values = [choice.value for choice in self.choices()]
         if empty:
             values = [''] + values
         return values
@@ -277,9 +313,10 @@ class Dropdown(models.Model):
 
     @staticmethod
     def get(name):
-        result = Dropdown.objects.filter(name=name)
+        from apps.noclook import reference_data
+        result = reference_data.get_dropdown(name)
         if result:
-            return result[0]
+            return result
         else:
             logger.error(u'Could not find dropdown with name "{}". Please create it using /admin/'.format(name))
             return DummyDropdown(name)
@@ -303,16 +340,78 @@ class SwitchType(models.Model):
     @classmethod
     def as_choices(self):
         choices=[('','')]
-        choices.extend([(val.pk, val.name) for val in SwitchType.objects.all()])
+        from apps.noclook import reference_data
+        choices.extend([(val.pk, val.name) for val in reference_data.switch_types()])
         return choices
 
     def __str__(self):
         return "{}".format(self.name)
 
 
+class HostReportSnapshot(models.Model):
+    """
+    A materialized copy of the host data used by the host reports, see apps.noclook.report_snapshots.
+    """
+    generated = models.DateTimeField(auto_now_add=True, db_index=True)
+    duration = models.FloatField(default=0, help_text='Seconds it took to collect the data from neo4j.')
+    num_hosts = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-generated']
+        get_latest_by = 'generated'
+
+    def __str__(self):
+        return 'Host report snapshot {}'.format(self.generated)
+
+
+class HostSnapshot(models.Model):
+    snapshot = models.ForeignKey(HostReportSnapshot, related_name='hosts', on_delete=models.CASCADE)
+    handle_id = models.IntegerField()
+    name = models.CharField(max_length=255, blank=True)
+    host_type = models.CharField(max_length=255, blank=True)
+    operational_state = models.CharField(max_length=255, null=True)
+    noclook_last_seen = models.CharField(max_length=255, null=True)
+    classified = models.BooleanField(default=False)
+    services_locked = models.BooleanField(default=False)
+    num_unauthorized_ports = models.IntegerField(default=0)
+    num_public_ports = models.IntegerField(default=0)
+    # Node properties and aggregates as they were returned from neo4j
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    host_users = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    unauthorized_ports = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    public_ports = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        unique_together = ('snapshot', 'handle_id')
+
+    def __str__(self):
+        return self.name
+
+
+class HardwareInventory(models.Model):
+    """
+    The hardware module tree of a router or switch as collected by the juniper consumer, see apps.noclook.hardware.
+    """
+    node_handle = models.OneToOneField(NodeHandle, primary_key=True, related_name='hardware_inventory',
+                                       on_delete=models.CASCADE)
+    modules = models.JSONField(default=dict)
+    content_hash = models.CharField(max_length=64, help_text='SHA-256 of the modules as canonical JSON.')
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return 'Hardware of {}'.format(self.node_handle_id)
+
+
 # -- Signals
+def _touch_commented(comment):
+    # Comments are shown on the detail page, see apps.noclook.conditional
+    if isinstance(comment.content_object, NodeHandle):
+        NodeHandle.objects.filter(pk=comment.content_object.pk).update(watermark=timezone.now())
+
+
 @receiver(comment_was_posted, dispatch_uid="apps.noclook.models")
 def comment_posted_handler(sender, comment, request, **kwargs):
+    _touch_commented(comment)
     action.send(
         comment.user,
         verb='create',
@@ -326,6 +425,7 @@ def comment_posted_handler(sender, comment, request, **kwargs):
 
 @receiver(comment_was_flagged, dispatch_uid="apps.noclook.models")
 def comment_removed_handler(sender, comment, flag, created, request, **kwargs):
+    _touch_commented(comment)
     action.send(
         comment.user,
         verb='delete',
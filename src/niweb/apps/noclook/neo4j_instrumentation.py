@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the Cypher queries sent to neo4j.
+
+All norduniclient calls end up in neo4j.Session.run, install() wraps it so that every query records a hash of the
+query text, the size of the parameters, the number of rows returned and the wall time including fetching the rows.
+Queries made while a collector is active, see Neo4jQueryMiddleware, are summed up per request and added to a per view
+histogram. Queries slower than NEO4J_SLOW_QUERY_THRESHOLD seconds are logged together with the calling view.
+
+Results are not buffered, so streaming exports keep streaming. The result is wrapped in an InstrumentedResult that
+counts the rows as they are read and records the query when the rows are exhausted, the result is consumed or
+closed, or when it is garbage collected unread. The time of a streamed result includes the time the caller spends
+between rows.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.conf import settings
+
+from apps.noclook import metrics
+
+logger = logging.getLogger('noclook.neo4j')
+slow_logger = logging.getLogger('noclook.neo4j.slow')
+
+_local = threading.local()
+_installed = False
+
+
+def query_hash(statement):
+    return hashlib.sha1(u'{}'.format(statement).encode('utf-8')).hexdigest()[:12]
+
+
+def params_size(parameters):
+    """
+    :return: Length of the parameters serialized as JSON
+    """
+    if not parameters:
+        return 0
+    try:
+        return len(json.dumps(parameters, default=str))
+    except (TypeError, ValueError):
+        return len(repr(parameters))
+
+
+class QueryStats(object):
+
+    def __init__(self, statement, parameters, rows, duration):
+        self.statement = u'{}'.format(statement)
+        self.query_hash = query_hash(statement)
+        self.params_size = params_size(parameters)
+        self.rows = rows
+        self.duration = duration
+
+
+class RequestCollector(object):
+    """
+    Sums up the queries made while it is active, including those made while a nested collector is active.
+    """
+
+    def __init__(self, view=None, parent=None):
+        self.view = view
+        self.parent = parent
+        self.queries = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(q.duration for q in self.queries)
+
+    @property
+    def rows(self):
+        return sum(q.rows for q in self.queries)
+
+    def add(self, stats):
+        collector = self
+        while collector is not None:
+            collector.queries.append(stats)
+            collector = collector.parent
+
+
+def current_collector():
+    return getattr(_local, 'collector', None)
+
+
+@contextmanager
+def collect(view=None):
+    """
+    Collects the queries made in the current thread within the with block.
+    """
+    previous = current_collector()
+    collector = RequestCollector(view, parent=previous)
+    _local.collector = collector
+    try:
+        yield collector
+    finally:
+        _local.collector = previous
+
+
+@contextmanager
+def use_collector(collector):
+    """
+    Makes the queries made in the current thread count towards collector, for threads doing work on behalf of the
+    thread that owns the collector.
+    """
+    previous = current_collector()
+    _local.collector = collector
+    try:
+        yield collector
+    finally:
+        _local.collector = previous
+
+
+def slow_query_threshold():
+    return float(getattr(settings, 'NEO4J_SLOW_QUERY_THRESHOLD', 1.0))
+
+
+def record(statement, parameters, rows, duration, collector=None):
+    """
+    :param collector: RequestCollector the query counts towards, the current collector by default
+    """
+    stats = QueryStats(statement, parameters, rows, duration)
+    collector = collector or current_collector()
+    if collector is not None:
+        collector.add(stats)
+    if duration >= slow_query_threshold():
+        view = collector.view if collector is not None else None
+        slow_logger.warning(u'Slow neo4j query %s in %s: %.3fs, %d rows, %d bytes of parameters: %s',
+                            stats.query_hash, view or 'unknown view', duration, rows, stats.params_size,
+                            u' '.join(stats.statement.split())[:1000])
+    return stats
+
+
+def observe_view(view, collector):
+    """
+    Adds the neo4j time of a request to the histogram of its view, see metrics.NEO4J_REQUEST_SECONDS.
+    """
+    metrics.NEO4J_REQUEST_SECONDS.labels(view=view).observe(collector.duration)
+
+
+class InstrumentedResult(object):
+    """
+    Result of neo4j.Session.run that counts the rows read through it and records the query once they are read.
+    Everything else is delegated to the result.
+    """
+
+    def __init__(self, result, statement, parameters, start):
+        self._result = result
+        self._statement = statement
+        self._parameters = parameters
+        self._start = start
+        # The collector of the thread running the query, the rows may be read after it is no longer current
+        self._collector = current_collector()
+        self._rows = 0
+        self._recorded = False
+
+    def _record(self):
+        if not self._recorded:
+            self._recorded = True
+            record(self._statement, self._parameters, self._rows, perf_counter() - self._start, self._collector)
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self):
+        try:
+            for item in self._result.records():
+                self._rows += 1
+                yield item
+        finally:
+            self._record()
+
+    def single(self):
+        item = self._result.single()
+        if item is not None:
+            self._rows += 1
+        self._record()
+        return item
+
+    def data(self, *items):
+        return [item.data(*items) for item in self]
+
+    def value(self, item=0, default=None):
+        return [record.value(item, default) for record in self]
+
+    def values(self, *items):
+        return [record.values(*items) for record in self]
+
+    def consume(self):
+        try:
+            return self._result.consume()
+        finally:
+            self._record()
+
+    def __del__(self):
+        # Results that are never read, like those of most writes
+        self._record()
+
+
+def _instrumented_run(run):
+    def wrapper(self, statement, parameters=None, **kwparameters):
+        start = perf_counter()
+        result = run(self, statement, parameters, **kwparameters)
+        return InstrumentedResult(result, statement, dict(parameters or {}, **kwparameters), start)
+    wrapper.__wrapped__ = run
+    return wrapper
+
+
+def installed():
+    return _installed
+
+
+def install():
+    """
+    Wraps neo4j.Session.run, does nothing if NEO4J_INSTRUMENTATION is false or if already installed.
+    """
+    global _installed
+    if _installed or not getattr(settings, 'NEO4J_INSTRUMENTATION', True):
+        return
+    from neo4j import Session
+    Session.run = _instrumented_run(Session.run)
+    _installed = True
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Process local cache of reference data: dropdowns with their choices, node types, service types and switch types.
+
+Reference data is read on every form instantiation and menu render but changes rarely. Each process keeps a copy of
+all of it and reloads the copy when the shared version, stored in the Django cache, changes. The version is changed
+when a reference data object is saved or deleted.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from apps.noclook import metrics
+from apps.noclook.models import Dropdown, Choice, NodeType, ServiceClass, ServiceType, SwitchType
+
+logger = logging.getLogger('noclook.reference_data')
+
+VERSION_KEY = 'noclook.reference_data.version'
+
+MODELS = (Dropdown, Choice, NodeType, ServiceClass, ServiceType, SwitchType)
+
+
+class ReferenceData(object):
+    """
+    All reference data loaded at one version.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.node_types = list(NodeType.objects.order_by('pk'))
+        self.node_types_by_slug = dict((nt.slug, nt) for nt in self.node_types)
+        self.node_types_by_type = dict((nt.type, nt) for nt in self.node_types)
+        choices = defaultdict(list)
+        for choice in Choice.objects.order_by('name'):
+            choices[choice.dropdown_id].append(choice)
+        self.dropdowns = {}
+        for dropdown in Dropdown.objects.all():
+            dropdown.cached_choices = choices[dropdown.pk]
+            self.dropdowns[dropdown.name] = dropdown
+        self.service_types = list(ServiceType.objects.select_related('service_class')
+                                  .order_by('service_class__name', 'name'))
+        self.service_types_by_name = dict((st.name, st) for st in self.service_types)
+        self.switch_types = list(SwitchType.objects.order_by('pk'))
+
+
+_lock = threading.Lock()
+_state = {'data': None, 'checked': 0}
+
+
+def _shared_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # First process to start or the cache was cleared
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get():
+    """
+    :return: ReferenceData
+    """
+    data = _state['data']
+    now = time.monotonic()
+    if data is not None and now - _state['checked'] < settings.REFERENCE_DATA_CHECK_INTERVAL:
+        metrics.cache_lookup('reference_data', hit=True)
+        return data
+    with _lock:
+        version = _shared_version()
+        data = _state['data']
+        hit = data is not None and data.version == version
+        if not hit:
+            data = ReferenceData(version)
+            _state['data'] = data
+            logger.debug('Reference data loaded at version %s.', version)
+        _state['checked'] = now
+    metrics.cache_lookup('reference_data', hit=hit)
+    return data
+
+
+def clear():
+    """
+    Drops the local copy, it is reloaded on next use.
+    """
+    with _lock:
+        _state['data'] = None
+
+
+def _bump_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate():
+    """
+    Drops the local copy at once and changes the shared version when the current transaction is committed, other
+    processes would otherwise risk to reload the data before the change is visible to them.
+    """
+    clear()
+    transaction.on_commit(_bump_version)
+
+
+def _invalidate_handler(sender, **kwargs):
+    invalidate()
+
+
+for model in MODELS:
+    post_save.connect(_invalidate_handler, sender=model, dispatch_uid='noclook.reference_data.save.{}'.format(
+        model.__name__))
+    post_delete.connect(_invalidate_handler, sender=model, dispatch_uid='noclook.reference_data.delete.{}'.format(
+        model.__name__))
+
+
+def get_dropdown(name):
+    """
+    :return: Dropdown with its choices or None
+    """
+    return get().dropdowns.get(name)
+
+
+def node_types():
+    return get().node_types
+
+
+def menu_node_types():
+    return [nt for nt in get().node_types if not nt.hidden]
+
+
+def node_type_by_slug(slug):
+    """
+    :return: NodeType or None
+    """
+    return get().node_types_by_slug.get(slug)
+
+
+def node_type_by_type(type_name):
+    """
+    :return: NodeType or None
+    """
+    return get().node_types_by_type.get(type_name)
+
+
+def service_types():
+    """
+    :return: List of ServiceType ordered by service class name and name
+    """
+    return get().service_types
+
+
+def switch_types():
+    return get().switch_types
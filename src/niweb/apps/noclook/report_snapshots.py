@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed host reports.
+
+The host users, host security class and host services reports aggregate over all hosts and their Depends_on
+relationships. Instead of asking neo4j for that on every page view the data is collected once, by the
+generate_host_report_snapshot management command or after a consumer run, and stored in HostSnapshot rows
+belonging to a HostReportSnapshot. The report views read the latest snapshot.
+"""
+
+import logging
+from collections import OrderedDict
+from time import time
+
+from django.db import transaction
+from django.db.models import F
+
+from apps.noclook import metrics
+from apps.noclook.models import HostReportSnapshot, HostSnapshot
+import norduniclient as nc
+
+logger = logging.getLogger('noclook.report_snapshots')
+
+HOSTS_QUERY = """
+    MATCH (host:Host)
+    OPTIONAL MATCH (host)<-[:Uses|Owns]-(host_user:Host_User)
+    RETURN host, filter(x in labels(host) where not x in ['Node', 'Host']) as type,
+        collect(DISTINCT {name: host_user.name, handle_id: host_user.handle_id}) as host_users
+    """
+
+UNAUTHORIZED_PORTS_QUERY = """
+    MATCH (host:Host)<-[r:Depends_on]-(service)
+    WHERE exists(r.rogue_port)
+    RETURN host.handle_id as handle_id, collect({data: r, start: service.handle_id}) as ports
+    """
+
+PUBLIC_PORTS_QUERY = """
+    MATCH (host:Host)<-[r:Depends_on]-(service)
+    WHERE r.public
+    RETURN host.handle_id as handle_id, collect({data: r, id: id(r), start: service.handle_id}) as ports
+    """
+
+# Host reports does not show hosts without operational state or decommissioned hosts, except host users
+ACTIVE_HOSTS = dict(operational_state__isnull=False)
+DECOMMISSIONED = dict(operational_state='Decommissioned')
+
+
+def _port_data(item):
+    data = dict(item['data'])
+    data['start'] = item['start']
+    return data
+
+
+def collect_hosts():
+    """
+    :return: List of unsaved HostSnapshot objects
+    """
+    hosts = OrderedDict()
+    for item in nc.query_to_iterator(nc.graphdb.manager, HOSTS_QUERY):
+        data = dict(item['host'])
+        hosts[data['handle_id']] = HostSnapshot(
+            handle_id=data['handle_id'],
+            name=data.get('name', ''),
+            host_type=item['type'][0] if item['type'] else '',
+            operational_state=data.get('operational_state'),
+            noclook_last_seen=data.get('noclook_last_seen'),
+            classified='security_class' in data or 'security_comment' in data,
+            services_locked=bool(data.get('services_locked')),
+            data=data,
+            host_users=[user for user in item['host_users'] if user['handle_id'] is not None],
+        )
+    for item in nc.query_to_iterator(nc.graphdb.manager, UNAUTHORIZED_PORTS_QUERY):
+        host = hosts.get(item['handle_id'])
+        if host:
+            host.unauthorized_ports = [_port_data(port) for port in item['ports']]
+            host.num_unauthorized_ports = len(host.unauthorized_ports)
+    for item in nc.query_to_iterator(nc.graphdb.manager, PUBLIC_PORTS_QUERY):
+        host = hosts.get(item['handle_id'])
+        if host:
+            host.public_ports = [{'data': _port_data(port), 'id': port['id']} for port in item['ports']]
+            host.num_public_ports = len(host.public_ports)
+    return list(hosts.values())
+
+
+def generate_host_report_snapshot():
+    """
+    Collects the host report data from neo4j and replaces the current snapshot with it.
+
+    :return: HostReportSnapshot
+    """
+    start = time()
+    hosts = collect_hosts()
+    duration = time() - start
+    with transaction.atomic():
+        snapshot = HostReportSnapshot.objects.create(duration=duration, num_hosts=len(hosts))
+        for host in hosts:
+            host.snapshot = snapshot
+        HostSnapshot.objects.bulk_create(hosts, batch_size=500)
+        HostReportSnapshot.objects.exclude(pk=snapshot.pk).delete()
+    logger.info('Host report snapshot with %d hosts generated in %.2fs.', len(hosts), duration)
+    return snapshot
+
+
+def get_host_report_snapshot():
+    """
+    Returns the latest snapshot, a snapshot is generated if none exists.
+    """
+    snapshot = HostReportSnapshot.objects.order_by('-generated').first()
+    metrics.cache_lookup('host_report_snapshot', hit=snapshot is not None)
+    if snapshot is None:
+        snapshot = generate_host_report_snapshot()
+    return snapshot
+
+
+def _host_item(host):
+    return {'data': host.data, 'type': [host.host_type] if host.host_type else []}
+
+
+def host_users(snapshot, host_user_id=None, missing=False, host_filter=None):
+    """
+    Returns the same structure as the host users report queries, a list of dicts with host_user and hosts.
+
+    :param snapshot: HostReportSnapshot
+    :param host_user_id: Only hosts used or owned by this host user
+    :param missing: Only hosts without host user
+    :param host_filter: Q object, eg. HostReportForm.to_filter()
+    """
+    hosts = snapshot.hosts.order_by('name')
+    if host_filter is not None:
+        hosts = hosts.filter(host_filter)
+    if missing:
+        return [{'hosts': [_host_item(host) for host in hosts if not host.host_users]}]
+    users = OrderedDict()
+    for host in hosts:
+        for user in host.host_users:
+            if host_user_id is None or user['handle_id'] == host_user_id:
+                users.setdefault(user['handle_id'], {'host_user': user, 'hosts': []})['hosts'].append(_host_item(host))
+    return sorted(users.values(), key=lambda item: item['host_user']['name'] or '')
+
+
+def _active_hosts(snapshot):
+    return snapshot.hosts.filter(**ACTIVE_HOSTS).exclude(**DECOMMISSIONED)\
+        .order_by(F('noclook_last_seen').desc(nulls_first=True))
+
+
+def host_security_class(snapshot, classified=None):
+    """
+    :param snapshot: HostReportSnapshot
+    :param classified: None for all hosts, True or False
+    :return: List of dicts with host
+    """
+    hosts = _active_hosts(snapshot)
+    if classified is not None:
+        hosts = hosts.filter(classified=classified)
+    return [{'host': host.data} for host in hosts]
+
+
+def host_services(snapshot, status):
+    """
+    :param snapshot: HostReportSnapshot
+    :param status: unauthorized-ports, public, locked or not-locked
+    :return: List of dicts with host and for the port reports ports
+    """
+    hosts = _active_hosts(snapshot)
+    if status == 'unauthorized-ports':
+        return [{'host': host.data, 'ports': host.unauthorized_ports}
+                for host in hosts.filter(num_unauthorized_ports__gt=0)]
+    elif status == 'public':
+        return [{'host': host.data, 'ports': host.public_ports} for host in hosts.filter(num_public_ports__gt=0)]
+    elif status == 'locked':
+        return [{'host': host.data} for host in hosts.filter(services_locked=True)]
+    elif status == 'not-locked':
+        return [{'host': host.data} for host in hosts.filter(services_locked=False)]
+    raise ValueError('Unknown host services status: {}'.format(status))
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic inventories for benchmarks and query budget tests.
+
+Nodes are created in bulk, the NodeHandles with bulk_create and the neo4j nodes and relationships with one UNWIND
+query per label and relationship type, so inventories with hundreds of thousands of nodes are built in minutes.
+The inventory is generated from a seed, the same arguments always give the same inventory.
+
+The nerds_* functions return NERDS producer data for the synthetic inventory, in the format the consumers in
+src/scripts read, so that the consumers can be benchmarked against it.
+"""
+import logging
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.template.defaultfilters import slugify
+
+from apps.noclook import helpers
+from apps.noclook.models import NodeHandle
+import norduniclient as nc
+
+logger = logging.getLogger('noclook.synthetic')
+
+# Rows per UNWIND query
+BATCH_SIZE = 5000
+
+CREATE_NODES = """
+    UNWIND {rows} AS row
+    CREATE (n:Node:%(meta_type)s:%(label)s)
+    SET n = row
+    """
+
+CREATE_RELATIONSHIPS = """
+    UNWIND {rows} AS row
+    MATCH (a:Node {handle_id: row.start}), (b:Node {handle_id: row.end})
+    CREATE (a)-[r:%(rel_type)s]->(b)
+    SET r = row.properties
+    """
+
+COUNTRIES = [('SE', 'Sweden'), ('NO', 'Norway'), ('DK', 'Denmark'), ('FI', 'Finland'), ('IS', 'Iceland')]
+HOST_DOMAINS = ['nordu.net', 'sunet.se', 'uninett.no', 'funet.fi', 'example.net']
+HOST_SERVICES = [('tcp', 22, 'ssh', 'OpenSSH'), ('tcp', 80, 'http', 'nginx'), ('tcp', 443, 'https', 'nginx'),
+                 ('tcp', 5432, 'postgresql', 'PostgreSQL'), ('udp', 161, 'snmp', 'net-snmp')]
+
+
+def _batches(rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        yield rows[i:i + BATCH_SIZE]
+
+
+class SyntheticGraph(object):
+
+    def __init__(self, user):
+        self.user = user
+        self.nodes = defaultdict(list)
+        self._relationships = defaultdict(list)
+
+    def add_nodes(self, node_type, meta_type, names, properties=None):
+        """
+        :param node_type: Node type name, eg. 'Optical Node'
+        :param meta_type: Location, Logical, Physical or Relation
+        :param names: Node names, unique within the node type
+        :param properties: Function of the node index returning extra node properties
+        :return: List of NodeHandle
+        """
+        nt = helpers.slug_to_node_type(slugify(node_type), create=True)
+        names = list(names)
+        handles = []
+        for batch in _batches(names):
+            NodeHandle.objects.bulk_create([NodeHandle(node_name=name, node_type=nt, node_meta_type=meta_type,
+                                                       creator=self.user, modifier=self.user) for name in batch])
+            # Not all databases return the primary keys from bulk_create
+            by_name = dict((nh.node_name, nh) for nh in NodeHandle.objects.filter(node_type=nt, node_name__in=batch))
+            handles.extend(by_name[name] for name in batch)
+        rows = []
+        for i, nh in enumerate(handles):
+            row = {'name': nh.node_name, 'handle_id': nh.handle_id}
+            if properties:
+                row.update(properties(i))
+            rows.append(row)
+        with nc.graphdb.manager.session as s:
+            for batch in _batches(rows):
+                s.run(CREATE_NODES % {'meta_type': meta_type, 'label': nt.get_label()}, {'rows': batch})
+        self.nodes[node_type].extend(handles)
+        return handles
+
+    def relate(self, start, rel_type, end, **properties):
+        self._relationships[rel_type].append({'start': start.handle_id, 'end': end.handle_id,
+                                              'properties': properties})
+
+    def save(self):
+        """
+        Creates the relationships added with relate.
+        """
+        with nc.graphdb.manager.session as s:
+            for rel_type, rows in self._relationships.items():
+                for batch in _batches(rows):
+                    s.run(CREATE_RELATIONSHIPS % {'rel_type': rel_type}, {'rows': batch})
+        self._relationships.clear()
+        return self
+
+    def counts(self):
+        """
+        :return: Dict of node type and number of nodes
+        """
+        return dict((node_type, len(handles)) for node_type, handles in self.nodes.items())
+
+
+def port_name(i):
+    return 'xe-{}/{}/{}'.format(i // 480, (i // 48) % 10, i % 48)
+
+
+def router_name(i):
+    return 'router-{:04d}.example.net'.format(i)
+
+
+def host_name(i):
+    return 'host-{:05d}.{}'.format(i, HOST_DOMAINS[i % len(HOST_DOMAINS)])
+
+
+def host_address(i):
+    return '10.{}.{}.{}'.format(i // 65536 % 256, i // 256 % 256, i % 256)
+
+
+def unit_address(router, port, unit):
+    return '172.{}.{}.{}'.format(16 + router % 16, port % 256, unit * 4 + 1)
+
+
+def peer_address(i):
+    return '192.0.{}.{}'.format(i // 256 % 256, i % 256)
+
+
+def inventory(user, scale=1, ports_per_router=24, units_per_port=1, seed=0):
+    """
+    Builds a network inventory:
+
+    - sites with rooms and racks, and site owners responsible for the sites
+    - routers with ports, units on the ports and cables between the ports of neighbouring routers
+    - optical nodes connected by dark fiber
+    - peering partners using peering groups depending on router units
+    - services depending on router units or ports, used by customers and end users
+    - hosts with host services, used by host users
+
+    :param user: Creator of the nodes
+    :param scale: Multiplies the number of nodes of each type, 1 gives 10 sites, 10 routers and 50 hosts
+    :param ports_per_router: Ports of each router
+    :param units_per_port: Units of each router port
+    :param seed: Seed of the properties that are picked at random
+    :return: SyntheticGraph
+    """
+    rnd = random.Random(seed)
+    graph = SyntheticGraph(user)
+    num_sites = 10 * scale
+    sites = graph.add_nodes('Site', 'Location', ['SITE-{:04d}'.format(i) for i in range(num_sites)], lambda i: {
+        'country_code': COUNTRIES[i % len(COUNTRIES)][0],
+        'country': COUNTRIES[i % len(COUNTRIES)][1],
+        'latitude': round(rnd.uniform(54.0, 70.0), 4),
+        'longitude': round(rnd.uniform(5.0, 30.0), 4),
+        'area': 'Area {}'.format(i % 7),
+    })
+    owners = graph.add_nodes('Site Owner', 'Relation', ['Owner {}'.format(i) for i in range(3 * scale)])
+    rooms = graph.add_nodes('Room', 'Location', ['ROOM-{:04d}'.format(i) for i in range(num_sites * 2)])
+    racks = graph.add_nodes('Rack', 'Location', ['RACK-{:04d}'.format(i) for i in range(num_sites * 4)], lambda i: {
+        'height': 42 * 44.45, 'rack_units': 42,
+    })
+    for i, site in enumerate(sites):
+        graph.relate(owners[i % len(owners)], 'Responsible_for', site)
+        for room in rooms[i * 2:i * 2 + 2]:
+            graph.relate(site, 'Has', room)
+        for rack in racks[i * 4:i * 4 + 4]:
+            graph.relate(site, 'Has', rack)
+
+    routers = graph.add_nodes('Router', 'Physical', [router_name(i) for i in range(10 * scale)], lambda i: {
+        'model': rnd.choice(['mx480', 'mx960', 'mx10003', 'ptx10008']),
+        'version': rnd.choice(['17.4R2', '18.4R3', '20.4R1']),
+        'operational_state': 'In service',
+    })
+    router_ports, router_units = [], []
+    for r, router in enumerate(routers):
+        graph.relate(router, 'Located_in', racks[r % len(racks)], position=1 + r % 30)
+        ports = graph.add_nodes('Port', 'Physical', ['{}:{}'.format(router.node_name, port_name(p))
+                                                     for p in range(ports_per_router)],
+                                lambda p: {'description': 'Port {}'.format(p), 'port_type': 'LC'})
+        units = graph.add_nodes('Unit', 'Logical', ['{}:{}.{}'.format(router.node_name, port_name(p), u)
+                                                    for p in range(ports_per_router)
+                                                    for u in range(units_per_port)],
+                                lambda i: {'vlanid': i % units_per_port,
+                                           'ip_addresses': [unit_address(r, i // units_per_port,
+                                                                         i % units_per_port)]})
+        for p, port in enumerate(ports):
+            graph.relate(router, 'Has', port)
+            for unit in units[p * units_per_port:(p + 1) * units_per_port]:
+                graph.relate(unit, 'Part_of', port)
+        router_ports.append(ports)
+        router_units.append(units)
+    # Every other port is connected to the same port on the next router
+    cable_ends = [(ports[p], router_ports[(r + 1) % len(router_ports)][p])
+                  for r, ports in enumerate(router_ports) for p in range(0, ports_per_router, 2)]
+    cables = graph.add_nodes('Cable', 'Physical', ['CBL-{:06d}'.format(i) for i in range(len(cable_ends))],
+                             lambda i: {'cable_type': rnd.choice(['Patch', 'Patch', 'TP'])})
+    for cable, (a, b) in zip(cables, cable_ends):
+        graph.relate(cable, 'Connected_to', a)
+        graph.relate(cable, 'Connected_to', b)
+
+    optical_nodes = graph.add_nodes('Optical Node', 'Physical', ['optical-{:04d}'.format(i)
+                                                                 for i in range(5 * scale)],
+                                    lambda i: {'type': 'ciena6500', 'operational_state': 'In service'})
+    optical_ports = []
+    for i, optical_node in enumerate(optical_nodes):
+        graph.relate(optical_node, 'Located_in', racks[(i * 4) % len(racks)])
+        ports = graph.add_nodes('Port', 'Physical', ['{}:{}'.format(optical_node.node_name, p) for p in range(4)])
+        for port in ports:
+            graph.relate(optical_node, 'Has', port)
+        optical_ports.append(ports)
+    fibers = graph.add_nodes('Cable', 'Physical', ['FIBER-{:04d}'.format(i) for i in range(len(optical_nodes))],
+                             lambda i: {'cable_type': 'Dark Fiber'})
+    for i, fiber in enumerate(fibers):
+        graph.relate(fiber, 'Connected_to', optical_ports[i][0])
+        graph.relate(fiber, 'Connected_to', optical_ports[(i + 1) % len(optical_ports)][1])
+
+    peering_groups = graph.add_nodes('Peering Group', 'Logical', ['PEERS-{}'.format(i) for i in range(5)])
+    peering_partners = graph.add_nodes('Peering Partner', 'Relation', ['Peer AS{}'.format(64512 + i)
+                                                                       for i in range(20 * scale)],
+                                       lambda i: {'as_number': str(64512 + i)})
+    for i, partner in enumerate(peering_partners):
+        group = peering_groups[i % len(peering_groups)]
+        graph.relate(partner, 'Uses', group, ip_address=peer_address(i))
+        units = router_units[i % len(router_units)]
+        graph.relate(group, 'Depends_on', units[i % len(units)], ip_address=unit_address(i % len(routers), 0, 0))
+
+    customers = graph.add_nodes('Customer', 'Relation', ['Customer {:03d}'.format(i) for i in range(10 * scale)])
+    end_users = graph.add_nodes('End User', 'Relation', ['End user {:03d}'.format(i) for i in range(10 * scale)])
+    services = graph.add_nodes('Service', 'Logical', ['SRV-{:06d}'.format(i) for i in range(50 * scale)],
+                               lambda i: {'service_class': 'Ethernet', 'service_type': 'Ethernet VPN',
+                                          'operational_state': rnd.choice(['In service'] * 8 + ['Testing',
+                                                                                                'Reserved']),
+                                          'description': 'Service {}'.format(i)})
+    for i, service in enumerate(services):
+        r = i % len(routers)
+        if i % 2:
+            units = router_units[r]
+            graph.relate(service, 'Depends_on', units[(i // len(routers)) % len(units)])
+        else:
+            ports = router_ports[r]
+            graph.relate(service, 'Depends_on', ports[(i // len(routers)) % len(ports)])
+        graph.relate(customers[i % len(customers)], 'Uses', service)
+        if i % 3 == 0:
+            graph.relate(end_users[i % len(end_users)], 'Uses', service)
+
+    host_users = graph.add_nodes('Host User', 'Relation', ['Host user {}'.format(i) for i in range(5 * scale)])
+    now = datetime.now()
+    hosts = graph.add_nodes('Host', 'Logical', [host_name(i) for i in range(50 * scale)], lambda i: {
+        'ip_addresses': [host_address(i)],
+        'hostnames': [host_name(i)],
+        'os': 'Linux',
+        'os_version': rnd.choice(['4.19', '5.10', '5.15']),
+        'operational_state': 'In service',
+        'noclook_last_seen': (now - timedelta(days=rnd.randint(0, 40))).isoformat(),
+        'contract_number': 'NU-{}'.format(i % 4),
+    })
+    host_services = graph.add_nodes('Host Service', 'Logical', ['{}-{}'.format(name, port)
+                                                                for _, port, name, _ in HOST_SERVICES])
+    for i, host in enumerate(hosts):
+        graph.relate(host_users[i % len(host_users)], 'Uses', host)
+        for j in rnd.sample(range(len(HOST_SERVICES)), 3):
+            protocol, port, name, product = HOST_SERVICES[j]
+            graph.relate(host_services[j], 'Depends_on', host, ip_address=host_address(i), protocol=protocol,
+                         port=str(port), name=name, product=product, state='open',
+                         noclook_last_seen=now.isoformat(), public=bool(i % 10 == 0))
+    return graph.save()
+
+
+def nerds_juniper_conf(scale=1, ports_per_router=24, units_per_port=1):
+    """
+    juniper_conf producer data for the routers of the inventory with the same arguments.
+    """
+    data = []
+    for r in range(10 * scale):
+        interfaces = [{
+            'name': port_name(p),
+            'description': 'Port {}'.format(p),
+            'vlantagging': units_per_port > 1,
+            'bundle': '',
+            'tunnels': [],
+            'units': [{'unit': str(u), 'description': '', 'vlanid': str(u),
+                       'address': [unit_address(r, p, u) + '/30']} for u in range(units_per_port)],
+        } for p in range(ports_per_router)]
+        bgp_peerings = [{
+            'type': 'external',
+            'group': 'PEERS-{}'.format(i % 5),
+            'as_number': str(64512 + i),
+            'description': 'Peer AS{}'.format(64512 + i),
+            'remote_address': peer_address(i),
+            'local_address': unit_address(r, 0, 0),
+        } for i in range(r, 20 * scale, 10 * scale)]
+        data.append({'host': {'name': router_name(r), 'version': 1, 'juniper_conf': {
+            'name': router_name(r),
+            'model': 'mx480',
+            'version': '18.4R3',
+            'hardware': {'name': 'Chassis', 'serial_number': 'JN{:08d}'.format(r), 'description': 'MX480',
+                         'modules': [{'name': 'FPC {}'.format(f), 'part_number': '750-045715',
+                                      'serial_number': 'FPC{:04d}{}'.format(r, f),
+                                      'description': 'MPC7E 3D 40XGE'} for f in range(4)]},
+            'interfaces': interfaces,
+            'bgp_peerings': bgp_peerings,
+        }}})
+    return data
+
+
+def nerds_nmap_services(scale=1):
+    """
+    nmap_services_py producer data for the hosts of the inventory with the same scale.
+    """
+    data = []
+    for i in range(50 * scale):
+        services = {host_address(i): {}}
+        for protocol, port, name, product in HOST_SERVICES[:3]:
+            services[host_address(i)].setdefault(protocol, {})[str(port)] = {
+                'conf': '10', 'extrainfo': '', 'name': name, 'product': product, 'reason': 'syn-ack',
+                'state': 'open', 'version': '',
+            }
+        data.append({'host': {'name': host_name(i), 'version': 1, 'nmap_services_py': {
+            'addresses': [host_address(i)],
+            'hostnames': [host_name(i)],
+            'services': services,
+        }}})
+    return data
+
+
+def nerds_checkmk(scale=1):
+    """
+    checkmk_livestatus producer data for the hosts of the inventory with the same scale.
+    """
+    last_check = int((datetime.now() - datetime(1970, 1, 1)).total_seconds())
+    return [{'host': {'name': host_name(i), 'version': 1, 'checkmk_livestatus': {
+        'host_name': host_name(i),
+        'host_alias': host_name(i),
+        'host_address': host_address(i),
+        'checks': [
+            {'check_command': 'CHECK_NRPE!check_uptime', 'description': 'check_uptime',
+             'display_name': 'check_uptime', 'last_check': last_check, 'perf_data': 'type=1 uptime_minutes=25572',
+             'plugin_output': 'OK: Linux - up 17 days 18 hours 12 minutes'},
+            {'check_command': 'CHECK_NRPE!check_backup', 'description': 'check backup',
+             'display_name': 'check backup', 'last_check': last_check, 'perf_data': '',
+             'plugin_output': "PROCS OK: 1 process with UID = 0 (root), args 'dsmcad'"},
+        ],
+    }}} for i in range(50 * scale)]
+
+
+def nerds_cfengine_report(scale=1):
+    """
+    cfengine_report producer data for the hosts of the inventory with the same scale.
+    """
+    return [{'host': {'name': host_name(i), 'version': 1, 'cfengine_report': [
+        {'last_verified_(gmt_+00:00)': '06-10-2013 16:55',
+         'promisehandle': 'system_administration_methods_syslog_conf',
+         'promisestatus': 'kept' if i % 5 else 'notkept'},
+    ]}} for i in range(50 * scale)]
+
+
+def nerds_nunoc_cosmos(scale=1):
+    """
+    nunoc_cosmos producer data for the hosts of the inventory with the same scale.
+    """
+    return [{'host': {'name': host_name(i), 'version': 1, 'nunoc_cosmos': {
+        'addresses': [host_address(i)],
+        'sunet_iaas': i % 4 == 0,
+        'managed_by': 'Puppet',
+    }}} for i in range(50 * scale)]
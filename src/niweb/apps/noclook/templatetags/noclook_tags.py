@@ -1,5 +1,5 @@
-from apps.noclook.models import NodeType
-from apps.noclook.helpers import neo4j_data_age, neo4j_report_age, get_node_type
+from apps.noclook import reference_data
+from apps.noclook.helpers import neo4j_data_age, neo4j_report_age, get_node_type, get_dependency_details
 import norduniclient as nc
 from datetime import datetime, timedelta
 from django import template
@@ -17,9 +17,8 @@ def type_menu():
     """
     Returns a list with all wanted NodeType objects for easy menu
     handling.
-    Just chain .exclude(type='name') to remove unwanted types.
     """
-    types = NodeType.objects.exclude(hidden=True)
+    types = reference_data.menu_node_types()
     return {'types': types}
 
 
@@ -152,6 +151,19 @@ def noclook_report_age(item, old, very_old):
         return ''
 
 
+@register.simple_tag
+def dependency_details(dependent, dependencies):
+    """
+    :return: The users, ports and placement paths shown by depend_include.html, see helpers.get_dependency_details
+    """
+    return get_dependency_details(dependent, dependencies)
+
+
+@register.filter
+def get_item(dictionary, key):
+    return dictionary.get(key)
+
+
 @register.simple_tag
 def noclook_has_rogue_ports(handle_id):
     """
@@ -32,6 +32,19 @@ def export_as(context, file_type, param_del=["page"]):
         path +="?" + params.urlencode() 
     return path 
 
+@register.simple_tag(takes_context=True)
+def export_url(context, file_format, param_del=["page"]):
+    """
+      Current page with the format query param set, filter params are kept as is.
+    """
+    params = context['request'].GET.copy()
+    for param in param_del:
+        if param in params:
+            del params[param]
+    params['format'] = file_format
+    return "?" + params.urlencode()
+
+
 def clean_queryparams(params):
     out = params.copy()
     for param,val in params.items():
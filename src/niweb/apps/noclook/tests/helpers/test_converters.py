@@ -1,5 +1,8 @@
+import zipfile
+from unittest import mock
+from io import BytesIO
 from django.test import SimpleTestCase
-from apps.noclook import helpers
+from apps.noclook import helpers, exports
 
 
 class FileExportHelperTest(SimpleTestCase):
@@ -21,7 +24,50 @@ class FileExportHelperTest(SimpleTestCase):
         self.assertEqual(resp['content-type'], 'text/csv')
         self.assertEqual(resp['Content-Disposition'], 'attachment; filename=result.csv; charset=utf-8;')
 
-        self.assertContains(resp, '"Test","Foo"')
-        self.assertContains(resp, '"hest","bar"')
-        self.assertContains(resp, '"best of all","baz"')
-        self.assertContains(resp, '"fest","yay"')
+        content = b''.join(resp.streaming_content).decode('utf-8')
+        self.assertIn('"Test","Foo"', content)
+        self.assertIn('"hest","bar"', content)
+        self.assertIn('"best of all","baz"', content)
+        self.assertIn('"fest","yay"', content)
+
+    def test_dicts_to_csv_response_sampled_header(self):
+        resp = helpers.dicts_to_csv_response(iter(self.dicts))
+        content = b''.join(resp.streaming_content).decode('utf-8')
+        self.assertEqual(content.splitlines()[0], '"Foo","Test"')
+        self.assertIn('"bar","hest"', content)
+
+    def test_dicts_to_xlsx_response(self):
+        resp = helpers.dicts_to_xlsx_response(self.dicts, [u'Test', u'Foo'])
+        self.assertEqual(resp['content-type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.assertEqual(resp['Content-Disposition'], 'attachment; filename=result.xlsx;')
+        with zipfile.ZipFile(BytesIO(b''.join(resp.streaming_content))) as zf:
+            self.assertIn('[Content_Types].xml', zf.namelist())
+            sheet = zf.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertIn('<t xml:space="preserve">best of all</t>', sheet)
+        self.assertEqual(sheet.count('<row '), 4)
+
+    def test_xlsx_continues_on_new_sheet(self):
+        rows = ({'n': i} for i in range(10))
+        data = b''.join(exports.xlsx_chunks(rows, ['n'], 'Numbers', max_rows=4))
+        with zipfile.ZipFile(BytesIO(data)) as zf:
+            workbook = zf.read('xl/workbook.xml').decode('utf-8')
+            sheets = [zf.read('xl/worksheets/sheet{}.xml'.format(i)).decode('utf-8') for i in range(1, 5)]
+        self.assertIn('name="Numbers (4)"', workbook)
+        # Header plus three rows per sheet, last sheet gets the remaining row
+        self.assertEqual([s.count('<row ') for s in sheets], [4, 4, 4, 2])
+
+    def test_xlsx_non_finite_numbers(self):
+        rows = [{'n': float('nan')}, {'n': float('inf')}, {'n': 1.5}]
+        data = b''.join(exports.xlsx_chunks(rows, ['n'], 'Numbers'))
+        with zipfile.ZipFile(BytesIO(data)) as zf:
+            sheet = zf.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertIn('<t xml:space="preserve">nan</t>', sheet)
+        self.assertIn('<t xml:space="preserve">inf</t>', sheet)
+        self.assertIn('<v>1.5</v>', sheet)
+
+    def test_header_keys(self):
+        rows = [{'Test': 'hest'}] * exports.HEADER_SAMPLE_SIZE + [{'Foo': 'bar'}]
+        self.assertEqual(exports.header_keys(iter(rows)), ['Foo', 'Test'])
+        with mock.patch.object(helpers, 'dicts_to_xls') as dicts_to_xls:
+            helpers.dicts_to_xls_response(iter(rows))
+        self.assertEqual(dicts_to_xls.call_args[0][1], ['Foo', 'Test'])
@@ -5,22 +5,73 @@ try:
 except NameError:
     # Python 3 has reload in importlib
     from importlib import reload
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.test import TestCase, Client, tag
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from apps.noclook.models import NodeHandle
 from dynamic_preferences.registries import global_preferences_registry
-from apps.noclook import forms, helpers
+from apps.noclook import forms, helpers, reference_data, neo4j_instrumentation
 from django.template.defaultfilters import slugify
-from apps.noclook.tests.testing import nc
+from apps.noclook.tests.testing import nc, reserve_handle_ids, worker_handle_id_range, delete_nodes
 
 # We instantiate a manager for our global preferences
 global_preferences = global_preferences_registry.manager()
 
 
+class QueryBudgetMixin(object):
+    """
+    Like assertNumQueries but asserts an upper bound, for both the SQL queries and the neo4j queries made through
+    norduniclient.
+
+        with self.assertMaxQueries(sql=10, neo4j=2):
+            self.client.get('/router/')
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, sql=None, neo4j=None, using=DEFAULT_DB_ALIAS):
+        if neo4j is not None and not neo4j_instrumentation.installed():
+            self.skipTest('neo4j queries are not counted, NEO4J_INSTRUMENTATION is false.')
+        with CaptureQueriesContext(connections[using]) as sql_queries, neo4j_instrumentation.collect() as collector:
+            yield
+        if sql is not None:
+            self.assertLessEqual(
+                len(sql_queries), sql, '%d SQL queries executed, at most %d expected\nCaptured queries were:\n%s' % (
+                    len(sql_queries), sql,
+                    '\n'.join('%d. %s' % (i, q['sql']) for i, q in enumerate(sql_queries.captured_queries, start=1))))
+        if neo4j is not None:
+            self.assertLessEqual(
+                collector.count, neo4j, '%d neo4j queries executed, at most %d expected\nCaptured queries were:\n%s' % (
+                    collector.count, neo4j,
+                    '\n'.join(u'%d. %s' % (i, ' '.join(q.statement.split()))
+                              for i, q in enumerate(collector.queries, start=1))))
+
+
+class Neo4jIsolationMixin(object):
+    """
+    Makes the NodeHandles, and so the neo4j nodes, created by a test get handle_ids in the range of the test worker
+    and deletes only those nodes after the test. Tests in different workers do not see each others nodes, so the
+    suite can run with manage.py test --parallel against one neo4j database.
+
+    Nodes created directly in neo4j, not through a NodeHandle, have to be deleted by the test.
+    """
+
+    def setUp(self):
+        super(Neo4jIsolationMixin, self).setUp()
+        self.first_handle_id = reserve_handle_ids()
+
+    def tearDown(self):
+        start, end = worker_handle_id_range()
+        delete_nodes(max(start, self.first_handle_id), end)
+        super(Neo4jIsolationMixin, self).tearDown()
+
+
 @tag('db', 'neo4j')
-class NeoTestCase(TestCase):
+class NeoTestCase(Neo4jIsolationMixin, QueryBudgetMixin, TestCase):
 
     def setUp(self):
+        super(NeoTestCase, self).setUp()
         # Create user
         user = User.objects.create_user(username='test user', email='test@localhost', password='test')
         user.is_staff = True
@@ -32,11 +83,8 @@ class NeoTestCase(TestCase):
         # Load the default forms
         global_preferences['general__data_domain'] = 'common'
         reload(forms)
-
-    def tearDown(self):
-        with nc.graphdb.manager.session as s:
-            s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
-        super(NeoTestCase, self).tearDown()
+        # Rolled back test data does not invalidate the reference data cache
+        reference_data.clear()
 
     def get_full_url(self, what):
         if isinstance(what, NodeHandle):
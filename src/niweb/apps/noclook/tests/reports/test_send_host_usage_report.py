@@ -1,9 +1,16 @@
+from collections import OrderedDict
+
 from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
 from ..neo4j_base import NeoTestCase
 from apps.noclook import helpers
 from django.core import mail
+from datetime import datetime, timedelta
+from io import StringIO
+from apps.noclook.management.commands.send_host_usage_report import create_workbooks, get_hosts
 
 
+@override_settings(REPORTS_TO=['noc@example.com'])
 class SendHostReportTest(NeoTestCase):
 
     def test_send_host_report(self):
@@ -35,3 +42,47 @@ class SendHostReportTest(NeoTestCase):
         self.assertIn('DEV_TEST hosts', attachment[0])
         self.assertIn('.xls', attachment[0])
         # need to decode xls to see if values are correct
+
+    def test_send_host_report_filters_and_contracts(self):
+        host_user = self.create_node('Test co', 'host-user', 'Relation')
+        hosts = {
+            'current.test.dev': {'contract_number': 'DEV_TEST', 'operational_state': 'In service',
+                                 'noclook_last_seen': datetime.now().isoformat()},
+            'very-old.test.dev': {'contract_number': 'DEV_TEST',
+                                  'noclook_last_seen': (datetime.now() - timedelta(days=31)).isoformat()},
+            'decommissioned.test.dev': {'contract_number': 'DEV_TEST', 'operational_state': 'Decommissioned'},
+            'other.test.dev': {'contract_number': 'OTHER_TEST'},
+        }
+        for name, data in hosts.items():
+            host = self.create_node(name, 'host', 'Logical')
+            host.get_node().set_user(host_user.handle_id)
+            data['ip_addresses'] = ['10.0.0.2']
+            helpers.dict_update_node(self.user, host.handle_id, data)
+
+        result = get_hosts(['DEV_TEST', 'OTHER_TEST', 'EMPTY_TEST'])
+        self.assertEqual(list(result), ['DEV_TEST', 'OTHER_TEST', 'EMPTY_TEST'])
+        self.assertEqual([h['name'] for _, h in result['DEV_TEST']], ['current.test.dev'])
+        self.assertEqual([h['name'] for _, h in result['OTHER_TEST']], ['other.test.dev'])
+        self.assertEqual(result['EMPTY_TEST'], [])
+
+        out = StringIO()
+        call_command('send_host_usage_report', 'DEV_TEST', 'OTHER_TEST', 'EMPTY_TEST', stdout=out)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual([m.subject for m in mail.outbox], ['NOCLook host report for DEV_TEST',
+                                                            'NOCLook host report for OTHER_TEST',
+                                                            'NOCLook host report for EMPTY_TEST'])
+        self.assertIn('Sent 3 reports with 2 hosts', out.getvalue())
+
+
+class CreateWorkbooksTest(SimpleTestCase):
+
+    def test_worker_processes(self):
+        hosts = OrderedDict(
+            (contract_number, [('Test co', {'name': 'host.{}'.format(contract_number),
+                                            'contract_number': contract_number})])
+            for contract_number in ['DEV_TEST', 'OTHER_TEST', 'EMPTY_TEST'])
+        hosts['EMPTY_TEST'] = []
+        serial = [(num_hosts, xls) for num_hosts, xls, _ in create_workbooks(hosts, 1)]
+        parallel = [(num_hosts, xls) for num_hosts, xls, _ in create_workbooks(hosts, 2)]
+        self.assertEqual([num_hosts for num_hosts, _ in parallel], [1, 1, 0])
+        self.assertEqual(parallel, serial)
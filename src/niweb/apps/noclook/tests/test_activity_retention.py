@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from actstream import action
+from actstream.models import Action
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.noclook import activity_retention, synthetic
+from apps.noclook.memory_graph import MemoryGraphManager
+import norduniclient as nc
+
+
+class ActivityRetentionTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user', is_staff=True)
+        self.consumer = User.objects.create(username='noclook')
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        self.router, self.other = self.graph.nodes['Router'][:2]
+        self.archive_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_path)
+        self.old = timezone.now() - timedelta(days=100)
+
+    def property_action(self, actor, timestamp):
+        action.send(actor, verb='update', action_object=self.router, timestamp=timestamp,
+                    noclook={'action_type': 'node_property', 'property': 'noclook_last_seen',
+                             'value_before': '', 'value_after': timestamp.isoformat()})
+
+    def relationship_action(self, verb, timestamp, relationship_type='Connected_to'):
+        action.send(self.consumer, verb=verb, action_object=self.router, target=self.other, timestamp=timestamp,
+                    noclook={'action_type': 'relationship', 'relationship_type': relationship_type})
+        return Action.objects.latest('id').id
+
+    def test_policies(self):
+        self.assertEqual(activity_retention.policies([{'action_type': 'comment'}]),
+                         [activity_retention.RetentionPolicy('comment', None, None)])
+        with self.assertRaises(ImproperlyConfigured):
+            activity_retention.policies([{'action_type': 'comment', 'weeks': 2}])
+        with self.assertRaises(ImproperlyConfigured):
+            activity_retention.policies([{'days': 0}])
+
+    def test_expired_actions(self):
+        self.property_action(self.consumer, self.old)
+        self.property_action(self.consumer, timezone.now())
+        self.property_action(self.user, self.old)
+        retention_policies = activity_retention.policies([
+            {'actor': 'test user'},
+            {'action_type': 'node_property', 'days': 30},
+        ])
+        (policy, actions), = activity_retention.expired_actions(retention_policies)
+        # Actions of test user are kept by the first policy
+        self.assertEqual([a.actor for a in actions], [self.consumer])
+        self.assertEqual(actions.get().timestamp, self.old)
+
+    def test_redundant_actions(self):
+        first = self.relationship_action('create', self.old)
+        repeated = self.relationship_action('create', self.old + timedelta(minutes=1))
+        self.relationship_action('create', self.old + timedelta(minutes=2), relationship_type='Depends_on')
+        delete = self.relationship_action('delete', self.old + timedelta(minutes=3))
+        repeated_delete = self.relationship_action('delete', self.old + timedelta(minutes=4))
+        self.relationship_action('create', self.old + timedelta(minutes=5))
+        self.assertEqual(activity_retention.redundant_actions(), [repeated, repeated_delete])
+        self.assertEqual(activity_retention.redundant_actions([self.other.handle_id]), [])
+        self.assertNotIn(first, activity_retention.redundant_actions())
+        self.assertNotIn(delete, activity_retention.redundant_actions())
+
+    @override_settings(ACTIVITY_RETENTION_POLICIES=[{'action_type': 'node_property', 'days': 30}])
+    def test_run(self):
+        for i in range(5):
+            self.property_action(self.consumer, self.old + timedelta(minutes=i))
+        self.property_action(self.consumer, timezone.now())
+        self.relationship_action('create', self.old)
+        repeated = self.relationship_action('create', self.old + timedelta(minutes=1))
+        before = Action.objects.count()
+
+        result = activity_retention.run(dry_run=True, archive_path=self.archive_path)
+        self.assertEqual(sum(result.values()), 6)
+        self.assertEqual(Action.objects.count(), before)
+
+        result = activity_retention.run(batch_size=2, archive_path=self.archive_path)
+        self.assertEqual(result['compacted'], 1)
+        self.assertEqual(Action.objects.count(), before - 6)
+        self.assertFalse(Action.objects.filter(id=repeated).exists())
+
+        archive, = os.listdir(self.archive_path)
+        with gzip.open(os.path.join(self.archive_path, archive), 'rt', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[-1]['id'], repeated)
+        self.assertEqual(rows[0]['data']['noclook']['property'], 'noclook_last_seen')
+
+    def test_command(self):
+        self.relationship_action('create', self.old)
+        self.relationship_action('create', self.old + timedelta(minutes=1))
+        call_command('compact_activity_log', '--archive-path', '', stdout=mock.MagicMock())
+        self.assertEqual(activity_retention.redundant_actions(), [])
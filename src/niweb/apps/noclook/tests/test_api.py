@@ -6,12 +6,12 @@ from django.test import TestCase
 from tastypie.models import ApiKey
 from apps.noclook.models import NodeHandle, NodeType, UniqueIdGenerator
 from apps.noclook import helpers
-from apps.noclook.tests.testing import nc
+from apps.noclook.tests.neo4j_base import Neo4jIsolationMixin
 
 __author__ = 'lundberg'
 
 
-class ApiTest(ResourceTestCaseMixin, TestCase):
+class ApiTest(Neo4jIsolationMixin, ResourceTestCaseMixin, TestCase):
 
     def setUp(self):
         super(ApiTest, self).setUp()
@@ -27,13 +27,6 @@ class ApiTest(ResourceTestCaseMixin, TestCase):
 
         self.DEFAULT_HANDLE_IDS = []
 
-    def tearDown(self):
-        for nh in NodeHandle.objects.all():
-            nh.delete()
-        with nc.graphdb.manager.session as s:
-            s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
-        super(ApiTest, self).tearDown()
-
     def get_credentials(self):
         return self.create_apikey(username=self.username, api_key=str(self.api_key.key))
 
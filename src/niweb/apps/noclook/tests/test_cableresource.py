@@ -17,13 +17,13 @@ from tastypie.models import ApiKey
 from dynamic_preferences.registries import global_preferences_registry
 from apps.noclook.models import NodeHandle, NodeType, UniqueIdGenerator
 from apps.noclook import helpers, forms
-from apps.noclook.tests.testing import nc
+from apps.noclook.tests.neo4j_base import Neo4jIsolationMixin
 
 # We instantiate a manager for our global preferences
 global_preferences = global_preferences_registry.manager()
 
 
-class CableResourceTest(ResourceTestCaseMixin, TestCase):
+class CableResourceTest(Neo4jIsolationMixin, ResourceTestCaseMixin, TestCase):
 
     def setUp(self):
         super(CableResourceTest, self).setUp()
@@ -81,13 +81,6 @@ class CableResourceTest(ResourceTestCaseMixin, TestCase):
         helpers.set_has(self.user, self.router1.get_node(), self.port1.handle_id)
         helpers.set_has(self.user, self.router2.get_node(), self.port2.handle_id)
 
-    def tearDown(self):
-        for nh in NodeHandle.objects.all():
-            nh.delete()
-        with nc.graphdb.manager.session as s:
-            s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
-        super(CableResourceTest, self).tearDown()
-
     def get_credentials(self):
         return self.create_apikey(username=self.username, api_key=str(self.api_key.key))
 
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from tastypie.models import ApiKey
+
+from apps.noclook import activitylog, conditional, synthetic
+from apps.noclook.memory_graph import MemoryGraphManager
+from apps.noclook.models import NodeHandle
+import norduniclient as nc
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user', is_staff=True)
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        self.router = self.graph.nodes['Router'][0]
+        self.port = next(nh for nh in self.graph.nodes['Port'] if nh.node_name.startswith(self.router.node_name))
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def assertNotModified(self, url, resp, **extra):
+        with mock.patch.object(nc.graphdb, '_manager', None):
+            # Answered without neo4j
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'], **extra)
+        self.assertEqual(resp.status_code, 304)
+
+    def assertModified(self, url, resp, **extra):
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'], **extra)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_detail_view(self):
+        url = '{}history'.format(self.router.get_absolute_url())
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('no-cache', resp['Cache-Control'])
+        self.assertNotModified(url, resp)
+        resp_modified_since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified'])
+        self.assertEqual(resp_modified_since.status_code, 304)
+
+        # Changed properties of the ports are shown on the router pages
+        activitylog.update_node_property(self.user, self.port, 'description', '', 'Uplink')
+        self.assertModified(url, resp)
+
+    def test_neighbourhood(self):
+        cable = self.graph.nodes['Cable'][-1]
+        modified = NodeHandle.objects.get(pk=self.router.handle_id).modified
+        watermark = conditional.node_watermark(self.router.handle_id)
+        self.assertNotIn(cable.handle_id, conditional.neighbourhood(self.router.handle_id))
+
+        # Connecting a cable to a port of the router is shown on the router page
+        with self.captureOnCommitCallbacks(execute=True):
+            graph = self.manager.graph
+            graph.create_relationship(graph.get_node(cable.handle_id), 'Connected_to',
+                                      graph.get_node(self.port.handle_id))
+            activitylog.create_relationship(self.user, mock.Mock(start={'handle_id': cable.handle_id},
+                                                                 end={'handle_id': self.port.handle_id},
+                                                                 type='Connected_to'))
+        self.assertIn(cable.handle_id, conditional.neighbourhood(self.router.handle_id))
+        self.assertGreater(conditional.node_watermark(self.router.handle_id), watermark)
+
+        watermark = conditional.node_watermark(self.router.handle_id)
+        activitylog.update_node_property(self.user, cable, 'name', cable.node_name, 'Renamed')
+        self.assertGreater(conditional.node_watermark(self.router.handle_id), watermark)
+        # Changes of other nodes are not changes of the router
+        self.assertEqual(NodeHandle.objects.get(pk=self.router.handle_id).modified, modified)
+
+    def test_changes_elsewhere_keep_the_neighbourhood(self):
+        watermark = conditional.node_watermark(self.router.handle_id)
+        handle_ids = conditional.neighbourhood(self.router.handle_id)
+        start, end = [nh for nh in self.graph.nodes['Cable'] if nh.handle_id not in handle_ids][:2]
+        activitylog.create_relationship(self.user, mock.Mock(start={'handle_id': start.handle_id},
+                                                             end={'handle_id': end.handle_id}, type='Connected_to'))
+        with mock.patch.object(conditional, '_walk_neighbourhood', side_effect=AssertionError('walked')):
+            self.assertEqual(conditional.node_watermark(self.router.handle_id), watermark)
+
+    @override_settings(CONDITIONAL_GET_MAX_NODES=2)
+    def test_large_neighbourhood(self):
+        self.assertIsNone(conditional.node_watermark(self.router.handle_id))
+        url = '{}history'.format(self.router.get_absolute_url())
+        self.assertNotIn('ETag', self.client.get(url))
+
+    def test_other_user(self):
+        url = '{}history'.format(self.router.get_absolute_url())
+        resp = self.client.get(url)
+        self.client.force_login(User.objects.create(username='other user'))
+        self.assertModified(url, resp)
+
+    def test_type_watermark(self):
+        watermark = conditional.type_watermark('router')
+        # Other node types do not change the router list
+        activitylog.update_node_property(self.user, self.graph.nodes['Customer'][0], 'description', '', 'Changed')
+        self.assertEqual(conditional.type_watermark('router'), watermark)
+        activitylog.update_node_property(self.user, self.router, 'description', '', 'Changed')
+        self.assertGreater(conditional.type_watermark('router'), watermark)
+        self.assertEqual(conditional.type_watermark('router', 'customer'), conditional.type_watermark('router'))
+
+    def test_api(self):
+        api_key = ApiKey.objects.create(user=self.user, key='testkey')
+        auth = {'HTTP_AUTHORIZATION': 'ApiKey {}:{}'.format(self.user.username, api_key.key)}
+        self.client.logout()
+        url = '/api/v1/router/{}/'.format(self.router.handle_id)
+        resp = self.client.get(url, **auth)
+        self.assertNotModified(url, resp, **auth)
+        # Not authenticated
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 401)
+
+        resp = self.client.get('/api/v1/router/', **auth)
+        self.assertNotModified('/api/v1/router/', resp, **auth)
+        activitylog.create_relationship(self.user, mock.Mock(start={'handle_id': self.router.handle_id},
+                                                             end={'handle_id': self.port.handle_id}, type='Has'))
+        self.assertModified('/api/v1/router/', resp, **auth)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from actstream import action
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from apps.noclook import connection_paths, synthetic, topology
+from apps.noclook.memory_graph import MemoryGraphManager
+import norduniclient as nc
+
+
+@override_settings(TOPOLOGY_SNAPSHOT_PATH='')
+class ConnectionPathTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user', is_staff=True)
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        cache.clear()
+        topology.reset()
+        # FIBER-0000 connects port 0 of the first optical node to port 1 of the second
+        self.cables = [nh for nh in self.graph.nodes['Cable'] if nh.node_name.startswith('FIBER')]
+        self.cable = self.cables[0]
+        self.optical_nodes = self.graph.nodes['Optical Node'][:2]
+        ports = dict((nh.node_name, nh) for nh in self.graph.nodes['Port'])
+        self.ports = [ports['{}:0'.format(self.optical_nodes[0].node_name)],
+                      ports['{}:1'.format(self.optical_nodes[1].node_name)]]
+
+    def test_cable_path(self):
+        path = connection_paths.get_connection_path(self.cable.handle_id)
+        self.assertEqual(len(path), 3)
+        self.assertEqual(path[1]['part']['name'], self.cable.node_name)
+        self.assertIsNone(path[1]['parent'])
+        ends = set((item['parent']['name'], item['part']['name']) for item in (path[0], path[-1]))
+        self.assertEqual(ends, set((optical_node.node_name, port.node_name)
+                                   for optical_node, port in zip(self.optical_nodes, self.ports)))
+        # The ports share the path of the cable
+        port_path = connection_paths.get_connection_path(self.ports[0].handle_id)
+        self.assertEqual([item['part']['handle_id'] for item in port_path],
+                         [item['part']['handle_id'] for item in path])
+
+    def test_unconnected_port(self):
+        port = next(nh for nh in self.graph.nodes['Port'] if nh.node_name.endswith(':2'))
+        self.assertEqual(connection_paths.get_connection_path(port.handle_id), [])
+        self.assertEqual(connection_paths.endpoints([port.handle_id]), {port.handle_id: []})
+
+    def test_cache_invalidation(self):
+        connection_paths.paths([self.cable.handle_id])
+        with mock.patch.object(nc.graphdb, '_manager', None):
+            # Cached paths do not touch neo4j
+            self.assertEqual(len(connection_paths.paths([self.cable.handle_id])[self.cable.handle_id]), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            graph = self.manager.graph
+            cable_node = graph.get_node(self.cable.handle_id)
+            relationship = next(r for r in graph.relationships_of(cable_node, 'out', ['Connected_to'])
+                                if r.end.properties['handle_id'] == self.ports[1].handle_id)
+            graph.delete_relationship(relationship)
+            action.send(self.user, verb='delete', action_object=self.cable, target=self.ports[1],
+                        noclook={'action_type': 'relationship', 'relationship_type': 'Connected_to'})
+        path = connection_paths.paths([self.cable.handle_id])[self.cable.handle_id]
+        self.assertEqual(sorted(part for part, parent in path), sorted([self.cable.handle_id,
+                                                                        self.ports[0].handle_id]))
+
+    def test_endpoints(self):
+        cables = self.cables[:3]
+        ends = connection_paths.endpoints([nh.handle_id for nh in cables])
+        self.assertEqual(set(ends), set(nh.handle_id for nh in cables))
+        names = set(end['name'] for end in ends[self.cable.handle_id])
+        self.assertEqual(names, set('{} {}'.format(optical_node.node_name, port.node_name)
+                                    for optical_node, port in zip(self.optical_nodes, self.ports)))
+        self.assertTrue(all(len(cable_ends) == 2 for cable_ends in ends.values()))
@@ -11,7 +11,7 @@ from django.template.defaultfilters import slugify
 from dynamic_preferences.registries import global_preferences_registry
 from apps.noclook.models import NodeHandle, NodeType, UniqueIdGenerator, ServiceType, ServiceClass
 from apps.noclook import forms, helpers
-from apps.noclook.tests.testing import nc
+from apps.noclook.tests.neo4j_base import Neo4jIsolationMixin
 
 __author__ = 'lundberg'
 
@@ -19,9 +19,10 @@ __author__ = 'lundberg'
 global_preferences = global_preferences_registry.manager()
 
 
-class FormTestCase(TestCase):
+class FormTestCase(Neo4jIsolationMixin, TestCase):
 
     def setUp(self):
+        super(FormTestCase, self).setUp()
         # Create user
         user = User.objects.create_user(username='test user', email='test@localhost', password='test')
         user.is_staff = True
@@ -61,11 +62,6 @@ class FormTestCase(TestCase):
             modifier=self.user,
         )
 
-    def tearDown(self):
-        with nc.graphdb.manager.session as s:
-            s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
-        super(FormTestCase, self).tearDown()
-
     def get_full_url(self, path):
         return path
 
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.noclook import detail_loader, neo4j_instrumentation
+
+
+class FakeNode(object):
+
+    def __init__(self, parties):
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def get_location_path(self):
+        # Only passes if the other method runs at the same time
+        self.barrier.wait()
+        neo4j_instrumentation.record('MATCH (n) RETURN n', {}, 1, 0.01)
+        return {'location_path': []}
+
+    def get_connections(self):
+        self.barrier.wait()
+        neo4j_instrumentation.record('MATCH (n) RETURN n', {}, 2, 0.01)
+        return ['connection']
+
+    def get_relations(self):
+        raise ValueError('broken')
+
+
+class DetailLoaderTest(SimpleTestCase):
+
+    def test_load_concurrently(self):
+        node = FakeNode(2)
+        with neo4j_instrumentation.collect() as collector:
+            location_path, connections = detail_loader.load(node, 'get_location_path', 'get_connections')
+        self.assertEqual(location_path, {'location_path': []})
+        self.assertEqual(connections, ['connection'])
+        # Queries made by the pool threads are counted for the calling thread
+        self.assertEqual(collector.count, 2)
+        self.assertEqual(collector.rows, 3)
+
+    def test_exception(self):
+        with self.assertRaises(ValueError):
+            detail_loader.load(FakeNode(1), 'get_location_path', 'get_relations')
+
+    @override_settings(NEO4J_QUERY_THREADS=1)
+    def test_one_thread(self):
+        calls = []
+        results = detail_loader.run_concurrently(lambda: calls.append(threading.current_thread()) or 1,
+                                                 lambda: calls.append(threading.current_thread()) or 2)
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(calls, [threading.current_thread()] * 2)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from apps.noclook import activitylog, impact, synthetic, topology
+from apps.noclook.memory_graph import MemoryGraphManager
+from apps.noclook.models import NodeHandle
+from apps.noclook.views import fragments
+import norduniclient as nc
+
+
+@override_settings(TOPOLOGY_SNAPSHOT_PATH='')
+class FragmentCacheTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user', is_staff=True)
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        cache.clear()
+        topology.reset()
+        self.cable = next(nh for nh in self.graph.nodes['Cable'] if nh.node_name.startswith('FIBER'))
+        self.url = reverse('node_fragment', args=['cable', self.cable.handle_id, 'connection-path'])
+        self.client.force_login(self.user)
+
+    def test_cached_section(self):
+        resp = self.client.get(self.url)
+        self.assertContains(resp, self.cable.node_name)
+        with mock.patch.object(nc.graphdb, '_manager', None):
+            # Rendered sections do not touch neo4j
+            resp_cached = self.client.get(self.url)
+        self.assertEqual(resp_cached.content, resp.content)
+        self.assertIn('max-age', resp_cached['Cache-Control'])
+
+    def test_path_watermark(self):
+        self.client.get(self.url)
+        # The optical nodes are not neighbours of the cable but their names are shown in the path
+        optical_node = self.graph.nodes['Optical Node'][0]
+        self.manager.graph.get_node(optical_node.handle_id).properties['name'] = 'renamed-optical-node'
+        activitylog.update_node_property(self.user, optical_node, 'name', optical_node.node_name,
+                                         'renamed-optical-node')
+        self.assertContains(self.client.get(self.url), 'renamed-optical-node')
+
+    def test_router_section_watermark(self):
+        router = self.graph.nodes['Router'][0]
+        loader = fragments.get_section('router', 'dependents')
+        watermark = loader.watermark(router)
+        # A service depending on a unit of a port of the router, three relationships away
+        service = NodeHandle.objects.get(
+            pk=impact.impact_analysis(router.handle_id)['groups']['Service'][0]['handle_id'])
+        activitylog.update_node_property(self.user, service, 'description', '', 'Changed')
+        self.assertGreater(loader.watermark(router), watermark)
+
+    def test_router_sections(self):
+        router = self.graph.nodes['Router'][0]
+        unit = next(nh for nh in self.graph.nodes['Unit'] if nh.node_name.startswith(router.node_name))
+        service = NodeHandle.objects.get(
+            pk=impact.impact_analysis(router.handle_id)['groups']['Service'][0]['handle_id'])
+        user = service.get_node().get_relations()['Uses'][0]['node']
+        resp = self.client.get(reverse('node_fragment', args=['router', router.handle_id, 'connections']))
+        # The units of the ports and what depends on the ports and units, with the node type
+        self.assertContains(resp, unit.node_name)
+        self.assertContains(resp, 'Service {}'.format(service.node_name))
+        resp = self.client.get(reverse('node_fragment', args=['router', router.handle_id, 'dependents']))
+        self.assertContains(resp, service.node_name)
+        self.assertContains(resp, user.data['name'])
+
+    def test_uncached_section(self):
+        render_section = mock.Mock(return_value='section')
+        for i in range(2):
+            self.assertEqual(fragments.cached_section('test', 1, None, render_section), 'section')
+        self.assertEqual(render_section.call_count, 2)
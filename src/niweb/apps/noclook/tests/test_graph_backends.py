@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Conformance tests for the graph backends, the same tests run against neo4j and the in-memory graph.
+
+The neo4j tests are skipped when no neo4j database is configured for the tests.
+"""
+from django.test import SimpleTestCase, tag
+from neo4j.exceptions import ConstraintError
+
+from apps.noclook import neo4j_instrumentation
+from apps.noclook.api import resources
+from apps.noclook.memory_graph import MemoryGraphManager, UnsupportedQuery, register_query, _queries
+from apps.noclook.tests.testing import nc
+
+
+class GraphBackendConformance(object):
+    """
+    Subclasses set self.manager in setUp. Node handle_ids start at 900000 to not collide with other test data.
+    """
+
+    handle_ids = iter(range(900000, 1000000))
+
+    def setUp(self):
+        super(GraphBackendConformance, self).setUp()
+        self.created = []
+
+    def tearDown(self):
+        for handle_id in self.created:
+            nc.delete_node(self.manager, handle_id)
+        super(GraphBackendConformance, self).tearDown()
+
+    def create(self, name, meta_type, label):
+        handle_id = next(self.handle_ids)
+        nc.create_node(self.manager, name, meta_type, label, handle_id)
+        self.created.append(handle_id)
+        return nc.get_node_model(self.manager, handle_id)
+
+    def neighbours(self, d, key):
+        return sorted(item['node'].data['name'] for item in d.get(key, []))
+
+    def test_node(self):
+        router = self.create('router-1.example.net', 'Physical', 'Router')
+        self.assertEqual(router.__class__, nc.models.RouterModel)
+        self.assertEqual(router.meta_type, 'Physical')
+        self.assertEqual(router.labels, ['Router'])
+        self.assertEqual(nc.get_node_meta_type(self.manager, router.handle_id), 'Physical')
+        node = nc.get_node(self.manager, router.handle_id)
+        self.assertEqual(node, {'name': 'router-1.example.net', 'handle_id': router.handle_id})
+
+        node = nc.set_node_properties(self.manager, router.handle_id, {'name': 'router-1', 'model': 'MX480',
+                                                                      'removed': None})
+        self.assertEqual(node, {'name': 'router-1', 'model': 'MX480', 'handle_id': router.handle_id})
+        self.assertEqual(router.reload().data['model'], 'MX480')
+
+        nc.delete_node(self.manager, router.handle_id)
+        with self.assertRaises(nc.exceptions.NodeNotFound):
+            nc.get_node(self.manager, router.handle_id)
+
+    def test_labels(self):
+        host = self.create('host-1', 'Logical', 'Host')
+        self.assertEqual(host.__class__, nc.models.LogicalHostModel)
+        host = host.change_meta_type('Physical')
+        self.assertEqual(host.meta_type, 'Physical')
+        self.assertEqual(host.__class__, nc.models.PhysicalHostModel)
+        switch = host.switch_type('Host', 'Switch')
+        self.assertEqual(switch.labels, ['Switch'])
+
+    def test_relationships(self):
+        site = self.create('SITE-1', 'Location', 'Site')
+        rack = self.create('rack-1', 'Location', 'Rack')
+        router = self.create('router-1', 'Physical', 'Router')
+        rel_id = nc.create_relationship(self.manager, site.handle_id, rack.handle_id, 'Has')
+        bundle = nc.get_relationship_bundle(self.manager, rel_id)
+        self.assertEqual(bundle['type'], 'Has')
+        self.assertEqual(bundle['start']['handle_id'], site.handle_id)
+        self.assertEqual(bundle['end']['handle_id'], rack.handle_id)
+        self.assertEqual(bundle['data'], {})
+
+        with self.assertRaises(nc.exceptions.NoRelationshipPossible):
+            nc.create_relationship(self.manager, site.handle_id, router.handle_id, 'Has')
+
+        nc.set_relationship_properties(self.manager, rel_id, {'note': 'row 3'})
+        self.assertEqual(nc.get_relationship(self.manager, rel_id), {'note': 'row 3'})
+        relationships = nc.get_relationships(self.manager, rack.handle_id, site.handle_id)
+        self.assertEqual([r.id for r in relationships], [rel_id])
+        self.assertEqual(nc.get_relationships(self.manager, site.handle_id, rack.handle_id, 'Located_in'), [])
+
+        rel = nc.get_relationship_model(self.manager, rel_id)
+        self.assertEqual(rel.type, 'Has')
+        rel.delete()
+        with self.assertRaises(nc.exceptions.RelationshipNotFound):
+            nc.get_relationship(self.manager, rel_id)
+
+    def test_delete_node_deletes_relationships(self):
+        router = self.create('router-1', 'Physical', 'Router')
+        port = self.create('xe-0/0/0', 'Physical', 'Port')
+        router.set_has(port.handle_id)
+        port.delete()
+        self.assertEqual(router.get_has(), {})
+
+    def test_api_relationship_ids(self):
+        site = self.create('SITE-1', 'Location', 'Site')
+        rack = self.create('rack-1', 'Location', 'Rack')
+        router = self.create('router-1', 'Physical', 'Router')
+        has_id = nc.create_relationship(self.manager, site.handle_id, rack.handle_id, 'Has')
+        located_id = nc.create_relationship(self.manager, router.handle_id, rack.handle_id, 'Located_in')
+        result = nc.query_to_list(self.manager, resources.RELATIONSHIP_IDS_QUERY,
+                                  handle_ids=[rack.handle_id, router.handle_id])
+        self.assertEqual([item['relationship_id'] for item in result if item['handle_id'] == rack.handle_id],
+                         [has_id, located_id])
+        self.assertEqual([item['relationship_id'] for item in result if item['handle_id'] == router.handle_id],
+                         [located_id])
+
+    def test_physical_model(self):
+        site = self.create('SITE-1', 'Location', 'Site')
+        router = self.create('router-1', 'Physical', 'Router')
+        port = self.create('xe-0/0/0', 'Physical', 'Port')
+        unit = self.create('0', 'Logical', 'Unit')
+        owner = self.create('NORDUnet', 'Relation', 'Provider')
+
+        created = router.set_has(port.handle_id)
+        self.assertTrue(created['Has'][0]['created'])
+        self.assertFalse(router.set_has(port.handle_id)['Has'][0]['created'])
+        self.assertTrue(router.set_location(site.handle_id)['Located_in'][0]['created'])
+        self.assertTrue(port.set_part_of(unit.handle_id)['Part_of'][0]['created'])
+        self.assertTrue(router.set_owner(owner.handle_id)['Owns'][0]['created'])
+        # Only logical nodes can be part of a physical node
+        self.assertEqual(port.set_part_of(owner.handle_id), {})
+
+        self.assertEqual(self.neighbours(router.get_has(), 'Has'), ['xe-0/0/0'])
+        self.assertEqual(self.neighbours(router.get_ports(), 'Has'), ['xe-0/0/0'])
+        self.assertEqual(self.neighbours(router.get_port('xe-0/0/0'), 'Has'), ['xe-0/0/0'])
+        self.assertEqual(router.get_port('xe-0/0/1'), {})
+        self.assertEqual(self.neighbours(router.get_location(), 'Located_in'), ['SITE-1'])
+        self.assertEqual(self.neighbours(port.get_parent(), 'Has'), ['router-1'])
+        self.assertEqual(self.neighbours(port.get_units(), 'Part_of'), ['0'])
+        self.assertEqual(self.neighbours(port.get_unit('0'), 'Part_of'), ['0'])
+        self.assertEqual(self.neighbours(router.get_relations(), 'Owns'), ['NORDUnet'])
+        self.assertEqual(self.neighbours(site.get_located_in(), 'Located_in'), ['router-1'])
+        self.assertEqual(sorted(router.relationships.keys()), ['Has', 'Located_in', 'Owns'])
+        self.assertEqual(sorted(router.outgoing.keys()), ['Has', 'Located_in'])
+        self.assertEqual(sorted(router.incoming.keys()), ['Owns'])
+
+    def test_logical_model(self):
+        port = self.create('xe-0/0/0', 'Physical', 'Port')
+        service = self.create('service-1', 'Logical', 'Service')
+        customer = self.create('Customer AB', 'Relation', 'Customer')
+        provider = self.create('NORDUnet', 'Relation', 'Provider')
+
+        self.assertTrue(service.set_dependency(port.handle_id)['Depends_on'][0]['created'])
+        self.assertTrue(service.set_user(customer.handle_id)['Uses'][0]['created'])
+        self.assertTrue(service.set_provider(provider.handle_id)['Provides'][0]['created'])
+        self.assertFalse(service.set_user(customer.handle_id)['Uses'][0]['created'])
+
+        self.assertEqual(self.neighbours(service.get_dependencies(), 'Depends_on'), ['xe-0/0/0'])
+        self.assertEqual(self.neighbours(port.get_dependents(), 'Depends_on'), ['service-1'])
+        self.assertEqual(self.neighbours(service.get_customers(), 'customers'), ['Customer AB'])
+        self.assertEqual(self.neighbours(customer.get_uses(), 'Uses'), ['service-1'])
+        self.assertEqual(self.neighbours(provider.get_provides(), 'Provides'), ['service-1'])
+        self.assertEqual(sorted(service.get_relations().keys()), ['Provides', 'Uses'])
+
+    def test_relationship_properties(self):
+        host = self.create('host-1', 'Logical', 'Host')
+        ssh = self.create('ssh', 'Logical', 'Host_Service')
+        partner = self.create('Partner AB', 'Relation', 'Peering_Partner')
+        group = self.create('group-1', 'Logical', 'Peering_Group')
+        unit = self.create('0', 'Logical', 'Unit')
+
+        host.set_host_service(ssh.handle_id, '192.0.2.1', '22', 'tcp')
+        result = host.get_host_service(ssh.handle_id, '192.0.2.1', '22', 'tcp')
+        self.assertEqual(result['Depends_on'][0]['relationship']['protocol'], 'tcp')
+        self.assertEqual(host.get_host_service(ssh.handle_id, '192.0.2.1', '22', 'udp'), {})
+        self.assertEqual(self.neighbours(host.get_host_services(), 'Depends_on'), ['ssh'])
+
+        partner.set_peering_group(group.handle_id, '192.0.2.2')
+        self.assertEqual(self.neighbours(partner.get_peering_groups(), 'Uses'), ['group-1'])
+        self.assertEqual(len(partner.get_peering_group(group.handle_id, '192.0.2.2')['Uses']), 1)
+        self.assertEqual(partner.get_peering_group(group.handle_id, '192.0.2.3'), {})
+
+        group.set_group_dependency(unit.handle_id, '192.0.2.2')
+        self.assertEqual(len(group.get_group_dependency(unit.handle_id, '192.0.2.2')['Depends_on']), 1)
+
+    def test_lookups(self):
+        a = self.create('host-a.example.net', 'Logical', 'Host')
+        b = self.create('host-b.example.net', 'Logical', 'Host')
+        self.create('Host-A.example.net', 'Relation', 'Host_User')
+        nc.set_node_properties(self.manager, a.handle_id, {'name': a.data['name'], 'os': 'Linux',
+                                                           'hostnames': ['a.example.net', 'www.example.net']})
+
+        def names(nodes):
+            return sorted(node['name'] for node in nodes)
+
+        self.assertEqual(names(nc.get_nodes_by_value(self.manager, 'Linux', 'os', 'Host')), ['host-a.example.net'])
+        self.assertEqual(names(nc.get_nodes_by_value(self.manager, 'www.example.net', 'hostnames', 'Host')),
+                         ['host-a.example.net'])
+        self.assertEqual(names(nc.search_nodes_by_value(self.manager, 'WWW', 'hostnames', 'Host')),
+                         ['host-a.example.net'])
+        self.assertEqual(names(nc.search_nodes_by_value(self.manager, 'linux', node_type='Host')),
+                         ['host-a.example.net'])
+        self.assertEqual(names(nc.get_nodes_by_type(self.manager, 'Host')),
+                         ['host-a.example.net', 'host-b.example.net'])
+        self.assertEqual(names(nc.get_nodes_by_name(self.manager, 'host-b.example.net')), ['host-b.example.net'])
+        self.assertEqual(names(nc.get_indexed_node(self.manager, 'name', 'HOST-A', 'Host', 'STARTS WITH')),
+                         ['host-a.example.net'])
+        self.assertEqual(nc.get_unique_node_by_name(self.manager, 'host-b.example.net', 'Host'), b)
+        self.assertIsNone(nc.get_unique_node_by_name(self.manager, 'host-c.example.net', 'Host'))
+        self.create('host-b.example.net', 'Physical', 'Host')
+        with self.assertRaises(nc.exceptions.MultipleNodesReturned):
+            nc.get_unique_node_by_name(self.manager, 'host-b.example.net', 'Host')
+
+
+class MemoryBackendTest(GraphBackendConformance, SimpleTestCase):
+
+    def setUp(self):
+        self.manager = MemoryGraphManager()
+        super(MemoryBackendTest, self).setUp()
+
+    def test_unsupported_query(self):
+        with self.assertRaises(UnsupportedQuery):
+            nc.query_to_list(self.manager, 'MATCH (n:Node) RETURN count(n) as nodes')
+
+    def test_register_query(self):
+        pattern = r'MATCH \(n:(?P<label>\w+)\) RETURN count\(n\) as nodes'
+
+        @register_query(pattern)
+        def count_nodes(graph, match, params):
+            return [(('nodes',), (len(graph.nodes_with_label(match.group('label'))),))]
+        self.addCleanup(_queries.remove, _queries[-1])
+        self.create('router-1', 'Physical', 'Router')
+        self.assertEqual(nc.query_to_list(self.manager, 'MATCH (n:Router)\n    RETURN count(n) as nodes'),
+                         [{'nodes': 1}])
+
+    def test_unique_handle_id(self):
+        router = self.create('router-1', 'Physical', 'Router')
+        with self.assertRaises(ConstraintError):
+            nc.create_node(self.manager, 'router-2', 'Physical', 'Router', router.handle_id)
+
+    def test_instrumented(self):
+        if not neo4j_instrumentation.installed():
+            self.skipTest('NEO4J_INSTRUMENTATION is false.')
+        with neo4j_instrumentation.collect() as collector:
+            self.create('router-1', 'Physical', 'Router')
+        # create_node and get_node_model
+        self.assertEqual(collector.count, 2)
+
+
+@tag('neo4j')
+class Neo4jBackendTest(GraphBackendConformance, SimpleTestCase):
+
+    def setUp(self):
+        self.manager = nc.graphdb.manager
+        if self.manager is None or isinstance(self.manager, MemoryGraphManager):
+            self.skipTest('No neo4j database configured for the tests.')
+        super(Neo4jBackendTest, self).setUp()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from apps.noclook import hardware, helpers, synthetic
+from apps.noclook.memory_graph import MemoryGraphManager
+from apps.noclook.models import HardwareInventory
+import norduniclient as nc
+
+MODULES = {
+    'name': 'Chassis',
+    'serial_number': 'JN0001',
+    'modules': [
+        {'name': 'FPC 0', 'part_number': '750-001', 'sub_modules': [{'name': 'PIC 0', 'description': '10x 10GE'}]},
+    ],
+}
+
+
+class HardwareTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user', is_staff=True)
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        self.router = self.graph.nodes['Router'][0]
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_store(self):
+        inventory, changed = hardware.store(self.router.handle_id, MODULES)
+        self.assertTrue(changed)
+        self.assertEqual(inventory.content_hash, hardware.content_hash(json.loads(json.dumps(MODULES))))
+        self.assertFalse(hardware.store(self.router.handle_id, dict(reversed(list(MODULES.items()))))[1])
+
+        text = hardware.render(hardware.get_inventory(self.router))
+        self.assertIn('    name: FPC 0', text)
+        self.assertIn('        description: 10x 10GE', text)
+        with mock.patch('apps.noclook.hardware.hardware_module') as hardware_module:
+            self.assertEqual(hardware.render(hardware.get_inventory(self.router)), text)
+        hardware_module.assert_not_called()
+
+    def test_legacy_attachment(self):
+        helpers.attach_as_file(self.router.handle_id, hardware.attachment_name(self.router.node_name),
+                               json.dumps(MODULES), self.user, overwrite=True)
+        inventory = hardware.get_inventory(self.router)
+        self.assertEqual(inventory.modules, MODULES)
+        self.assertTrue(HardwareInventory.objects.filter(node_handle=self.router).exists())
+
+    def test_router_hardware_section(self):
+        url = reverse('node_fragment', args=['router', self.router.handle_id, 'hardware'])
+        self.assertNotContains(self.client.get(url), 'Hardware information')
+        hardware.store(self.router.handle_id, MODULES)
+        helpers.attach_as_file(self.router.handle_id, hardware.attachment_name(self.router.node_name),
+                               json.dumps(MODULES), self.user, overwrite=True)
+        resp = self.client.get(url)
+        self.assertContains(resp, 'Hardware information')
+        self.assertContains(resp, 'part_number: 750-001')
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from unittest import mock
+
+from actstream import action
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.noclook import history, synthetic
+from apps.noclook.memory_graph import MemoryGraphManager
+import norduniclient as nc
+
+
+class HistoryTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user', is_staff=True)
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        self.router, self.other = self.graph.nodes['Router'][:2]
+        start = timezone.now() - timedelta(days=1)
+        for i in range(7):
+            # Pairs of actions with the same timestamp
+            action.send(self.user, verb='update', action_object=self.router, timestamp=start + timedelta(minutes=i // 2),
+                        noclook={'action_type': 'node_property', 'property': 'description',
+                                 'value_before': '', 'value_after': str(i)})
+        for i in range(3):
+            action.send(self.user, verb='create', action_object=self.other, target=self.router,
+                        timestamp=start + timedelta(minutes=i),
+                        noclook={'action_type': 'relationship', 'relationship_type': 'Connected_to'})
+        self.client.force_login(self.user)
+
+    def all_pages(self, **kwargs):
+        actions, cursor = [], None
+        while True:
+            page = history.get_page(self.router, cursor, per_page=4, **kwargs)
+            actions.extend(page.actions)
+            cursor = page.next_cursor
+            if cursor is None:
+                return actions
+
+    def test_pages(self):
+        actions = self.all_pages()
+        expected = sorted(self.router.action_object_actions.all() | self.router.target_actions.all(),
+                          key=lambda a: (a.timestamp, a.pk), reverse=True)
+        self.assertEqual([a.pk for a in actions], [a.pk for a in expected])
+        self.assertEqual(len(actions), len(set(a.pk for a in actions)))
+
+    def test_action_type(self):
+        actions = self.all_pages(action_type='relationship')
+        self.assertEqual(len(actions), 3)
+        self.assertEqual(set(a.data['noclook']['action_type'] for a in actions), {'relationship'})
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            history.get_page(self.router, 'not a cursor')
+
+    @override_settings(HISTORY_PAGE_SIZE=4)
+    def test_view(self):
+        url = '{}history'.format(self.router.get_absolute_url())
+        resp = self.client.get(url)
+        self.assertContains(resp, '<h2>History</h2>')
+        self.assertEqual(len(resp.context['history']), 4)
+        cursor = resp.context['next_cursor']
+        self.assertContains(resp, 'cursor={}'.format(cursor))
+
+        resp = self.client.get(url, {'cursor': cursor})
+        self.assertNotContains(resp, '<h2>History</h2>')
+        self.assertEqual(len(resp.context['history']), 4)
+
+        resp = self.client.get(url, {'cursor': 'broken', 'action_type': 'relationship'})
+        self.assertContains(resp, '<h2>History</h2>')
+        self.assertEqual(len(resp.context['history']), 3)
+        self.assertIsNone(resp.context['next_cursor'])
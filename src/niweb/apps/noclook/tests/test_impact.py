@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from actstream import action
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from tastypie.models import ApiKey
+
+from apps.noclook import impact, synthetic, topology
+from apps.noclook.memory_graph import MemoryGraphManager
+import norduniclient as nc
+
+
+@override_settings(TOPOLOGY_SNAPSHOT_PATH='')
+class ImpactTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user', is_staff=True)
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        self.router = self.graph.nodes['Router'][0]
+        cache.clear()
+        topology.reset()
+
+    def names(self, result, node_type):
+        return set(item['name'] for item in result['groups'].get(node_type, []))
+
+    def test_router_impact(self):
+        result = impact.impact_analysis(self.router.handle_id)
+        ports = set(nh.node_name for nh in self.graph.nodes['Port'] if nh.node_name.startswith(self.router.node_name))
+        self.assertTrue(ports.issubset(self.names(result, 'Port')))
+        self.assertIn('Service', result['groups'])
+        self.assertIn('Customer', result['groups'])
+        self.assertEqual(list(result['groups'])[:2], ['Service', 'Customer'])
+        self.assertFalse(result['truncated'])
+        self.assertEqual(result['count'], sum(len(items) for items in result['groups'].values()))
+        port = result['groups']['Port'][0]
+        self.assertEqual((port['depth'], port['via'], port['via_name']), (1, self.router.handle_id,
+                                                                          self.router.node_name))
+        # Only the ports of the router are one relationship away
+        result = impact.impact_analysis(self.router.handle_id, depth=1)
+        self.assertEqual(list(result['groups']), ['Port'])
+        self.assertEqual(self.names(result, 'Port'), ports)
+
+    def test_cycles_and_limits(self):
+        with override_settings(IMPACT_MAX_NODES=3):
+            cache.clear()
+            result = impact.impact_analysis(self.router.handle_id)
+        self.assertTrue(result['truncated'])
+        self.assertEqual(result['count'], 3)
+
+    def test_cache_invalidation(self):
+        service = self.graph.nodes['Service'][0]
+        end_user = self.graph.nodes['End User'][-1]
+        result = impact.impact_analysis(service.handle_id)
+        self.assertNotIn(end_user.node_name, self.names(result, 'End User'))
+
+        # Cached
+        with self.assertNumQueries(0):
+            impact.impact_analysis(service.handle_id)
+
+        # Writes only change the topology version, they do not traverse
+        with self.captureOnCommitCallbacks(execute=True), mock.patch('apps.noclook.topology.traverse') as traverse:
+            graph = self.manager.graph
+            graph.create_relationship(graph.get_node(end_user.handle_id), 'Uses', graph.get_node(service.handle_id))
+            action.send(self.user, verb='create', action_object=end_user, target=service,
+                        noclook={'action_type': 'relationship', 'relationship_type': 'Uses'})
+        traverse.assert_not_called()
+        result = impact.impact_analysis(service.handle_id)
+        self.assertIn(end_user.node_name, self.names(result, 'End User'))
+
+    def test_views(self):
+        self.client.force_login(self.user)
+        resp = self.client.get('{}impact?depth=2'.format(self.router.get_absolute_url()))
+        self.assertContains(resp, self.router.node_name)
+        self.assertEqual(resp.context['impact']['depth'], 2)
+
+        api_key = ApiKey.objects.create(user=self.user, key='testkey')
+        resp = self.client.get('/api/v1/router/{}/impact/'.format(self.router.handle_id), {'depth': 1},
+                               HTTP_AUTHORIZATION='ApiKey {}:{}'.format(self.user.username, api_key.key))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(resp.json()['groups']), ['Port'])
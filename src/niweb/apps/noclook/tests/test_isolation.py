@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from apps.noclook.memory_graph import MemoryGraphManager
+from apps.noclook.models import NodeHandle, NodeType
+from apps.noclook.tests.testing import nc, reserve_handle_ids, delete_nodes, HANDLE_ID_RANGE
+
+
+class WorkerIsolationTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user')
+        self.node_type = NodeType.objects.create(type='Router', slug='router')
+
+    def create_handles(self, *names):
+        NodeHandle.objects.bulk_create([NodeHandle(node_name=name, node_type=self.node_type, node_meta_type='Physical',
+                                                   creator=self.user, modifier=self.user) for name in names])
+        return list(NodeHandle.objects.filter(node_name__in=names).order_by('handle_id'))
+
+    @mock.patch('django.test.runner._worker_id', 3)
+    def test_reserve_handle_ids(self):
+        first = reserve_handle_ids()
+        self.assertEqual(first, 3 * HANDLE_ID_RANGE + 1)
+        handles = self.create_handles('router-1', 'router-2')
+        self.assertEqual([nh.handle_id for nh in handles], [first, first + 1])
+        # The range is only reserved once
+        self.assertEqual(reserve_handle_ids(), first + 2)
+
+    def test_delete_nodes(self):
+        manager = MemoryGraphManager()
+        with mock.patch.object(nc.graphdb, '_manager', manager):
+            for handle_id in [5, 3 * HANDLE_ID_RANGE, 3 * HANDLE_ID_RANGE + 1, 4 * HANDLE_ID_RANGE]:
+                nc.create_node(manager, 'router', 'Physical', 'Router', handle_id)
+            delete_nodes(3 * HANDLE_ID_RANGE, 4 * HANDLE_ID_RANGE)
+        self.assertEqual(sorted(manager.graph.by_handle_id), [5, 4 * HANDLE_ID_RANGE])
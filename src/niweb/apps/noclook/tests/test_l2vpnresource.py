@@ -17,14 +17,14 @@ from tastypie.models import ApiKey
 from dynamic_preferences.registries import global_preferences_registry
 from apps.noclook.models import NodeHandle, NodeType, UniqueIdGenerator, ServiceClass, ServiceType
 from apps.noclook import helpers, forms
-from apps.noclook.tests.testing import nc
+from apps.noclook.tests.neo4j_base import Neo4jIsolationMixin
 
 
 # We instantiate a manager for our global preferences
 global_preferences = global_preferences_registry.manager()
 
 
-class ServiceL2VPNResourceTest(ResourceTestCaseMixin, TestCase):
+class ServiceL2VPNResourceTest(Neo4jIsolationMixin, ResourceTestCaseMixin, TestCase):
 
     # TODO: Write tests for this.
     # vpn creation:
@@ -125,14 +125,6 @@ class ServiceL2VPNResourceTest(ResourceTestCaseMixin, TestCase):
         helpers.set_part_of(self.user, self.port1.get_node(), self.unit1.handle_id)
         helpers.set_part_of(self.user, self.port2.get_node(), self.unit2.handle_id)
 
-    def tearDown(self):
-        for handle_id in self.DEFAULT_HANDLE_IDS:
-            nh = NodeHandle.objects.get(pk=handle_id)
-            nh.delete()
-        with nc.graphdb.manager.session as s:
-            s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
-        super(ServiceL2VPNResourceTest, self).tearDown()
-
     def get_credentials(self):
         return self.create_apikey(username=self.username, api_key=str(self.api_key.key))
 
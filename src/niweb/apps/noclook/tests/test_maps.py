@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from actstream import action
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from apps.noclook import synthetic
+from apps.noclook.memory_graph import MemoryGraphManager
+import norduniclient as nc
+
+
+class MapsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user', is_staff=True)
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        self.sites = self.graph.nodes['Site']
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_sites(self):
+        resp = self.client.get('/gmaps/sites.json')
+        sites = dict((node['name'], node) for node in resp.json()['nodes'])
+        self.assertEqual(set(sites), set(nh.node_name for nh in self.sites))
+        self.assertEqual(sites[self.sites[0].node_name]['url'], self.sites[0].get_absolute_url())
+
+        resp = self.client.get('/gmaps/sites.json', {'format': 'geojson'})
+        geojson = resp.json()
+        self.assertEqual(geojson['type'], 'FeatureCollection')
+        self.assertEqual(len(geojson['features']), len(self.sites))
+        self.assertEqual(geojson['features'][0]['geometry']['type'], 'Point')
+
+    def test_etag_and_invalidation(self):
+        resp = self.client.get('/gmaps/sites.json')
+        etag = resp['ETag']
+        with mock.patch.object(nc.graphdb, '_manager', None):
+            # Cached documents do not touch neo4j
+            resp = self.client.get('/gmaps/sites.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        # Changes to other node types keep the document
+        host = self.graph.nodes['Host'][0]
+        with self.captureOnCommitCallbacks(execute=True):
+            action.send(self.user, verb='update', action_object=host,
+                        noclook={'action_type': 'node_property', 'property': 'description',
+                                 'value_before': '', 'value_after': 'changed'})
+        with mock.patch.object(nc.graphdb, '_manager', None):
+            resp = self.client.get('/gmaps/sites.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        site = self.sites[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manager.graph.get_node(site.handle_id).properties['latitude'] = 1.5
+            action.send(self.user, verb='update', action_object=site,
+                        noclook={'action_type': 'node_property', 'property': 'latitude',
+                                 'value_before': '', 'value_after': 1.5})
+        resp = self.client.get('/gmaps/sites.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        sites = dict((node['name'], node) for node in resp.json()['nodes'])
+        self.assertEqual(sites[site.node_name]['lat'], 1.5)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, SimpleTestCase, override_settings
+from prometheus_client import REGISTRY, generate_latest, values
+
+from apps.noclook import metrics
+from apps.noclook.models import NodeHandle, NodeType
+from apps.scan.models import QueueItem
+
+
+class CacheLookupTest(SimpleTestCase):
+
+    def test_hit_and_miss(self):
+        def value(result):
+            return REGISTRY.get_sample_value('noclook_cache_requests_total', {'cache': 'test', 'result': result}) or 0
+        hits, misses = value('hit'), value('miss')
+        metrics.cache_lookup('test', hit=True)
+        metrics.cache_lookup('test', hit=True)
+        metrics.cache_lookup('test', hit=False)
+        self.assertEqual(value('hit'), hits + 2)
+        self.assertEqual(value('miss'), misses + 1)
+
+
+class MetricsViewTest(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='staff', is_staff=True)
+        self.user = User.objects.create_user('user', password='user')
+
+    def test_forbidden(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.login(username='user', password='user')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_staff(self):
+        QueueItem.objects.create(type='Host', data='{}')
+        self.client.login(username='staff', password='staff')
+        self.client.get('/metrics')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain;'))
+        content = response.content.decode('utf-8')
+        self.assertIn('noclook_request_duration_seconds_count{method="GET",url_name="metrics"}', content)
+        self.assertIn('noclook_db_queries_total{url_name="metrics"}', content)
+        self.assertIn('noclook_scan_queue_items{status="QUEUED",type="Host"} 1.0', content)
+        self.assertIn('noclook_scan_queue_oldest_age_seconds{status="QUEUED",type="Host"}', content)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_allowed_ip(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1', '192.0.2.1'], TRUSTED_PROXIES=['127.0.0.1'])
+    def test_forwarded_for(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='192.0.2.1').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='198.51.100.1').status_code, 403)
+        # Only the last address is added by the trusted proxy
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='192.0.2.1, 198.51.100.1').status_code,
+                         403)
+        # Forwarded by a proxy that is not trusted
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='192.0.2.1',
+                                         HTTP_X_FORWARDED_FOR='127.0.0.1').status_code, 403)
+
+
+class MultiprocessMetricsTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_sum_over_processes(self):
+        with mock.patch.dict(os.environ, PROMETHEUS_MULTIPROC_DIR=self.tmp_dir):
+            # The values other worker processes keep in the directory
+            for pid, amount in ((1, 5), (2, 3)):
+                value_class = values.MultiProcessValue(process_identifier=lambda: pid)
+                value = value_class('counter', 'noclook_db_queries', 'noclook_db_queries_total', ('url_name',),
+                                    ('test',), 'Number of SQL queries.')
+                value.inc(amount)
+            output = generate_latest(metrics.web_registry()).decode('utf-8')
+        self.assertIn('noclook_db_queries_total{url_name="test"} 8.0\n', output)
+        # Served from the directory only, the metrics of this process are not in it
+        self.assertNotIn('noclook_request_duration_seconds', output)
+
+
+class ConsumerRunTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_textfile(self):
+        run = metrics.ConsumerRun('test_consumer')
+        with run.phase('hosts'):
+            items = list(run.counted('hosts', [{}, {}, {}]))
+        self.assertEqual(len(items), 3)
+        user = User.objects.create_user('consumer')
+        node_type = NodeType.objects.create(type='Host', slug='host')
+        # bulk_create does not create the neo4j node
+        NodeHandle.objects.bulk_create([NodeHandle(node_name='host', node_type=node_type, node_meta_type='Logical',
+                                                   creator=user, modifier=user)])
+        run.count_nodes()
+        path = os.path.join(self.tmp_dir, 'consumer.prom')
+        run.write_textfile(path)
+        self.assertEqual(os.listdir(self.tmp_dir), ['consumer.prom'])
+        with open(path) as f:
+            content = f.read()
+        self.assertIn('noclook_consumer_items_processed{consumer="test_consumer",phase="hosts"} 3.0\n', content)
+        self.assertIn('noclook_consumer_phase_duration_seconds{consumer="test_consumer",phase="hosts"}', content)
+        self.assertIn('noclook_consumer_nodes{change="created",consumer="test_consumer"} 1.0\n', content)
+        self.assertIn('noclook_consumer_nodes{change="updated",consumer="test_consumer"} 0.0\n', content)
+        self.assertIn('noclook_consumer_duration_seconds{consumer="test_consumer"}', content)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from prometheus_client import REGISTRY
+from apps.noclook import neo4j_instrumentation
+from apps.noclook.middleware import Neo4jQueryMiddleware
+
+
+class FakeResult(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.read = 0
+
+    def records(self):
+        for i in range(self.rows):
+            self.read += 1
+            yield i
+
+    def keys(self):
+        return ('n',)
+
+
+class Neo4jInstrumentationTest(SimpleTestCase):
+
+    def test_instrumented_run(self):
+        run = neo4j_instrumentation._instrumented_run(lambda session, statement, parameters=None: FakeResult(3))
+        with neo4j_instrumentation.collect('test-view') as collector:
+            result = run(None, 'MATCH (n:Node) RETURN n LIMIT {limit}', {'limit': 3})
+            self.assertEqual(result.keys(), ('n',))
+            rows = iter(result)
+            self.assertEqual(next(rows), 0)
+            # Not buffered, recorded when the rows are exhausted
+            self.assertEqual(result._result.read, 1)
+            self.assertEqual(collector.count, 0)
+            self.assertEqual(list(rows), [1, 2])
+        self.assertEqual(collector.count, 1)
+        self.assertEqual(collector.rows, 3)
+        stats = collector.queries[0]
+        self.assertEqual(stats.query_hash, neo4j_instrumentation.query_hash('MATCH (n:Node) RETURN n LIMIT {limit}'))
+        self.assertEqual(stats.params_size, len('{"limit": 3}'))
+
+    def test_unread_result(self):
+        run = neo4j_instrumentation._instrumented_run(lambda session, statement, parameters=None: FakeResult(3))
+        with neo4j_instrumentation.collect('test-view') as collector:
+            run(None, 'CREATE (n:Node)')
+        self.assertEqual(collector.count, 1)
+        self.assertEqual(collector.rows, 0)
+
+    @override_settings(NEO4J_SLOW_QUERY_THRESHOLD=0.5)
+    def test_slow_query_log(self):
+        with neo4j_instrumentation.collect('test-view'):
+            with self.assertLogs('noclook.neo4j.slow', level='WARNING') as logs:
+                neo4j_instrumentation.record('MATCH (n)   RETURN n', {}, 10, 0.75)
+        self.assertIn('test-view', logs.output[0])
+        self.assertIn('MATCH (n) RETURN n', logs.output[0])
+
+    def test_middleware(self):
+        def view(request):
+            neo4j_instrumentation.record('MATCH (n) RETURN n', {}, 2, 0.02)
+            neo4j_instrumentation.record('MATCH (n) RETURN n', {}, 5, 0.2)
+            return HttpResponse('ok')
+
+        middleware = Neo4jQueryMiddleware(view)
+        request = RequestFactory().get('/router/')
+        with self.assertLogs('noclook.neo4j', level='INFO'):
+            response = middleware(request)
+        self.assertEqual(response['X-Neo4j-Queries'], '2')
+        self.assertEqual(response['X-Neo4j-Time'], '220.0')
+        self.assertEqual(response['X-Neo4j-Rows'], '7')
+        count = REGISTRY.get_sample_value('noclook_neo4j_request_seconds_count', {'view': 'unresolved'}) or 0
+        bucket = REGISTRY.get_sample_value('noclook_neo4j_request_seconds_bucket',
+                                           {'view': 'unresolved', 'le': '0.25'}) or 0
+        with self.assertLogs('noclook.neo4j', level='INFO'):
+            middleware(request)
+        self.assertEqual(REGISTRY.get_sample_value('noclook_neo4j_request_seconds_count', {'view': 'unresolved'}),
+                         count + 1)
+        self.assertEqual(REGISTRY.get_sample_value('noclook_neo4j_request_seconds_bucket',
+                                                   {'view': 'unresolved', 'le': '0.25'}), bucket + 1)
+
+    def test_nested_collectors(self):
+        with neo4j_instrumentation.collect() as outer:
+            neo4j_instrumentation.record('MATCH (n) RETURN n', {}, 1, 0.01)
+            with neo4j_instrumentation.collect() as inner:
+                neo4j_instrumentation.record('MATCH (n) RETURN n', {}, 2, 0.01)
+        self.assertEqual(inner.count, 1)
+        self.assertEqual(outer.count, 2)
+        self.assertEqual(outer.rows, 3)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Number of SQL and neo4j queries per request on a large synthetic graph.
+
+The budgets are the counts measured per request with a cold cache, only the session, the reference data and the
+preferences are loaded before. The graph has hundreds of nodes of each type so a view making a query per row or per
+related node exceeds its budget by far. The neo4j budgets are exact, the number of statements a view sends does not
+depend on the data. The SQL budgets leave SQL_MARGIN queries for the bulk NodeHandle lookups of views whose results
+are empty on a small graph.
+
+If a change makes a budget too tight, make the view fetch the rows in bulk rather than raising the budget.
+"""
+from django.core.cache import cache
+from dynamic_preferences.registries import global_preferences_registry
+from tastypie.models import ApiKey
+
+from apps.noclook import conditional, reference_data, synthetic
+from apps.noclook.tests.neo4j_base import NeoTestCase
+
+# Scale of the synthetic inventory, 1 gives 10 routers with 24 ports each, 50 services and 50 hosts
+SCALE = 2
+SQL_MARGIN = 2
+# The conditional GET of the detail views, their fragments and the API detail walks the neighbourhood of the node,
+# a neo4j query per stage of conditional.NEIGHBOURHOOD
+NEIGHBOURHOOD = sum(len(pattern) for pattern in conditional.NEIGHBOURHOOD)
+
+# (sql, neo4j) per request
+LIST_BUDGET = (5, 1)
+# The user lists also look up the user types
+USER_LIST_BUDGET = (6, 1)
+# The cable list also finds the end to end paths, a query per level of Connected_to and Has, and their names
+CABLE_LIST_BUDGET = (7, 5)
+SEARCH_BUDGET = (5, 1)
+FINDIN_BUDGET = (5, 1)
+TYPEAHEAD_BUDGET = (2, 1)
+MAPS_BUDGET = (3, 1)
+# NodeHandleResource fetches the nodes and relationship ids of a page in one query each
+API_LIST_BUDGET = (4, 2)
+API_DETAIL_BUDGET = (4, NEIGHBOURHOOD + 2)
+API_RELATIONSHIPS_BUDGET = (3, 1)
+
+LIST_URLS = [
+    ('/router/', LIST_BUDGET),
+    ('/host/', LIST_BUDGET),
+    ('/site/', LIST_BUDGET),
+    ('/rack/', LIST_BUDGET),
+    ('/cable/', CABLE_LIST_BUDGET),
+    ('/port/', LIST_BUDGET),
+    ('/customer/', LIST_BUDGET),
+    ('/service/', LIST_BUDGET),
+    ('/optical-node/', LIST_BUDGET),
+    ('/host-user/', USER_LIST_BUDGET),
+    ('/site-owner/', USER_LIST_BUDGET),
+]
+
+# Node type, index of the node to show and (sql, neo4j)
+DETAIL_NODES = [
+    ('Router', 0, (12, NEIGHBOURHOOD + 2)),
+    ('Host', 0, (12, NEIGHBOURHOOD + 6)),
+    ('Site', 0, (12, NEIGHBOURHOOD + 5)),
+    # The rack also renders the equipment located in it
+    ('Rack', 0, (13, NEIGHBOURHOOD + 5)),
+    ('Cable', 0, (12, NEIGHBOURHOOD + 3)),
+    # The port also finds its connection path
+    ('Port', 0, (12, NEIGHBOURHOOD + 12)),
+    ('Customer', 0, (12, NEIGHBOURHOOD + 4)),
+    ('Service', 0, (12, NEIGHBOURHOOD + 8)),
+    ('Optical Node', 0, (12, NEIGHBOURHOOD + 5)),
+    ('Host User', 0, (12, NEIGHBOURHOOD + 3)),
+    ('Site Owner', 0, (12, NEIGHBOURHOOD + 3)),
+]
+
+# Node type, index of the node, section of the lazy loaded detail page fragments and (sql, neo4j)
+DETAIL_FRAGMENTS = [
+    ('Router', 0, 'connections', (5, NEIGHBOURHOOD + 4)),
+    ('Router', 0, 'dependents', (6, NEIGHBOURHOOD + 4)),
+    ('Router', 0, 'hardware', (6, NEIGHBOURHOOD)),
+    ('Cable', 0, 'connections', (5, NEIGHBOURHOOD + 1)),
+    # The connection path has a watermark of its own, the nodes of the path
+    ('Cable', 0, 'connection-path', (5, 5)),
+]
+
+SEARCH_URLS = [
+    ('/search/example.net/', SEARCH_BUDGET),
+    ('/findall/example.net/', SEARCH_BUDGET),
+    ('/findin/router/example.net/', FINDIN_BUDGET),
+    ('/findin/host/', FINDIN_BUDGET),
+    ('/search/typeahead/ports?query=router-0001', TYPEAHEAD_BUDGET),
+    ('/search/typeahead/locations?query=SITE', TYPEAHEAD_BUDGET),
+    ('/search/typeahead/non-locations?query=host', TYPEAHEAD_BUDGET),
+]
+
+MAPS_URLS = [
+    '/gmaps/sites.json',
+    '/gmaps/optical-nodes.json',
+]
+
+API_LIST_URLS = [
+    '/api/v1/router/',
+    '/api/v1/host/',
+    '/api/v1/site/',
+    '/api/v1/port/',
+    '/api/v1/cable/',
+    '/api/v1/service/',
+    '/api/v1/customer/',
+]
+
+
+class QueryBudgetTest(NeoTestCase):
+
+    def setUp(self):
+        super(QueryBudgetTest, self).setUp()
+        self.graph = synthetic.inventory(self.user, scale=SCALE)
+        api_key = ApiKey.objects.create(user=self.user, key='testkey')
+        self.api_auth = {'HTTP_AUTHORIZATION': 'ApiKey {}:{}'.format(self.user.username, api_key.key)}
+
+    def assertWithinBudget(self, url, budget, **extra):
+        sql, neo4j = budget
+        sql += SQL_MARGIN
+        with self.subTest(url=url):
+            # The first request loads the session, the reference data and the preferences, everything else is
+            # measured with a cold cache
+            self.client.get(url, **extra)
+            cache.clear()
+            cache.set(reference_data.VERSION_KEY, reference_data.get().version, None)
+            global_preferences_registry.manager().all()
+            with self.assertMaxQueries(sql=sql, neo4j=neo4j):
+                response = self.client.get(url, **extra)
+            self.assertIn(response.status_code, (200, 302))
+
+    def test_list_views(self):
+        for url, budget in LIST_URLS:
+            self.assertWithinBudget(url, budget)
+
+    def test_detail_views(self):
+        for node_type, index, budget in DETAIL_NODES:
+            self.assertWithinBudget(self.graph.nodes[node_type][index].get_absolute_url(), budget)
+
+    def test_detail_fragments(self):
+        for node_type, index, section, budget in DETAIL_FRAGMENTS:
+            url = '{}fragments/{}'.format(self.graph.nodes[node_type][index].get_absolute_url(), section)
+            self.assertWithinBudget(url, budget)
+
+    def test_search_views(self):
+        for url, budget in SEARCH_URLS:
+            self.assertWithinBudget(url, budget)
+
+    def test_maps(self):
+        for url in MAPS_URLS:
+            self.assertWithinBudget(url, MAPS_BUDGET)
+
+    def test_api(self):
+        for url in API_LIST_URLS:
+            self.assertWithinBudget(url, API_LIST_BUDGET, **self.api_auth)
+        router = self.graph.nodes['Router'][0]
+        self.assertWithinBudget('/api/v1/router/{}/'.format(router.handle_id), API_DETAIL_BUDGET, **self.api_auth)
+        self.assertWithinBudget('/api/v1/router/{}/relationships/'.format(router.handle_id), API_RELATIONSHIPS_BUDGET,
+                                **self.api_auth)
+        self.assertWithinBudget('/api/v1/router/{}/relationships/Has/'.format(router.handle_id),
+                                API_RELATIONSHIPS_BUDGET, **self.api_auth)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from apps.noclook.models import Dropdown, NodeType, ServiceClass, ServiceType, SwitchType
+from apps.noclook.templatetags.noclook_tags import type_menu
+from apps.noclook import helpers, reference_data
+
+
+class ReferenceDataTest(TestCase):
+
+    def setUp(self):
+        reference_data.clear()
+        self.node_type = NodeType.objects.create(type='Router', slug='router')
+        NodeType.objects.create(type='Secret', slug='secret', hidden=True)
+        service_class = ServiceClass.objects.create(name='Testing')
+        ServiceType.objects.create(name='External', service_class=service_class)
+        SwitchType.objects.create(name='Fast switch')
+
+    def test_steady_state_without_queries(self):
+        reference_data.get()
+        with self.assertNumQueries(0):
+            self.assertIn(('', ''), Dropdown.get('cable_types').as_choices())
+            self.assertEqual([nt.slug for nt in type_menu()['types']], ['router'])
+            self.assertEqual(helpers.slug_to_node_type('router'), self.node_type)
+            self.assertEqual([st.as_choice() for st in reference_data.service_types()],
+                             [('External', 'Testing - External')])
+            self.assertEqual(SwitchType.as_choices()[1][1], 'Fast switch')
+
+    def test_invalidated_on_save_and_delete(self):
+        dropdown = Dropdown.get('cable_types')
+        self.assertNotIn('Unobtainium', dropdown.as_values())
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            dropdown.choice_set.create(name='Unobtainium', value='Unobtainium')
+        self.assertGreater(len(callbacks), 0)
+        self.assertIn('Unobtainium', Dropdown.get('cable_types').as_values())
+
+        self.node_type.delete()
+        self.assertIsNone(reference_data.node_type_by_slug('router'))
+
+    def test_shared_version_change_reloads(self):
+        data = reference_data.get()
+        self.assertIs(reference_data.get(), data)
+        with override_settings(REFERENCE_DATA_CHECK_INTERVAL=0):
+            self.assertIs(reference_data.get(), data)
+            # Another process changed reference data
+            cache.set(reference_data.VERSION_KEY, 'other')
+            self.assertIsNot(reference_data.get(), data)
@@ -0,0 +1,68 @@
+from .neo4j_base import NeoTestCase
+from apps.noclook.helpers import set_user, set_noclook_auto_manage, dict_update_node
+from apps.noclook.models import HostReportSnapshot
+from apps.noclook import report_snapshots
+from apps.noclook.tests.testing import nc
+from django.urls import reverse
+
+
+class HostReportSnapshotTest(NeoTestCase):
+
+    def setUp(self):
+        super(HostReportSnapshotTest, self).setUp()
+        self.host_user = self.create_node('AwesomeCo', 'host-user', 'Relation')
+        self.host = self.create_node('sweet-host.nordu.net', 'host', 'Logical')
+        set_noclook_auto_manage(self.host.get_node(), True)
+        set_user(self.user, self.host.get_node(), self.host_user.handle_id)
+        dict_update_node(self.user, self.host.handle_id, {'operational_state': 'In service', 'security_class': '2'})
+        self.missing = self.create_node('lonely-host.nordu.net', 'host', 'Logical')
+        dict_update_node(self.user, self.missing.handle_id, {'operational_state': 'Decommissioned'})
+        service = self.create_node('ssh', 'host-service', 'Logical')
+        result = self.host.get_node().set_host_service(service.handle_id, None, '22', 'tcp')
+        relationship_id = result['Depends_on'][0]['relationship_id']
+        nc.set_relationship_properties(nc.graphdb.manager, relationship_id,
+                                       {'protocol': 'tcp', 'port': '22', 'rogue_port': True})
+
+    def test_generate(self):
+        snapshot = report_snapshots.generate_host_report_snapshot()
+        self.assertEqual(snapshot.num_hosts, 2)
+        host = snapshot.hosts.get(handle_id=self.host.handle_id)
+        self.assertEqual(host.host_type, 'Logical')
+        self.assertTrue(host.classified)
+        self.assertEqual(host.host_users, [{'name': 'AwesomeCo', 'handle_id': self.host_user.handle_id}])
+        self.assertEqual(host.num_unauthorized_ports, 1)
+        self.assertEqual(host.unauthorized_ports[0]['port'], '22')
+        # Only the latest snapshot is kept
+        report_snapshots.generate_host_report_snapshot()
+        self.assertEqual(HostReportSnapshot.objects.count(), 1)
+
+    def test_reports(self):
+        snapshot = report_snapshots.generate_host_report_snapshot()
+        users = report_snapshots.host_users(snapshot)
+        self.assertEqual(len(users), 1)
+        self.assertEqual(users[0]['host_user']['name'], 'AwesomeCo')
+        self.assertEqual([h['data']['name'] for h in users[0]['hosts']], ['sweet-host.nordu.net'])
+        missing = report_snapshots.host_users(snapshot, missing=True)
+        self.assertEqual([h['data']['name'] for h in missing[0]['hosts']], ['lonely-host.nordu.net'])
+        # Decommissioned hosts are not part of the security class or host services reports
+        self.assertEqual(len(report_snapshots.host_security_class(snapshot)), 1)
+        self.assertEqual(len(report_snapshots.host_security_class(snapshot, classified=False)), 0)
+        unauthorized = report_snapshots.host_services(snapshot, 'unauthorized-ports')
+        self.assertEqual(unauthorized[0]['host']['name'], 'sweet-host.nordu.net')
+        self.assertEqual(report_snapshots.host_services(snapshot, 'public'), [])
+
+    def test_refresh_view(self):
+        resp = self.client.get('/reports/hosts/host-users/All/')
+        self.assertContains(resp, 'sweet-host.nordu.net')
+        self.assertContains(resp, 'Refresh now')
+
+        new_host = self.create_node('new-host.nordu.net', 'host', 'Logical')
+        set_noclook_auto_manage(new_host.get_node(), True)
+        set_user(self.user, new_host.get_node(), self.host_user.handle_id)
+        resp = self.client.get('/reports/hosts/host-users/All/')
+        self.assertNotContains(resp, 'new-host.nordu.net')
+
+        resp = self.client.post(reverse('refresh_host_reports'), {'next': '/reports/hosts/host-users/All/'})
+        self.assertRedirects(resp, '/reports/hosts/host-users/All/')
+        resp = self.client.get('/reports/hosts/host-users/All/')
+        self.assertContains(resp, 'new-host.nordu.net')
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from django.test import SimpleTestCase
+
+from apps.noclook import synthetic
+from apps.noclook.models import NodeHandle
+from apps.noclook.tests.neo4j_base import NeoTestCase
+
+
+class SyntheticInventoryTest(NeoTestCase):
+
+    def test_inventory(self):
+        graph = synthetic.inventory(self.user, scale=1, ports_per_router=4, units_per_port=2)
+        counts = graph.counts()
+        self.assertEqual(counts['Router'], 10)
+        self.assertEqual(counts['Unit'], 10 * 4 * 2)
+        self.assertEqual(NodeHandle.objects.count(), sum(counts.values()))
+        router = graph.nodes['Router'][0].get_node()
+        self.assertEqual(len(router.get_ports().get('Has', [])), 4)
+        host = graph.nodes['Host'][0].get_node()
+        self.assertEqual(len(host.get_host_services().get('Depends_on', [])), 3)
+
+    def test_same_seed_same_inventory(self):
+        first = synthetic.inventory(self.user, scale=1, ports_per_router=2, units_per_port=1, seed=1)
+        first_models = [nh.get_node().data.get('model') for nh in first.nodes['Router']]
+        NodeHandle.objects.all().delete()
+        second = synthetic.inventory(self.user, scale=1, ports_per_router=2, units_per_port=1, seed=1)
+        self.assertEqual(first_models, [nh.get_node().data.get('model') for nh in second.nodes['Router']])
+
+
+class SyntheticNerdsDataTest(SimpleTestCase):
+
+    def test_juniper_conf(self):
+        data = synthetic.nerds_juniper_conf(scale=1, ports_per_router=3, units_per_port=2)
+        self.assertEqual(len(data), 10)
+        conf = data[0]['host']['juniper_conf']
+        self.assertEqual(conf['name'], synthetic.router_name(0))
+        self.assertEqual([i['name'] for i in conf['interfaces']], [synthetic.port_name(p) for p in range(3)])
+        self.assertEqual(len(conf['interfaces'][0]['units']), 2)
+        self.assertEqual(len(conf['bgp_peerings']), 2)
+
+    def test_port_names_are_unique(self):
+        names = [synthetic.port_name(p) for p in range(5000)]
+        self.assertEqual(len(set(names)), len(names))
+
+    def test_host_data(self):
+        for data in [synthetic.nerds_nmap_services(2), synthetic.nerds_checkmk(2), synthetic.nerds_cfengine_report(2),
+                     synthetic.nerds_nunoc_cosmos(2)]:
+            self.assertEqual(len(data), 100)
+            self.assertEqual(data[7]['host']['name'], synthetic.host_name(7))
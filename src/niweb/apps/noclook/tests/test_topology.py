@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from unittest import mock
+
+from actstream import action
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.noclook import activitylog, synthetic, topology
+from apps.noclook.memory_graph import MemoryGraphManager
+from apps.noclook.topology import TopologySnapshot, OUT, IN, BOTH
+import norduniclient as nc
+
+# Router -Has-> Port <-Part_of- Unit <-Depends_on- Service, Cable -Connected_to-> Port, Port 4 is not connected
+NODES = [
+    (1, 'router-1', 'Router', 'Physical'),
+    (2, 'ge-0/0/0', 'Port', 'Physical'),
+    (3, 'ge-0/0/0.0', 'Unit', 'Logical'),
+    (4, 'ge-0/0/1', 'Port', 'Physical'),
+    (5, 'SRV-1', 'Service', 'Logical'),
+    (6, 'CBL-1', 'Cable', 'Physical'),
+    (7, 'router-2', 'Router', 'Physical'),
+    (8, 'xe-0/0/0', 'Port', 'Physical'),
+]
+RELATIONSHIPS = [
+    (1, 'Has', 2),
+    (1, 'Has', 4),
+    (3, 'Part_of', 2),
+    (5, 'Depends_on', 3),
+    (6, 'Connected_to', 2),
+    (6, 'Connected_to', 8),
+    (7, 'Has', 8),
+    # Unknown end node
+    (5, 'Depends_on', 99),
+]
+PHYSICAL = [('Has', BOTH), ('Connected_to', BOTH)]
+
+
+class TopologySnapshotTest(SimpleTestCase):
+
+    def setUp(self):
+        self.snapshot = TopologySnapshot(NODES, RELATIONSHIPS, last_action_id=10)
+
+    def test_nodes(self):
+        self.assertEqual(len(self.snapshot), 8)
+        self.assertIn(5, self.snapshot)
+        self.assertNotIn(99, self.snapshot)
+        self.assertEqual(self.snapshot.node(5),
+                         {'handle_id': 5, 'name': 'SRV-1', 'node_type': 'Service', 'meta_type': 'Logical'})
+        self.assertEqual(self.snapshot.node_type(7), 'Router')
+        with self.assertRaises(KeyError):
+            self.snapshot.node(99)
+
+    def test_relationships(self):
+        self.assertEqual(self.snapshot.relationship_types, ['Connected_to', 'Depends_on', 'Has', 'Part_of'])
+        self.assertEqual(sorted(self.snapshot.relationships()), sorted(RELATIONSHIPS[:-1]))
+        self.assertEqual(self.snapshot.neighbours(1, [('Has', OUT)]), [2, 4])
+        self.assertEqual(self.snapshot.neighbours(2, [('Has', IN), ('Part_of', IN)]), [1, 3])
+        self.assertEqual(self.snapshot.neighbours(99, [('Has', OUT)]), [])
+
+    def test_traverse(self):
+        # Services depending on router-1
+        dependents = self.snapshot.reachable([1], [('Has', OUT), ('Part_of', IN), ('Depends_on', IN)])
+        self.assertEqual(dependents, {2: 1, 4: 1, 3: 2, 5: 3})
+        self.assertEqual(list(self.snapshot.reachable([1], PHYSICAL, max_depth=2)), [2, 4, 6])
+        self.assertEqual(len(self.snapshot.reachable([1], PHYSICAL, max_nodes=2)), 2)
+        self.assertEqual(self.snapshot.path(1, 7, PHYSICAL), [1, 2, 6, 8, 7])
+        self.assertIsNone(self.snapshot.path(1, 7, PHYSICAL, max_depth=3))
+        self.assertIsNone(self.snapshot.path(1, 5, PHYSICAL))
+
+    def test_cycles(self):
+        snapshot = TopologySnapshot(NODES[:3], [(1, 'Has', 2), (2, 'Has', 3), (3, 'Has', 1)])
+        self.assertEqual(list(snapshot.traverse([1], [('Has', BOTH)])), [(1, 0, None), (2, 1, 1), (3, 1, 1)])
+
+    def test_changed(self):
+        changed = self.snapshot.changed(created_nodes=[(9, 'SRV-2', 'Service', 'Logical')],
+                                        deleted_nodes=[6],
+                                        created_relationships=[(9, 'Depends_on', 4)],
+                                        deleted_relationships=[(1, 'Has', 4)],
+                                        last_action_id=12)
+        self.assertEqual(changed.last_action_id, 12)
+        self.assertNotIn(6, changed)
+        self.assertEqual(changed.neighbours(1, [('Has', OUT)]), [2])
+        self.assertEqual(changed.neighbours(4, [('Depends_on', IN)]), [9])
+        self.assertIsNone(changed.path(1, 7, PHYSICAL))
+        self.assertEqual(changed.node(9)['name'], 'SRV-2')
+        self.assertEqual(len(changed), 8)
+        # The original snapshot is unchanged and shares the arrays
+        self.assertEqual(self.snapshot.path(1, 7, PHYSICAL), [1, 2, 6, 8, 7])
+        self.assertEqual(len(self.snapshot), 8)
+        self.assertIs(changed.outgoing, self.snapshot.outgoing)
+
+        again = changed.changed(deleted_nodes=[9], created_relationships=[(1, 'Has', 4), (1, 'Has', 3)],
+                                deleted_relationships=[(6, 'Connected_to', 8)])
+        self.assertNotIn(9, again)
+        self.assertEqual(again.neighbours(4, [('Depends_on', IN)]), [])
+        self.assertEqual(again.neighbours(1, [('Has', OUT)]), [2, 4, 3])
+        self.assertEqual(changed.neighbours(1, [('Has', OUT)]), [2])
+
+        compacted = again.compacted()
+        self.assertEqual(sorted(compacted.relationships()), sorted(again.relationships()))
+        self.assertEqual(sorted(compacted.nodes()), sorted(again.nodes()))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'topology.pickle')
+            self.assertIsNone(topology.load(path))
+            topology.save(self.snapshot, path)
+            loaded = topology.load(path)
+        self.assertEqual(loaded.last_action_id, 10)
+        self.assertEqual(sorted(loaded.relationships()), sorted(self.snapshot.relationships()))
+        self.assertEqual(loaded.node(1), self.snapshot.node(1))
+
+
+class TopologyBuildTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user')
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        topology.reset()
+        self.addCleanup(topology.reset)
+
+    def test_build(self):
+        snapshot = topology.build(batch_size=7)
+        self.assertEqual(len(snapshot), sum(self.graph.counts().values()))
+        self.assertEqual(sum(1 for r in snapshot.relationships()), len(self.manager.graph.relationships))
+        router = self.graph.nodes['Router'][0]
+        ports = snapshot.neighbours(router.handle_id, [('Has', OUT)])
+        self.assertEqual(sorted(ports), sorted(nh.handle_id for nh in self.graph.nodes['Port'][:4]))
+
+    def test_refresh(self):
+        snapshot = topology.build()
+        self.assertIs(topology.refresh(snapshot), snapshot)
+        customer, service = self.graph.nodes['Customer'][0], self.graph.nodes['Service'][-1]
+        action.send(self.user, verb='create', action_object=customer, target=service,
+                    noclook={'action_type': 'relationship', 'relationship_type': 'Owns'})
+        refreshed = topology.refresh(snapshot)
+        self.assertIn(service.handle_id, refreshed.neighbours(customer.handle_id, [('Owns', OUT)]))
+        self.assertGreater(refreshed.last_action_id, snapshot.last_action_id)
+        self.assertNotIn(service.handle_id, snapshot.neighbours(customer.handle_id, [('Owns', OUT)]))
+
+        # Property changes do not modify the snapshot either
+        last_action_id = refreshed.last_action_id
+        action.send(self.user, verb='update', action_object=service, noclook={'action_type': 'node_property'})
+        self.assertGreater(topology.refresh(refreshed).last_action_id, last_action_id)
+        self.assertEqual(refreshed.last_action_id, last_action_id)
+
+        activitylog.delete_node(self.user, service)
+        self.assertNotIn(service.handle_id, topology.refresh(refreshed))
+
+    def test_reachable(self):
+        router = self.graph.nodes['Router'][0]
+        # One variable length query, and one query per depth for steps in different directions
+        patterns = [(PHYSICAL, 3), ([('Has', IN)], None), ([('Has', OUT), ('Part_of', IN)], 2)]
+        with override_settings(TOPOLOGY_SNAPSHOT_PATH=''):
+            reached = [topology.reachable([router.handle_id], steps, max_depth) for steps, max_depth in patterns]
+        self.assertIn(self.graph.nodes['Port'][0].handle_id, reached[0])
+        self.assertNotIn(router.handle_id, reached[0])
+        self.assertEqual(topology.reachable([router.handle_id], PHYSICAL, 0), set())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'topology.pickle')
+            topology.save(topology.build(), path)
+            with override_settings(TOPOLOGY_SNAPSHOT_PATH=path):
+                self.assertEqual([topology.reachable([router.handle_id], steps, max_depth)
+                                  for steps, max_depth in patterns], reached)
+
+    def test_get_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'topology.pickle')
+            with override_settings(TOPOLOGY_SNAPSHOT_PATH=path, TOPOLOGY_SNAPSHOT_REFRESH_INTERVAL=0):
+                self.assertIsNone(topology.get_snapshot())
+                topology.save(topology.build(), path)
+                self.assertEqual(len(topology.get_snapshot()), sum(self.graph.counts().values()))
+            with override_settings(TOPOLOGY_SNAPSHOT_PATH=path, TOPOLOGY_SNAPSHOT_REFRESH_INTERVAL=3600):
+                snapshot = topology.get_snapshot()
+                # Nothing changed, no refresh
+                with mock.patch('apps.noclook.topology.refresh') as refresh:
+                    self.assertIs(topology.get_snapshot(current=True), snapshot)
+                refresh.assert_not_called()
+                customer, service = self.graph.nodes['Customer'][0], self.graph.nodes['Service'][-1]
+                with self.captureOnCommitCallbacks(execute=True):
+                    action.send(self.user, verb='create', action_object=customer, target=service,
+                                noclook={'action_type': 'relationship', 'relationship_type': 'Owns'})
+                self.assertIs(topology.get_snapshot(), snapshot)
+                self.assertIn(service.handle_id,
+                              topology.get_snapshot(current=True).neighbours(customer.handle_id, [('Owns', OUT)]))
+            with override_settings(TOPOLOGY_SNAPSHOT_PATH=''):
+                self.assertIsNone(topology.get_snapshot())
@@ -1,7 +1,7 @@
 from .neo4j_base import NeoTestCase
 from apps.noclook.views.edit import _handle_trunk_cable
 from apps.noclook.forms.common import TrunkCableForm
-from apps.noclook.models import UniqueIdGenerator, NordunetUniqueId
+from apps.noclook.models import NodeHandle, UniqueIdGenerator, NordunetUniqueId
 from apps.noclook import helpers
 
 
@@ -212,8 +212,6 @@ class TrunkCableTest(NeoTestCase):
         return panel1, panel2
 
     def get_cables(self, handle_id):
-        q = """
-            MATCH (n:Node {handle_id: $handle_id})-[:Has]->(p:Port)<-[:Connected_to]-(c:Cable)
-            RETURN c as cable
-            """
-        return {c.get('cable').get('name'): c.get('cable') for c in self.query_to_list(q, handle_id=handle_id)}
+        node = NodeHandle.objects.get(handle_id=handle_id).get_node()
+        cables = [c['node'] for p in self.get_ports(node) for c in p['node'].get_connected_to().get('Connected_to', [])]
+        return {c.data.get('name'): c.data for c in cables}
@@ -6,7 +6,8 @@ Created on 2014-06-26 1:40 PM
 """
 
 from django.test import TestCase
-from django.db import transaction, IntegrityError
+from django.db import connection, transaction, IntegrityError
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from apps.noclook.models import UniqueIdGenerator, NordunetUniqueId
 from apps.noclook import unique_ids
@@ -95,3 +96,30 @@ class UniqueIdGeneration(TestCase):
         result = unique_ids.is_free_unique_id(self.id_collection, 'TEST-000001')
         self.assertFalse(result)
 
+
+    def test_lease_ids(self):
+        ids = self.id_generator.lease_ids(3)
+        self.assertEqual(ids, ['TEST-000001', 'TEST-000002', 'TEST-000003'])
+        self.assertEqual(self.id_generator.last_id, 'TEST-000003')
+        self.assertEqual(self.id_generator.next_id, 'TEST-000004')
+        self.assertEqual(self.id_generator.get_id(), 'TEST-000004')
+        self.assertEqual(UniqueIdGenerator.objects.get(pk=self.id_generator.pk).base_id, 5)
+
+    def test_reserve_sequence_queries(self):
+        unique_ids.bulk_reserve_id_range(10, 19, self.id_generator, self.id_collection, 'Reserve message', self.user)
+        with CaptureQueriesContext(connection) as queries:
+            seq = unique_ids.reserve_id_sequence(1000, self.id_generator, self.id_collection, 'Reserve message',
+                                                 self.user)
+        self.assertLess(len(queries), 20)
+        self.assertEqual(len(seq), 1000)
+        self.assertEqual(len([item for item in seq if item['error_message']]), 10)
+        self.assertEqual(self.id_collection.objects.count(), 1000)
+        self.assertEqual(self.id_generator.next_id, 'TEST-001001')
+
+    def test_get_unique_id_skips_taken_block(self):
+        unique_ids.bulk_reserve_id_range(1, 250, self.id_generator, self.id_collection, 'Reserve message', self.user)
+        with CaptureQueriesContext(connection) as queries:
+            new_id = unique_ids.get_collection_unique_id(self.id_generator, self.id_collection)
+        self.assertEqual(new_id, 'TEST-000251')
+        self.assertLess(len(queries), 15)
+        self.assertEqual(self.id_generator.next_id, 'TEST-000252')
@@ -2,6 +2,7 @@ from .neo4j_base import NeoTestCase
 from apps.noclook.helpers import set_user, set_noclook_auto_manage
 from apps.noclook import forms
 from django.urls import reverse
+import json
 
 
 class ViewTest(NeoTestCase):
@@ -30,6 +31,30 @@ class ViewTest(NeoTestCase):
         self.assertContains(resp, host.node_name)
         self.assertEqual(resp.context['node_handle'].handle_id, host.handle_id)
 
+    def test_router_detail_fragments(self):
+        router = self.create_node('awesome-router.test.dev', 'router')
+
+        resp = self.client.get(router.get_absolute_url())
+        self.assertContains(resp, router.node_name)
+        self.assertNotIn('connections', resp.context)
+        for section in ['dependents', 'connections', 'hardware', 'history']:
+            url = reverse('node_fragment', args=['router', router.handle_id, section])
+            self.assertContains(resp, url)
+            resp_fragment = self.client.get(url)
+            self.assertEqual(resp_fragment.status_code, 200)
+            self.assertIn('max-age', resp_fragment['Cache-Control'])
+
+    def test_cable_detail_fragments(self):
+        cable = self.create_node('cable-01', 'cable')
+
+        resp = self.client.get(reverse('node_fragment', args=['cable', cable.handle_id, 'connections']))
+        self.assertContains(resp, 'No connections found.')
+        resp = self.client.get(reverse('node_fragment', args=['cable', cable.handle_id, 'connection-path']))
+        self.assertContains(resp, 'Connection path')
+        # Hardware is only available for routers
+        resp = self.client.get(reverse('node_fragment', args=['cable', cable.handle_id, 'hardware']))
+        self.assertEqual(resp.status_code, 404)
+
     def test_router_edit_view(self):
         router = self.create_node('awesome-router.test.dev', 'router')
 
@@ -73,5 +98,32 @@ class ViewTest(NeoTestCase):
 
         self.assertContains(resp, host.node_name)
 
+    def test_list_view_export(self):
+        self.create_node('awesome-router.test.dev', 'router')
+        self.create_node('fine.test.dev', 'router')
+
+        resp = self.client.get('/router/', {'format': 'csv'})
+        self.assertEqual(resp['Content-Disposition'], 'attachment; filename=routers.csv; charset=utf-8;')
+        lines = b''.join(resp.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], '"Router","Model","JUNOS version","Operational state"')
+        self.assertEqual(lines[1], '"awesome-router.test.dev","","",""')
+        self.assertEqual(len(lines), 3)
+
+        resp = self.client.get('/router/', {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(resp.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([row['Router'] for row in rows], ['awesome-router.test.dev', 'fine.test.dev'])
+
+    def test_report_view_export(self):
+        host_user = self.create_node('AwesomeCo', 'host-user', 'Relation')
+        host = self.create_node('sweet-host.nordu.net', 'host', 'Logical')
+        set_noclook_auto_manage(host.get_node(), True)
+        set_user(self.user, host.get_node(), host_user.handle_id)
+
+        resp = self.client.get(reverse('host_users_report'), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(resp.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['Host user'], 'AwesomeCo')
+        self.assertEqual(rows[0]['Host'], 'sweet-host.nordu.net')
+
     # import nodes? it is tested seperatly
 
@@ -1,7 +1,16 @@
-from .neo4j_base import NeoTestCase
-from apps.noclook import helpers
+from unittest import mock
+
+from actstream import action
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
+from .neo4j_base import NeoTestCase
+from apps.noclook import arborgraph, helpers, synthetic
+from apps.noclook.memory_graph import MemoryGraphManager
+import norduniclient as nc
+
 
 class VisualizeTest(NeoTestCase):
     """
@@ -21,3 +30,89 @@ class VisualizeTest(NeoTestCase):
         self.assertEqual(1, len(json['edges']))
         self.assertIn(str(host_user.handle_id), json['edges'].keys())
         self.assertIn(host.node_name, json['nodes'][str(host.handle_id)]['label'])
+
+
+@override_settings(VISUALIZE_MAX_DEPTH=3, VISUALIZE_MAX_NODES=300)
+class VisualizeGraphTest(TestCase):
+    """
+    Tests the cached multi depth graphs against the in-memory graph
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='test user', is_staff=True)
+        self.manager = MemoryGraphManager()
+        patcher = mock.patch.object(nc.graphdb, '_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = synthetic.inventory(self.user, scale=1, ports_per_router=4)
+        self.router = self.graph.nodes['Router'][0]
+        self.ports = [nh for nh in self.graph.nodes['Port'] if nh.node_name.startswith(self.router.node_name)]
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_graph(self, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('visualize_json', args=[self.router.handle_id]), params, **headers)
+
+    def test_depth(self):
+        resp = self.get_graph()
+        graph = resp.json()
+        self.assertNotIn(b'\n', resp.content)
+        self.assertFalse(graph['truncated'])
+        self.assertTrue(graph['nodes'][str(self.router.handle_id)]['fixed'])
+        self.assertEqual(graph['nodes'][str(self.ports[0].handle_id)]['url'], self.ports[0].get_absolute_url())
+        self.assertEqual(graph['edges'][str(self.router.handle_id)][str(self.ports[0].handle_id)]['label'], 'Has')
+        # Units are part of the ports, two relationships away
+        unit = self.graph.nodes['Unit'][0]
+        self.assertNotIn(str(unit.handle_id), graph['nodes'])
+        graph = self.get_graph(depth=2).json()
+        self.assertIn(str(unit.handle_id), graph['nodes'])
+        self.assertEqual(graph['edges'][str(unit.handle_id)][str(self.ports[0].handle_id)]['label'], 'Part of')
+
+        graph = self.get_graph(depth=3, max_nodes=5).json()
+        self.assertTrue(graph['truncated'])
+        self.assertEqual(len(graph['nodes']), 5)
+        self.assertTrue(all(end in graph['nodes'] for start, ends in graph['edges'].items() for end in ends))
+
+    def test_decommissioned(self):
+        port = self.manager.graph.get_node(self.ports[0].handle_id)
+        port.properties['operational_state'] = 'Decommissioned'
+        graph = self.get_graph().json()
+        self.assertNotIn(str(self.ports[0].handle_id), graph['nodes'])
+        self.assertIn(str(self.ports[1].handle_id), graph['nodes'])
+
+    def test_etag_and_cache(self):
+        resp = self.get_graph(depth=2)
+        etag = resp['ETag']
+        with mock.patch.object(nc.graphdb, '_manager', None):
+            # Cached graphs do not touch neo4j
+            resp = self.get_graph(depth=2, etag=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        # A changed node in the graph drops the cached graph
+        port = self.ports[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manager.graph.get_node(port.handle_id).properties['name'] = 'renamed'
+            action.send(self.user, verb='update', action_object=port,
+                        noclook={'action_type': 'node_property', 'property': 'name',
+                                 'value_before': port.node_name, 'value_after': 'renamed'})
+        resp = self.get_graph(depth=2, etag=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertIn('renamed', resp.json()['nodes'][str(port.handle_id)]['label'])
+
+    def test_changed_while_computed(self):
+        create_generic_graph = arborgraph.create_generic_graph
+
+        def changed_meanwhile(*args, **kwargs):
+            graph_dict = create_generic_graph(*args, **kwargs)
+            arborgraph.invalidate(self.ports[0].handle_id)
+            return graph_dict
+
+        with mock.patch.object(arborgraph, 'create_generic_graph', side_effect=changed_meanwhile):
+            etag = self.get_graph()['ETag']
+        with mock.patch.object(arborgraph, 'create_generic_graph', wraps=create_generic_graph) as computed:
+            self.assertEqual(self.get_graph(etag=etag).status_code, 304)
+            self.get_graph()
+        # Computed again, then cached
+        self.assertEqual(computed.call_count, 1)
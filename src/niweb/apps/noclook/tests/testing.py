@@ -6,15 +6,71 @@ from django.core.exceptions import ImproperlyConfigured
 
 __author__ = 'lundberg'
 
-try:
-    NEO4J_URI = settings.TEST_NEO4J_URI
-    NEO4J_USERNAME = settings.TEST_NEO4J_USERNAME
-    NEO4J_PASSWORD = settings.TEST_NEO4J_PASSWORD
-    # Use provided test database
-    test_db = nc.init_db(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
-    nc.graphdb._manager = test_db
-except ImproperlyConfigured:
-    from norduniclient.testing import Neo4jTemporaryInstance
-    # Use test instance of the neo4j db
-    neo4j_tmp = Neo4jTemporaryInstance.get_instance()
-    nc.graphdb.manager = neo4j_tmp.db
+if settings.NEO4J_BACKEND == 'memory':
+    # nc.graphdb.manager is a MemoryGraphManager already, see NOCLookConfig.ready
+    pass
+else:
+    try:
+        NEO4J_URI = settings.TEST_NEO4J_URI
+        NEO4J_USERNAME = settings.TEST_NEO4J_USERNAME
+        NEO4J_PASSWORD = settings.TEST_NEO4J_PASSWORD
+        # Use provided test database
+        test_db = nc.init_db(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
+        nc.graphdb._manager = test_db
+    except ImproperlyConfigured:
+        from norduniclient.testing import Neo4jTemporaryInstance
+        # Use test instance of the neo4j db
+        neo4j_tmp = Neo4jTemporaryInstance.get_instance()
+        nc.graphdb.manager = neo4j_tmp.db
+
+# Tests running with --parallel share the neo4j database, each worker creates nodes in its own handle_id range
+HANDLE_ID_RANGE = 10 ** 7
+
+DELETE_HANDLE_ID_RANGE = """
+    MATCH (n:Node)
+    WHERE n.handle_id >= {start} AND n.handle_id < {end}
+    DETACH DELETE n
+    """
+
+
+def worker_handle_id_range():
+    """
+    :return: (start, end) of the handle_ids of the current test worker, worker 0 when not running in parallel
+    """
+    from django.test import runner
+    start = runner._worker_id * HANDLE_ID_RANGE
+    return start, start + HANDLE_ID_RANGE
+
+
+def reserve_handle_ids(using='default'):
+    """
+    Makes the next NodeHandle created get a handle_id in the range of the current test worker.
+
+    :return: The first handle_id that will be used
+    """
+    from django.db import connections
+    from django.db.models import Max
+    from apps.noclook.models import NodeHandle
+    start, end = worker_handle_id_range()
+    current = NodeHandle.objects.using(using).aggregate(Max('handle_id'))['handle_id__max'] or 0
+    if current >= start:
+        return current + 1
+    connection = connections[using]
+    table = NodeHandle._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s', [table])
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'handle_id'), %s)", [table, start])
+        else:
+            return current + 1
+    return start + 1
+
+
+def delete_nodes(start, end):
+    """
+    Deletes the nodes with handle_id in [start, end) and their relationships.
+    """
+    with nc.graphdb.manager.session as s:
+        s.run(DELETE_HANDLE_ID_RANGE, {'start': start, 'end': end})
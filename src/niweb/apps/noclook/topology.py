@@ -0,0 +1,760 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only in-memory snapshot of the topology for traversals.
+
+Questions like which services depend on a port or what a cable is connected to are variable length traversals that
+neo4j answers slowly under concurrent load. The snapshot holds the node metadata of the NodeHandles and, per
+relationship type, the outgoing and incoming adjacency in compressed sparse row (CSR) form: the neighbours of the node
+with index i are targets[offsets[i]:offsets[i + 1]]. The arrays are typed arrays from the standard library array
+module, a node costs a few bytes per relationship instead of a Python object per node and relationship.
+
+The topology_snapshot management command builds the snapshot from a streaming export of the graph and writes it to
+TOPOLOGY_SNAPSHOT_PATH. get_snapshot loads that file in each process and brings it up to date with the relationships
+and nodes created or deleted in the activity log since the snapshot was taken. The snapshot is optional, get_snapshot
+returns None when TOPOLOGY_SNAPSHOT_PATH is not set or the file does not exist, callers then fall back to Cypher.
+
+A snapshot is never modified, refreshing creates a new snapshot, so a traversal never sees a half applied change.
+The changes are applied as an overlay next to the CSR arrays, which costs the size of the changes. The arrays are
+rebuilt with the overlay by the topology_snapshot --refresh command, off the request path. Processes load the new
+file when it is replaced, so run the command periodically to keep the overlay small.
+
+version returns a token per relationship type that changes when the activity log records a relationship of that type
+being created or deleted, or a node being deleted. Results derived from the topology can be cached keyed on it.
+get_snapshot(current=True) refreshes only when the CHANGES token differs from the one of the last refresh.
+"""
+
+import bisect
+import copy
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+from array import array
+from collections import OrderedDict, deque
+from time import time
+
+from actstream.models import Action
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import post_save
+
+from apps.noclook.models import NodeHandle
+import norduniclient as nc
+
+logger = logging.getLogger('noclook.topology')
+
+OUT = 'out'
+IN = 'in'
+BOTH = 'both'
+
+# Version of the nodes, changed when nodes are deleted
+NODES = 'nodes'
+# Version of the whole topology, changed with any of the other versions
+CHANGES = 'changes'
+VERSION_KEY = 'noclook:topology:version:{}'
+
+# Increase when the pickled attributes of TopologySnapshot change, older files are then ignored
+FORMAT_VERSION = 1
+
+RELATIONSHIPS_QUERY = """
+    MATCH (a:Node)-[r]->(b:Node)
+    WHERE a.handle_id >= {start} AND a.handle_id <= {end}
+    RETURN a.handle_id as start, type(r) as type, b.handle_id as end
+    """
+
+# One depth of a traversal without snapshot, pattern is eg. (n)-[:Has|Depends_on]->(m:Node)
+EXPAND_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {{handle_ids}}
+    MATCH {pattern}
+    RETURN n.handle_id as parent, m.handle_id as handle_id
+    """
+
+# All nodes reachable within a depth without snapshot, pattern is eg. (n)<-[:Has*1..]-(m:Node)
+REACHABLE_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {{handle_ids}}
+    MATCH {pattern}
+    RETURN DISTINCT m.handle_id as handle_id
+    """
+
+
+class Adjacency(object):
+    """
+    Neighbours of all nodes for one relationship type and direction in CSR form.
+    """
+    __slots__ = ('offsets', 'targets')
+
+    def __init__(self, size, sources, targets):
+        """
+        :param size: Number of nodes
+        :param sources: Node indexes the relationships start from
+        :param targets: Node indexes the relationships end at, in the same order as sources
+        """
+        offsets = array('l', [0]) * (size + 1)
+        for source in sources:
+            offsets[source + 1] += 1
+        for i in range(size):
+            offsets[i + 1] += offsets[i]
+        position = offsets[:-1]
+        self.targets = array('l', [0]) * len(targets)
+        for source, target in zip(sources, targets):
+            self.targets[position[source]] = target
+            position[source] += 1
+        self.offsets = offsets
+
+    def neighbours(self, index):
+        return self.targets[self.offsets[index]:self.offsets[index + 1]]
+
+
+class TopologySnapshot(object):
+    """
+    Node metadata indexed on handle_id and adjacency per relationship type.
+
+    The CSR arrays are built once. Changes are kept next to them as an overlay of created and deleted nodes and
+    relationships, so applying the changes of the activity log costs the size of the changes instead of a rebuild of
+    the arrays, see changed. compacted builds new arrays with the overlay applied.
+    """
+
+    # Overlay of the changes after the arrays were built, replaced and never modified by changed
+    # handle_id: (name, node type, meta type) of nodes not in the arrays
+    _created_nodes = {}
+    # handle_ids of nodes in the arrays
+    _deleted_nodes = frozenset()
+    # handle_id: tuple of (relationship type, OUT or IN, other handle_id)
+    _created_relationships = {}
+    # (start handle_id, relationship type, end handle_id) of relationships in the arrays
+    _deleted_relationships = frozenset()
+
+    def __init__(self, nodes, relationships, last_action_id=0, created=None):
+        """
+        :param nodes: Iterable of (handle_id, name, node type, meta type)
+        :param relationships: Iterable of (start handle_id, relationship type, end handle_id), relationships to or
+        from nodes not in nodes are left out
+        :param last_action_id: Id of the last activity log Action the snapshot includes
+        :param created: Timestamp of the export, now if not given
+        """
+        self.last_action_id = last_action_id
+        self.created = created or time()
+        self.handle_ids = array('q')
+        self.names = []
+        self._node_types = []
+        self._type_codes = array('h')
+        self.meta_types = []
+        codes = {}
+        for handle_id, name, node_type, meta_type in sorted(nodes):
+            if self.handle_ids and self.handle_ids[-1] == handle_id:
+                continue
+            self.handle_ids.append(handle_id)
+            self.names.append(name)
+            if node_type not in codes:
+                codes[node_type] = len(self._node_types)
+                self._node_types.append(node_type)
+            self._type_codes.append(codes[node_type])
+            self.meta_types.append(meta_type)
+
+        by_type = {}
+        for start, rel_type, end in relationships:
+            try:
+                edge = (self.index(start), self.index(end))
+            except KeyError:
+                continue
+            by_type.setdefault(rel_type, set()).add(edge)
+        size = len(self.handle_ids)
+        self.outgoing = {}
+        self.incoming = {}
+        for rel_type, edges in by_type.items():
+            edges = sorted(edges)
+            sources = array('l', (s for s, e in edges))
+            targets = array('l', (e for s, e in edges))
+            self.outgoing[rel_type] = Adjacency(size, sources, targets)
+            self.incoming[rel_type] = Adjacency(size, targets, sources)
+
+    def __len__(self):
+        return len(self.handle_ids) - len(self._deleted_nodes) + len(self._created_nodes)
+
+    def __contains__(self, handle_id):
+        if handle_id in self._created_nodes:
+            return True
+        return handle_id not in self._deleted_nodes and self._in_arrays(handle_id)
+
+    def _in_arrays(self, handle_id):
+        i = bisect.bisect_left(self.handle_ids, handle_id)
+        return i < len(self.handle_ids) and self.handle_ids[i] == handle_id
+
+    def index(self, handle_id):
+        """
+        :return: Index of the node with handle_id in the node arrays
+        :raises KeyError: If the node is not in the arrays
+        """
+        i = bisect.bisect_left(self.handle_ids, handle_id)
+        if i < len(self.handle_ids) and self.handle_ids[i] == handle_id:
+            return i
+        raise KeyError(handle_id)
+
+    def node(self, handle_id):
+        """
+        :return: Dict with handle_id, name, node_type and meta_type of the node
+        :raises KeyError: If the node is not in the snapshot
+        """
+        if handle_id in self._created_nodes:
+            name, node_type, meta_type = self._created_nodes[handle_id]
+        elif handle_id in self._deleted_nodes:
+            raise KeyError(handle_id)
+        else:
+            i = self.index(handle_id)
+            name, node_type, meta_type = self.names[i], self._node_types[self._type_codes[i]], self.meta_types[i]
+        return {
+            'handle_id': handle_id,
+            'name': name,
+            'node_type': node_type,
+            'meta_type': meta_type,
+        }
+
+    def node_type(self, handle_id):
+        return self.node(handle_id)['node_type']
+
+    def nodes(self):
+        """
+        :return: Generator of (handle_id, name, node type, meta type)
+        """
+        for i, handle_id in enumerate(self.handle_ids):
+            if handle_id not in self._deleted_nodes:
+                yield handle_id, self.names[i], self._node_types[self._type_codes[i]], self.meta_types[i]
+        for handle_id, node in self._created_nodes.items():
+            yield (handle_id,) + node
+
+    @property
+    def relationship_types(self):
+        rel_types = set(self.outgoing)
+        for entries in self._created_relationships.values():
+            rel_types.update(rel_type for rel_type, direction, other in entries)
+        return sorted(rel_types)
+
+    def relationships(self):
+        """
+        :return: Generator of (start handle_id, relationship type, end handle_id)
+        """
+        for rel_type, adjacency in self.outgoing.items():
+            for i, handle_id in enumerate(self.handle_ids):
+                if handle_id in self._deleted_nodes:
+                    continue
+                for j in adjacency.neighbours(i):
+                    relationship = (handle_id, rel_type, self.handle_ids[j])
+                    if relationship[2] not in self._deleted_nodes and \
+                            relationship not in self._deleted_relationships:
+                        yield relationship
+        for handle_id, entries in self._created_relationships.items():
+            for rel_type, direction, other in entries:
+                if direction == OUT:
+                    yield handle_id, rel_type, other
+
+    def _in_arrays_relationship(self, start, rel_type, end):
+        if rel_type not in self.outgoing:
+            return False
+        try:
+            targets = self.outgoing[rel_type].neighbours(self.index(start))
+            j = self.index(end)
+        except KeyError:
+            return False
+        # The targets of a node are sorted
+        k = bisect.bisect_left(targets, j)
+        return k < len(targets) and targets[k] == j
+
+    @staticmethod
+    def _directions(steps):
+        """
+        :return: OrderedDict with (relationship type, OUT or IN) keys in the order of steps
+        """
+        directions = OrderedDict()
+        for rel_type, direction in steps:
+            if direction in (OUT, BOTH):
+                directions[(rel_type, OUT)] = True
+            if direction in (IN, BOTH):
+                directions[(rel_type, IN)] = True
+        return directions
+
+    def _adjacencies(self, directions):
+        adjacencies = []
+        for rel_type, direction in directions:
+            by_type = self.outgoing if direction == OUT else self.incoming
+            if rel_type in by_type:
+                adjacencies.append((rel_type, direction, by_type[rel_type]))
+        return adjacencies
+
+    def _expand(self, handle_id, directions, adjacencies):
+        """
+        :return: Generator of the handle_ids of the neighbours of a node in the snapshot, with repetitions
+        """
+        deleted_nodes = self._deleted_nodes
+        deleted_relationships = self._deleted_relationships
+        if handle_id not in deleted_nodes:
+            i = bisect.bisect_left(self.handle_ids, handle_id)
+            if i < len(self.handle_ids) and self.handle_ids[i] == handle_id:
+                for rel_type, direction, adjacency in adjacencies:
+                    for j in adjacency.neighbours(i):
+                        other = self.handle_ids[j]
+                        if deleted_nodes or deleted_relationships:
+                            relationship = (handle_id, rel_type, other) if direction == OUT else \
+                                (other, rel_type, handle_id)
+                            if other in deleted_nodes or relationship in deleted_relationships:
+                                continue
+                        yield other
+        for rel_type, direction, other in self._created_relationships.get(handle_id, ()):
+            if (rel_type, direction) in directions:
+                yield other
+
+    def neighbours(self, handle_id, steps):
+        """
+        :param steps: Iterable of (relationship type, direction) to follow, direction is OUT, IN or BOTH
+        :return: List of the handle_ids of the neighbours, empty if the node is not in the snapshot
+        """
+        directions = self._directions(steps)
+        seen = set()
+        result = []
+        for other in self._expand(handle_id, directions, self._adjacencies(directions)):
+            if other not in seen:
+                seen.add(other)
+                result.append(other)
+        return result
+
+    def traverse(self, roots, steps, max_depth=None):
+        """
+        Breadth first traversal, every node is visited once so cycles are harmless.
+
+        :param roots: handle_ids to start from, nodes not in the snapshot are skipped
+        :param steps: Iterable of (relationship type, direction) to follow, direction is OUT, IN or BOTH
+        :param max_depth: Number of relationships to follow at most, None for no limit
+        :return: Generator of (handle_id, depth, parent handle_id) in breadth first order, starting with the roots
+        """
+        directions = self._directions(steps)
+        adjacencies = self._adjacencies(directions)
+        visited = set()
+        queue = deque()
+        for root in roots:
+            if root in self and root not in visited:
+                visited.add(root)
+                queue.append((root, 0))
+                yield root, 0, None
+        while queue:
+            handle_id, depth = queue.popleft()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for other in self._expand(handle_id, directions, adjacencies):
+                if other not in visited:
+                    visited.add(other)
+                    queue.append((other, depth + 1))
+                    yield other, depth + 1, handle_id
+
+    def reachable(self, roots, steps, max_depth=None, max_nodes=None):
+        """
+        :param max_nodes: Stop after this many nodes, roots not included, None for no limit
+        :return: OrderedDict of handle_id and depth of the nodes reachable from the roots, roots not included
+        """
+        result = OrderedDict()
+        for handle_id, depth, parent in self.traverse(roots, steps, max_depth):
+            if depth == 0:
+                continue
+            if max_nodes is not None and len(result) >= max_nodes:
+                break
+            result[handle_id] = depth
+        return result
+
+    def path(self, start, end, steps, max_depth=None):
+        """
+        :return: List of handle_ids of a shortest path from start to end, both included, None if there is none
+        """
+        parents = {}
+        for handle_id, depth, parent in self.traverse([start], steps, max_depth):
+            parents[handle_id] = parent
+            if handle_id == end:
+                path = [end]
+                while parents[path[-1]] is not None:
+                    path.append(parents[path[-1]])
+                return list(reversed(path))
+        return None
+
+    def changed(self, created_nodes=(), deleted_nodes=(), created_relationships=(), deleted_relationships=(),
+                last_action_id=None):
+        """
+        Copies the overlay, the arrays are shared with the new snapshot.
+
+        :param created_nodes: Iterable of (handle_id, name, node type, meta type)
+        :param deleted_nodes: Iterable of handle_ids
+        :param created_relationships: Iterable of (start handle_id, relationship type, end handle_id)
+        :param deleted_relationships: Iterable of (start handle_id, relationship type, end handle_id)
+        :return: New TopologySnapshot with the changes applied
+        """
+        snapshot = copy.copy(self)
+        if last_action_id:
+            snapshot.last_action_id = last_action_id
+        deleted_nodes = set(deleted_nodes)
+        nodes = dict(self._created_nodes)
+        removed_nodes = set(self._deleted_nodes)
+        entries = dict(self._created_relationships)
+        removed_relationships = set(self._deleted_relationships)
+        snapshot._created_nodes = nodes
+        snapshot._created_relationships = entries
+
+        def remove_entry(handle_id, entry):
+            remaining = tuple(e for e in entries.get(handle_id, ()) if e != entry)
+            if remaining:
+                entries[handle_id] = remaining
+            else:
+                entries.pop(handle_id, None)
+
+        for handle_id, name, node_type, meta_type in created_nodes:
+            if handle_id not in deleted_nodes and handle_id not in snapshot:
+                nodes[handle_id] = (name, node_type, meta_type)
+        for relationship in created_relationships:
+            start, rel_type, end = relationship
+            if start not in snapshot or end not in snapshot:
+                continue
+            if self._in_arrays_relationship(start, rel_type, end):
+                removed_relationships.discard(relationship)
+            elif (rel_type, OUT, end) not in entries.get(start, ()):
+                entries[start] = entries.get(start, ()) + ((rel_type, OUT, end),)
+                entries[end] = entries.get(end, ()) + ((rel_type, IN, start),)
+        for relationship in deleted_relationships:
+            start, rel_type, end = relationship
+            remove_entry(start, (rel_type, OUT, end))
+            remove_entry(end, (rel_type, IN, start))
+            if self._in_arrays_relationship(start, rel_type, end):
+                removed_relationships.add(relationship)
+        for handle_id in deleted_nodes:
+            for rel_type, direction, other in entries.pop(handle_id, ()):
+                remove_entry(other, (rel_type, IN if direction == OUT else OUT, handle_id))
+            if nodes.pop(handle_id, None) is None and self._in_arrays(handle_id):
+                removed_nodes.add(handle_id)
+        snapshot._deleted_nodes = frozenset(removed_nodes)
+        snapshot._deleted_relationships = frozenset(removed_relationships)
+        return snapshot
+
+    def compacted(self):
+        """
+        :return: New TopologySnapshot with the overlay built into the arrays
+        """
+        return TopologySnapshot(self.nodes(), self.relationships(), self.last_action_id, self.created)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['format_version'] = FORMAT_VERSION
+        return state
+
+
+def export_nodes():
+    """
+    :return: Generator of (handle_id, name, node type, meta type) of all NodeHandles
+    """
+    return NodeHandle.objects.order_by('handle_id')\
+        .values_list('handle_id', 'node_name', 'node_type__type', 'node_meta_type').iterator()
+
+
+def export_relationships(handle_ids, batch_size=1000):
+    """
+    Streams the relationships from neo4j, batch_size start nodes at a time.
+
+    :param handle_ids: Sorted handle_ids of the start nodes
+    :return: Generator of (start handle_id, relationship type, end handle_id)
+    """
+    for i in range(0, len(handle_ids), batch_size):
+        start, end = handle_ids[i], handle_ids[min(i + batch_size, len(handle_ids)) - 1]
+        for item in nc.query_to_iterator(nc.graphdb.manager, RELATIONSHIPS_QUERY, start=start, end=end):
+            yield item['start'], item['type'], item['end']
+
+
+def build(batch_size=1000):
+    """
+    :return: TopologySnapshot of the current graph
+    """
+    # Changes made during the export are applied again by refresh, applying them twice is harmless
+    last_action_id = Action.objects.aggregate(Max('id'))['id__max'] or 0
+    created = time()
+    nodes = list(export_nodes())
+    handle_ids = [node[0] for node in nodes]
+    return TopologySnapshot(nodes, export_relationships(handle_ids, batch_size), last_action_id, created)
+
+
+def refresh(snapshot):
+    """
+    Applies the nodes and relationships created or deleted in the activity log after the snapshot was taken, as an
+    overlay, see TopologySnapshot.changed.
+
+    :return: New TopologySnapshot, or snapshot if there are no new actions
+    """
+    actions = Action.objects.filter(id__gt=snapshot.last_action_id).order_by('id')\
+        .values_list('id', 'verb', 'action_object_object_id', 'target_object_id', 'data')
+    created_handles, deleted_handles, created, deleted = set(), set(), set(), set()
+    unknown_deleted = False
+    last_action_id = snapshot.last_action_id
+    for action_id, verb, start, end, data in actions:
+        last_action_id = action_id
+        noclook = (data or {}).get('noclook', {})
+        action_type = noclook.get('action_type')
+        if action_type == 'node' and verb == 'create' and start:
+            created_handles.add(int(start))
+        elif action_type == 'node' and verb == 'delete':
+            if noclook.get('handle_id'):
+                deleted_handles.add(int(noclook['handle_id']))
+            else:
+                # Older actions do not keep the handle_id of deleted nodes
+                unknown_deleted = True
+        elif action_type == 'relationship' and start and end:
+            relationship = (int(start), noclook.get('relationship_type'), int(end))
+            if verb == 'create':
+                created.add(relationship)
+                deleted.discard(relationship)
+            elif verb == 'delete':
+                deleted.add(relationship)
+                created.discard(relationship)
+    if last_action_id == snapshot.last_action_id:
+        return snapshot
+    created_nodes = []
+    if created_handles:
+        created_nodes = NodeHandle.objects.filter(handle_id__in=created_handles)\
+            .values_list('handle_id', 'node_name', 'node_type__type', 'node_meta_type')
+    if unknown_deleted:
+        existing = set(NodeHandle.objects.values_list('handle_id', flat=True))
+        deleted_handles.update(handle_id for handle_id, name, node_type, meta_type in snapshot.nodes()
+                               if handle_id not in existing)
+    return snapshot.changed(created_nodes, deleted_handles, created, deleted, last_action_id)
+
+
+def save(snapshot, path):
+    """
+    Writes the snapshot to path, readers see either the old or the new file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.topology-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def load(path):
+    """
+    :return: TopologySnapshot from path, None if the file is missing or of another format version
+    """
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    if snapshot.__dict__.pop('format_version', None) != FORMAT_VERSION:
+        logger.warning('Ignoring topology snapshot %s of another format version, rebuild it.', path)
+        return None
+    return snapshot
+
+
+class _Current(object):
+    lock = threading.Lock()
+    snapshot = None
+    mtime = None
+    checked = 0
+    # CHANGES version when the snapshot was last refreshed
+    version = None
+
+
+def get_snapshot(current=False):
+    """
+    :param current: Refresh now if the activity log recorded topology changes since the last refresh, instead of at
+    most every TOPOLOGY_SNAPSHOT_REFRESH_INTERVAL seconds, for callers that must see changes made just before. Costs
+    one cache lookup when nothing changed.
+    :return: The process wide TopologySnapshot, None if there is no snapshot
+    """
+    path = settings.TOPOLOGY_SNAPSHOT_PATH
+    if not path:
+        return None
+    changes = version_token(CHANGES) if current else None
+    if time() - _Current.checked < settings.TOPOLOGY_SNAPSHOT_REFRESH_INTERVAL and \
+            (changes is None or changes == _Current.version):
+        return _Current.snapshot
+    with _Current.lock:
+        if time() - _Current.checked < settings.TOPOLOGY_SNAPSHOT_REFRESH_INTERVAL and \
+                (changes is None or changes == _Current.version):
+            return _Current.snapshot
+        # Read before refreshing, changes committed during the refresh are applied by the next one
+        changes = version_token(CHANGES)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime != _Current.mtime:
+            _Current.snapshot = load(path) if mtime else None
+            _Current.mtime = mtime
+        if _Current.snapshot is not None:
+            _Current.snapshot = refresh(_Current.snapshot)
+        _Current.version = changes
+        _Current.checked = time()
+    return _Current.snapshot
+
+
+def _expand_query(steps):
+    out_types = [rel_type for rel_type, direction in steps if direction in (OUT, BOTH)]
+    in_types = [rel_type for rel_type, direction in steps if direction in (IN, BOTH)]
+    parts = []
+    if out_types:
+        parts.append(EXPAND_QUERY.format(pattern='(n)-[:{}]->(m:Node)'.format('|'.join(out_types))))
+    if in_types:
+        parts.append(EXPAND_QUERY.format(pattern='(n)<-[:{}]-(m:Node)'.format('|'.join(in_types))))
+    return 'UNION'.join(parts)
+
+
+def _traverse_neo4j(roots, steps, max_depth=None):
+    """
+    Breadth first traversal with one neo4j query per depth.
+    """
+    query = _expand_query(steps)
+    roots = list(OrderedDict.fromkeys(roots))
+    nodes = NodeHandle.objects.filter(handle_id__in=roots).values_list('handle_id', flat=True)
+    existing = set(nodes)
+    frontier = [handle_id for handle_id in roots if handle_id in existing]
+    visited = set(frontier)
+    for handle_id in frontier:
+        yield handle_id, 0, None
+    depth = 0
+    while frontier and query and (max_depth is None or depth < max_depth):
+        depth += 1
+        found = OrderedDict()
+        rows = nc.query_to_list(nc.graphdb.manager, query, handle_ids=frontier)
+        order = dict((handle_id, i) for i, handle_id in enumerate(frontier))
+        for row in sorted(rows, key=lambda r: (order[r['parent']], r['handle_id'])):
+            if row['handle_id'] not in visited and row['handle_id'] not in found:
+                found[row['handle_id']] = row['parent']
+        for handle_id, parent in found.items():
+            visited.add(handle_id)
+            yield handle_id, depth, parent
+        frontier = list(found)
+
+
+def _reachable_query(steps, max_depth):
+    """
+    :return: Variable length query for steps, None if the steps are followed in different directions
+    """
+    directions = set(direction for rel_type, direction in steps)
+    if len(directions) != 1:
+        return None
+    direction = directions.pop()
+    rel_types = '|'.join(OrderedDict.fromkeys(rel_type for rel_type, direction in steps))
+    pattern = '(n){}-[:{}*1..{}]-{}(m:Node)'.format('<' if direction == IN else '', rel_types,
+                                                  '' if max_depth is None else max_depth,
+                                                  '>' if direction == OUT else '')
+    return REACHABLE_QUERY.format(pattern=pattern)
+
+
+def reachable(roots, steps, max_depth=None, current=False):
+    """
+    TopologySnapshot.reachable on the snapshot, or on neo4j with one query if there is none. Steps followed in
+    different directions take one neo4j query per depth.
+
+    :param current: See get_snapshot
+    :return: Set of the handle_ids of the nodes reachable from the roots, roots not included
+    """
+    roots = set(roots)
+    snapshot = get_snapshot(current)
+    if snapshot is not None:
+        return set(snapshot.reachable(roots, steps, max_depth))
+    if not roots or max_depth == 0:
+        return set()
+    query = _reachable_query(steps, max_depth)
+    if query is None:
+        return set(handle_id for handle_id, depth, parent in _traverse_neo4j(roots, steps, max_depth) if depth)
+    rows = nc.query_to_list(nc.graphdb.manager, query, handle_ids=sorted(roots))
+    return set(row['handle_id'] for row in rows) - roots
+
+
+def expand(handle_ids, steps, current=False):
+    """
+    :param current: See get_snapshot
+    :return: Dict of handle_id and list of neighbour handle_ids, from the snapshot or one neo4j query
+    """
+    snapshot = get_snapshot(current)
+    if snapshot is not None:
+        return dict((handle_id, snapshot.neighbours(handle_id, steps)) for handle_id in handle_ids)
+    result = dict((handle_id, []) for handle_id in handle_ids)
+    query = _expand_query(steps)
+    if query and result:
+        for row in nc.query_to_list(nc.graphdb.manager, query, handle_ids=list(result)):
+            if row['handle_id'] not in result[row['parent']]:
+                result[row['parent']].append(row['handle_id'])
+    return result
+
+
+def traverse(roots, steps, max_depth=None, current=False):
+    """
+    TopologySnapshot.traverse on the snapshot, or on neo4j with one query per depth if there is none.
+
+    :param current: See get_snapshot
+    :return: Generator of (handle_id, depth, parent handle_id) in breadth first order, starting with the roots
+    """
+    snapshot = get_snapshot(current)
+    if snapshot is not None:
+        return snapshot.traverse(roots, steps, max_depth)
+    return _traverse_neo4j(roots, steps, max_depth)
+
+
+def reset():
+    """
+    Forgets the process wide snapshot, the next get_snapshot loads it again.
+    """
+    with _Current.lock:
+        _Current.snapshot = None
+        _Current.mtime = None
+        _Current.checked = 0
+        _Current.version = None
+
+
+def version_token(name):
+    """
+    :param name: Relationship type, NODES or CHANGES
+    :return: Current token of name
+    """
+    key = VERSION_KEY.format(name)
+    token = cache.get(key)
+    if token is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        token = cache.get(key)
+    return token
+
+
+def version(*rel_types):
+    """
+    :return: Token that changes when relationships of any of rel_types are created or deleted, or nodes are deleted
+    """
+    keys = [VERSION_KEY.format(name) for name in (NODES,) + rel_types]
+    versions = cache.get_many(keys)
+    if len(versions) < len(keys):
+        for key in keys:
+            if key not in versions:
+                cache.add(key, uuid.uuid4().hex, None)
+        versions = cache.get_many(keys)
+    return hashlib.md5(':'.join(versions.get(key, '') for key in keys).encode('utf-8')).hexdigest()
+
+
+def bump_version(*names):
+    """
+    :param names: Relationship types or NODES, CHANGES is always bumped
+    """
+    cache.set_many(dict((VERSION_KEY.format(name), uuid.uuid4().hex) for name in names + (CHANGES,)), None)
+
+
+def _action_handler(sender, instance, created, **kwargs):
+    if not created:
+        return
+    noclook = (instance.data or {}).get('noclook', {})
+    action_type = noclook.get('action_type')
+    if action_type == 'relationship' and noclook.get('relationship_type'):
+        rel_type = noclook['relationship_type']
+        transaction.on_commit(lambda: bump_version(rel_type))
+    elif action_type == 'node' and instance.verb == 'delete':
+        transaction.on_commit(lambda: bump_version(NODES))
+
+
+post_save.connect(_action_handler, sender=Action, dispatch_uid='noclook.topology.action')
@@ -7,6 +7,10 @@ from django.utils.text import slugify
 from django.conf import settings
 from .models import NordunetUniqueId, UniqueIdGenerator
 
+# Number of ids that are checked against the unique id collection in one query
+ID_BLOCK_SIZE = 100
+IN_QUERY_SIZE = 500
+
 
 def unique_id_map(slug):
     """
@@ -45,18 +49,57 @@ def is_free_unique_id(unique_id_collection, unique_id):
     return False
 
 
+def taken_unique_ids(unique_id_collection, unique_ids):
+    """
+    Returns the ids in unique_ids that already are in the unique id collection, reserved or not.
+    :param unique_id_collection: UniqueId subclass
+    :param unique_ids: List of strings
+    :return: Set of strings
+    """
+    taken = set()
+    for i in range(0, len(unique_ids), IN_QUERY_SIZE):
+        chunk = unique_ids[i:i + IN_QUERY_SIZE]
+        taken.update(unique_id_collection.objects.filter(unique_id__in=chunk).values_list('unique_id', flat=True))
+    return taken
+
+
+def _create_unique_id(unique_id_collection, unique_id):
+    try:
+        with transaction.atomic():
+            unique_id_collection.objects.create(unique_id=unique_id)
+    except IntegrityError:
+        # Registered by someone else after the block was checked
+        return False
+    return True
+
+
 def get_collection_unique_id(unique_id_generator, unique_id_collection=NordunetUniqueId):
     """
     Return the next available unique id by counting up the id generator until an available id is found
     in the unique id collection.
+
+    The generator is locked while the ids from its counter and onwards are checked, ID_BLOCK_SIZE ids at a time, so
+    concurrent callers get different ids.
     :param unique_id_generator: UniqueIdGenerator instance
     :param unique_id_collection: UniqueId subclass instance
     :return: String unique id
     """
-    created = False
-    while not created:
-        unique_id = unique_id_generator.get_id()
-        obj, created = unique_id_collection.objects.get_or_create(unique_id=unique_id)
+    with transaction.atomic():
+        generator = unique_id_generator.lock()
+        base_id = generator.base_id
+        unique_id = None
+        while unique_id is None:
+            block = [generator.format_id(i) for i in range(base_id, base_id + ID_BLOCK_SIZE)]
+            taken = taken_unique_ids(unique_id_collection, block)
+            for offset, candidate in enumerate(block):
+                if candidate not in taken and _create_unique_id(unique_id_collection, candidate):
+                    unique_id = candidate
+                    base_id += offset
+                    break
+            else:
+                base_id += ID_BLOCK_SIZE
+        generator.advance_to(base_id + 1)
+    unique_id_generator.refresh_from_db()
     return unique_id
 
 
@@ -112,7 +155,8 @@ def bulk_reserve_id_range(start, end, unique_id_generator, unique_id_collection,
 
 def reserve_id_sequence(num_of_ids, unique_id_generator, unique_id_collection, reserve_message, reserver, site=None):
     """
-    Reserves IDs by incrementing the unique ID generator.
+    Reserves IDs by incrementing the unique ID generator. The ids are leased from the generator as one block, checked
+    against the collection with one query and created with bulk_create.
     :param num_of_ids: Number of IDs to reserve.
     :param unique_id_generator: Instance of UniqueIdGenerator
     :param unique_id_collection: Instance of UniqueId subclass
@@ -120,15 +164,29 @@ def reserve_id_sequence(num_of_ids, unique_id_generator, unique_id_collection, r
     :param reserver: Django user object
     :return: List of dicts with reserved ids, reserve message and eventual error message.
     """
+    unique_ids = unique_id_generator.lease_ids(num_of_ids)
+    taken = taken_unique_ids(unique_id_collection, unique_ids)
+    free = [unique_id for unique_id in unique_ids if unique_id not in taken]
+    try:
+        with transaction.atomic():
+            unique_id_collection.objects.bulk_create([
+                unique_id_collection(unique_id=unique_id, reserved=True, reserve_message=reserve_message,
+                                     reserver=reserver, site=site)
+                for unique_id in free
+            ], batch_size=IN_QUERY_SIZE)
+    except IntegrityError:
+        # Some id was registered after the check above, fall back to creating the ids one by one
+        for unique_id in free:
+            try:
+                with transaction.atomic():
+                    unique_id_collection.objects.create(unique_id=unique_id, reserved=True,
+                                                        reserve_message=reserve_message, reserver=reserver, site=site)
+            except IntegrityError:
+                taken.add(unique_id)
     reserve_list = []
-    for x in range(0, num_of_ids):
-        unique_id = unique_id_generator.get_id()
+    for unique_id in unique_ids:
         error_message = ''
-        try:
-            with transaction.atomic():
-                unique_id_collection.objects.create(unique_id=unique_id, reserved=True,
-                                                    reserve_message=reserve_message, reserver=reserver, site=site)
-        except IntegrityError:
+        if unique_id in taken:
             error_message = 'ID already in database. Manual check needed.'
         reserve_list.append({'unique_id': unique_id, 'reserve_message': reserve_message, 'error_message': error_message})
     return reserve_list
@@ -2,12 +2,13 @@
 from django.conf import settings
 from django.urls import path, re_path
 from django.contrib.auth import views as auth_views
-from .views import other, create, edit, import_nodes, report, detail, redirect, debug, list as _list
+from .views import other, create, edit, import_nodes, report, detail, redirect, debug, fragments, list as _list
 
 urlpatterns = [
     path('', other.index),
     # Log out
     path(r'logout/', other.logout_page),
+    path('metrics', other.metrics, name='metrics'),
     # Visualize views
     path('visualize/<handle_id>.json', other.visualize_json, name='visualize_json'),
     path('visualize/<slug>/<handle_id>/maximized/', other.visualize_maximize),
@@ -18,14 +19,14 @@ urlpatterns = [
     # Get all
     # TODO: can it be switched to path instead
     # Or are they even used?, cannot find anything on getall and findall
-    re_path(r'^getall/(?P<slug>[-\w]+)/(result.)?(?P<form>(csv|json|xls)?)$', other.find_all),
+    re_path(r'^getall/(?P<slug>[-\w]+)/(result.)?(?P<form>(csv|json|xlsx|xls)?)$', other.find_all),
     # Find all
-    re_path(r'^findall/(?P<key>[-\w]+)/(?P<value>.*)/(result.)?(?P<form>(csv|json|xls)?)$', other.find_all),
-    re_path(r'^findall/(?P<value>.*)/(result.)?(?P<form>(csv|json|xls)?)$', other.find_all),
+    re_path(r'^findall/(?P<key>[-\w]+)/(?P<value>.*)/(result.)?(?P<form>(csv|json|xlsx|xls)?)$', other.find_all),
+    re_path(r'^findall/(?P<value>.*)/(result.)?(?P<form>(csv|json|xlsx|xls)?)$', other.find_all),
     # Find in - re_path due to result.csv
-    re_path(r'^findin/(?P<slug>[-\w]+)/(result.)?(?P<form>(csv|json|xls)?)$', other.find_all),
-    re_path(r'^findin/(?P<slug>[-\w]+)/(?P<key>[-\w]+)/(?P<value>.*)/(result.)?(?P<form>(csv|json|xls)?)$', other.find_all),
-    re_path(r'^findin/(?P<slug>[-\w]+)/(?P<value>.*)/(result.)?(?P<form>(csv|json|xls)?)$', other.find_all),
+    re_path(r'^findin/(?P<slug>[-\w]+)/(result.)?(?P<form>(csv|json|xlsx|xls)?)$', other.find_all),
+    re_path(r'^findin/(?P<slug>[-\w]+)/(?P<key>[-\w]+)/(?P<value>.*)/(result.)?(?P<form>(csv|json|xlsx|xls)?)$', other.find_all),
+    re_path(r'^findin/(?P<slug>[-\w]+)/(?P<value>.*)/(result.)?(?P<form>(csv|json|xlsx|xls)?)$', other.find_all),
     # Search
     path('search/', other.search),
     path('search/autocomplete', other.search_autocomplete),
@@ -34,7 +35,7 @@ urlpatterns = [
     path('search/typeahead/locations', other.search_location_typeahead),
     path('search/typeahead/non-locations', other.search_non_location_typeahead),
     path('search/typeahead/<slug>/', other.typeahead_slugs, name='typeahead_slugs'),
-    re_path(r'^search/(?P<value>.*)/(result.)?(?P<form>(csv|json|xls)?)$', other.search),
+    re_path(r'^search/(?P<value>.*)/(result.)?(?P<form>(csv|json|xlsx|xls)?)$', other.search),
     # QR lookup
     path('lu/<name>/', other.qr_lookup),
     # Hostname lookup
@@ -75,15 +76,16 @@ urlpatterns = [
 
     # -- report views
     path('reports/hosts/', report.host_reports, name='host_report'),
+    path('reports/hosts/refresh/', report.refresh_host_reports, name='refresh_host_reports'),
     path('reports/hosts/host-users/', report.host_users, name='host_users_report'),
     path('reports/hosts/host-users/<host_user_name>/', report.host_users, name='host_user_report'),
     path('reports/hosts/host-security-class/', report.host_security_class),
     path('reports/hosts/host-security-class/<status>/', report.host_security_class),
     path('reports/hosts/host-services/', report.host_services),
     path('reports/hosts/host-services/<status>/', report.host_services),
-    re_path(r'^reports/unique-ids\.(?P<file_format>xls|csv)$', report.download_unique_ids),
+    re_path(r'^reports/unique-ids\.(?P<file_format>xlsx|xls|csv)$', report.download_unique_ids),
     path('reports/unique-ids/', report.unique_ids),
-    re_path(r'^reports/rack-cables/(?P<handle_id>\d+)\.(?P<file_format>xls|csv)$', report.download_rack_cables),
+    re_path(r'^reports/rack-cables/(?P<handle_id>\d+)\.(?P<file_format>xlsx|xls|csv)$', report.download_rack_cables),
 
     # -- list views
     # TODO: do as edit? with one for all based on slug
@@ -146,6 +148,8 @@ urlpatterns = [
     # Generic detail
     path('<slug>/<int:handle_id>/', detail.generic_detail, name='generic_detail'),
     path('<slug>/<int:handle_id>/history', detail.generic_history),
+    path('<slug>/<int:handle_id>/impact', detail.generic_impact, name='impact'),
+    path('<slug>/<int:handle_id>/fragments/<slug:section>', fragments.node_fragment, name='node_fragment'),
 
     # -- redirect
     # wins only because of no /
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404
+from django.template.loader import render_to_string
 import ipaddress
-import json
 import logging
 
 from apps.noclook.models import NodeHandle
-from apps.noclook import helpers
+from apps.noclook import conditional, connection_paths, detail_loader, hardware, helpers, history, impact
+from apps.noclook.conditional import node_condition
+from apps.noclook.templatetags.rack_tags import noclook_rack
+from apps.noclook.views.fragments import cached_section
 from apps.noclook.views.helpers import Table, TableRow
 import norduniclient as nc
 
@@ -14,6 +18,7 @@ logger = logging.getLogger(__name__)
 
 
 @login_required
+@node_condition
 def generic_detail(request, handle_id, slug):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -25,45 +30,49 @@ def generic_detail(request, handle_id, slug):
 
 
 @login_required
+@node_condition
 def generic_history(request, handle_id, slug):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
-    history = helpers.get_history(nh)
-    return render(request, 'noclook/detail/history.html',
-                  {'node_handle': nh, 'history': history})
+    action_type = history.action_type_param(request)
+    cursor = request.GET.get('cursor')
+    try:
+        page = history.get_page(nh, cursor, action_type)
+    except ValueError:
+        cursor = None
+        page = history.get_page(nh, None, action_type)
+    # Later pages are appended to the first
+    template = 'noclook/detail/includes/history_page.html' if cursor else 'noclook/detail/history.html'
+    return render(request, template, history.page_context(nh, page, action_type))
 
 
 @login_required
+def generic_impact(request, handle_id, slug):
+    nh = get_object_or_404(NodeHandle, pk=handle_id)
+    try:
+        depth = int(request.GET['depth'])
+    except (KeyError, ValueError):
+        depth = None
+    result = impact.impact_analysis(nh.handle_id, depth)
+    return render(request, 'noclook/detail/impact.html',
+                  {'node_handle': nh, 'impact': result, 'depths': range(1, settings.IMPACT_MAX_DEPTH + 1)})
+
+
+@login_required
+@node_condition
 def cable_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     cable = nh.get_node()
     last_seen, expired = helpers.neo4j_data_age(cable.data)
-
-    # TODO: should be fixed in nc.get_connected_equipment
-    q = """
-                MATCH (n:Node {handle_id: {handle_id}})-[rel:Connected_to]->(port)
-                OPTIONAL MATCH (port)<-[:Has*1..10]-(end)
-                WITH  rel, port, last(collect(end)) as end
-                OPTIONAL MATCH (end)-[:Located_in]->(location)
-                OPTIONAL MATCH (location)<-[:Has*1..10]-(site:Site)
-                RETURN id(rel) as rel_id, rel, port, end, location, site
-                ORDER BY end.name, port.name
-                """
-    connections = nc.query_to_list(nc.graphdb.manager, q, handle_id=cable.handle_id)
-
-    # connections = cable.get_connected_equipment()
+    # Connections, dependents and connection path are loaded by views.fragments
     relations = cable.get_relations()
-    dependent = cable.get_dependent_as_types()
-    connection_path = cable.get_connection_path()
-    urls = helpers.get_node_urls(cable, connections, relations, dependent)
-    if not any(dependent.values()):
-        dependent = None
+    urls = helpers.get_node_urls(cable, relations)
     return render(request, 'noclook/detail/cable_detail.html',
                   {'node': cable, 'node_handle': nh, 'last_seen': last_seen, 'expired': expired,
-                   'connections': connections, 'dependent': dependent, 'connection_path': connection_path,
                    'history': True, 'relations': relations, 'urls': urls})
 
 
 @login_required
+@node_condition
 def customer_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -93,6 +102,7 @@ def customer_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def end_user_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -109,6 +119,7 @@ def end_user_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def external_equipment_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -139,18 +150,16 @@ def external_equipment_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def firewall_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
     firewall = nh.get_node()
     last_seen, expired = helpers.neo4j_data_age(firewall.data)
-    location_path = firewall.get_location_path()
     # Get ports in firewall
-    connections = firewall.get_connections()
-    host_services = firewall.get_host_services()
-    dependent = firewall.get_dependent_as_types()
-    dependencies = firewall.get_dependencies_as_types()
-    relations = firewall.get_relations()
+    location_path, connections, host_services, dependent, dependencies, relations = detail_loader.load(
+        firewall, 'get_location_path', 'get_connections', 'get_host_services', 'get_dependent_as_types',
+        'get_dependencies_as_types', 'get_relations')
     scan_enabled = helpers.app_enabled("apps.scan")
     return render(request, 'noclook/detail/firewall_detail.html',
                   {'node_handle': nh, 'node': firewall, 'last_seen': last_seen, 'expired': expired,
@@ -160,21 +169,18 @@ def firewall_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def host_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
     host = nc.get_node_model(nc.graphdb.manager, nh.handle_id)
     last_seen, expired = helpers.neo4j_data_age(host.data)
-    location_path = host.get_location_path()
-    # Handle relationships
-    host_services = host.get_host_services()
-    relations = host.get_relations()
-    dependent = host.get_dependent_as_types()
-    # Get ports in Host
-    connections = host.get_connections()
+    # Handle relationships and get ports in Host
+    location_path, host_services, relations, dependent, connections, dependencies = detail_loader.load(
+        host, 'get_location_path', 'get_host_services', 'get_relations', 'get_dependent_as_types', 'get_connections',
+        'get_dependencies_as_types')
     if not any(dependent.values()):
         dependent = None
-    dependencies = host.get_dependencies_as_types()
 
     urls = helpers.get_node_urls(relations, host_services, dependent, dependencies)
     scan_enabled = helpers.app_enabled("apps.scan")
@@ -186,6 +192,7 @@ def host_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def host_provider_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -204,6 +211,7 @@ def host_provider_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def host_service_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -218,6 +226,7 @@ def host_service_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def host_user_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -244,6 +253,7 @@ def host_user_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def odf_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -275,6 +285,7 @@ def odf_detail(request, handle_id):
                    'history': True, 'urls': urls})
 
 @login_required
+@node_condition
 def outlet_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -307,6 +318,7 @@ def outlet_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def patch_panel_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -339,6 +351,7 @@ def patch_panel_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def optical_filter_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -357,6 +370,7 @@ def optical_filter_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def optical_link_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -372,6 +386,7 @@ def optical_link_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def optical_multiplex_section_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -389,6 +404,7 @@ def optical_multiplex_section_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def optical_node_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -408,6 +424,7 @@ def optical_node_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def optical_path_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -425,18 +442,16 @@ def optical_path_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def pdu_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
     pdu = nh.get_node()
     last_seen, expired = helpers.neo4j_data_age(pdu.data)
-    location_path = pdu.get_location_path()
     # Get ports in pdu
-    connections = pdu.get_connections()
-    host_services = pdu.get_host_services()
-    dependent = pdu.get_dependent_as_types()
-    dependencies = pdu.get_dependencies_as_types()
-    relations = pdu.get_relations()
+    location_path, connections, host_services, dependent, dependencies, relations = detail_loader.load(
+        pdu, 'get_location_path', 'get_connections', 'get_host_services', 'get_dependent_as_types',
+        'get_dependencies_as_types', 'get_relations')
 
     urls = helpers.get_node_urls(pdu, host_services, connections, dependent, dependencies, relations, location_path)
     scan_enabled = helpers.app_enabled("apps.scan")
@@ -448,6 +463,7 @@ def pdu_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def peering_group_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -487,6 +503,7 @@ def peering_group_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def peering_partner_detail(request, handle_id):
     # TODO: Needs to be rewritten using cypher
     nh = get_object_or_404(NodeHandle, pk=handle_id)
@@ -533,6 +550,7 @@ def peering_partner_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def port_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -541,7 +559,7 @@ def port_detail(request, handle_id):
     location_path = port.get_location_path()
     connections = port.get_connections()
     dependent = port.get_dependent_as_types()
-    connection_path = port.get_connection_path()
+    connection_path = connection_paths.get_connection_path(port.handle_id)
     # Units
     q = """
         MATCH (n:Node {handle_id: {handle_id}})<-[:Part_of]-(unit:Unit)
@@ -565,6 +583,7 @@ def port_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def provider_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -588,22 +607,27 @@ def _nodes_without(nodes, what, excludes):
 
 
 @login_required
+@node_condition
 def rack_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
     rack = nh.get_node()
     last_seen, expired = helpers.neo4j_data_age(rack.data)
     location_path = rack.get_location_path()
-    # Get equipment in rack
-    _located_in = rack.get_located_in().get('Located_in', [])
-    physical_relationships = {
-        "Located_in": _nodes_without(_located_in, 'operational_state', ['decommissioned'])
-    }
 
-    urls = helpers.get_node_urls(rack, physical_relationships, location_path)
+    def render_rack():
+        # Get equipment in rack
+        _located_in = rack.get_located_in().get('Located_in', [])
+        equipment = _nodes_without(_located_in, 'operational_state', ['decommissioned'])
+        return render_to_string('noclook/tags/rack.html', noclook_rack(rack, equipment))
+    # The watermark of the rack covers the equipment located in it
+    rack_equipment = cached_section('rack:equipment', nh.handle_id, conditional.node_watermark(nh.handle_id),
+                                    render_rack)
+
+    urls = helpers.get_node_urls(rack, location_path)
     return render(request, 'noclook/detail/rack_detail.html',
                   {'node': rack, 'node_handle': nh, 'last_seen': last_seen, 'expired': expired,
-                   'physical_relationships': physical_relationships, 'location_path': location_path,
+                   'rack_equipment': rack_equipment, 'location_path': location_path,
                    'history': True, 'urls': urls})
 
 
@@ -621,38 +645,22 @@ def _zip_modules(chain, out):
 
 
 @login_required
+@node_condition
 def router_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
     router = nh.get_node()
     last_seen, expired = helpers.neo4j_data_age(router.data)
+    # Interfaces, dependents and hardware modules are loaded by views.fragments
     location_path = router.get_location_path()
-    # Get all the Ports and what depends on the port.
-    connections = router.get_connections()
-    dependent = router.get_dependent_as_types()
-
-    hw_name = "{}-hardware.json".format(router.data.get('name', 'router'))
-    hw_attachment = helpers.find_attachments(handle_id, hw_name).first()
-    if hw_attachment:
-        try:
-            hardware_modules = [json.loads(helpers.attachment_content(hw_attachment))]
-        except IOError as e:
-            logger.warning('Missing hardware modules json for router %s(%s). Error was: %s', nh.node_name, nh.handle_id, e)
-            hardware_modules = []
-    else:
-        hardware_modules = []
-
-    # TODO: generally very inefficient lookups in view...
-    urls = helpers.get_node_urls(router, location_path, dependent, connections, hardware_modules)
+    urls = helpers.get_node_urls(router, location_path)
     return render(request, 'noclook/detail/router_detail.html',
                   {'node_handle': nh, 'node': router, 'last_seen': last_seen, 'expired': expired,
-                   'location_path': location_path, 'dependent': dependent,
-                   'connections': connections,
-                   'hardware_modules': hardware_modules,
-                   'history': True, 'urls': urls})
+                   'location_path': location_path, 'history': True, 'urls': urls})
 
 
 @login_required
+@node_condition
 def unit_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -670,6 +678,7 @@ def unit_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def service_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -687,6 +696,7 @@ def service_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def site_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -737,6 +747,7 @@ def site_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def room_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -778,6 +789,7 @@ def room_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def site_owner_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
@@ -796,33 +808,23 @@ def site_owner_detail(request, handle_id):
 
 
 @login_required
+@node_condition
 def switch_detail(request, handle_id):
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     # Get node from neo4j-database
     switch = nh.get_node()
     last_seen, expired = helpers.neo4j_data_age(switch.data)
-    location_path = switch.get_location_path()
     # Get ports in switch
-    connections = switch.get_connections()
-    host_services = switch.get_host_services()
-    dependent = switch.get_dependent_as_types()
-    dependencies = switch.get_dependencies_as_types()
-    relations = switch.get_relations()
+    location_path, connections, host_services, dependent, dependencies, relations = detail_loader.load(
+        switch, 'get_location_path', 'get_connections', 'get_host_services', 'get_dependent_as_types',
+        'get_dependencies_as_types', 'get_relations')
 
     urls = helpers.get_node_urls(switch, host_services, connections, dependent, dependencies, relations, location_path)
     scan_enabled = helpers.app_enabled("apps.scan")
-    hw_name = "{}-hardware.json".format(switch.data.get('name', 'switch'))
-    hw_attachment = helpers.find_attachments(handle_id, hw_name).first()
-    if hw_attachment:
-        try:
-            hardware_modules = [json.loads(helpers.attachment_content(hw_attachment))]
-        except IOError as e:
-            logger.warning('Missing hardware modules json for router %s(%s). Error was: %s', nh.node_name, nh.handle_id, e)
-            hardware_modules = []
-    else:
-        hardware_modules = []
+    inventory = hardware.get_inventory(nh, switch.data.get('name', 'switch'))
+    hardware_text = hardware.render(inventory) if inventory else None
     return render(request, 'noclook/detail/switch_detail.html',
                   {'node_handle': nh, 'node': switch, 'last_seen': last_seen, 'expired': expired,
                    'host_services': host_services, 'connections': connections, 'dependent': dependent,
                    'dependencies': dependencies, 'relations': relations, 'location_path': location_path,
-                   'history': True, 'urls': urls, 'scan_enabled': scan_enabled, 'hardware_modules': hardware_modules})
+                   'history': True, 'urls': urls, 'scan_enabled': scan_enabled, 'hardware': hardware_text})
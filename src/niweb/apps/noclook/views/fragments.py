@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Sections of the detail pages that are loaded after the page shell.
+
+The detail views render the node itself and a placeholder per section, see
+noclook/detail/includes/fragment.html. The placeholders are replaced with the responses of node_fragment when the
+page has been displayed, so the slow neo4j queries of a section do not delay the rest of the page.
+
+Sections are registered per node type slug with the fragment decorator, sections registered without slug are
+available for all node types.
+
+Rendered sections are shared between users in the cache, keyed on the handle_id and the modification watermark of
+what the section shows, see apps.noclook.conditional. The watermark of a node covers the nodes several relationships
+away that its page shows, so a popular node is rendered once per change instead of once per view. Like the
+conditional GET of the pages, the keys also change every CONDITIONAL_GET_INTERVAL seconds for what depends on the
+time. Sections of nodes without watermark, with too large neighbourhoods, are not cached.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.db.models import Max
+from django.db.models.functions import Greatest
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.views.decorators.cache import cache_control
+
+from apps.noclook.models import NodeHandle
+from apps.noclook import conditional, connection_paths, hardware, helpers, history, metrics
+import norduniclient as nc
+
+logger = logging.getLogger('noclook.views.fragments')
+
+# The units of the ports of a router and what depends on the ports and units, for all ports at once
+PORT_UNITS_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {handle_ids}
+    MATCH (n)<-[:Part_of]-(unit:Unit)
+    RETURN n.handle_id as handle_id, unit
+    """
+DEPENDENTS_QUERY = """
+    MATCH (n:Node) WHERE n.handle_id IN {handle_ids}
+    MATCH (n)<-[:Depends_on]-(node)
+    RETURN n.handle_id as handle_id, node
+    """
+
+SECTIONS = {}
+
+
+def _node_watermark(nh):
+    return conditional.node_watermark(nh.handle_id)
+
+
+def fragment(section, slug=None, watermark=_node_watermark):
+    """
+    Registers a section loader, a function taking the NodeHandle and returning the template name and context.
+
+    :param section: Name of the section in the fragment url
+    :param slug: Node type slug the section is available for, None for all node types
+    :param watermark: Function taking the NodeHandle and returning the modification watermark of what the section
+    shows, the watermark of the node by default
+    """
+    def decorator(func):
+        func.watermark = watermark
+        SECTIONS[(slug, section)] = func
+        return func
+    return decorator
+
+
+def get_section(slug, section):
+    """
+    :return: The section loader registered for the node type slug, or for all node types, None if there is none
+    """
+    return SECTIONS.get((slug, section)) or SECTIONS.get((None, section))
+
+
+def cached_section(name, handle_id, watermark, render_section):
+    """
+    :param name: Name of the section, unique per template
+    :param watermark: Modification watermark of what the section shows, None to not cache the section
+    :param render_section: Function returning the rendered section, only called when it is not cached
+    :return: The rendered section
+    """
+    if watermark is None:
+        return render_section()
+    key = 'noclook:fragment:{}:{}:{}:{}'.format(name, handle_id, watermark.isoformat(), conditional.interval_start())
+    html = cache.get(key)
+    metrics.cache_lookup('detail_fragment', hit=html is not None)
+    if html is None:
+        html = render_section()
+        cache.set(key, html, settings.DETAIL_FRAGMENT_CACHE_TIMEOUT)
+    return html
+
+
+@login_required
+@cache_control(private=True, max_age=settings.DETAIL_FRAGMENT_MAX_AGE)
+def node_fragment(request, slug, handle_id, section):
+    nh = get_object_or_404(NodeHandle, pk=handle_id)
+    loader = get_section(slug, section)
+    if loader is None:
+        raise Http404('No section {} for {}.'.format(section, slug))
+
+    def render_section():
+        template, context = loader(nh)
+        context.setdefault('urls', helpers.get_node_urls(*context.values()))
+        context['node_handle'] = nh
+        return render_to_string(template, context, request)
+    return HttpResponse(cached_section('{}:{}'.format(slug, section), nh.handle_id, loader.watermark(nh),
+                                       render_section))
+
+
+@fragment('history')
+def history_section(nh):
+    context = history.page_context(nh, history.get_page(nh))
+    context['urls'] = {}
+    return 'noclook/detail/history.html', context
+
+
+@fragment('dependents')
+def dependents_section(nh):
+    dependent = nh.get_node().get_dependent_as_types()
+    if not any(dependent.values()):
+        dependent = None
+    return 'noclook/detail/includes/depend_include.html', {'dependent': dependent}
+
+
+def _path_watermark(nh):
+    # The path shows the names of the parts and of their parents, more than one relationship away
+    path = connection_paths.paths([nh.handle_id])[nh.handle_id]
+    handle_ids = set(handle_id for part in path for handle_id in part if handle_id is not None)
+    handle_ids.add(nh.handle_id)
+    return NodeHandle.objects.filter(handle_id__in=handle_ids)\
+        .aggregate(watermark=Max(Greatest('modified', 'watermark')))['watermark']
+
+
+@fragment('connection-path', watermark=_path_watermark)
+def connection_path_section(nh):
+    return 'noclook/detail/includes/connection_path.html',\
+        {'node': {'handle_id': nh.handle_id}, 'connection_path': connection_paths.get_connection_path(nh.handle_id)}
+
+
+@fragment('connections', slug='router')
+def router_connections_section(nh):
+    # Get all the Ports and what depends on the port.
+    connections = nh.get_node().get_connections()
+    units = helpers.get_related_rows(PORT_UNITS_QUERY, [con['porta']['handle_id'] for con in connections], 'unit')
+    dependents = helpers.get_related_rows(
+        DEPENDENTS_QUERY, list(units) + [unit['handle_id'] for items in units.values() for unit in items], 'node')
+    for con in connections:
+        port_id = con['porta']['handle_id']
+        con['units'] = [{'node': unit, 'dependents': dependents[unit['handle_id']]} for unit in units[port_id]]
+        con['dependents'] = dependents[port_id]
+    return 'noclook/detail/includes/router_interfaces.html', {'connections': connections}
+
+
+@fragment('hardware', slug='router')
+def router_hardware_section(nh):
+    inventory = hardware.get_inventory(nh, nh.node_name or 'router')
+    if inventory is None:
+        return 'noclook/detail/includes/hardware_modules.html', {'node': None, 'hardware': None}
+    return 'noclook/detail/includes/hardware_modules.html',\
+        {'node': nh.get_node(), 'hardware': hardware.render(inventory)}
+
+
+@fragment('connections', slug='cable')
+def cable_connections_section(nh):
+    # TODO: should be fixed in nc.get_connected_equipment
+    q = """
+                MATCH (n:Node {handle_id: {handle_id}})-[rel:Connected_to]->(port)
+                OPTIONAL MATCH (port)<-[:Has*1..10]-(end)
+                WITH  rel, port, last(collect(end)) as end
+                OPTIONAL MATCH (end)-[:Located_in]->(location)
+                OPTIONAL MATCH (location)<-[:Has*1..10]-(site:Site)
+                RETURN id(rel) as rel_id, rel, port, end, location, site
+                ORDER BY end.name, port.name
+                """
+    connections = nc.query_to_list(nc.graphdb.manager, q, handle_id=nh.handle_id)
+    return 'noclook/detail/includes/cable_connections.html', {'connections': connections}
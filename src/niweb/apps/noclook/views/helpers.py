@@ -1,3 +1,6 @@
+from collections.abc import Iterable
+
+
 
 class Table(object):
     def __init__(self, *args):
@@ -11,6 +14,13 @@ class Table(object):
     def add_filter(self, badge, name, param, params):
         self.filters.append(create_filter(badge, name, param, params))
 
+    def to_dicts(self):
+        """
+        Yields each row as a dict of header to the text shown in the column.
+        """
+        for row in self.rows:
+            yield dict(zip(self.headers, [cell_to_text(col) for col in row.cols]))
+
     def __repr__(self):
         s = u'''
             {header}
@@ -37,6 +47,22 @@ class TableRow(object):
         self.cols = args[:]
 
 
+def cell_to_text(item):
+    """
+    Plain text version of a table column, see the table_column template tag.
+    """
+    if not item:
+        return u''
+    elif type(item) is list:
+        return u', '.join(text for text in (cell_to_text(i) for i in item) if text)
+    elif isinstance(item, str):
+        return item
+    elif isinstance(item, Iterable) and ('handle_id' in item or 'url' in item):
+        # item is a node or a 'link'
+        return u'{}'.format(item.get('name', ''))
+    return u'{}'.format(item)
+
+
 def create_filter(badge, name, param, params):
     """
         params should be a QueryDict e.g. request.GET.copy()
@@ -2,14 +2,24 @@
 
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, render
+from django.template.defaultfilters import slugify
 
 from apps.noclook.models import NodeType, NodeHandle
+from apps.noclook import connection_paths
+from apps.noclook.conditional import type_condition
 from apps.noclook.views.helpers import Table, TableRow
 from apps.noclook.helpers import get_node_urls, neo4j_data_age
+from apps.noclook.exports import export_response, requested_format
 import norduniclient as nc
 
 __author__ = 'lundberg'
 
+# Node types shown in the rows of other node types, for the conditional GET of the lists showing them
+EQUIPMENT_TYPES = ('port', 'router', 'switch', 'firewall', 'host', 'pdu', 'optical-node', 'odf', 'patch-panel',
+                   'outlet', 'external-equipment', 'optical-filter')
+LOCATION_TYPES = ('site', 'room', 'rack')
+USER_TYPES = ('customer', 'end-user', 'host-user', 'provider', 'site-owner')
+
 OPERATIONAL_BADGES = [
     ('badge-info', 'Testing'),
     ('badge-warning', 'Reserved'),
@@ -74,6 +84,18 @@ def _filter_operational_state(nodes, request, select=lambda n: n):
     return [n for n in nodes if select(n).get('operational_state', '').lower() not in exclude]
 
 
+def _render_table(request, table, name, node_list):
+    """
+    Renders the list table or, if a format is requested with ?format=csv|xlsx|ndjson, streams the table rows as a file.
+    """
+    file_format = requested_format(request)
+    if file_format:
+        return export_response(table.to_dicts(), file_format, header=list(table.headers), file_name=slugify(name),
+                               sheet_name=name)
+    urls = get_node_urls(node_list)
+    return render(request, 'noclook/list/list_generic.html', {'table': table, 'name': name, 'urls': urls})
+
+
 def _type_table(wrapped_node):
     node = wrapped_node.get('node')
     row = TableRow(node, node.get('description'))
@@ -82,6 +104,7 @@ def _type_table(wrapped_node):
 
 
 @login_required
+@type_condition()
 def list_by_type(request, slug):
     node_type = get_object_or_404(NodeType, slug=slug)
     q = """
@@ -92,14 +115,12 @@ def list_by_type(request, slug):
     node_list = nc.query_to_list(nc.graphdb.manager, q)
     node_list = _filter_expired(node_list, request, select=lambda n: n.get('node'))
     # Since all is the same type... we could use a defaultdict with type/id return
-    urls = get_node_urls(node_list)
 
     table = Table('Name', 'Description')
     table.rows = [_type_table(node) for node in node_list]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': '{}s'.format(node_type), 'urls': urls})
+    return _render_table(request, table, '{}s'.format(node_type), node_list)
 
 
 def _cable_end(end):
@@ -111,16 +132,17 @@ def _cable_end(end):
     }
 
 
-def _cable_table(wrapped_cable):
+def _cable_table(wrapped_cable, end_to_end):
     cable = wrapped_cable.get('cable')
     equipment = [e.get('equipment') for e in wrapped_cable.get('end') if e.get('equipment').get('handle_id')]
     ports = [e.get('port') for e in wrapped_cable.get('end') if e.get('port').get('handle_id')]
-    row = TableRow(cable, cable.get('cable_type'), equipment, ports)
+    row = TableRow(cable, cable.get('cable_type'), equipment, ports, end_to_end.get(cable.get('handle_id'), []))
     _set_expired(row, cable)
     return row
 
 
 @login_required
+@type_condition('cable', *EQUIPMENT_TYPES)
 def list_cables(request):
     # MK: not 100% sure this gives the correct end+port pairs
     # Due to the <-[:Has*1..10]
@@ -133,14 +155,14 @@ def list_cables(request):
         """
     cable_list = nc.query_to_list(nc.graphdb.manager, q)
     cable_list = _filter_expired(cable_list, request, select=lambda n: n.get('cable'))
-    urls = get_node_urls(cable_list)
 
-    table = Table('Name', 'Cable type', 'End equipment', 'Port')
-    table.rows = [_cable_table(item) for item in cable_list]
+    # The ends of the whole path through patch panels, for all listed cables at once
+    end_to_end = connection_paths.endpoints([item['cable']['handle_id'] for item in cable_list])
+    table = Table('Name', 'Cable type', 'End equipment', 'Port', 'End to end')
+    table.rows = [_cable_table(item, end_to_end) for item in cable_list]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Cables', 'urls': urls})
+    return _render_table(request, table, 'Cables', cable_list)
 
 
 def _port_row(wrapped_port):
@@ -152,6 +174,7 @@ def _port_row(wrapped_port):
 
 
 @login_required
+@type_condition(*EQUIPMENT_TYPES)
 def list_ports(request):
     q = """
         MATCH (port:Port)
@@ -160,14 +183,12 @@ def list_ports(request):
         """
     port_list = nc.query_to_list(nc.graphdb.manager, q)
     port_list = _filter_expired(port_list, request, select=lambda n: n.get('port'))
-    urls = get_node_urls(port_list)
 
     table = Table('Name', 'Description', 'Equipment')
     table.rows = [_port_row(item) for item in port_list]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Ports', 'urls': urls})
+    return _render_table(request, table, 'Ports', port_list)
 
 
 def _customer_table(wrapped_customer):
@@ -176,6 +197,7 @@ def _customer_table(wrapped_customer):
 
 
 @login_required
+@type_condition('customer')
 def list_customers(request):
     q = """
         MATCH (customer:Customer)
@@ -183,14 +205,12 @@ def list_customers(request):
         ORDER BY customer.name
         """
     customer_list = nc.query_to_list(nc.graphdb.manager, q)
-    urls = get_node_urls(customer_list)
 
     table = Table('Name', 'Description')
     table.rows = [_customer_table(customer) for customer in customer_list]
     table.no_badges = True
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Customers', 'urls': urls})
+    return _render_table(request, table, 'Customers', customer_list)
 
 
 def _host_table(host, users):
@@ -204,6 +224,7 @@ def _host_table(host, users):
 
 
 @login_required
+@type_condition('host', *USER_TYPES)
 def list_hosts(request):
     q = """
         MATCH (host:Host)
@@ -215,15 +236,13 @@ def list_hosts(request):
     host_list = nc.query_to_list(nc.graphdb.manager, q)
     host_list = _filter_expired(host_list, request, select=lambda n: n.get('host'))
     host_list = _filter_operational_state(host_list, request, select=lambda n: n.get('host'))
-    urls = get_node_urls(host_list)
 
     table = Table('Host', 'Address', 'OS', 'OS version', 'User')
     table.rows = [_host_table(item['host'], item['users']) for item in host_list]
     _set_filters_expired(table, request)
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Hosts', 'urls': urls})
+    return _render_table(request, table, 'Hosts', host_list)
 
 
 def _switch_table(switch, users):
@@ -235,6 +254,7 @@ def _switch_table(switch, users):
 
 
 @login_required
+@type_condition('switch', *USER_TYPES)
 def list_switches(request):
     q = """
         MATCH (switch:Switch)
@@ -245,17 +265,16 @@ def list_switches(request):
 
     switch_list = nc.query_to_list(nc.graphdb.manager, q)
     switch_list = _filter_expired(switch_list, request, select=lambda n: n.get('switch'))
-    urls = get_node_urls(switch_list)
 
     table = Table('Switch', 'Model', 'Address', 'User')
     table.rows = [_switch_table(item['switch'], item['users']) for item in switch_list]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'name': 'Switches', 'table': table, 'urls': urls})
+    return _render_table(request, table, 'Switches', switch_list)
 
 
 @login_required
+@type_condition('firewall', *USER_TYPES)
 def list_firewalls(request):
     q = """
         MATCH (firewall:Firewall)
@@ -266,14 +285,12 @@ def list_firewalls(request):
 
     firewall_list = nc.query_to_list(nc.graphdb.manager, q)
     firewall_list = _filter_expired(firewall_list, request, select=lambda n: n.get('firewall'))
-    urls = get_node_urls(firewall_list)
 
     table = Table('Firewall', 'Model', 'Address', 'User')
     table.rows = [_switch_table(item['firewall'], item['users']) for item in firewall_list]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'name': 'Firewalls', 'table': table, 'urls': urls})
+    return _render_table(request, table, 'Firewalls', firewall_list)
 
 
 def _odf_table(item):
@@ -286,6 +303,7 @@ def _odf_table(item):
 
 
 @login_required
+@type_condition('odf', *LOCATION_TYPES)
 def list_odfs(request):
     q = """
         MATCH (odf:ODF)
@@ -299,16 +317,13 @@ def list_odfs(request):
         """
     odf_list = nc.query_to_list(nc.graphdb.manager, q)
     odf_list = _filter_operational_state(odf_list, request, select=lambda n: n.get('odf'))
-    urls = get_node_urls(odf_list)
-
 
     table = Table("Name", "Location")
     table.rows = [_odf_table(item) for item in odf_list]
     # Filter out
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'ODFs', 'urls': urls})
+    return _render_table(request, table, 'ODFs', odf_list)
 
 def _outlet_table(item):
     outlet = item.get('outlet')
@@ -320,6 +335,7 @@ def _outlet_table(item):
 
 
 @login_required
+@type_condition('outlet', *LOCATION_TYPES)
 def list_outlet(request):
     q = """
         MATCH (outlet:Outlet)
@@ -333,16 +349,13 @@ def list_outlet(request):
         """
     outlet_list = nc.query_to_list(nc.graphdb.manager, q)
     outlet_list = _filter_operational_state(outlet_list, request, select=lambda n: n.get('outlet'))
-    urls = get_node_urls(outlet_list)
-
 
     table = Table("Name", "Location" )
     table.rows = [_outlet_table(item) for item in outlet_list]
     # Filter out
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Outlets', 'urls': urls})
+    return _render_table(request, table, 'Outlets', outlet_list)
 
 
 def _patch_panel_table(item):
@@ -355,6 +368,7 @@ def _patch_panel_table(item):
 
 
 @login_required
+@type_condition('patch-panel', *LOCATION_TYPES)
 def list_patch_panels(request):
     q = """
         MATCH (patch_panel:Patch_Panel)
@@ -368,16 +382,13 @@ def list_patch_panels(request):
         """
     patch_panel_list = nc.query_to_list(nc.graphdb.manager, q)
     patch_panel_list = _filter_operational_state(patch_panel_list, request, select=lambda n: n.get('patch_panel'))
-    urls = get_node_urls(patch_panel_list)
-
 
     table = Table("Name", "Location" )
     table.rows = [_patch_panel_table(item) for item in patch_panel_list]
     # Filter out
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Patch Panels', 'urls': urls})
+    return _render_table(request, table, 'Patch Panels', patch_panel_list)
 
 
 def _optical_link_table(link, dependencies):
@@ -396,6 +407,7 @@ def _optical_link_table(link, dependencies):
 
 
 @login_required
+@type_condition('optical-link', *EQUIPMENT_TYPES)
 def list_optical_links(request):
     # TODO: returns [None,None] and [node, None]
     #   tried to use [:Has *0-1] path matching but that gave "duplicate paths"
@@ -411,9 +423,7 @@ def list_optical_links(request):
     table.rows = [_optical_link_table(item['link'], item['dependencies']) for item in optical_link_list]
     _set_filters_operational_state(table, request)
 
-    urls = get_node_urls(optical_link_list)
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Optical Links', 'urls': urls})
+    return _render_table(request, table, 'Optical Links', optical_link_list)
 
 
 def _oms_table(oms, dependencies):
@@ -424,6 +434,7 @@ def _oms_table(oms, dependencies):
 
 
 @login_required
+@type_condition('optical-multiplex-section', 'optical-link')
 def list_optical_multiplex_section(request):
     q = """
         MATCH (oms:Optical_Multiplex_Section)
@@ -434,14 +445,11 @@ def list_optical_multiplex_section(request):
     oms_list = nc.query_to_list(nc.graphdb.manager, q)
     oms_list = _filter_operational_state(oms_list, request, select=lambda n: n.get('oms'))
 
-    urls = get_node_urls(oms_list)
-
     table = Table("Optical Multiplex Section", "Description", "Depends on")
     table.rows = [_oms_table(item['oms'], item['dependencies']) for item in oms_list]
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Optical Multiplex Sections', 'urls': urls})
+    return _render_table(request, table, 'Optical Multiplex Sections', oms_list)
 
 
 def _optical_nodes_table(node):
@@ -451,6 +459,7 @@ def _optical_nodes_table(node):
 
 
 @login_required
+@type_condition('optical-node')
 def list_optical_nodes(request):
     q = """
         MATCH (node:Optical_Node)
@@ -460,13 +469,11 @@ def list_optical_nodes(request):
 
     optical_node_list = nc.query_to_list(nc.graphdb.manager, q)
     optical_node_list = _filter_operational_state(optical_node_list, request, select=lambda n: n.get('node'))
-    urls = get_node_urls(optical_node_list)
 
     table = Table('Name', 'Type', 'Link', 'OTS')
     table.rows = [_optical_nodes_table(item['node']) for item in optical_node_list]
     _set_filters_operational_state(table, request)
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Optical Nodes', 'urls': urls})
+    return _render_table(request, table, 'Optical Nodes', optical_node_list)
 
 
 def _optical_path_table(path):
@@ -482,6 +489,7 @@ def _optical_path_table(path):
 
 
 @login_required
+@type_condition('optical-path')
 def list_optical_paths(request):
     q = """
         MATCH (path:Optical_Path)
@@ -491,14 +499,12 @@ def list_optical_paths(request):
 
     optical_path_list = nc.query_to_list(nc.graphdb.manager, q)
     optical_path_list = _filter_operational_state(optical_path_list, request, select=lambda n: n.get('path'))
-    urls = get_node_urls(optical_path_list)
 
     table = Table('Optical Path', 'Framing', 'Capacity', 'Wavelength', 'Description', 'ENRs')
     table.rows = [_optical_path_table(item['path']) for item in optical_path_list]
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Optical Paths', 'urls': urls})
+    return _render_table(request, table, 'Optical Paths', optical_path_list)
 
 
 def _peering_partner_table(peer, peering_groups):
@@ -508,6 +514,7 @@ def _peering_partner_table(peer, peering_groups):
 
 
 @login_required
+@type_condition('peering-partner', 'peering-group')
 def list_peering_partners(request):
     q = """
         MATCH (peer:Peering_Partner)
@@ -519,17 +526,16 @@ def list_peering_partners(request):
 
     partner_list = nc.query_to_list(nc.graphdb.manager, q)
     partner_list = _filter_expired(partner_list, request, select=lambda n: n.get('peer'))
-    urls = get_node_urls(partner_list)
 
     table = Table('Peering Partner', 'AS Number', 'Peering Groups')
     table.rows = [_peering_partner_table(item['peer'], item['peering_groups']) for item in partner_list]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Peering Partners', 'urls': urls})
+    return _render_table(request, table, 'Peering Partners', partner_list)
 
 
 @login_required
+@type_condition(*LOCATION_TYPES)
 def list_racks(request):
     q = """
         MATCH (rack:Rack)
@@ -543,7 +549,6 @@ def list_racks(request):
         """
 
     rack_list = nc.query_to_list(nc.graphdb.manager, q)
-    urls = get_node_urls(rack_list)
 
     table = Table('Name', 'Location')
     table.no_badges = True
@@ -553,11 +558,11 @@ def list_racks(request):
         location_path = item.get('location_path')
         table.rows.append(TableRow(rack, location_path))
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Racks', 'urls': urls})
+    return _render_table(request, table, 'Racks', rack_list)
 
 
 @login_required
+@type_condition('room')
 def list_rooms(request):
     q = """
         MATCH (room:Room)
@@ -566,7 +571,6 @@ def list_rooms(request):
         """
 
     room_list = nc.query_to_list(nc.graphdb.manager, q)
-    urls = get_node_urls(room_list)
 
     table = Table('Name', 'Location')
     for item in room_list:
@@ -578,8 +582,7 @@ def list_rooms(request):
 
     table.no_badges = True
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Rooms', 'urls': urls})
+    return _render_table(request, table, 'Rooms', room_list)
 
 
 def _router_table(router):
@@ -589,6 +592,7 @@ def _router_table(router):
 
 
 @login_required
+@type_condition('router')
 def list_routers(request):
     q = """
         MATCH (router:Router)
@@ -598,14 +602,12 @@ def list_routers(request):
 
     router_list = nc.query_to_list(nc.graphdb.manager, q)
     router_list = _filter_expired(router_list, request, select=lambda n: n.get('router'))
-    urls = get_node_urls(router_list)
 
     table = Table('Router', 'Model', 'JUNOS version', 'Operational state')
     table.rows = [_router_table(item['router']) for item in router_list]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Routers', 'urls': urls})
+    return _render_table(request, table, 'Routers', router_list)
 
 
 def _service_table(service, customers, end_users):
@@ -620,6 +622,7 @@ def _service_table(service, customers, end_users):
 
 
 @login_required
+@type_condition('service', 'customer', 'end-user')
 def list_services(request, service_class=None):
     where_statement = ''
     name = 'Services'
@@ -638,7 +641,6 @@ def list_services(request, service_class=None):
 
     service_list = nc.query_to_list(nc.graphdb.manager, q)
     service_list = _filter_operational_state(service_list, request, select=lambda n: n.get('service'))
-    urls = get_node_urls(service_list)
 
     table = Table('Service',
                   'Service Class',
@@ -650,8 +652,7 @@ def list_services(request, service_class=None):
 
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': name, 'urls': urls})
+    return _render_table(request, table, name, service_list)
 
 
 def _site_table(site, owner):
@@ -665,6 +666,7 @@ def _site_table(site, owner):
 
 
 @login_required
+@type_condition('site', 'site-owner')
 def list_sites(request):
     q = """
         MATCH (site:Site)
@@ -674,14 +676,12 @@ def list_sites(request):
         """
 
     site_list = nc.query_to_list(nc.graphdb.manager, q)
-    urls = get_node_urls(site_list)
 
     table = Table('Country', 'Site name', 'Area', 'Responsible')
     table.rows = [_site_table(item['site'], item['owner']) for item in site_list]
     table.no_badges = True
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Sites', 'urls': urls})
+    return _render_table(request, table, 'Sites', site_list)
 
 
 def _pdu_table(pdu):
@@ -691,6 +691,7 @@ def _pdu_table(pdu):
 
 
 @login_required
+@type_condition('pdu')
 def list_pdu(request):
     q = """
         MATCH (pdu:PDU)
@@ -701,15 +702,13 @@ def list_pdu(request):
     pdu_list = nc.query_to_list(nc.graphdb.manager, q)
     pdu_list = _filter_expired(pdu_list, request, select=lambda n: n.get('pdu'))
     pdu_list = _filter_operational_state(pdu_list, request, select=lambda n: n.get('pdu'))
-    urls = get_node_urls(pdu_list)
 
     table = Table('Name', 'Type', 'Description')
     table.rows = [_pdu_table(item['pdu']) for item in pdu_list]
     _set_filters_expired(table, request)
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'PDUs', 'urls': urls})
+    return _render_table(request, table, 'PDUs', pdu_list)
 
 
 def _external_equipment_table(equipment, owner):
@@ -719,6 +718,7 @@ def _external_equipment_table(equipment, owner):
 
 
 @login_required
+@type_condition('external-equipment', *USER_TYPES)
 def list_external_equipment(request):
     q = """
         MATCH (equipment:External_Equipment)
@@ -728,10 +728,7 @@ def list_external_equipment(request):
         """
     equipment_list = nc.query_to_list(nc.graphdb.manager, q)
 
-    urls = get_node_urls(equipment_list)
-
     table = Table('Name', 'Description', 'Owner')
     table.rows = [_external_equipment_table(item['equipment'], item['owner']) for item in equipment_list]
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'External Equipment', 'urls': urls})
+    return _render_table(request, table, 'External Equipment', equipment_list)
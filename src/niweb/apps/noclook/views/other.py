@@ -4,14 +4,17 @@ __author__ = 'lundberg'
 # -*- coding: utf-8 -*-
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, HttpResponseForbidden, Http404
 from django.shortcuts import get_object_or_404, render, redirect
 from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
 from re import escape as re_escape
+from prometheus_client import CONTENT_TYPE_LATEST
 import json
 
 from apps.noclook.models import NodeHandle, NodeType
-from apps.noclook import arborgraph
+from apps.noclook import arborgraph, maps
+from apps.noclook import metrics as noclook_metrics
 from apps.noclook import helpers
 import norduniclient as nc
 
@@ -29,24 +32,56 @@ def logout_page(request):
     return redirect('/')
 
 
+def metrics(request):
+    """
+    Metrics in the Prometheus text exposition format, for staff users and METRICS_ALLOWED_IPS. With
+    PROMETHEUS_MULTIPROC_DIR the web metrics are the sum over all worker processes.
+    """
+    if not (request.user.is_active and request.user.is_staff) and \
+            helpers.client_address(request) not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(noclook_metrics.web_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
 # Visualization views
+def _json_response(request, jsonstr, etag):
+    """
+    :return: The JSON response, or 304 Not Modified when the client has the version with etag
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(jsonstr, content_type='application/json')
+    response['ETag'] = etag
+    # Browsers keep the response but ask if it is still current
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _visualize_params(request):
+    """
+    :return: (depth, max_nodes) of the request, bounded by VISUALIZE_MAX_DEPTH and VISUALIZE_MAX_NODES
+    """
+    try:
+        depth = min(max(int(request.GET.get('depth', 1)), 1), settings.VISUALIZE_MAX_DEPTH)
+    except ValueError:
+        depth = 1
+    try:
+        max_nodes = min(max(int(request.GET['max_nodes']), 1), settings.VISUALIZE_MAX_NODES)
+    except (KeyError, ValueError):
+        max_nodes = settings.VISUALIZE_MAX_NODES
+    return depth, max_nodes
+
+
 @login_required
 def visualize_json(request, handle_id):
     """
-    Creates a JSON representation of the node and the adjacent nodes.
+    Creates a JSON representation of the node and the nodes at most depth relationships away.
     This JSON data is then used by Arbor.js (http://arborjs.org/) to make
     a visual representation.
     """
-    # Get the node
-    nh = NodeHandle.objects.get(pk=handle_id)
-    root_node = nc.get_node_model(nc.graphdb.manager, nh.handle_id)
-    if root_node:
-        # Create the data JSON structure needed
-        graph_dict = arborgraph.create_generic_graph(root_node)
-        jsonstr = arborgraph.get_json(graph_dict)
-    else:
-        jsonstr = '{}'
-    return HttpResponse(jsonstr, content_type='application/json')
+    nh = get_object_or_404(NodeHandle, pk=handle_id)
+    depth, max_nodes = _visualize_params(request)
+    return _json_response(request, *arborgraph.get_graph(nh.handle_id, depth, max_nodes))
 
 
 @login_required
@@ -56,7 +91,10 @@ def visualize(request, slug, handle_id):
     """
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     node = nh.get_node()
-    return render(request, 'noclook/visualize/visualize.html', {'node_handle': nh, 'node': node, 'slug': slug})
+    depth, max_nodes = _visualize_params(request)
+    return render(request, 'noclook/visualize/visualize.html',
+                  {'node_handle': nh, 'node': node, 'slug': slug, 'depth': depth, 'max_nodes': max_nodes,
+                   'depths': range(1, settings.VISUALIZE_MAX_DEPTH + 1)})
 
 
 @login_required
@@ -66,11 +104,28 @@ def visualize_maximize(request, slug, handle_id):
     """
     nh = get_object_or_404(NodeHandle, pk=handle_id)
     node = nh.get_node()
+    depth, max_nodes = _visualize_params(request)
     return render(request, 'noclook/visualize/visualize_maximize.html',
-                  {'node_handle': nh, 'node': node, 'slug': slug})
+                  {'node_handle': nh, 'node': node, 'slug': slug, 'depth': depth, 'max_nodes': max_nodes})
 
 
 # Search views
+def _with_node_handles(nodes):
+    """
+    :param nodes: Node dicts
+    :return: List of dicts with node and nh, the NodeHandles are fetched in one query
+    """
+    nodes = list(nodes)
+    node_handles = NodeHandle.objects.select_related('node_type').in_bulk([node['handle_id'] for node in nodes])
+    result = []
+    for node in nodes:
+        nh = node_handles.get(node['handle_id'])
+        if nh is None:
+            raise Http404('No NodeHandle matches the given query.')
+        result.append({'node': node, 'nh': nh})
+    return result
+
+
 @login_required
 def search(request, value='', form=None):
     """
@@ -91,13 +146,12 @@ def search(request, value='', form=None):
             """
         nodes = nc.query_to_list(nc.graphdb.manager, q, search=query)
         if form == 'csv':
-            return helpers.dicts_to_csv_response([n['n'] for n in nodes])
+            return helpers.dicts_to_csv_response(n['n'] for n in nodes)
+        elif form == 'xlsx':
+            return helpers.dicts_to_xlsx_response(n['n'] for n in nodes)
         elif form == 'xls':
             return helpers.dicts_to_xls_response([n['n'] for n in nodes])
-        for node in nodes:
-            nh = get_object_or_404(NodeHandle, pk=node['n']['handle_id'])
-            item = {'node': node['n'], 'nh': nh}
-            result.append(item)
+        result = _with_node_handles([node['n'] for node in nodes])
         if len(result) == 1:
             return redirect(result[0]['nh'].get_absolute_url())
     return render(request, 'noclook/search_result.html', {'value': value, 'result': result, 'posted': posted})
@@ -283,14 +337,12 @@ def find_all(request, slug=None, key=None, value=None, form=None):
     else:
         nodes = nc.get_nodes_by_type(nc.graphdb.manager, label)
     if form == 'csv':
-        return helpers.dicts_to_csv_response(list(nodes))
+        return helpers.dicts_to_csv_response(nodes)
+    elif form == 'xlsx':
+        return helpers.dicts_to_xlsx_response(nodes)
     elif form == 'xls':
         return helpers.dicts_to_xls_response(list(nodes))
-    result = []
-    for node in nodes:
-        nh = get_object_or_404(NodeHandle, pk=node['handle_id'])
-        item = {'node': node, 'nh': nh}
-        result.append(item)
+    result = _with_node_handles(nodes)
     return render(request, 'noclook/search_result.html',
                   {'node_type': node_type, 'key': key, 'value': value, 'result': result})
 
@@ -320,7 +372,7 @@ def gmaps_json(request, slug):
 @login_required
 def gmaps_sites(request):
     """
-    Return a json object with node dicts.
+    Return a json object with node dicts, or GeoJSON with format=geojson.
     {
         nodes: [
             {
@@ -333,28 +385,13 @@ def gmaps_sites(request):
         edges: []
     }
     """
-    sites = nc.get_nodes_by_type(nc.graphdb.manager, 'Site')
-    site_list = []
-    for site in sites:
-        try:
-            site = {
-                'name': site['name'],
-                'url': helpers.get_node_url(site['handle_id']),
-                'lng': float(str(site.get('longitude', 0))),
-                'lat': float(str(site.get('latitude', 0)))
-            }
-        except KeyError:
-            continue
-        site_list.append(site)
-    response = HttpResponse(content_type='application/json')
-    json.dump({'nodes': site_list, 'edges': []}, response)
-    return response
+    return _json_response(request, *maps.get_map(maps.SITES, _map_format(request)))
 
 
 @login_required
 def gmaps_optical_nodes(request):
     """
-    Return a json object with dicts of optical node and cables.
+    Return a json object with dicts of optical node and cables, or GeoJSON with format=geojson.
     {
     nodes: [
         {
@@ -372,47 +409,11 @@ def gmaps_optical_nodes(request):
         }
     ]
     """
-    # Cypher query to get all cables with cable type fiber that are connected
-    # to two optical node.
-    q = """
-        MATCH (cable:Cable)
-        WHERE cable.cable_type = "Dark Fiber"
-        MATCH (cable)-[Connected_to]->(port)
-        WITH cable, port
-        MATCH (port)<-[:Has*0..]-(equipment)
-        WHERE (equipment:Optical_Node) AND NOT equipment.type =~ "(?i).*tss.*"
-        WITH cable, port, equipment
-        MATCH p2=(equipment)-[:Located_in]->()<-[:Has*0..]-(loc)
-        WHERE (loc:Site)
-        RETURN cable, equipment, loc
-        """
-    result = nc.query_to_list(nc.graphdb.manager, q)
-    nodes = {}
-    edges = {}
-    for item in result:
-        node = {
-            'name': item['equipment']['name'],
-            'url': helpers.get_node_url(item['equipment']['handle_id']),
-            'lng': float(str(item['loc'].get('longitude', 0))),
-            'lat': float(str(item['loc'].get('latitude', 0)))
-        }
-        coords = {
-            'lng': float(str(item['loc'].get('longitude', 0))),
-            'lat': float(str(item['loc'].get('latitude', 0)))
-        }
-        edge = {
-            'name': item['cable']['name'],
-            'url': helpers.get_node_url(item['cable']['handle_id']),
-            'end_points': [coords]
-        }
-        nodes[item['equipment']['name']] = node
-        if item['cable']['name'] in edges:
-            edges[item['cable']['name']]['end_points'].append(coords)
-        else:
-            edges[item['cable']['name']] = edge
-    response = HttpResponse(content_type='application/json')
-    json.dump({'nodes': list(nodes.values()), 'edges': list(edges.values())}, response)
-    return response
+    return _json_response(request, *maps.get_map(maps.OPTICAL_NODES, _map_format(request)))
+
+
+def _map_format(request):
+    return 'geojson' if request.GET.get('format') == 'geojson' else 'json'
 
 
 @login_required
@@ -444,6 +445,8 @@ def json_table_to_file(request):
         header = json.loads(header)
         if table and file_format == 'csv':
             return helpers.dicts_to_csv_response(table, header)
+        elif table and file_format == 'xlsx':
+            return helpers.dicts_to_xlsx_response(table, header)
         elif table and file_format == 'xls':
             return helpers.dicts_to_xls_response(table, header)
     raise Http404
@@ -5,17 +5,96 @@ Created on 2012-06-11 5:48 PM
 @author: lundberg
 """
 
+from datetime import timedelta
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, redirect
 from django.http import Http404
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
 
 from apps.noclook.forms import get_node_type_tuples, SearchIdForm
 from apps.noclook.forms.reports import HostReportForm
 from apps.noclook.models import NordunetUniqueId, NodeHandle
-from apps.noclook import helpers
+from apps.noclook import helpers, report_snapshots
+from apps.noclook.exports import export_response, requested_format
 import norduniclient as nc
 
 
+def _yesno(value, none='Not set'):
+    if value is None:
+        return none
+    return 'Yes' if value else 'No'
+
+
+def _uptime_days(seconds):
+    try:
+        return timedelta(seconds=float(seconds)).days
+    except (ValueError, TypeError):
+        return ''
+
+
+HOST_USERS_HEADER = ['Host user', 'Host', 'Host type', 'IP address(es)', 'Contract number', 'Description',
+                     'Responsible', 'Backup', 'Syslog', 'Nagios', 'Managed by', 'Operational State', 'Security Class',
+                     'Last seen', 'Uptime (days)']
+
+
+def _host_users_rows(hosts):
+    for item in hosts:
+        host_user = item.get('host_user') or {}
+        for host in item['hosts']:
+            data = host['data']
+            host_type = host['type'][0].capitalize() if host['type'] else ''
+            yield {
+                'Host user': host_user.get('name', ''),
+                'Host': data.get('name'),
+                'Host type': '{} host'.format(host_type),
+                'IP address(es)': ', '.join(data.get('ip_addresses', [])),
+                'Contract number': data.get('contract_number', ''),
+                'Description': data.get('description', ''),
+                'Responsible': data.get('responsible_group', ''),
+                'Backup': data.get('backup', ''),
+                'Syslog': _yesno(data.get('syslog')),
+                'Nagios': _yesno(data.get('nagios_checks')),
+                'Managed by': data.get('managed_by', ''),
+                'Operational State': data.get('operational_state', 'Not set'),
+                'Security Class': data.get('security_class', ''),
+                'Last seen': data.get('noclook_last_seen', ''),
+                'Uptime (days)': _uptime_days(data.get('uptime')),
+            }
+
+
+def _host_rows(hosts, *keys):
+    """
+    Rows for reports that list one host per row, keys are tuples of column name and host property.
+    """
+    for item in hosts:
+        host = item['host']
+        yield dict((column, host.get(key, '')) for column, key in keys)
+
+
+def _host_port_rows(hosts, public=False):
+    for item in hosts:
+        host = item['host']
+        for port in item['ports']:
+            data = port['data'] if public else port
+            row = {
+                'Host': host.get('name'),
+                'Host service': data.get('name'),
+                'Protocol': data.get('protocol'),
+                'Port': data.get('port'),
+                'Last seen': data.get('noclook_last_seen', ''),
+            }
+            if public:
+                row.update({
+                    'Public service': _yesno(data.get('public_service'), none='No'),
+                    'Public': _yesno(data.get('public'), none='No'),
+                    'Last public check': data.get('noclook_last_external_check', ''),
+                })
+            yield row
+
+
 @login_required
 def host_reports(request):
     return render(request, 'noclook/reports/host_reports.html', {})
@@ -27,28 +106,18 @@ def host_users(request, host_user_name=None):
     users = dict([(name, uid) for uid, name in get_node_type_tuples('Host User') if name])
     host_user_id = users.get(host_user_name, None)
     form = HostReportForm(request.GET or {'cut_off': '1'})
+    snapshot = report_snapshots.get_host_report_snapshot()
 
     if host_user_id:
-        q = '''
-            MATCH (host_user:Host_User {handle_id: {handle_id}})-[:Uses|Owns]->(host:Host)
-            {where}
-            RETURN host_user, collect(DISTINCT {data: host, type: filter(x in labels(host) where not x in ['Node', 'Host'])}) as hosts
-            '''.replace("{where}", form.to_where())
-        hosts = nc.query_to_list(nc.graphdb.manager, q, handle_id=host_user_id)
+        hosts = report_snapshots.host_users(snapshot, host_user_id=host_user_id, host_filter=form.to_filter())
     elif host_user_name == 'Missing':
-        q = '''
-            MATCH (host:Host)
-            {where}
-            RETURN collect(DISTINCT {data: host, type: filter(x in labels(host) where not x in ['Node', 'Host'])}) as hosts
-          '''.replace("{where}", form.to_where(additional="NOT (host)<-[:Uses|Owns]-()"))
-        hosts = nc.query_to_list(nc.graphdb.manager, q)
+        hosts = report_snapshots.host_users(snapshot, missing=True, host_filter=form.to_filter())
     elif host_user_name == 'All' or host_user_name is None:
-        q = '''
-            MATCH (host_user:Host_User)-[:Uses|Owns]->(host:Host) 
-            {where}
-            RETURN host_user, collect(DISTINCT {data: host, type: filter(x in labels(host) where not x in ['Node', 'Host'])}) as hosts
-            '''.replace("{where}", form.to_where())
-        hosts = nc.query_to_list(nc.graphdb.manager, q)
+        hosts = report_snapshots.host_users(snapshot, host_filter=form.to_filter())
+    file_format = requested_format(request)
+    if file_format:
+        return export_response(_host_users_rows(hosts), file_format, HOST_USERS_HEADER,
+                               file_name='host-users_{}'.format(host_user_name or 'All'), sheet_name='Host users')
     num_of_hosts = 0
     for item in hosts:
         num_of_hosts += len(item['hosts'])
@@ -56,70 +125,78 @@ def host_users(request, host_user_name=None):
     urls = helpers.get_node_urls(hosts)
     return render(request, 'noclook/reports/host_users.html',
                               {'host_user_name': host_user_name, 'host_users': users, 'hosts': hosts,
-                               'num_of_hosts': num_of_hosts, 'urls': urls, 'form': form})
+                               'num_of_hosts': num_of_hosts, 'urls': urls, 'form': form, 'snapshot': snapshot})
 
 
 @login_required
 def host_security_class(request, status=None, form=None):
-    where_statement = ''
+    classified = None
     if status == 'classified':
-        where_statement = 'and (exists(host.security_class) or exists(host.security_comment))'
+        classified = True
     elif status == 'not-classified':
-        where_statement = 'and (not(exists(host.security_class)) and not(exists(host.security_comment)))'
-    q = '''
-            MATCH (host:Host)
-            WHERE not(host.operational_state = "Decommissioned") %s
-            RETURN host
-            ORDER BY host.noclook_last_seen DESC
-            ''' % where_statement
-    hosts = nc.query_to_list(nc.graphdb.manager, q)
+        classified = False
+    snapshot = report_snapshots.get_host_report_snapshot()
+    hosts = report_snapshots.host_security_class(snapshot, classified)
+    file_format = requested_format(request)
+    if file_format:
+        rows = _host_rows(hosts, ('Host', 'name'), ('Description', 'description'), ('Class', 'security_class'),
+                          ('Comment', 'security_comment'), ('Last seen', 'noclook_last_seen'))
+        return export_response(rows, file_format, ['Host', 'Description', 'Class', 'Comment', 'Last seen'],
+                               file_name='host-security-class_{}'.format(status or 'all'),
+                               sheet_name='Host security class')
     urls = helpers.get_node_urls(hosts)
     return render(request, 'noclook/reports/host_security_class.html',
-                              {'status': status, 'hosts': hosts, 'urls': urls})
+                              {'status': status, 'hosts': hosts, 'urls': urls, 'snapshot': snapshot})
 
 
 @login_required
 def host_services(request, status=None):
     hosts = []
+    snapshot = report_snapshots.get_host_report_snapshot()
     if status:
         if status == 'unauthorized-ports':
-            q = """
-                MATCH (host:Host)
-                MATCH (host)<-[r:Depends_on]-()
-                WHERE host.operational_state <> "Decommissioned" and exists(r.rogue_port)
-                RETURN host, collect(r) as ports
-                ORDER BY host.noclook_last_seen DESC
-                """
-            hosts = nc.query_to_list(nc.graphdb.manager, q)
+            hosts = report_snapshots.host_services(snapshot, status)
+            file_format = requested_format(request)
+            if file_format:
+                return export_response(_host_port_rows(hosts), file_format,
+                                       ['Host', 'Host service', 'Protocol', 'Port', 'Last seen'],
+                                       file_name='host-services_{}'.format(status), sheet_name='Host services')
             return render(request, 'noclook/reports/host_unauthorized_ports.html',
-                                      {'status': status, 'hosts': hosts})
+                                      {'status': status, 'hosts': hosts, 'snapshot': snapshot})
         elif status == 'public':
-            q = """
-                MATCH (host:Host)
-                MATCH (host)<-[r:Depends_on]-()
-                WHERE host.operational_state <> "Decommissioned" and r.public
-                RETURN host, collect({data: r, id: id(r)}) as ports
-                ORDER BY host.noclook_last_seen DESC
-                """
-            hosts = nc.query_to_list(nc.graphdb.manager, q)
+            hosts = report_snapshots.host_services(snapshot, status)
+            file_format = requested_format(request)
+            if file_format:
+                header = ['Host', 'Host service', 'Protocol', 'Port', 'Public service', 'Public', 'Last public check',
+                          'Last seen']
+                return export_response(_host_port_rows(hosts, public=True), file_format, header,
+                                       file_name='host-services_{}'.format(status), sheet_name='Host services')
             return render(request, 'noclook/reports/host_public_ports.html',
-                                      {'status': status, 'hosts': hosts})
+                                      {'status': status, 'hosts': hosts, 'snapshot': snapshot})
+        elif status in ['locked', 'not-locked']:
+            hosts = report_snapshots.host_services(snapshot, status)
         else:
-            if status == 'locked':
-                where_statement = 'and (exists(host.services_locked) and host.services_locked)'
-            elif status == 'not-locked':
-                where_statement = 'and (not(exists(host.services_locked)) or not host.services_locked)'
-            else:
-                raise Http404()
-            q = """
-                MATCH (host:Host)
-                WHERE host.operational_state <> "Decommissioned" %s
-                RETURN host
-                ORDER BY host.noclook_last_seen DESC
-                """ % where_statement
-        hosts = nc.query_to_list(nc.graphdb.manager, q)
+            raise Http404()
+    file_format = requested_format(request)
+    if file_format:
+        rows = _host_rows(hosts, ('Host', 'name'), ('Description', 'description'), ('Last seen', 'noclook_last_seen'))
+        return export_response(rows, file_format, ['Host', 'Description', 'Last seen'],
+                               file_name='host-services_{}'.format(status or 'all'), sheet_name='Host services')
     return render(request, 'noclook/reports/host_services.html',
-                              {'status': status, 'hosts': hosts})
+                              {'status': status, 'hosts': hosts, 'snapshot': snapshot})
+
+
+@staff_member_required
+@require_POST
+def refresh_host_reports(request):
+    """
+    Generates a new host report snapshot and redirects back to the report.
+    """
+    report_snapshots.generate_host_report_snapshot()
+    next_url = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = reverse('host_report')
+    return redirect(next_url)
 
 
 @login_required
@@ -152,7 +229,9 @@ def download_unique_ids(request, file_format=None):
     table = [create_dict(uid) for uid in id_list]
     # using values is faster, a lot, but no nice header :( and no username
     # table = id_list.values()
-    if table and file_format == 'xls':
+    if table and file_format == 'xlsx':
+        return helpers.dicts_to_xlsx_response(table, header)
+    elif table and file_format == 'xls':
         return helpers.dicts_to_xls_response(table, header)
     elif table and file_format == 'csv':
         return helpers.dicts_to_csv_response(table, header)
@@ -199,8 +278,10 @@ def download_rack_cables(request, handle_id, file_format=None):
     cables = nc.query_to_list(nc.graphdb.manager, q, handle_id=nh.handle_id)
 
     file_name = 'rack-cables_{}_{}_{}.{}'.format(location, nh.node_name, nh.handle_id, file_format)
-    if cables and file_format == 'xls':
-        sheet_name = '{} - {}'.format(location, nh.node_name)
+    sheet_name = '{} - {}'.format(location, nh.node_name)
+    if cables and file_format == 'xlsx':
+        return helpers.dicts_to_xlsx_response(cables, header, file_name, sheet_name=sheet_name)
+    elif cables and file_format == 'xls':
         return helpers.dicts_to_xls_response(cables, header, file_name, sheet_name=sheet_name)
     elif cables and file_format == 'csv':
         return helpers.dicts_to_csv_response(cables, header, file_name)
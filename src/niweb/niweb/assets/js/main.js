@@ -34,8 +34,8 @@ $(document).ready(function() {
   }
 
   // Handle datatables (sorting, searching)
-   var $tables = $("table[data-tablesort]")
-   $tables.each(function(){
+  var init_tables = function($tables, filter_by_id) {
+    $tables.each(function(){
         var $table = $(this).DataTable(
         {
             "paging": false,
@@ -45,7 +45,7 @@ $(document).ready(function() {
                    { type: 'natural', targets: '_all'}
             ]
         });
-        if($tables.length > 1) {
+        if(filter_by_id || $tables.length > 1) {
             $("input[data-tablefilter="+this.id+"]").on('keyup', 
               debounce(function(){
                 $table.search(this.value).draw();
@@ -57,6 +57,38 @@ $(document).ready(function() {
 
         }
     });
+  }
+  init_tables($("table[data-tablesort]"), false);
+
+  // Handle paged and filtered node history, see apps/noclook/history.py
+  $(document).on("click", "[data-history-load]", function(e){
+    e.preventDefault();
+    var $history = $(this).closest("[data-history]");
+    $.get(this.href, function(data){
+      $history.replaceWith(data);
+    }, "html");
+  });
+  $(document).on("click", "[data-history-more]", function(e){
+    e.preventDefault();
+    var $more = $(this);
+    $.get(this.href, function(data){
+      $more.replaceWith(data);
+    }, "html");
+  });
+
+  // Handle lazy loaded detail sections, see apps/noclook/views/fragments.py
+  // Scripts of a fragment run after its tables are set up
+  $("[data-fragment]").each(function(){
+    var $fragment = $(this);
+    $.get($fragment.data("fragment"), function(data){
+      var $nodes = $($.parseHTML(data, document, true));
+      $fragment.empty().append($nodes.not("script"));
+      init_tables($fragment.find("table[data-tablesort]"), true);
+      $fragment.append($nodes.filter("script"));
+    }, "html").fail(function(){
+      $fragment.find(".muted").text("Could not load " + $fragment.data("fragment"));
+    });
+  });
 
 
   // Dynamic ports
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import json
 from os.path import abspath, basename, dirname, join, normpath
 from os import environ
 from sys import path
@@ -196,6 +197,7 @@ SAML_ENABLED = environ.get('SAML_ENABLED', False)
 ########## MIDDLEWARE CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#middleware-classes
 MIDDLEWARE = (
+    'apps.noclook.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -203,9 +205,113 @@ MIDDLEWARE = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.noclook.middleware.Neo4jQueryMiddleware',
 )
 ########## END MIDDLEWARE CONFIGURATION
 
+########## NEO4J BACKEND CONFIGURATION
+# neo4j or memory, memory replaces the neo4j database with the in-memory graph in apps.noclook.memory_graph that only
+# answers the queries registered there. Only for tests and benchmark dry runs, nothing is persisted.
+NEO4J_BACKEND = environ.get('NEO4J_BACKEND', 'neo4j').lower()
+# Number of threads running independent neo4j queries of the detail views concurrently, 1 runs them one by one
+NEO4J_QUERY_THREADS = int(environ.get('NEO4J_QUERY_THREADS', 8))
+########## END NEO4J BACKEND CONFIGURATION
+
+########## NEO4J INSTRUMENTATION CONFIGURATION
+# Record hash, parameter size, rows and time of all neo4j queries, see apps.noclook.neo4j_instrumentation
+NEO4J_INSTRUMENTATION = environ.get('NEO4J_INSTRUMENTATION', 'true').lower() == 'true'
+# Queries slower than this (seconds) are logged to the noclook.neo4j.slow logger
+NEO4J_SLOW_QUERY_THRESHOLD = float(environ.get('NEO4J_SLOW_QUERY_THRESHOLD', 1.0))
+########## END NEO4J INSTRUMENTATION CONFIGURATION
+
+########## METRICS CONFIGURATION
+# Besides staff users these addresses may scrape /metrics, comma separated
+METRICS_ALLOWED_IPS = [ip.strip() for ip in environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+# Addresses of the reverse proxies in front of NOCLook, comma separated. The address of a client is taken from
+# X-Forwarded-For only behind these proxies, see apps.noclook.helpers.client_address
+TRUSTED_PROXIES = [ip.strip() for ip in environ.get('TRUSTED_PROXIES', '').split(',') if ip.strip()]
+# With more than one worker process set PROMETHEUS_MULTIPROC_DIR in the environment of the server, it is read by
+# prometheus_client and not a setting, see apps.noclook.metrics
+########## END METRICS CONFIGURATION
+
+########## DETAIL FRAGMENTS CONFIGURATION
+# Seconds browsers may reuse the lazy loaded sections of the detail pages, see apps.noclook.views.fragments
+DETAIL_FRAGMENT_MAX_AGE = int(environ.get('DETAIL_FRAGMENT_MAX_AGE', 60))
+# Seconds rendered sections are kept in the cache, keyed on the watermark of the node
+DETAIL_FRAGMENT_CACHE_TIMEOUT = int(environ.get('DETAIL_FRAGMENT_CACHE_TIMEOUT', 3600))
+# Seconds the text of a hardware module tree is kept in the cache, keyed on its content hash, see apps.noclook.hardware
+HARDWARE_CACHE_TIMEOUT = int(environ.get('HARDWARE_CACHE_TIMEOUT', 86400))
+########## END DETAIL FRAGMENTS CONFIGURATION
+
+########## REFERENCE DATA CONFIGURATION
+# Seconds between checks of the shared reference data version, changes made in other processes are seen after at most
+# this long, see apps.noclook.reference_data
+REFERENCE_DATA_CHECK_INTERVAL = float(environ.get('REFERENCE_DATA_CHECK_INTERVAL', 5))
+########## END REFERENCE DATA CONFIGURATION
+
+########## HISTORY CONFIGURATION
+# Actions per page of the node history, see apps.noclook.history
+HISTORY_PAGE_SIZE = int(environ.get('HISTORY_PAGE_SIZE', 50))
+########## END HISTORY CONFIGURATION
+
+########## ACTIVITY RETENTION CONFIGURATION
+# JSON list of policies, dicts with action_type, actor (username) and days, see apps.noclook.activity_retention.
+# The first matching policy applies, a policy without days keeps the actions. Eg.
+# [{"action_type": "comment"}, {"actor": "noclook", "action_type": "node_property", "days": 90}]
+ACTIVITY_RETENTION_POLICIES = json.loads(environ.get('ACTIVITY_RETENTION_POLICIES', '[]'))
+# Directory for the gzip compressed NDJSON archives of removed actions. Empty removes actions without archiving.
+ACTIVITY_ARCHIVE_PATH = environ.get('ACTIVITY_ARCHIVE_PATH', '')
+# Actions deleted per transaction
+ACTIVITY_RETENTION_BATCH_SIZE = int(environ.get('ACTIVITY_RETENTION_BATCH_SIZE', 1000))
+########## END ACTIVITY RETENTION CONFIGURATION
+
+########## TOPOLOGY SNAPSHOT CONFIGURATION
+# File written by the topology_snapshot management command, see apps.noclook.topology. Empty disables the snapshot.
+TOPOLOGY_SNAPSHOT_PATH = environ.get('TOPOLOGY_SNAPSHOT_PATH', '')
+# Seconds between checks for a new snapshot file and for activity log changes to apply to the loaded snapshot
+TOPOLOGY_SNAPSHOT_REFRESH_INTERVAL = int(environ.get('TOPOLOGY_SNAPSHOT_REFRESH_INTERVAL', 30))
+########## END TOPOLOGY SNAPSHOT CONFIGURATION
+
+########## IMPACT ANALYSIS CONFIGURATION
+# Relationships followed at most from the node that goes down, see apps.noclook.impact
+IMPACT_MAX_DEPTH = int(environ.get('IMPACT_MAX_DEPTH', 10))
+# Impacted nodes listed at most, the result is marked as truncated when there are more
+IMPACT_MAX_NODES = int(environ.get('IMPACT_MAX_NODES', 5000))
+# Seconds results are cached, changed relationships drop the affected results before that
+IMPACT_CACHE_TIMEOUT = int(environ.get('IMPACT_CACHE_TIMEOUT', 600))
+########## END IMPACT ANALYSIS CONFIGURATION
+
+########## CONNECTION PATH CONFIGURATION
+# Connected_to relationships followed at most from a cable or port, see apps.noclook.connection_paths
+CONNECTION_PATH_MAX_DEPTH = int(environ.get('CONNECTION_PATH_MAX_DEPTH', 20))
+# Seconds paths are cached, created or deleted Connected_to and Has relationships change the cache keys before that
+CONNECTION_PATH_CACHE_TIMEOUT = int(environ.get('CONNECTION_PATH_CACHE_TIMEOUT', 3600))
+########## END CONNECTION PATH CONFIGURATION
+
+########## VISUALIZATION CONFIGURATION
+# Relationships followed at most from the visualized node, see apps.noclook.arborgraph
+VISUALIZE_MAX_DEPTH = int(environ.get('VISUALIZE_MAX_DEPTH', 3))
+# Nodes in a visualization graph at most, the graph is marked as truncated when there are more
+VISUALIZE_MAX_NODES = int(environ.get('VISUALIZE_MAX_NODES', 300))
+# Seconds graphs are cached, changes to their nodes in the activity log drop them before that
+VISUALIZE_CACHE_TIMEOUT = int(environ.get('VISUALIZE_CACHE_TIMEOUT', 3600))
+########## END VISUALIZATION CONFIGURATION
+
+########## MAPS CONFIGURATION
+# Seconds the map documents are cached, changed sites, cables and optical nodes drop them before that
+MAPS_CACHE_TIMEOUT = int(environ.get('MAPS_CACHE_TIMEOUT', 3600))
+########## END MAPS CONFIGURATION
+
+########## CONDITIONAL GET CONFIGURATION
+# Seconds after which detail, list and API responses get new validators even if no node changed, for expired nodes,
+# announcements and imported data that do not go through the activity log. See apps.noclook.conditional
+CONDITIONAL_GET_INTERVAL = int(environ.get('CONDITIONAL_GET_INTERVAL', 900))
+# Nodes a page can show at most for conditional GET, pages of nodes with larger neighbourhoods are always rendered
+CONDITIONAL_GET_MAX_NODES = int(environ.get('CONDITIONAL_GET_MAX_NODES', 2000))
+# Seconds the neighbourhoods are cached, a neighbourhood is walked again before that when one of its nodes changes
+CONDITIONAL_GET_NEIGHBOURHOOD_TIMEOUT = int(environ.get('CONDITIONAL_GET_NEIGHBOURHOOD_TIMEOUT', 3600))
+########## END CONDITIONAL GET CONFIGURATION
+
 ########## AUTHENTICATION BACKENDS CONFIGURATION
 AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',
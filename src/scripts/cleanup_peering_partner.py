@@ -1,8 +1,9 @@
 import argparse
 import logging
 import utils  # noqa: F401 Keep for django_hack
+from django.conf import settings
+from apps.noclook import activity_retention
 from apps.noclook.models import NodeType, NodeHandle
-from actstream.models import Action
 
 logger = logging.getLogger('noclook_cleanup_peering_partners')
 
@@ -16,26 +17,12 @@ def cli():
 
 
 def cleanup_activity_created(node_handles, dry_run=False):
-    total_deleted = 0
-    for nh in node_handles:
-        node_log = {}
-        to_delete = set()
-        for action in nh.action_object_actions.all().reverse():
-            # could also check if action.data.noclook.action_type == relationship
-            previous_action = node_log.get(action.target_object_id)
-            if previous_action == action.verb:
-                if action.verb == 'create':
-                    logger.info('Mark for deletion %s for %s', action, nh)
-                    to_delete.add(action.id)
-            else:
-                node_log[action.target_object_id] = action.verb
-        deletions = len(to_delete)
-        if deletions > 0:
-            if not dry_run:
-                Action.objects.filter(id__in=to_delete).delete()
-            total_deleted += deletions
-            logger.warning('Deleted %d useless actions for %s (%s)', deletions, nh, nh.handle_id)
-    logger.warning('Total usless actions deleted: %d', total_deleted)
+    # Repeated creates and deletes of the same relationship, see apps.noclook.activity_retention
+    to_delete = activity_retention.redundant_actions([nh.handle_id for nh in node_handles])
+    if not dry_run:
+        with activity_retention.Archive(settings.ACTIVITY_ARCHIVE_PATH) as archive:
+            activity_retention.delete_actions(to_delete, archive)
+    logger.warning('Total usless actions deleted: %d', len(to_delete))
 
 
 def cleanup_missing_description(dry_run=False):
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       noclook_benchmark.py
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+# Times the key views, the API and the consumers against a synthetic inventory and writes the results to a JSON file
+# that can be compared between commits.
+#
+# Only run this against a benchmark database, the consumers write to it:
+#
+#   python manage.py generate_synthetic_inventory --scale 5
+#   python noclook_benchmark.py --scale 5 -o before.json
+#   (change the code)
+#   python noclook_benchmark.py --scale 5 -o after.json --compare before.json
+#
+# The --scale, --ports-per-router and --units-per-port arguments must match the ones of the generated inventory for
+# the consumers to update existing nodes.
+#
+# With NEO4J_BACKEND=memory the script is a dry run against the in-memory graph, it generates the synthetic inventory
+# itself and needs an empty SQL database. Views using queries the in-memory graph does not support are reported with
+# an error instead of timings.
+
+import argparse
+import json
+import logging
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from time import perf_counter
+
+import utils
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from tastypie.models import ApiKey
+
+from apps.noclook import neo4j_instrumentation, synthetic
+from apps.noclook.memory_graph import UnsupportedQuery
+from apps.noclook.models import NodeHandle
+
+import noclook_juniper_consumer
+import noclook_nmap_consumer
+import noclook_checkmk_consumer
+import noclook_cfengine_consumer
+import noclook_nunoc_consumer
+
+logger = logging.getLogger('noclook_benchmark')
+
+LIST_VIEWS = ['/router/', '/host/', '/site/', '/rack/', '/cable/', '/port/', '/customer/', '/service/',
+              '/optical-node/', '/peering-partner/', '/host-user/']
+# Node types to show the detail view of, the first node of each type is used
+DETAIL_TYPES = ['Router', 'Host', 'Site', 'Rack', 'Port', 'Cable', 'Service', 'Customer', 'Optical Node',
+                'Peering Partner', 'Peering Group', 'Host Service']
+TYPEAHEAD_VIEWS = ['/search/typeahead/ports?query=router-0001', '/search/typeahead/locations?query=SITE-00',
+                   '/search/typeahead/non-locations?query=host-0001', '/search/typeahead/router/?query=router']
+SEARCH_VIEWS = ['/search/example.net/', '/findall/example.net/', '/findin/host/os/Linux/']
+API_VIEWS = ['/api/v1/router/', '/api/v1/host/', '/api/v1/port/', '/api/v1/service/', '/api/v1/cable/',
+             '/api/v1/router/?offset=100', '/api/v1/host/?limit=100']
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(durations, sql=None, neo4j=None, status=None):
+    """
+    :param durations: Durations in seconds
+    :return: Dict with min, median, mean and max in milliseconds and the query counts of the last run
+    """
+    ms = [d * 1000 for d in durations]
+    result = {
+        'runs': len(ms),
+        'min_ms': round(min(ms), 2),
+        'median_ms': round(statistics.median(ms), 2),
+        'mean_ms': round(statistics.mean(ms), 2),
+        'max_ms': round(max(ms), 2),
+    }
+    if sql is not None:
+        result['sql_queries'] = sql
+    if neo4j is not None:
+        result['neo4j_queries'] = neo4j
+    if status is not None:
+        result['status'] = status
+    return result
+
+
+def time_request(client, url, repeat, **extra):
+    # The first request warms up caches and connections
+    try:
+        client.get(url, **extra)
+    except UnsupportedQuery as e:
+        logger.warning('Skipping %s: %s', url, e)
+        return {'error': 'unsupported query'}
+    durations = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as sql, neo4j_instrumentation.collect() as collector:
+            start = perf_counter()
+            response = client.get(url, **extra)
+            durations.append(perf_counter() - start)
+    return summarize(durations, len(sql), collector.count, response.status_code)
+
+
+def detail_urls():
+    urls = []
+    for node_type in DETAIL_TYPES:
+        nh = NodeHandle.objects.filter(node_type__type=node_type).order_by('handle_id').first()
+        if nh:
+            urls.append(nh.get_absolute_url())
+        else:
+            logger.warning('No %s in the database, detail view skipped.', node_type)
+    return urls
+
+
+def benchmark_views(user, repeat):
+    client = Client()
+    client.force_login(user)
+    results = {}
+    for group, urls in [('list', LIST_VIEWS), ('detail', detail_urls()), ('typeahead', TYPEAHEAD_VIEWS),
+                        ('search', SEARCH_VIEWS)]:
+        for url in urls:
+            logger.info('Timing %s', url)
+            results['{} {}'.format(group, url)] = time_request(client, url, repeat)
+    return results
+
+
+def benchmark_api(user, repeat):
+    api_key, created = ApiKey.objects.get_or_create(user=user)
+    auth = {'HTTP_AUTHORIZATION': 'ApiKey {}:{}'.format(user.username, api_key.key)}
+    client = Client()
+    results = {}
+    for url in API_VIEWS:
+        logger.info('Timing %s', url)
+        results['api {}'.format(url)] = time_request(client, url, repeat, **auth)
+    router = NodeHandle.objects.filter(node_type__type='Router').order_by('handle_id').first()
+    if router:
+        for url in ['/api/v1/router/{}/'.format(router.handle_id),
+                    '/api/v1/router/{}/relationships/'.format(router.handle_id)]:
+            results['api {}'.format(url.replace(str(router.handle_id), '<handle_id>'))] = time_request(
+                client, url, repeat, **auth)
+    return results
+
+
+def benchmark_consumers(scale, ports_per_router, units_per_port, runs):
+    """
+    Runs each consumer on synthetic NERDS data. The first run may create nodes, later runs update them.
+    """
+    consumers = [
+        ('juniper_conf', lambda: noclook_juniper_consumer.consume_juniper_conf(
+            synthetic.nerds_juniper_conf(scale, ports_per_router, units_per_port), False)),
+        ('nmap_services_py', lambda: noclook_nmap_consumer.insert_nmap(synthetic.nerds_nmap_services(scale))),
+        ('nagios_checkmk', lambda: noclook_checkmk_consumer.insert(synthetic.nerds_checkmk(scale))),
+        ('cfengine_report', lambda: noclook_cfengine_consumer.insert(synthetic.nerds_cfengine_report(scale))),
+        ('nunoc_cosmos', lambda: noclook_nunoc_consumer.insert_hosts(synthetic.nerds_nunoc_cosmos(scale))),
+    ]
+    results = {}
+    for name, consume in consumers:
+        durations, sql, neo4j = [], [], []
+        try:
+            for i in range(runs):
+                logger.info('Running the %s consumer (%d/%d)', name, i + 1, runs)
+                with CaptureQueriesContext(connection) as queries, neo4j_instrumentation.collect() as collector:
+                    start = perf_counter()
+                    consume()
+                    durations.append(perf_counter() - start)
+                sql.append(len(queries))
+                neo4j.append(collector.count)
+        except UnsupportedQuery as e:
+            logger.warning('Skipping the %s consumer: %s', name, e)
+            results['consumer {}'.format(name)] = {'error': 'unsupported query'}
+            continue
+        result = summarize(durations, sql[-1], neo4j[-1])
+        result['first_run_ms'] = round(durations[0] * 1000, 2)
+        results['consumer {}'.format(name)] = result
+    return results
+
+
+def compare(baseline, current):
+    """
+    Prints the median time and query counts of current compared to baseline.
+    """
+    rows = []
+    for name, result in sorted(current['results'].items()):
+        old = baseline['results'].get(name)
+        if 'error' in result or (old is not None and 'error' in old):
+            rows.append((name, '', '', 'error', ''))
+            continue
+        if old is None:
+            rows.append((name, '', '{:.1f}'.format(result['median_ms']), 'new', ''))
+            continue
+        change = (result['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0
+        queries = ''
+        if 'sql_queries' in result and 'sql_queries' in old:
+            queries = 'sql {}->{} neo4j {}->{}'.format(old['sql_queries'], result['sql_queries'],
+                                                        old.get('neo4j_queries'), result.get('neo4j_queries'))
+        rows.append((name, '{:.1f}'.format(old['median_ms']), '{:.1f}'.format(result['median_ms']),
+                     '{:+.1f}%'.format(change), queries))
+    width = max(len(row[0]) for row in rows) if rows else 10
+    print('{:<{w}} {:>10} {:>10} {:>8}  {}'.format('benchmark', 'before ms', 'after ms', 'change', 'queries',
+                                                  w=width))
+    for row in rows:
+        print('{:<{w}} {:>10} {:>10} {:>8}  {}'.format(*row, w=width))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks NOCLook against a synthetic inventory.')
+    parser.add_argument('--scale', type=int, default=1, help='Scale of the generated synthetic inventory.')
+    parser.add_argument('--ports-per-router', type=int, default=48)
+    parser.add_argument('--units-per-port', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed requests per view.')
+    parser.add_argument('--consumer-runs', type=int, default=2, help='Number of runs per consumer.')
+    parser.add_argument('--only', choices=['views', 'api', 'consumers'], action='append',
+                        help='Only run these benchmarks, can be repeated.')
+    parser.add_argument('--output', '-o', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Compare the results with this JSON file.')
+    parser.add_argument('--verbose', '-V', action='store_true', default=False)
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+    if not neo4j_instrumentation.installed():
+        logger.warning('NEO4J_INSTRUMENTATION is false, neo4j queries are not counted.')
+    # Adds testserver to ALLOWED_HOSTS for the test client
+    setup_test_environment()
+    user = utils.get_user()
+    if settings.NEO4J_BACKEND == 'memory':
+        if NodeHandle.objects.exists():
+            logger.error('NEO4J_BACKEND is memory, the SQL database has to be empty for a dry run.')
+            return 1
+        synthetic.inventory(user, scale=args.scale, ports_per_router=args.ports_per_router,
+                            units_per_port=args.units_per_port)
+    only = set(args.only or ['views', 'api', 'consumers'])
+    started = datetime.now()
+    results = {}
+    if 'views' in only:
+        results.update(benchmark_views(user, args.repeat))
+    if 'api' in only:
+        results.update(benchmark_api(user, args.repeat))
+    if 'consumers' in only:
+        results.update(benchmark_consumers(args.scale, args.ports_per_router, args.units_per_port,
+                                           args.consumer_runs))
+    output = {
+        'started': started.isoformat(),
+        'duration_s': round((datetime.now() - started).total_seconds(), 1),
+        'git_commit': git_commit(),
+        'options': {'scale': args.scale, 'ports_per_router': args.ports_per_router,
+                    'units_per_port': args.units_per_port, 'repeat': args.repeat,
+                    'consumer_runs': args.consumer_runs},
+        'nodes': NodeHandle.objects.count(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), output)
+    return 0
+
+
+if __name__ == '__main__':
+    logger.propagate = False
+    logger.setLevel(logging.WARNING)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(logging.DEBUG)
+    formatter = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
+    stream_handler.setFormatter(formatter)
+    logger.addHandler(stream_handler)
+    sys.exit(main())
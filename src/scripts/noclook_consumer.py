@@ -27,6 +27,8 @@ import logging
 import utils
 
 from apps.noclook.models import NodeHandle
+from apps.noclook import report_snapshots
+from apps.noclook.metrics import ConsumerRun
 from django.conf import settings as django_settings
 from django_comments.models import Comment
 from django.contrib.contenttypes.models import ContentType
@@ -180,30 +182,46 @@ def run_consume(config_file):
     cfengine_data = config.get('data', 'cfengine_report')
     # noclook
     noclook_data = config.get('data', 'noclook')
+    run = ConsumerRun('noclook_consumer')
     # Consume data
     if juniper_conf_data:
         data = utils.load_json(juniper_conf_data)
         switches = False
-        noclook_juniper_consumer.consume_juniper_conf(data, switches)
+        with run.phase('juniper_conf'):
+            noclook_juniper_consumer.consume_juniper_conf(run.counted('juniper_conf', data), switches)
     if nmap_services_py_data:
         data = utils.load_json(nmap_services_py_data)
-        noclook_nmap_consumer.insert_nmap(data)
+        with run.phase('nmap_services_py'):
+            noclook_nmap_consumer.insert_nmap(run.counted('nmap_services_py', data))
     if nagios_checkmk_data:
         data = utils.load_json(nagios_checkmk_data)
-        noclook_checkmk_consumer.insert(data)
+        with run.phase('nagios_checkmk'):
+            noclook_checkmk_consumer.insert(run.counted('nagios_checkmk', data))
     if cfengine_data:
         data = utils.load_json(cfengine_data)
-        noclook_cfengine_consumer.insert(data)
+        with run.phase('cfengine_report'):
+            noclook_cfengine_consumer.insert(run.counted('cfengine_report', data))
     if config.has_option('data', 'nunoc_cosmos'):
         data = utils.load_json(config.get('data', 'nunoc_cosmos'))
-        noclook_nunoc_consumer.insert_hosts(data)
+        with run.phase('nunoc_cosmos'):
+            noclook_nunoc_consumer.insert_hosts(run.counted('nunoc_cosmos', data))
     if noclook_data:
         nodes = utils.load_json(noclook_data, starts_with="node")
         relationships = utils.load_json(noclook_data, starts_with="relationship")
-        consume_noclook(nodes, relationships)
+        with run.phase('noclook'):
+            consume_noclook(run.counted('noclook_nodes', nodes), run.counted('noclook_relationships', relationships))
     # Clean up expired data
     if remove_expired_juniper_conf:
-        noclook_juniper_consumer.remove_juniper_conf(juniper_conf_data_age)
+        with run.phase('remove_juniper_conf'):
+            noclook_juniper_consumer.remove_juniper_conf(juniper_conf_data_age)
+    # Update the precomputed host reports with the new data
+    if config.has_option('reports', 'host_snapshot') and config.getboolean('reports', 'host_snapshot'):
+        with run.phase('host_report_snapshot'):
+            report_snapshots.generate_host_report_snapshot()
+    # Metrics for the node_exporter textfile collector
+    if config.has_option('metrics', 'textfile') and config.get('metrics', 'textfile'):
+        run.count_nodes()
+        run.write_textfile(config.get('metrics', 'textfile'))
 
 
 def purge_db():
@@ -30,6 +30,7 @@ import utils
 
 from apps.noclook import helpers
 from apps.noclook import activitylog
+from apps.noclook.hardware import attachment_name, store as store_hardware
 import norduniclient as nc
 from dynamic_preferences.registries import global_preferences_registry
 from apps.noclook.models import UniqueIdGenerator, NodeHandle
@@ -447,12 +448,15 @@ def insert_juniper_bgp_peerings(bgp_peerings):
 
 def insert_juniper_hardware(router_node, hardware):
     if hardware:
-        # Upload hardware info as json file.
-        hw_str = json.dumps(hardware)
-        name = "{}-hardware.json".format(router_node.data.get('name', 'router'))
-        user = utils.get_user()
-        # Store it! (or overwrite)
-        helpers.attach_as_file(router_node.handle_id, name, hw_str, user, overwrite=True)
+        # Store the parsed module tree for the detail pages
+        inventory, changed = store_hardware(router_node.handle_id, hardware)
+        if changed:
+            # Upload hardware info as json file, for download.
+            hw_str = json.dumps(hardware)
+            name = attachment_name(router_node.data.get('name', 'router'))
+            user = utils.get_user()
+            # Store it! (or overwrite)
+            helpers.attach_as_file(router_node.handle_id, name, hw_str, user, overwrite=True)
 
 
 def consume_juniper_conf(json_list, is_switches):
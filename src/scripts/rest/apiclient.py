@@ -5,10 +5,13 @@ Created on 2013-10-24 1:57 PM
 @author: lundberg
 """
 
-import hammock
-import json
-from itertools import count
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger('niapiclient')
 logger.setLevel(logging.INFO)
@@ -19,48 +22,142 @@ ch.setFormatter(formatter)
 logger.addHandler(ch)
 
 
+class PageSizer(object):
+    """
+    Adapts the page size (limit) to the observed response time. Pages that are fetched faster than the target time
+    grows the page size and slow pages shrinks it, always within min_limit and max_limit. Safe to share between
+    threads.
+    """
+
+    def __init__(self, limit=100, min_limit=20, max_limit=1000, target_time=1.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_time = target_time
+        self._lock = threading.Lock()
+        self.limit = self._clamp(limit)
+
+    def _clamp(self, limit):
+        return int(max(self.min_limit, min(self.max_limit, limit)))
+
+    def update(self, elapsed, num_objects):
+        """
+        :param elapsed: Seconds it took to fetch the page
+        :param num_objects: Number of objects in the page
+        :return: The new page size
+        """
+        with self._lock:
+            if num_objects and elapsed > 0:
+                # Aim for target_time per page but never more than double or halve the size at once
+                factor = max(0.5, min(2.0, self.target_time / elapsed))
+                self.limit = self._clamp(self.limit * factor)
+            return self.limit
+
+
 class NIApiClient():
 
-    def __init__(self, base_url, user, apikey):
+    def __init__(self, base_url, user, apikey, max_workers=4, page_size=100, min_page_size=20, max_page_size=1000,
+                 target_time=1.0, timeout=60):
         self.user = user
         self.apikey = apikey
-        self.client = hammock.Hammock(base_url, append_slash=True)
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.page_sizer = PageSizer(page_size, min_page_size, max_page_size, target_time)
+        # One keep-alive session shared by all worker threads. A page fetcher and get_relationships_many may run at
+        # the same time, each with max_workers requests in flight, the pool is sized for both and requests beyond it
+        # wait for a connection instead of opening one that is discarded afterwards.
+        self.session = requests.Session()
+        pool_size = 2 * max_workers
+        self._connections = threading.BoundedSemaphore(pool_size)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(self.create_headers())
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def create_headers(self, **kwargs):
         headers = {'Authorization': 'ApiKey %s:%s' % (self.user, self.apikey)}
         headers.update(kwargs)
         return headers
 
+    def _url(self, *path):
+        return '{}/api/v1/{}/'.format(self.base_url, '/'.join(str(p) for p in path))
+
+    def _get_page(self, url, limit, offset, headers):
+        """
+        :return: Tuple of response meta dict, list of objects and the elapsed time in seconds.
+                 (None, None, elapsed) is returned if the response could not be parsed.
+        """
+        with self._connections:
+            start = time.time()
+            response = self.session.get(url, headers=headers, params={'limit': limit, 'offset': offset},
+                                        timeout=self.timeout)
+            elapsed = time.time() - start
+        try:
+            data = response.json()
+            return data.get('meta', {}), data['objects'], elapsed
+        except (ValueError, KeyError) as e:
+            logger.error(e)
+            logger.error('{} {}'.format(response.status_code, response.reason))
+            return None, None, elapsed
+
+    def get_pages(self, url, limit=None, headers={}, max_workers=None):
+        """
+        Yields all objects from a paginated tastypie list resource.
+
+        The first page is fetched on its own to learn the total count, the rest of the pages are fetched concurrently
+        with max_workers requests in flight, self.max_workers by default. If limit is not set the page size is adapted
+        to the response time. Iteration stops at the first page that fails or is empty, no objects after it are
+        yielded.
+        """
+        max_workers = max_workers or self.max_workers
+        sizer = PageSizer(limit, limit, limit) if limit else self.page_sizer
+        meta, batch, elapsed = self._get_page(url, sizer.limit, 0, headers)
+        if not batch:
+            return
+        offset = len(batch)
+        sizer.update(elapsed, len(batch))
+        for obj in batch:
+            yield obj
+        total_count = meta.get('total_count')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while total_count is None or offset < total_count:
+                page_limit = sizer.limit
+                offsets = []
+                for _ in range(max_workers):
+                    if total_count is not None and offset >= total_count:
+                        break
+                    offsets.append(offset)
+                    offset += page_limit
+                futures = [executor.submit(self._get_page, url, page_limit, o, headers) for o in offsets]
+                for page_offset, future in zip(offsets, futures):
+                    meta, batch, elapsed = future.result()
+                    if not batch:
+                        if batch is None:
+                            logger.error('Stopped at offset {} of {}, the page could not be fetched.'.format(
+                                page_offset, url))
+                        for pending in futures:
+                            pending.cancel()
+                        return
+                    sizer.update(elapsed, len(batch))
+                    for obj in batch:
+                        yield obj
+
     def get_host_scan(self, limit=500, headers={}):
-        headers = self.create_headers(**headers)
-        for offset in count(start=0, step=limit):
-            response = self.client.api.v1('host-scan').GET(headers=headers, params={'limit': limit, 'offset': offset})
-            try:
-                batch = response.json()['objects']
-            except (ValueError, KeyError) as e:
-                logger.error(e)
-                logger.error('{} {}'.format(response.status_code, response.reason))
-                break
-            if not batch:
-                raise StopIteration
-            for obj in batch:
-                yield obj
-
-    def get_type(self, node_type, limit=20, headers={}):
-        for offset in count(start=0, step=limit):
-            request = self.client.api.v1(node_type).GET(headers=headers, params={'limit': limit, 'offset': offset})
-            try:
-                batch = json.loads(request.content)['objects']
-            except (ValueError, KeyError) as e:
-                logger.error(e)
-                logger.error('%s %s' % (request.status_code, request.reason))
-                break
-            if not batch:
-                raise StopIteration
-            for obj in batch:
-                yield obj
-
-    def get_relationships(self, entity, limit=20, relationship_type=None, headers={}):
+        return self.get_pages(self._url('host-scan'), limit=limit, headers=headers)
+
+    def get_type(self, node_type, limit=None, headers={}):
+        return self.get_pages(self._url(node_type), limit=limit, headers=headers)
+
+    def get_relationships(self, entity, limit=None, relationship_type=None, headers={}, max_workers=None):
         try:
             pk = entity['handle_id']
             node_type = entity['node_type'].split('/')[-2]
@@ -68,20 +165,34 @@ class NIApiClient():
             logger.error(e)
             logger.error('entity did not supply expected values.')
             raise KeyError
-        for offset in count(start=0, step=limit):
-            params = {'limit': limit, 'offset': offset}
-            if not relationship_type:
-                request = self.client.api.v1(node_type)(pk).relationships.GET(headers=headers, params=params)
-            else:
-                request = self.client.api.v1(node_type)(pk).relationships(relationship_type).GET(headers=headers,
-                                                                                                 params=params)
-            try:
-                batch = json.loads(request.content)['objects']
-            except ValueError as e:
-                logger.error(e)
-                logger.error('%s %s' % (request.status_code, request.reason))
-                break
-            if not batch:
-                raise StopIteration
-            for obj in batch:
-                yield obj
+        if not relationship_type:
+            url = self._url(node_type, pk, 'relationships')
+        else:
+            url = self._url(node_type, pk, 'relationships', relationship_type)
+        return self.get_pages(url, limit=limit, headers=headers, max_workers=max_workers)
+
+    def get_relationships_many(self, entities, limit=None, relationship_type=None, headers={}):
+        """
+        Fetches the relationships for many entities concurrently.
+
+        Yields tuples of entity and a list of its relationships in the same order as the entities were supplied.
+        The pages of each entity are fetched one at a time so that no more than max_workers requests, the size of the
+        connection pool, are in flight.
+        """
+        def _get(entity):
+            return entity, list(self.get_relationships(entity, limit=limit, relationship_type=relationship_type,
+                                                       headers=headers, max_workers=1))
+
+        entities = iter(entities)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Keep a bounded window of entities in flight so that a generator of entities is consumed lazily
+            window = []
+            while True:
+                while len(window) < self.max_workers * 2:
+                    try:
+                        window.append(executor.submit(_get, next(entities)))
+                    except StopIteration:
+                        break
+                if not window:
+                    break
+                yield window.pop(0).result()
@@ -30,26 +30,25 @@ def get_host_scan(output_file):
 # Deprecated old version that traverses hostsm nd gets dependencies. Use get_host_scan.
 def get_hosts(output_file):
     client = NIApiClient(BASE_URL, USER, APIKEY)
-    for host in client.get_type('host', headers=client.create_headers()):
-        if host['node'].get('operational_state', 'Not set') != 'Decommissioned':
-            if VERBOSE:
-                print('Getting ports for %s...' % host['node_name']),
-            ports = defaultdict(list)
-            for rel in client.get_relationships(host, relationship_type='Depends_on', headers=client.create_headers()):
-                protocol = rel['properties'].get('protocol', None)
-                port = rel['properties'].get('port', None)
-                if protocol and port:
-                    ports[protocol].append(port)
-            tcp_ports, udp_ports = '', ''
-            if 'tcp' in ports:
-                tcp_ports = 'T:%s,' % ','.join([str(i) for i in set(ports['tcp'])])
-            if 'udp' in ports:
-                udp_ports = 'U:%s' % ','.join([str(i) for i in set(ports['udp'])])
-            if tcp_ports or udp_ports:
-                for ip_address in host['node'].get('ip_addresses', []):
-                    output_file.writelines('%s %s%s\n' % (ip_address, tcp_ports, udp_ports))
-            if VERBOSE:
-                print('done.')
+    hosts = (host for host in client.get_type('host')
+             if host['node'].get('operational_state', 'Not set') != 'Decommissioned')
+    for host, relationships in client.get_relationships_many(hosts, relationship_type='Depends_on'):
+        if VERBOSE:
+            print('Got ports for %s.' % host['node_name'])
+        ports = defaultdict(list)
+        for rel in relationships:
+            protocol = rel['properties'].get('protocol', None)
+            port = rel['properties'].get('port', None)
+            if protocol and port:
+                ports[protocol].append(port)
+        tcp_ports, udp_ports = '', ''
+        if 'tcp' in ports:
+            tcp_ports = 'T:%s,' % ','.join([str(i) for i in set(ports['tcp'])])
+        if 'udp' in ports:
+            udp_ports = 'U:%s' % ','.join([str(i) for i in set(ports['udp'])])
+        if tcp_ports or udp_ports:
+            for ip_address in host['node'].get('ip_addresses', []):
+                output_file.writelines('%s %s%s\n' % (ip_address, tcp_ports, udp_ports))
 
 
 def main():
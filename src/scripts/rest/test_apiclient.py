@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for NIApiClient against a local stand-in for the NOCLook tastypie API.
+
+Run with: python -m unittest test_apiclient (from src/scripts/rest)
+"""
+
+import json
+import re
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from apiclient import NIApiClient, PageSizer
+
+NUM_HOSTS = 57
+
+
+def make_host(i):
+    return {
+        'handle_id': i,
+        'node_name': 'host{}'.format(i),
+        'node_type': '/api/v1/node_type/host/',
+        'node': {'ip_addresses': ['10.0.0.{}'.format(i)]},
+    }
+
+
+def make_relationship(handle_id, i):
+    return {'id': handle_id * 100 + i, 'type': 'Depends_on', 'properties': {'protocol': 'tcp', 'port': str(i)}}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    hosts = [make_host(i) for i in range(1, NUM_HOSTS + 1)]
+    relationship_count = 3
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            self.respond()
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def respond(self):
+        self.server.requests.append(self.path)
+        if self.headers.get('Authorization') != 'ApiKey user:key':
+            self.send_response(401)
+            self.end_headers()
+            return
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        limit = int(params.get('limit', ['20'])[0])
+        offset = int(params.get('offset', ['0'])[0])
+        if offset in self.server.fail_offsets:
+            self.send_response(500)
+            self.end_headers()
+            return
+        time.sleep(self.server.delay)
+        match = re.match(r'^/api/v1/host/(\d+)/relationships/Depends_on/$', url.path)
+        if url.path == '/api/v1/host/':
+            objects = self.hosts
+        elif match:
+            handle_id = int(match.group(1))
+            objects = [make_relationship(handle_id, i) for i in range(self.relationship_count)]
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps({
+            'meta': {'limit': limit, 'offset': offset, 'total_count': len(objects)},
+            'objects': objects[offset:offset + limit],
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class NIApiClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        cls.server.requests = []
+        cls.server.lock = threading.Lock()
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = 'http://127.0.0.1:{}'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.fail_offsets = ()
+        self.server.delay = 0
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.client = NIApiClient(self.base_url, 'user', 'key', max_workers=4)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_get_type_all_pages_in_order(self):
+        hosts = list(self.client.get_type('host', limit=10))
+        self.assertEqual([h['handle_id'] for h in hosts], list(range(1, NUM_HOSTS + 1)))
+        self.assertEqual(len(self.server.requests), 6)
+
+    def test_get_type_adaptive_page_size(self):
+        hosts = list(self.client.get_type('host'))
+        self.assertEqual([h['handle_id'] for h in hosts], list(range(1, NUM_HOSTS + 1)))
+
+    def test_get_relationships(self):
+        host = make_host(5)
+        relationships = list(self.client.get_relationships(host, relationship_type='Depends_on'))
+        self.assertEqual([r['id'] for r in relationships], [500, 501, 502])
+
+    def test_get_relationships_many(self):
+        hosts = [make_host(i) for i in range(1, 11)]
+        result = list(self.client.get_relationships_many(hosts, relationship_type='Depends_on'))
+        self.assertEqual([h['handle_id'] for h, rels in result], list(range(1, 11)))
+        for host, relationships in result:
+            self.assertEqual(len(relationships), 3)
+            self.assertEqual(relationships[0]['id'], host['handle_id'] * 100)
+
+    def test_get_relationships_many_in_flight(self):
+        self.server.delay = 0.01
+        hosts = [make_host(i) for i in range(1, 11)]
+        result = list(self.client.get_relationships_many(hosts, limit=1, relationship_type='Depends_on'))
+        self.assertEqual([len(rels) for h, rels in result], [3] * 10)
+        # One request per entity at a time, within the connection pool
+        self.assertLessEqual(self.server.max_in_flight, self.client.max_workers)
+
+    def test_pages_and_relationships_in_flight(self):
+        self.server.delay = 0.01
+        hosts = self.client.get_type('host', limit=5)
+        result = list(self.client.get_relationships_many(hosts, limit=1, relationship_type='Depends_on'))
+        self.assertEqual(len(result), NUM_HOSTS)
+        # The page fetcher and the relationship fetchers share the connection pool
+        self.assertLessEqual(self.server.max_in_flight, 2 * self.client.max_workers)
+
+    def test_error_response_stops_iteration(self):
+        client = NIApiClient(self.base_url, 'user', 'wrong', max_workers=2)
+        self.assertEqual(list(client.get_type('host')), [])
+        client.close()
+
+    def test_failed_page_stops_iteration(self):
+        self.server.fail_offsets = (20,)
+        hosts = list(self.client.get_type('host', limit=10))
+        # No objects after the failed page
+        self.assertEqual([h['handle_id'] for h in hosts], list(range(1, 21)))
+
+
+class PageSizerTest(unittest.TestCase):
+
+    def test_grows_when_fast(self):
+        sizer = PageSizer(limit=100, min_limit=20, max_limit=1000, target_time=1.0)
+        self.assertEqual(sizer.update(0.1, 100), 200)
+        self.assertEqual(sizer.update(0.1, 200), 400)
+
+    def test_shrinks_when_slow(self):
+        sizer = PageSizer(limit=100, min_limit=20, max_limit=1000, target_time=1.0)
+        self.assertEqual(sizer.update(4.0, 100), 50)
+
+    def test_bounded(self):
+        sizer = PageSizer(limit=900, min_limit=20, max_limit=1000, target_time=1.0)
+        self.assertEqual(sizer.update(0.01, 900), 1000)
+        sizer = PageSizer(limit=30, min_limit=20, max_limit=1000, target_time=1.0)
+        self.assertEqual(sizer.update(10.0, 30), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()